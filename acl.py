@@ -0,0 +1,167 @@
+"""
+acl.py
+Права админов и модераторов.
+
+Права — битовая маска Permission. Выдаются командой /grant (admins.py) и хранятся
+в таблице admin_grants: в одном сообществе (chat_id группы) или во всех (chat_id = 0).
+ADMIN_IDS из config.py — владельцы бота: у них все права, отозвать их нельзя.
+Администраторы группы в Telegram получают TENANT_ADMIN в своей группе (tenant.py).
+
+В памяти процесса права лежат неизменяемым снимком AclSnapshot. Проверка — поиск в
+frozenset и словаре без обращения к БД и без asyncio.to_thread. После изменения снимок
+перечитывается целиком и подменяется одним присваиванием: читатели видят либо старый,
+либо новый снимок, блокировки не нужны. Снимок читается из БД один раз при старте
+процесса (main.build_application — и в приёмнике, и в каждом воркере); до загрузки
+действуют только права владельцев. В режиме WORKERS изменение пересылается остальным
+процессам (workers.py, acl_changed).
+
+Права в сообществе ограничены TENANT_ADMIN: DIAGNOSTICS (/memory, /profiler, бэкапы,
+автопрофиль) — только глобальное право, эти данные общие для всех сообществ.
+"""
+from dataclasses import dataclass
+from enum import IntFlag
+from types import MappingProxyType
+
+from config import ADMIN_IDS, logger
+
+
+class Permission(IntFlag):
+    EVENTS = 1        # ивенты: создание, отмена, составы
+    PLAYERS = 2       # регистрация ролей, импорт/экспорт, удаление игроков
+    ANNOUNCE = 4      # объявления
+    REPORTS = 8       # выгрузка матчей, посещаемость
+    ACL = 16          # выдача и отзыв прав
+    DIAGNOSTICS = 32  # /memory, /profiler, уведомления о бэкапах и автопрофиле
+
+
+ALL = Permission.EVENTS | Permission.PLAYERS | Permission.ANNOUNCE | Permission.REPORTS \
+    | Permission.ACL | Permission.DIAGNOSTICS
+TENANT_ADMIN = ALL & ~Permission.DIAGNOSTICS
+MODERATOR = Permission.EVENTS | Permission.ANNOUNCE
+NONE = Permission(0)
+
+# chat_id глобальных прав (во всех сообществах)
+GLOBAL = 0
+
+# Имена для /grant, /revoke и /admins
+PERMISSION_NAMES = {
+    "events": Permission.EVENTS,
+    "players": Permission.PLAYERS,
+    "announce": Permission.ANNOUNCE,
+    "reports": Permission.REPORTS,
+    "acl": Permission.ACL,
+    "diagnostics": Permission.DIAGNOSTICS,
+}
+PRESETS = {"admin": TENANT_ADMIN, "moderator": MODERATOR, "all": ALL}
+
+
+@dataclass(frozen=True, slots=True)
+class AclSnapshot:
+    owners: frozenset
+    grants: MappingProxyType  # (chat_id, user_id) -> Permission (в сообществе — не шире TENANT_ADMIN)
+
+    def permissions(self, user_id: int, chat_id: int | None = None) -> Permission:
+        if user_id in self.owners:
+            return ALL
+        mask = self.grants.get((GLOBAL, user_id), NONE)
+        if chat_id:
+            mask |= self.grants.get((chat_id, user_id), NONE)
+        return mask
+
+
+def build_snapshot(rows) -> AclSnapshot:
+    """Снимок из строк (chat_id, user_id, маска)"""
+    grants = {}
+    for chat_id, user_id, mask in rows:
+        mask = Permission(mask) & (ALL if chat_id == GLOBAL else TENANT_ADMIN)
+        if mask:
+            grants[chat_id, user_id] = mask
+    return AclSnapshot(owners=frozenset(ADMIN_IDS), grants=MappingProxyType(grants))
+
+
+# До reload_sync() — только владельцы: проверка прав никогда не ходит в БД сама
+_snapshot = build_snapshot(())
+_listeners = []
+
+
+def reload_sync() -> AclSnapshot:
+    """Перечитывает admin_grants и подменяет снимок (при старте процесса и после изменений)"""
+    global _snapshot
+    from db import load_admin_grants_sync
+    _snapshot = build_snapshot(load_admin_grants_sync())
+    logger.info(f"🔑 Права загружены: владельцев {len(_snapshot.owners)}, выдано прав {len(_snapshot.grants)}")
+    return _snapshot
+
+
+def snapshot() -> AclSnapshot:
+    """Текущий снимок (до загрузки — только владельцы)"""
+    return _snapshot
+
+
+def permissions(user_id: int, chat_id: int | None = None) -> Permission:
+    """Права пользователя: глобальные + выданные в сообществе chat_id (без админов группы, см. tenant.py)"""
+    return snapshot().permissions(user_id, chat_id)
+
+
+def has(user_id: int, permission: Permission, chat_id: int | None = None) -> bool:
+    return permissions(user_id, chat_id) & permission == permission
+
+
+def holders(permission: Permission) -> list[int]:
+    """Владельцы и пользователи с глобальным правом — получатели служебных уведомлений"""
+    current = snapshot()
+    users = set(current.owners)
+    users.update(user_id for (chat_id, user_id), mask in current.grants.items()
+                 if chat_id == GLOBAL and mask & permission == permission)
+    return sorted(users)
+
+
+def tenant_holders(permission: Permission, chat_id: int) -> list[int]:
+    """Пользователи с правом, выданным в сообществе chat_id (без владельцев и глобальных)"""
+    return sorted(user_id for (grant_chat, user_id), mask in snapshot().grants.items()
+                  if grant_chat == chat_id and mask & permission == permission)
+
+
+def describe(mask: Permission) -> str:
+    """Короткое описание маски для сообщений и /admins"""
+    if not mask:
+        return "нет прав"
+    for name, preset in PRESETS.items():
+        if mask == preset:
+            return name
+    return ", ".join(name for name, flag in PERMISSION_NAMES.items() if mask & flag)
+
+
+def parse(text: str) -> Permission:
+    """Маска из "admin", "moderator" или списка прав через запятую ("events,reports")"""
+    mask = NONE
+    for part in text.lower().split(","):
+        part = part.strip()
+        if part in PRESETS:
+            mask |= PRESETS[part]
+        elif part in PERMISSION_NAMES:
+            mask |= PERMISSION_NAMES[part]
+        elif part:
+            known = ", ".join([*PRESETS, *PERMISSION_NAMES])
+            raise ValueError(f"Неизвестное право «{part}». Доступны: {known}")
+    return mask
+
+
+# ==========================================
+# ИЗМЕНЕНИЯ ПРАВ
+# ==========================================
+
+def on_acl_changed(callback):
+    """Подписка: callback() вызывается после подмены снимка (в потоке, где она произошла)"""
+    _listeners.append(callback)
+    return callback
+
+
+def changed():
+    """После commit в admin_grants: перечитать снимок и сообщить подписчикам"""
+    reload_sync()
+    for callback in _listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"❌ Ошибка подписчика изменений прав: {e}")
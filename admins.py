@@ -0,0 +1,156 @@
+"""
+admins.py
+Выдача и отзыв прав админов и модераторов на ходу (acl.py).
+
+    /grant <@user|id> [admin|moderator|права через запятую] [global]
+    /revoke <@user|id> [права через запятую] [global]
+    /admins
+
+Без global права выдаются в текущем сообществе (группа или выбранное через /community),
+с global — во всех. Выдавать и отзывать может только держатель права ACL там же
+(global — глобального), и только те права, которые есть у него самого.
+Владельцев (ADMIN_IDS) отозвать нельзя: так бот не остаётся без админов.
+"""
+import asyncio
+import html
+
+from sqlalchemy import select
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import acl
+from acl import Permission
+from config import logger
+from db import Session, User, change_admin_grant_sync, find_user_by_username
+from tenant import current_tenant, permissions
+
+USAGE = (
+    "Использование:\n"
+    "<code>/grant @user [admin|moderator|events,players,...] [global]</code>\n"
+    "<code>/revoke @user [права] [global]</code>\n"
+    "<code>/admins</code>"
+)
+
+
+def _user_labels_sync(user_ids) -> dict[int, str]:
+    """user_id -> @username или имя (для /admins)"""
+    session = Session()
+    try:
+        stmt = select(User.user_id, User.username, User.first_name).where(User.user_id.in_(list(user_ids)))
+        return {user_id: f"@{username}" if username else first_name for user_id, username, first_name in session.execute(stmt)}
+    finally:
+        session.close()
+
+
+async def _resolve_target(text: str) -> int | None:
+    if text.lstrip("-").isdigit():
+        return int(text)
+    if text.startswith("@"):
+        user = await find_user_by_username(text)
+        return user.user_id if user else None
+    return None
+
+
+def _granter_mask(user_id: int, chat_id: int) -> Permission:
+    """Права того, кто выдаёт: глобальные для global, иначе права в текущем сообществе"""
+    return acl.permissions(user_id) if chat_id == acl.GLOBAL else permissions(user_id)
+
+
+async def _change(update: Update, context: ContextTypes.DEFAULT_TYPE, revoke: bool):
+    args = list(context.args or [])
+    is_global = bool(args) and args[-1].lower() == "global"
+    if is_global:
+        args.pop()
+    if not args:
+        await update.message.reply_text(USAGE, parse_mode="HTML")
+        return
+
+    granter = update.effective_user.id
+    chat_id = acl.GLOBAL if is_global else current_tenant()
+    if not is_global and not chat_id:
+        await update.message.reply_text("❌ Сообщество не выбрано: /community или <code>global</code>.", parse_mode="HTML")
+        return
+
+    granter_mask = _granter_mask(granter, chat_id)
+    if not granter_mask & Permission.ACL:
+        await update.message.reply_text("❌ Нет права выдавать права" + (" во всех сообществах." if is_global else " в этом сообществе."))
+        return
+
+    try:
+        mask = acl.parse(",".join(args[1:])) if len(args) > 1 else (acl.ALL if revoke else acl.MODERATOR)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    if not is_global:
+        if not revoke and mask & ~acl.TENANT_ADMIN:
+            await update.message.reply_text("❌ diagnostics выдаётся только глобально: добавьте global.")
+            return
+        mask &= acl.TENANT_ADMIN
+    if mask & ~granter_mask:
+        if not revoke:
+            missing = acl.describe(mask & ~granter_mask)
+            await update.message.reply_text(f"❌ Нельзя выдать права, которых нет у вас: {missing}.")
+            return
+        mask &= granter_mask
+
+    target = await _resolve_target(args[0])
+    if target is None:
+        await update.message.reply_text("❌ Пользователь не найден. Укажите @username из сообщества или Telegram ID.")
+        return
+    if target in acl.snapshot().owners:
+        await update.message.reply_text("ℹ️ Это владелец бота (ADMIN_IDS): у него все права, изменить их нельзя.")
+        return
+
+    add, remove = (0, mask) if revoke else (mask, 0)
+    try:
+        result = await asyncio.to_thread(change_admin_grant_sync, chat_id, target, add, remove, granter)
+    except Exception as e:
+        logger.error(f"❌ Ошибка изменения прав {target}: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Не удалось изменить права: {e}")
+        return
+
+    scope = "во всех сообществах" if is_global else "в этом сообществе"
+    await update.message.reply_text(
+        f"✅ Права <code>{target}</code> {scope}: <b>{html.escape(acl.describe(Permission(result)))}</b>",
+        parse_mode="HTML"
+    )
+
+
+async def grant_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/grant — выдать права (по умолчанию moderator)"""
+    await _change(update, context, revoke=False)
+
+
+async def revoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/revoke — отозвать права (по умолчанию все)"""
+    await _change(update, context, revoke=True)
+
+
+async def admins_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/admins — владельцы и выданные права (глобальные и текущего сообщества)"""
+    if not permissions(update.effective_user.id) & Permission.ACL:
+        await update.message.reply_text("❌ Эта функция доступна только администраторам.")
+        return
+
+    snap = acl.snapshot()
+    chat_id = current_tenant()
+    global_grants = sorted((user_id, mask) for (grant_chat, user_id), mask in snap.grants.items() if grant_chat == acl.GLOBAL)
+    tenant_grants = sorted((user_id, mask) for (grant_chat, user_id), mask in snap.grants.items()
+                           if chat_id and grant_chat == chat_id)
+    labels = await asyncio.to_thread(
+        _user_labels_sync, {*snap.owners, *(user_id for user_id, _ in global_grants + tenant_grants)}
+    )
+
+    def line(user_id: int, text: str) -> str:
+        name = f" {html.escape(labels[user_id])}" if user_id in labels else ""
+        return f"• <code>{user_id}</code>{name} — {html.escape(text)}"
+
+    lines = ["🔑 <b>Права</b>", "", "<b>Владельцы (ADMIN_IDS):</b>"]
+    lines += [line(user_id, "все права") for user_id in sorted(snap.owners)] or ["—"]
+    lines += ["", "<b>Во всех сообществах:</b>"]
+    lines += [line(user_id, acl.describe(mask)) for user_id, mask in global_grants] or ["—"]
+    if chat_id:
+        lines += ["", "<b>В этом сообществе:</b>"]
+        lines += [line(user_id, acl.describe(mask)) for user_id, mask in tenant_grants] or ["—"]
+    lines += ["", "Администраторы группы в Telegram имеют права admin в своей группе."]
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
@@ -5,7 +5,9 @@ import html
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import ADMIN_IDS, logger
+from acl import Permission
+from config import logger
+from tenant import has_permission
 from db import get_all_users
 from events.utils import get_group_id
 import state
@@ -19,7 +21,7 @@ async def announce_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    if query.from_user.id not in ADMIN_IDS:
+    if not has_permission(query.from_user.id, Permission.ANNOUNCE):
         await query.edit_message_text("❌ Нет прав.")
         return
 
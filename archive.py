@@ -0,0 +1,260 @@
+"""
+Архивация старых завершённых ивентов (разделение на «горячие» и «холодные» данные).
+
+Завершённые и истёкшие ивенты старше ARCHIVE_AFTER_DAYS вместе с участниками, матчами, составами
+и оценками переносятся в отдельную БД (ARCHIVE_DB_NAME), подключённую через ATTACH.
+Перенос идёт пачками по ARCHIVE_BATCH_SIZE ивентов, каждая пачка — одна короткая
+транзакция из set-based запросов:
+    1. агрегаты статистики игроков добавляются в archived_user_stats / archived_role_stats,
+       туда же — посещаемость по завершённым ивентам (attendance.PlayerTally: серии считаются
+       по порядку ивентов, поэтому пачки идут по времени, а не по id);
+    2. строки копируются INSERT ... SELECT в архивные таблицы;
+    3. ивенты удаляются, а всё, что от них зависит, удаляет ON DELETE CASCADE.
+Профиль игрока складывает живые таблицы с агрегатами, поэтому статистика не меняется;
+ночной расчёт посещаемости начинает с архивных агрегатов.
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from attendance import ARCHIVED_COLUMNS, PlayerTally, accumulate
+from config import DB_NAME, ARCHIVE_DB_NAME, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, logger
+from events.utils import DATE_FORMAT, MSK_TZ
+import metrics
+
+# Таблицы, которые переносятся в архив: (таблица, условие отбора строк пачки)
+ARCHIVED_TABLES = [
+    ("events", "id IN (SELECT id FROM temp.archive_batch)"),
+    ("event_participants", "event_id IN (SELECT id FROM temp.archive_batch)"),
+    ("event_matches", "event_id IN (SELECT id FROM temp.archive_batch)"),
+    ("match_participants",
+     "match_id IN (SELECT id FROM main.event_matches WHERE event_id IN (SELECT id FROM temp.archive_batch))"),
+    ("role_ratings",
+     "match_participant_id IN (SELECT mp.id FROM main.match_participants mp "
+     "JOIN main.event_matches m ON m.id = mp.match_id WHERE m.event_id IN (SELECT id FROM temp.archive_batch))"),
+]
+
+# Участники матчей пачки вместе с сообществом ивента: агрегаты хранятся по (chat_id, user_id)
+BATCH_MATCH_PARTICIPANTS = """
+    SELECT mp.*, e.chat_id AS chat_id FROM main.match_participants mp
+    JOIN main.event_matches m ON m.id = mp.match_id
+    JOIN main.events e ON e.id = m.event_id
+    WHERE m.event_id IN (SELECT id FROM temp.archive_batch)
+"""
+
+AGGREGATE_USER_STATS = f"""
+    INSERT INTO main.archived_user_stats (chat_id, user_id, played_matches, spectator_count, ratings_count, ratings_sum)
+    SELECT chat_id, user_id, SUM(played_matches), SUM(spectator_count), SUM(ratings_count), SUM(ratings_sum) FROM (
+        SELECT mp.chat_id AS chat_id, mp.user_id AS user_id,
+               SUM(CASE WHEN mp.played THEN 1 ELSE 0 END) AS played_matches,
+               SUM(CASE WHEN mp.team = 'spectator' THEN 1 ELSE 0 END) AS spectator_count,
+               0 AS ratings_count, 0 AS ratings_sum
+        FROM ({BATCH_MATCH_PARTICIPANTS}) mp
+        GROUP BY mp.chat_id, mp.user_id
+        UNION ALL
+        SELECT mp.chat_id, r.user_id, 0, 0, COUNT(r.rating), COALESCE(SUM(r.rating), 0)
+        FROM main.role_ratings r JOIN ({BATCH_MATCH_PARTICIPANTS}) mp ON mp.id = r.match_participant_id
+        GROUP BY mp.chat_id, r.user_id
+    ) WHERE true
+    GROUP BY chat_id, user_id
+    ON CONFLICT(chat_id, user_id) DO UPDATE SET
+        played_matches = played_matches + excluded.played_matches,
+        spectator_count = spectator_count + excluded.spectator_count,
+        ratings_count = ratings_count + excluded.ratings_count,
+        ratings_sum = ratings_sum + excluded.ratings_sum
+"""
+
+AGGREGATE_ROLE_STATS = f"""
+    INSERT INTO main.archived_role_stats (chat_id, user_id, role, ratings_count, ratings_sum)
+    SELECT mp.chat_id, r.user_id, COALESCE(mp.role_played, 'unknown'), COUNT(r.rating), COALESCE(SUM(r.rating), 0)
+    FROM main.role_ratings r JOIN ({BATCH_MATCH_PARTICIPANTS}) mp ON mp.id = r.match_participant_id
+    WHERE r.rating IS NOT NULL
+    GROUP BY mp.chat_id, r.user_id, COALESCE(mp.role_played, 'unknown')
+    ON CONFLICT(chat_id, user_id, role) DO UPDATE SET
+        ratings_count = ratings_count + excluded.ratings_count,
+        ratings_sum = ratings_sum + excluded.ratings_sum
+"""
+
+# Записи и места в составе по завершённым ивентам — строки attendance.accumulate, по времени ивентов
+ATTENDANCE_HISTORY = """
+    SELECT e.event_time, e.id, e.chat_id, p.user_id, 1, NULL, NULL, NULL
+    FROM {schema}.events e JOIN {schema}.event_participants p ON p.event_id = e.id
+    WHERE e.status = 'completed' AND {condition}
+    UNION ALL
+    SELECT e.event_time, e.id, e.chat_id, mp.user_id, 0, mp.team, mp.played, mp.role_played
+    FROM {schema}.events e
+    JOIN {schema}.event_matches m ON m.event_id = e.id
+    JOIN {schema}.match_participants mp ON mp.match_id = m.id
+    WHERE e.status = 'completed' AND {condition}
+    ORDER BY 1, 2
+"""
+BATCH_CONDITION = "e.id IN (SELECT id FROM temp.archive_batch)"
+
+ARCHIVED_ATTENDANCE = f"""
+    SELECT chat_id, user_id, {", ".join(ARCHIVED_COLUMNS)} FROM main.archived_user_stats
+    WHERE user_id IN (SELECT value FROM json_each(?))
+"""
+ARCHIVED_ROLES = """
+    SELECT chat_id, user_id, role, events_played FROM main.archived_role_stats
+    WHERE events_played > 0 AND user_id IN (SELECT value FROM json_each(?))
+"""
+# Статистика матчей в новых строках — нули: у старых БД у этих колонок нет DEFAULT
+UPSERT_ATTENDANCE = f"""
+    INSERT INTO main.archived_user_stats
+        (chat_id, user_id, played_matches, spectator_count, ratings_count, ratings_sum, {", ".join(ARCHIVED_COLUMNS)})
+    VALUES (?, ?, 0, 0, 0, 0, {", ".join("?" for _ in ARCHIVED_COLUMNS)})
+    ON CONFLICT(chat_id, user_id) DO UPDATE SET
+        {", ".join(f"{column} = excluded.{column}" for column in ARCHIVED_COLUMNS)}
+"""
+UPSERT_ATTENDANCE_ROLE = """
+    INSERT INTO main.archived_role_stats (chat_id, user_id, role, ratings_count, ratings_sum, events_played)
+    VALUES (?, ?, ?, 0, 0, ?)
+    ON CONFLICT(chat_id, user_id, role) DO UPDATE SET events_played = excluded.events_played
+"""
+# Посещаемость в агрегатах (любой завершённый ивент с участниками даёт хотя бы одну из них)
+HAS_ARCHIVED_ATTENDANCE = """
+    SELECT 1 FROM main.archived_user_stats WHERE signups + events_played + no_shows + events_spectated > 0 LIMIT 1
+"""
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _prepare_archive_schema(conn: sqlite3.Connection):
+    """Создаёт архивные таблицы и добавляет в них колонки, появившиеся в основной БД"""
+    for table, _ in ARCHIVED_TABLES:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+        archived = set(_columns(conn, "archive", table))
+        for column in _columns(conn, "main", table):
+            if column not in archived:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_events_time ON events(event_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_events_chat ON events(chat_id, event_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_mp_user ON match_participants(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_rr_user ON role_ratings(user_id)")
+
+
+def _save_attendance(conn: sqlite3.Connection, players: dict):
+    """Записывает накопители в агрегаты целиком (значения, а не приращения)"""
+    conn.executemany(UPSERT_ATTENDANCE, [(*key, *player.row()) for key, player in players.items()])
+    conn.executemany(UPSERT_ATTENDANCE_ROLE, [
+        (*key, role, played) for key, player in players.items() for role, played in player.roles.items()
+    ])
+
+
+def _aggregate_attendance(conn: sqlite3.Connection):
+    """Посещаемость ивентов пачки поверх уже накопленной в агрегатах"""
+    rows = conn.execute(ATTENDANCE_HISTORY.format(schema="main", condition=BATCH_CONDITION)).fetchall()
+    if not rows:
+        return
+    user_ids = json.dumps(sorted({row[3] for row in rows}))
+    players = {(chat_id, user_id): PlayerTally(tuple(state))
+               for chat_id, user_id, *state in conn.execute(ARCHIVED_ATTENDANCE, (user_ids,))}
+    for chat_id, user_id, role, played in conn.execute(ARCHIVED_ROLES, (user_ids,)):
+        if (chat_id, user_id) in players:
+            players[chat_id, user_id].roles[role] = played
+    accumulate(players, ((row[:2], [row]) for row in rows))
+    _save_attendance(conn, players)
+
+
+def _backfill_attendance(conn: sqlite3.Connection) -> int:
+    """
+    Один раз после миграции m0008: посещаемость по ивентам, заархивированным до неё.
+    Считается заново по всему архиву одной транзакцией. Возвращает число игроков.
+    """
+    if conn.execute(HAS_ARCHIVED_ATTENDANCE).fetchone() is not None:
+        return 0
+    if conn.execute("SELECT 1 FROM archive.events WHERE status = 'completed' LIMIT 1").fetchone() is None:
+        return 0
+    players = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute(ATTENDANCE_HISTORY.format(schema="archive", condition="true"))
+        accumulate(players, ((row[:2], [row]) for row in cursor))
+        _save_attendance(conn, players)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(players)
+
+
+def _archive_batch(conn: sqlite3.Connection, cutoff: str, batch_size: int) -> dict:
+    """Переносит одну пачку ивентов. Возвращает число перенесённых строк по таблицам"""
+    counts = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM temp.archive_batch")
+        batch = conn.execute(
+            "INSERT INTO temp.archive_batch (id) "
+            "SELECT id FROM main.events WHERE status IN ('completed', 'expired') AND event_time < ? "
+            "ORDER BY event_time, id LIMIT ?",
+            (cutoff, batch_size),
+        ).rowcount
+        if batch:
+            conn.execute(AGGREGATE_USER_STATS)
+            conn.execute(AGGREGATE_ROLE_STATS)
+            _aggregate_attendance(conn)
+            for table, condition in ARCHIVED_TABLES:
+                columns = ", ".join(_columns(conn, "main", table))
+                counts[table] = conn.execute(
+                    f"INSERT INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE {condition}"
+                ).rowcount
+            # Остальное удаляет ON DELETE CASCADE
+            conn.execute("DELETE FROM main.events WHERE id IN (SELECT id FROM temp.archive_batch)")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return counts
+
+
+def archive_events_sync(after_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                        db_path: str = DB_NAME, archive_path: str = ARCHIVE_DB_NAME, pause_ms: float = 20) -> dict:
+    """Переносит все подходящие ивенты в архив. Возвращает итоги по таблицам"""
+    cutoff = (datetime.now(MSK_TZ) - timedelta(days=after_days)).strftime(DATE_FORMAT)
+    totals = {table: 0 for table, _ in ARCHIVED_TABLES}
+    started = time.perf_counter()
+    batches = 0
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+        _prepare_archive_schema(conn)
+        backfilled = _backfill_attendance(conn)
+        if backfilled:
+            logger.info(f"🗄 Посещаемость по ранее заархивированным ивентам досчитана: игроков {backfilled}")
+        while True:
+            counts = _archive_batch(conn, cutoff, batch_size)
+            if not counts:
+                break
+            batches += 1
+            for table, count in counts.items():
+                totals[table] += count
+            # Между пачками бот успевает записать своё
+            time.sleep(pause_ms / 1000)
+    finally:
+        conn.close()
+
+    report = {"cutoff": cutoff, "batches": batches, "tables": totals,
+              "duration_s": round(time.perf_counter() - started, 2)}
+    metrics.incr("archive.events", totals["events"])
+    return report
+
+
+async def scheduled_archive():
+    """Задача планировщика: архивация в отдельном потоке"""
+    try:
+        report = await asyncio.to_thread(archive_events_sync)
+    except Exception as e:
+        metrics.incr("archive.failed")
+        logger.error(f"❌ Ошибка архивации: {e}", exc_info=True)
+        return
+    if report["tables"]["events"]:
+        moved = ", ".join(f"{table}: {count}" for table, count in report["tables"].items())
+        logger.info(f"🗄 Архивировано ивентов до {report['cutoff']} за {report['duration_s']} с ({moved})")
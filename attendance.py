@@ -0,0 +1,436 @@
+"""
+attendance.py
+Посещаемость и надёжность игроков: ночной пакетный расчёт в пуле процессов.
+
+Для каждого игрока сообщества по завершённым ивентам считаются:
+    • записи (event_participants) и сыгранные игры (состав red/blue, played);
+    • неявки — был в составе, но админ отметил «не играл»;
+    • зрители и «не попал в состав» (записался, а в матче его нет);
+    • серия игр без неявки (текущая и лучшая): игра продлевает серию, неявка
+      обнуляет, зрители и «не попал» её не меняют;
+    • сыгранные игры по ролям.
+Игрок, который отписался уже после фиксации состава, всё равно учитывается по составу.
+
+Расчёт: история делится на шарды по user_id % shards, каждый процесс пула сам читает
+свой шард из БД порциями — записи и составы двумя потоками по времени ивентов,
+слитыми в один — и возвращает только готовые сводки. Таблицы attendance_stats / attendance_role_stats
+заменяются целиком одной транзакцией — профили и отчёт админов читают готовые цифры.
+
+Ивенты, перенесённые в архив (archive.py), расчёт не читает: архивация складывает их
+посещаемость в archived_user_stats / archived_role_stats тем же PlayerTally, и каждый игрок
+начинает с этих агрегатов (как skill.py с ArchivedRoleStats). Архив старше живых ивентов,
+поэтому серии продолжаются с того места, где остановились в архиве.
+
+Запуск вручную:
+    python attendance.py [--processes N]
+"""
+import argparse
+import asyncio
+import heapq
+import html
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+
+from sqlalchemy import delete, func, insert, literal, null, select
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+from acl import Permission
+from config import ATTENDANCE_PROCESSES, logger
+from db import (
+    Session, Event, EventParticipant, EventMatch, MatchParticipant, AttendanceStats, AttendanceRoleStats,
+    ArchivedUserStats, ArchivedRoleStats, User, ROLE_NAMES, notify_users_changed
+)
+from tenant import has_permission
+import metrics
+import state
+
+PLAYED_TEAMS = ('red', 'blue')
+UNKNOWN_ROLE = 'unknown'
+# Шардов больше, чем процессов: быстрые шарды не ждут самый медленный
+SHARDS_PER_PROCESS = 4
+LOAD_CHUNK = 20_000
+WRITE_CHUNK = 10_000
+# Отчёт админов: сколько игроков в списках и с какого числа записей считать долю неявок
+REPORT_TOP = 10
+REPORT_MIN_SIGNUPS = 3
+# Колонки посещаемости в archived_user_stats — в порядке PlayerTally.row()
+ARCHIVED_COLUMNS = ("signups", "events_played", "no_shows", "events_spectated", "not_picked",
+                    "current_streak", "best_streak", "last_played")
+
+
+# ==========================================
+# РАСЧЁТ ШАРДА (в процессе пула)
+# ==========================================
+
+def _history_queries(shards: int, shard: int):
+    """
+    Записи и места в составе по завершённым ивентам для игроков шарда — два потока,
+    оба по порядку (время ивента, ивент). Строка: (время, ивент, chat_id, user_id, записался, команда, играл, роль).
+    Оба идут от индекса events(status, event_time) без сортировки всей истории по игрокам:
+    порядок по игроку заставил бы SQLite сортировать во временном B-дереве вдвое больше строк.
+    """
+    completed = Event.status == 'completed'
+    order = (Event.event_time, Event.id)
+    signups = (
+        select(Event.event_time, Event.id, Event.chat_id, EventParticipant.user_id,
+               literal(1), null(), null(), null())
+        .join(EventParticipant, EventParticipant.event_id == Event.id)
+        .where(completed, EventParticipant.user_id % shards == shard)
+        .order_by(*order)
+    )
+    lineups = (
+        select(Event.event_time, Event.id, Event.chat_id, MatchParticipant.user_id,
+               literal(0), MatchParticipant.team, MatchParticipant.played, MatchParticipant.role_played)
+        .join(EventMatch, EventMatch.id == MatchParticipant.match_id)
+        .join(Event, Event.id == EventMatch.event_id)
+        .where(completed, MatchParticipant.user_id % shards == shard)
+        .order_by(*order)
+    )
+    return signups, lineups
+
+
+class PlayerTally:
+    """Накопитель одного игрока в одном сообществе (state — row() по архивным ивентам)"""
+
+    __slots__ = ("signups", "played", "no_shows", "spectated", "not_picked",
+                 "streak", "best_streak", "last_played", "roles")
+
+    def __init__(self, state: tuple = (0, 0, 0, 0, 0, 0, 0, None)):
+        (self.signups, self.played, self.no_shows, self.spectated, self.not_picked,
+         self.streak, self.best_streak, self.last_played) = state
+        self.roles = Counter()
+
+    def add_event(self, event_time: str, signed: bool, lineup: list):
+        """Один ивент игрока: lineup — его места во всех матчах ивента (команда, играл, роль)"""
+        self.signups += signed
+        played = [role for team, was_played, role in lineup if team in PLAYED_TEAMS and was_played]
+        if played:
+            self.played += 1
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+            self.last_played = event_time
+            self.roles[played[-1] or UNKNOWN_ROLE] += 1
+        elif any(team in PLAYED_TEAMS for team, _, _ in lineup):
+            self.no_shows += 1
+            self.streak = 0
+        elif lineup:
+            self.spectated += 1
+        elif signed:
+            self.not_picked += 1
+
+    def row(self) -> tuple:
+        return (self.signups, self.played, self.no_shows, self.spectated, self.not_picked,
+                self.streak, self.best_streak, self.last_played)
+
+
+# (время, ивент) строки истории
+_event_key = itemgetter(0, 1)
+
+
+def _events(rows):
+    """(время, ивент) и строки этого ивента"""
+    for key, group in groupby(rows, key=_event_key):
+        yield key, list(group)
+
+
+def _stream(session, query):
+    """Строки запроса курсором драйвера порциями — миллионы строк без обёрток Row (как skill.load_history_sync)"""
+    connection = session.connection()
+    sql = query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.execute(str(sql))
+        while rows := cursor.fetchmany(LOAD_CHUNK):
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def accumulate(players: dict, events) -> int:
+    """
+    Добавляет ивенты в накопители players {(chat_id, user_id): PlayerTally}; новых игроков заводит сам.
+    events — пары ((время, ивент), строки) по порядку времени, один ивент может идти несколькими парами.
+    Возвращает число прочитанных строк. Общий для ночного расчёта и архивации (archive.py).
+    """
+    rows_read = 0
+    for (event_time, _), parts in groupby(events, key=itemgetter(0)):
+        # Игрок -> [записался, места в составе]
+        event_players = {}
+        for _, rows in parts:
+            for _, _, chat_id, user_id, is_signup, team, played, role in rows:
+                rows_read += 1
+                entry = event_players.get((chat_id, user_id))
+                if entry is None:
+                    entry = event_players[(chat_id, user_id)] = [False, []]
+                if is_signup:
+                    entry[0] = True
+                else:
+                    entry[1].append((team, played, role))
+        for key, (signed, lineup) in event_players.items():
+            player = players.get(key)
+            if player is None:
+                player = players[key] = PlayerTally()
+            player.add_event(event_time, signed, lineup)
+    return rows_read
+
+
+def _archived_players(session, shards: int, shard: int) -> dict:
+    """Накопители игроков шарда с посещаемостью по заархивированным ивентам"""
+    players = {}
+    columns = [getattr(ArchivedUserStats, column) for column in ARCHIVED_COLUMNS]
+    archived = session.execute(
+        select(ArchivedUserStats.chat_id, ArchivedUserStats.user_id, *columns)
+        .where(ArchivedUserStats.user_id % shards == shard)
+        .execution_options(all_tenants=True)
+    )
+    for chat_id, user_id, *state in archived:
+        # Строки только со статистикой матчей (истёкшие ивенты) посещаемости не дают
+        if any(state[:-1]):
+            players[(chat_id, user_id)] = PlayerTally(tuple(state))
+    roles = session.execute(
+        select(ArchivedRoleStats.chat_id, ArchivedRoleStats.user_id, ArchivedRoleStats.role,
+               ArchivedRoleStats.events_played)
+        .where(ArchivedRoleStats.events_played > 0, ArchivedRoleStats.user_id % shards == shard)
+        .execution_options(all_tenants=True)
+    )
+    for chat_id, user_id, role, played in roles:
+        player = players.get((chat_id, user_id))
+        if player is not None:
+            player.roles[role] = played
+    return players
+
+
+def compute_shard(shards: int, shard: int) -> tuple:
+    """
+    Сводки игроков одного шарда: ({(chat_id, user_id): row}, {(chat_id, user_id, роль): игр}, строк прочитано).
+    Выполняется в процессе пула: свои соединения и чтение порциями.
+    Ивенты идут по времени, поэтому у каждого игрока они тоже по порядку — серии считаются на лету.
+    """
+    session = Session()
+    # Два курсора сразу — нужны два соединения (у SQLite курсор держит своё чтение)
+    lineup_session = Session()
+    try:
+        players = _archived_players(session, shards, shard)
+        signups, lineups = _history_queries(shards, shard)
+        signups, lineups = _stream(session, signups), _stream(lineup_session, lineups)
+        # Сливаются ивенты, а не строки: сравнение ключей одно на ивент потока
+        rows_read = accumulate(players, heapq.merge(_events(signups), _events(lineups), key=itemgetter(0)))
+    finally:
+        session.close()
+        lineup_session.close()
+
+    stats = {key: player.row() for key, player in players.items()}
+    roles = {(*key, role): count for key, player in players.items() for role, count in player.roles.items()}
+    return stats, roles, rows_read
+
+
+# ==========================================
+# ПАКЕТНЫЙ РАСЧЁТ
+# ==========================================
+
+def _write(session, stats: dict, roles: dict):
+    """Заменяет обе сводные таблицы одной транзакцией"""
+    now = datetime.utcnow()
+    session.execute(delete(AttendanceStats.__table__))
+    session.execute(delete(AttendanceRoleStats.__table__))
+    columns = ("signups", "played", "no_shows", "spectated", "not_picked", "current_streak", "best_streak", "last_played")
+    stat_rows = [
+        {"chat_id": chat_id, "user_id": user_id, **dict(zip(columns, row)), "updated_at": now}
+        for (chat_id, user_id), row in stats.items()
+    ]
+    role_rows = [
+        {"chat_id": chat_id, "user_id": user_id, "role": role, "played": played}
+        for (chat_id, user_id, role), played in roles.items()
+    ]
+    for table, rows in ((AttendanceStats.__table__, stat_rows), (AttendanceRoleStats.__table__, role_rows)):
+        for i in range(0, len(rows), WRITE_CHUNK):
+            session.execute(insert(table), rows[i:i + WRITE_CHUNK])
+
+
+def run_attendance_sync(processes: int = ATTENDANCE_PROCESSES) -> dict:
+    """Пересчитывает посещаемость по всей истории. processes=0 — по числу ядер, 1 — без пула"""
+    processes = processes or os.cpu_count() or 1
+    shards = processes * SHARDS_PER_PROCESS if processes > 1 else 1
+    started = time.perf_counter()
+
+    stats, roles, rows_read = {}, {}, 0
+    if processes > 1:
+        # spawn, а не fork: в боте уже есть потоки (пул SQLAlchemy, to_thread) — как в workers.py
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            parts = pool.map(compute_shard, [shards] * shards, range(shards))
+            for shard_stats, shard_roles, shard_rows in parts:
+                stats.update(shard_stats)
+                roles.update(shard_roles)
+                rows_read += shard_rows
+    else:
+        stats, roles, rows_read = compute_shard(1, 0)
+    computed = time.perf_counter()
+
+    session = Session()
+    try:
+        _write(session, stats, roles)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    finished = time.perf_counter()
+
+    # В карточках профиля новая посещаемость
+    notify_users_changed(None)
+    report = {
+        "players": len(stats),
+        "rows": rows_read,
+        "processes": processes,
+        "shards": shards,
+        "compute_ms": round((computed - started) * 1000, 1),
+        "write_ms": round((finished - computed) * 1000, 1),
+    }
+    metrics.observe("attendance.total_ms", (finished - started) * 1000)
+    logger.info(f"📅 Посещаемость пересчитана: {report}")
+    return report
+
+
+def backfill_sync() -> dict | None:
+    """Первый запуск с таблицей посещаемости: расчёт, если сводок ещё нет, а завершённые ивенты есть"""
+    session = Session()
+    try:
+        empty = session.execute(
+            select(AttendanceStats.user_id).limit(1).execution_options(all_tenants=True)
+        ).first() is None
+        has_history = session.execute(
+            select(Event.id).where(Event.status == 'completed').limit(1).execution_options(all_tenants=True)
+        ).first() is not None
+    finally:
+        session.close()
+    if empty and has_history:
+        return run_attendance_sync()
+    return None
+
+
+async def scheduled_attendance():
+    """Ночная задача планировщика"""
+    try:
+        await asyncio.to_thread(run_attendance_sync)
+    except Exception as e:
+        metrics.incr("attendance.failed")
+        logger.error(f"❌ Ошибка расчёта посещаемости: {e}", exc_info=True)
+
+
+async def scheduled_attendance_backfill():
+    """Разовая задача планировщика при старте"""
+    try:
+        await asyncio.to_thread(backfill_sync)
+    except Exception as e:
+        logger.error(f"❌ Ошибка расчёта посещаемости: {e}")
+
+
+# ==========================================
+# ОТЧЁТ АДМИНАМ
+# ==========================================
+
+def _rate(part: int, total: int) -> str:
+    return f"{part / total * 100:.0f}%" if total else "—"
+
+
+def build_attendance_report_sync() -> str:
+    """Отчёт по текущему сообществу из готовых сводок"""
+    session = Session()
+    try:
+        totals = session.execute(select(
+            func.count(), func.sum(AttendanceStats.signups), func.sum(AttendanceStats.played),
+            func.sum(AttendanceStats.no_shows), func.max(AttendanceStats.updated_at),
+        )).one()
+        players, signups, played, no_shows, updated_at = totals
+        if not players:
+            return "📅 <b>Посещаемость</b>\n\nДанных пока нет: расчёт идёт по ночам по завершённым ивентам."
+
+        def name(user):
+            return html.escape(user.first_name or (f"@{user.username}" if user.username else str(user.user_id)))
+
+        no_show_rate = AttendanceStats.no_shows * 1.0 / (AttendanceStats.played + AttendanceStats.no_shows)
+        unreliable = session.execute(
+            select(User, AttendanceStats)
+            .join(User, User.user_id == AttendanceStats.user_id)
+            .where(AttendanceStats.no_shows > 0, AttendanceStats.signups >= REPORT_MIN_SIGNUPS)
+            .order_by(no_show_rate.desc(), AttendanceStats.no_shows.desc())
+            .limit(REPORT_TOP)
+        ).all()
+        reliable = session.execute(
+            select(User, AttendanceStats)
+            .join(User, User.user_id == AttendanceStats.user_id)
+            .where(AttendanceStats.current_streak > 0)
+            .order_by(AttendanceStats.current_streak.desc(), AttendanceStats.played.desc())
+            .limit(REPORT_TOP)
+        ).all()
+        role_rows = session.execute(
+            select(AttendanceRoleStats.role, func.sum(AttendanceRoleStats.played))
+            .group_by(AttendanceRoleStats.role)
+            .order_by(func.sum(AttendanceRoleStats.played).desc())
+        ).all()
+    finally:
+        session.close()
+
+    lines = [
+        "📅 <b>Посещаемость</b>",
+        f"👥 Игроков: {players}, записей: {signups}, сыграно: {played} ({_rate(played, signups)}), "
+        f"неявок: {no_shows}",
+    ]
+    if unreliable:
+        lines.append(f"\n⚠️ <b>Чаще всего не приходят</b> (от {REPORT_MIN_SIGNUPS} записей):")
+        lines += [
+            f"• {name(user)}: {stats.no_shows} из {stats.played + stats.no_shows} "
+            f"({_rate(stats.no_shows, stats.played + stats.no_shows)})"
+            for user, stats in unreliable
+        ]
+    if reliable:
+        lines.append("\n✅ <b>Самые надёжные</b> (игр подряд без неявки):")
+        lines += [f"• {name(user)}: {stats.current_streak} (лучшая серия {stats.best_streak})" for user, stats in reliable]
+    if role_rows:
+        lines.append("\n🎮 <b>Игры по ролям:</b>")
+        lines += [
+            f"• {ROLE_NAMES.get(role, 'Без роли') if role != UNKNOWN_ROLE else 'Без роли'}: {count}"
+            for role, count in role_rows
+        ]
+    lines.append(f"\n🕓 Обновлено: {updated_at:%d.%m.%Y %H:%M} UTC")
+    return "\n".join(lines)
+
+
+async def attendance_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отчёт о посещаемости сообщества (ДопФункционал)"""
+    query = update.callback_query
+    await query.answer()
+
+    if not has_permission(query.from_user.id, Permission.REPORTS):
+        await query.edit_message_text("❌ Эта функция доступна только администраторам.")
+        return
+
+    try:
+        text = await asyncio.to_thread(build_attendance_report_sync)
+    except Exception as e:
+        logger.error(f"❌ Ошибка отчёта о посещаемости: {e}", exc_info=True)
+        text = "❌ Не удалось собрать отчёт."
+    keyboard = [[InlineKeyboardButton("⬅ Назад", callback_data=state.CD_MENU_SETTINGS)]]
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="пересчёт посещаемости игроков по всей истории")
+    parser.add_argument("--processes", type=int, default=ATTENDANCE_PROCESSES, help="процессов (0 — по числу ядер)")
+    args = parser.parse_args()
+    report = run_attendance_sync(args.processes)
+    print(f"📅 Игроков: {report['players']}, строк истории: {report['rows']}, "
+          f"процессов: {report['processes']}, расчёт {report['compute_ms']} мс, запись {report['write_ms']} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Онлайн-бэкапы базы данных.
+
+Копия снимается через sqlite3 backup API порциями по BACKUP_PAGES_PER_STEP страниц
+с паузой между порциями: блокировка чтения держится только на время одной порции,
+поэтому бот продолжает писать в БД. Копия проверяется PRAGMA integrity_check,
+сжимается gzip, старые архивы удаляются (ротация по BACKUP_KEEP).
+"""
+import asyncio
+import gzip
+import html
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import acl
+from acl import Permission
+from config import (
+    DB_NAME, BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP_MS, logger
+)
+import metrics
+
+BACKUP_PREFIX = "bot_users_"
+BACKUP_SUFFIX = ".db.gz"
+
+# Сколько раз копирование может начаться заново из-за записей в БД, прежде чем
+# перейти на копирование за один шаг
+MAX_RESTARTS = 3
+
+
+class BackupRestarted(Exception):
+    """Порционное копирование слишком часто перезапускается из-за записей в исходную БД"""
+
+
+def copy_database_sync(src_path: str, dst_path: str, pages: int = BACKUP_PAGES_PER_STEP,
+                       sleep_ms: float = BACKUP_STEP_SLEEP_MS) -> dict:
+    """
+    Копирует живую БД в dst_path через backup API.
+    Если исходную БД меняет другое соединение, SQLite начинает копирование заново;
+    после MAX_RESTARTS перезапусков копия снимается за один шаг.
+    """
+    progress = {"steps": 0, "restarts": 0, "remaining": None}
+
+    def on_progress(status, remaining, total):
+        progress["steps"] += 1
+        if progress["remaining"] is not None and remaining > progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > MAX_RESTARTS:
+                raise BackupRestarted()
+        progress["remaining"] = remaining
+
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    try:
+        dst = sqlite3.connect(dst_path)
+        try:
+            try:
+                src.backup(dst, pages=pages, progress=on_progress, sleep=sleep_ms / 1000)
+                progress["mode"] = "stepped"
+            except BackupRestarted:
+                logger.warning("⚠️ Бэкап перезапускался слишком часто, копируем за один шаг")
+                src.backup(dst, pages=-1)
+                progress["mode"] = "single"
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return progress
+
+
+def check_integrity_sync(path: str) -> str:
+    """Возвращает 'ok' или текст первой найденной ошибки"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _compress_sync(src_path: str, dst_path: str):
+    with open(src_path, "rb") as src, gzip.open(dst_path, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, length=1024 * 1024)
+    # Проверяем CRC архива, читая его до конца
+    with gzip.open(dst_path, "rb") as f:
+        while f.read(1024 * 1024):
+            pass
+
+
+def rotate_backups_sync(backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> list:
+    """Удаляет самые старые архивы, оставляя keep последних. Возвращает удалённые пути"""
+    files = sorted(
+        f for f in os.listdir(backup_dir)
+        if f.startswith(BACKUP_PREFIX) and f.endswith(BACKUP_SUFFIX)
+    )
+    removed = []
+    for name in files[:-keep] if keep > 0 else []:
+        path = os.path.join(backup_dir, name)
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def run_backup_sync(db_path: str = DB_NAME, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> dict:
+    """
+    Полный цикл бэкапа: копия -> проверка -> сжатие -> ротация.
+    Возвращает отчёт; при ошибке проверки архив не создаётся и выбрасывается RuntimeError.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    raw_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{timestamp}.db.tmp")
+    gz_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{timestamp}{BACKUP_SUFFIX}")
+
+    started = time.perf_counter()
+    try:
+        progress = copy_database_sync(db_path, raw_path)
+        copied = time.perf_counter()
+
+        integrity = check_integrity_sync(raw_path)
+        if integrity != "ok":
+            raise RuntimeError(f"integrity_check: {integrity}")
+        checked = time.perf_counter()
+
+        _compress_sync(raw_path, gz_path)
+        db_size = os.path.getsize(raw_path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+    finished = time.perf_counter()
+    report = {
+        "path": gz_path,
+        "db_size": db_size,
+        "gz_size": os.path.getsize(gz_path),
+        "copy_s": round(copied - started, 2),
+        "check_s": round(checked - copied, 2),
+        "compress_s": round(finished - checked, 2),
+        "total_s": round(finished - started, 2),
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "mode": progress["mode"],
+        "removed": rotate_backups_sync(backup_dir, keep),
+    }
+    metrics.incr("backup.completed")
+    metrics.observe("backup.total_s", report["total_s"])
+    return report
+
+
+def _format_size(size: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+def format_backup_report(report: dict) -> str:
+    """Текст отчёта для админов (HTML)"""
+    ratio = report["gz_size"] / report["db_size"] * 100 if report["db_size"] else 0
+    lines = [
+        "💾 <b>Бэкап базы данных</b>",
+        f"📁 <code>{os.path.basename(report['path'])}</code>",
+        f"📦 {_format_size(report['db_size'])} → {_format_size(report['gz_size'])} ({ratio:.0f}%)",
+        f"⏱ {report['total_s']} с (копия {report['copy_s']} с, проверка {report['check_s']} с, "
+        f"сжатие {report['compress_s']} с)",
+        f"🔁 Шагов: {report['steps']}, перезапусков: {report['restarts']}"
+        + (" (досняли за один шаг)" if report["mode"] == "single" else ""),
+        "✅ integrity_check: ok",
+    ]
+    if report["removed"]:
+        lines.append(f"🗑 Удалено старых копий: {len(report['removed'])}")
+    return "\n".join(lines)
+
+
+async def scheduled_backup(application):
+    """Задача планировщика: бэкап в отдельном потоке и отчёт админам"""
+    try:
+        report = await asyncio.to_thread(run_backup_sync)
+        text = format_backup_report(report)
+        logger.info(f"💾 Бэкап создан: {report['path']} ({report['total_s']} с)")
+    except Exception as e:
+        metrics.incr("backup.failed")
+        logger.error(f"❌ Ошибка бэкапа: {e}", exc_info=True)
+        text = f"❌ <b>Бэкап не удался</b>\n<code>{html.escape(str(e))}</code>"
+
+    for admin_id in acl.holders(Permission.DIAGNOSTICS):
+        try:
+            await application.bot.send_message(chat_id=admin_id, text=text, parse_mode="HTML")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось отправить отчёт о бэкапе админу {admin_id}: {e}")
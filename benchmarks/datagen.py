@@ -0,0 +1,163 @@
+"""
+datagen.py
+Генератор синтетического сообщества для бенчмарков и нагрузочных тестов.
+
+Заполняет текущую БД (DB_NAME) пользователями, ролями, ивентами, матчами и оценками.
+Строки получают chat_id текущего сообщества (tenant.use_tenant), иначе DEFAULT_TENANT_ID.
+Данные детерминированы при одинаковом seed, поэтому результаты разных коммитов сравнимы.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, delete
+
+from db import (
+    Base, Session, User, TenantMember, Event, EventParticipant, EventMatch, MatchParticipant, RoleRating,
+    ROLE_TO_MODEL, ROLE_LIST
+)
+from events.utils import DATE_FORMAT, MSK_TZ
+
+FIRST_USER_ID = 100_000
+TEAM_SIZE = 5
+
+# Доли ивентов по статусам: старые завершённые, с зафиксированным составом, будущие активные
+EVENT_STATUS_SHARES = (("completed", 0.8), ("lineup_fixed", 0.05), ("active", 0.15))
+
+
+def clear_all():
+    """Удаляет все строки из всех таблиц (в порядке зависимостей)"""
+    session = Session()
+    try:
+        for table in reversed(Base.metadata.sorted_tables):
+            session.execute(delete(table))
+        session.commit()
+    finally:
+        session.close()
+
+
+def _bulk(session, model, rows: list, chunk: int = 5000):
+    for i in range(0, len(rows), chunk):
+        session.execute(insert(model.__table__), rows[i:i + chunk])
+
+
+def _user_row(user_id: int, rnd: random.Random) -> dict:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    name = rnd.choice(letters).upper() + "".join(rnd.choice(letters) for _ in range(rnd.randint(3, 8)))
+    return {
+        "user_id": user_id,
+        "first_name": name,
+        "last_name": None,
+        "username": f"{name.lower()}{user_id}" if rnd.random() < 0.85 else None,
+    }
+
+
+def populate(users: int = 1000, events: int = 200, participants_per_event: int = 14,
+             role_share: float = 0.6, seed: int = 42, first_user_id: int = FIRST_USER_ID) -> dict:
+    """
+    Создаёт сообщество и возвращает описание сгенерированных данных:
+    user_ids, роли, id ивентов по статусам.
+    """
+    rnd = random.Random(seed)
+    session = Session()
+    try:
+        user_ids = list(range(first_user_id, first_user_id + users))
+        user_rows = [_user_row(uid, rnd) for uid in user_ids]
+        _bulk(session, User, user_rows)
+        _bulk(session, TenantMember, [{"user_id": uid} for uid in user_ids])
+
+        # --- Роли ---
+        user_role = {}
+        role_rows = {key: [] for key in ROLE_TO_MODEL}
+        for row in user_rows:
+            if rnd.random() >= role_share:
+                continue
+            role_key = rnd.choice(ROLE_LIST)
+            user_role[row["user_id"]] = role_key
+            role_rows[role_key].append({**row, "id_ml": rnd.randint(10_000_000, 99_999_999)})
+        moderators = rnd.sample(user_rows, k=max(1, users // 200))
+        role_rows["moderator"] = [{**row, "id_ml": rnd.randint(10_000_000, 99_999_999)} for row in moderators]
+        for role_key, rows in role_rows.items():
+            _bulk(session, ROLE_TO_MODEL[role_key], rows)
+
+        # --- Ивенты ---
+        now = datetime.now(MSK_TZ).replace(second=0, microsecond=0)
+        by_status = {status: [] for status, _ in EVENT_STATUS_SHARES}
+        event_rows = []
+        for i in range(events):
+            roll, status = rnd.random(), "completed"
+            for candidate, share in EVENT_STATUS_SHARES:
+                if roll < share:
+                    status = candidate
+                    break
+                roll -= share
+            if status == "active":
+                when = now + timedelta(hours=rnd.randint(1, 24 * 7))
+            else:
+                when = now - timedelta(days=rnd.randint(0 if status == "lineup_fixed" else 1, 365))
+            event_rows.append({"title": f"Игра #{i + 1}", "event_time": when.strftime(DATE_FORMAT), "status": status})
+        _bulk(session, Event, event_rows)
+        session.flush()
+        event_ids = [row[0] for row in session.query(Event.id).order_by(Event.id).all()]
+
+        participant_rows, match_rows, match_events = [], [], []
+        for event_id, row in zip(event_ids, event_rows):
+            by_status[row["status"]].append(event_id)
+            members = rnd.sample(user_ids, k=min(participants_per_event, len(user_ids)))
+            participant_rows.extend({"event_id": event_id, "user_id": uid, "status": "Active"} for uid in members)
+            if row["status"] != "active":
+                created = datetime.strptime(row["event_time"], DATE_FORMAT)
+                match_rows.append({"event_id": event_id, "created_at": created})
+                match_events.append(members)
+        _bulk(session, EventParticipant, participant_rows)
+        _bulk(session, EventMatch, match_rows)
+        session.flush()
+
+        # --- Составы и оценки ---
+        match_ids = [row[0] for row in session.query(EventMatch.id).order_by(EventMatch.id).all()]
+        mp_rows = []
+        for match_id, members in zip(match_ids, match_events):
+            for n, uid in enumerate(members):
+                team = "red" if n < TEAM_SIZE else "blue" if n < TEAM_SIZE * 2 else "spectator"
+                mp_rows.append({
+                    "match_id": match_id, "user_id": uid, "team": team,
+                    "role_played": user_role.get(uid), "played": team != "spectator",
+                })
+        _bulk(session, MatchParticipant, mp_rows)
+        session.flush()
+
+        admins = rnd.sample(user_ids, k=min(3, len(user_ids)))
+        completed_matches = set(
+            m for (m,) in session.query(EventMatch.id).join(Event).filter(Event.status == "completed").all()
+        )
+        rating_rows = []
+        for mp_id, match_id, uid, played in session.query(
+            MatchParticipant.id, MatchParticipant.match_id, MatchParticipant.user_id, MatchParticipant.played
+        ).yield_per(10_000):
+            if played and match_id in completed_matches:
+                rating_rows.append({
+                    "match_participant_id": mp_id, "user_id": uid,
+                    "rating": rnd.choices((1, 2, 3, 4, 5), weights=(1, 2, 4, 4, 2))[0],
+                    "rated_by": rnd.choice(admins),
+                })
+        _bulk(session, RoleRating, rating_rows)
+        session.commit()
+
+        return {
+            "user_ids": user_ids,
+            "user_role": user_role,
+            "events": by_status,
+            "counts": {
+                "users": len(user_rows),
+                "role_entries": sum(len(rows) for rows in role_rows.values()),
+                "events": len(event_rows),
+                "event_participants": len(participant_rows),
+                "matches": len(match_rows),
+                "match_participants": len(mp_rows),
+                "ratings": len(rating_rows),
+            },
+        }
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
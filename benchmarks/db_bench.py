@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+db_bench.py
+Бенчмарк функций работы с БД на синтетических сообществах разного размера.
+
+Для каждого размера (1k/10k/100k пользователей) временная БД заполняется
+генератором datagen, после чего каждая функция вызывается несколько раз на
+случайных входных данных (с фиксированным seed). Результаты сохраняются в JSON,
+чтобы сравнивать коммиты между собой.
+
+Запуск:
+    python -m benchmarks.db_bench --sizes 1k,10k --save before.json
+    python -m benchmarks.db_bench --sizes 1k,10k --compare before.json --threshold 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:DBBENCH")
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_dbbench_"), "bench.db"))
+
+import metrics  # noqa: E402
+from db import (  # noqa: E402
+    Session, User, ROLE_TO_MODEL, ROLE_LIST,
+    get_all_users_sync, get_role_users_sync, find_user_by_username_sync,
+    save_user_sync, get_user_statistics_sync, get_user_role_sync,
+)
+from events.handlers import load_event_detail_sync, get_mix_roles, smart_mix  # noqa: E402
+from lists_of_players import get_roles_for_users_sync  # noqa: E402
+from registration import search_users_by_letters_sync, LETTER_GROUPS  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+# Размер сообщества -> (пользователей, ивентов)
+SIZES = {
+    "1k": (1_000, 1_000),
+    "10k": (10_000, 3_000),
+    "100k": (100_000, 5_000),
+}
+
+
+def _time_calls(func, args_list: list) -> dict:
+    times = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        times.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(times)
+    return {
+        "calls": len(times),
+        "mean_ms": round(sum(times) / len(times), 3),
+        "p50_ms": round(metrics._percentile(ordered, 50), 3),
+        "p95_ms": round(metrics._percentile(ordered, 95), 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def _smart_mix_sync(user_ids: list):
+    session = Session()
+    try:
+        users = session.query(User).filter(User.user_id.in_(user_ids)).all()
+        return asyncio.run(smart_mix(users, session))
+    finally:
+        session.close()
+
+
+def _mix_roles_sync(user_ids: list):
+    session = Session()
+    try:
+        users = session.query(User).filter(User.user_id.in_(user_ids)).all()
+        return get_mix_roles(session, users)
+    finally:
+        session.close()
+
+
+def _usernames(sample_ids: list) -> list:
+    session = Session()
+    try:
+        rows = session.query(User.username).filter(
+            User.user_id.in_(sample_ids), User.username.isnot(None)
+        ).all()
+        return [row[0] for row in rows]
+    finally:
+        session.close()
+
+
+def _cases(data: dict, rnd: random.Random, repeat: int) -> dict:
+    """Набор (функция, список аргументов) на случайных, но воспроизводимых входах"""
+    user_ids = data["user_ids"]
+    role_users = list(data["user_role"])
+    sample = [rnd.choice(user_ids) for _ in range(repeat)]
+    active = data["events"]["active"] or data["events"]["completed"]
+    usernames = _usernames(sample) or ["nobody"]
+    mix_groups = [rnd.sample(user_ids, k=min(14, len(user_ids))) for _ in range(repeat)]
+
+    return {
+        "get_user_statistics_sync": (
+            get_user_statistics_sync, [(rnd.choice(role_users),) for _ in range(repeat)]
+        ),
+        "get_role_users_sync": (
+            get_role_users_sync, [(ROLE_TO_MODEL[rnd.choice(ROLE_LIST)],) for _ in range(repeat)]
+        ),
+        "find_user_by_username_sync": (
+            find_user_by_username_sync, [(rnd.choice(usernames),) for _ in range(repeat)]
+        ),
+        "save_user_sync (update)": (
+            save_user_sync, [(uid, f"Bench{uid}", None, f"bench{uid}") for uid in sample]
+        ),
+        "get_user_role_sync": (
+            get_user_role_sync, [(uid,) for uid in sample]
+        ),
+        "show_all_players: get_all_users_sync": (
+            get_all_users_sync, [() for _ in range(max(1, repeat // 10))]
+        ),
+        "show_all_players: get_roles_for_users_sync": (
+            get_roles_for_users_sync, [(rnd.sample(user_ids, k=min(10, len(user_ids))),) for _ in range(repeat)]
+        ),
+        "show_users_by_letter": (
+            search_users_by_letters_sync,
+            [(group, LETTER_GROUPS[group]) for group in (rnd.choice(list(LETTER_GROUPS)) for _ in range(repeat))]
+        ),
+        "_display_event_detail: load_event_detail_sync": (
+            load_event_detail_sync, [(rnd.choice(active), uid) for uid in sample]
+        ),
+        "smart_mix: get_mix_roles": (
+            _mix_roles_sync, [(group,) for group in mix_groups]
+        ),
+        "smart_mix": (
+            _smart_mix_sync, [(group,) for group in mix_groups]
+        ),
+    }
+
+
+def run_size(size: str, repeat: int, seed: int) -> dict:
+    users, events = SIZES[size]
+    datagen.clear_all()
+    started = time.perf_counter()
+    data = datagen.populate(users=users, events=events, seed=seed)
+    populate_s = time.perf_counter() - started
+    print(f"📦 {size}: {data['counts']} (генерация {populate_s:.1f} с)")
+
+    rnd = random.Random(seed)
+    random.seed(seed)
+    results = {}
+    for name, (func, args_list) in _cases(data, rnd, repeat).items():
+        results[name] = _time_calls(func, args_list)
+        print(f"   {name:<48}{results[name]['mean_ms']:>10.2f} ms")
+    return {"counts": data["counts"], "functions": results}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """Печатает сравнение с базовой линией и возвращает список регрессий"""
+    regressions = []
+    print(f"\n📊 Сравнение с {baseline.get('commit') or 'baseline'} (порог {threshold:.0f}%)")
+    for size, data in result["sizes"].items():
+        old_size = baseline.get("sizes", {}).get(size)
+        if not old_size:
+            continue
+        for name, stats in data["functions"].items():
+            old = old_size["functions"].get(name)
+            if not old or not old["mean_ms"]:
+                continue
+            change = (stats["mean_ms"] - old["mean_ms"]) / old["mean_ms"] * 100
+            mark = "🔺" if change > threshold else "  "
+            print(f"{mark} {size:>5} {name:<48}{old['mean_ms']:>9.2f} → {stats['mean_ms']:>9.2f} ms ({change:+.0f}%)")
+            if change > threshold:
+                regressions.append((size, name, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк функций БД на синтетических данных")
+    parser.add_argument("--sizes", default="1k,10k,100k", help=f"размеры через запятую ({', '.join(SIZES)})")
+    parser.add_argument("--repeat", type=int, default=50, help="сколько раз вызывать каждую функцию")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="сохранить результаты как JSON-baseline")
+    parser.add_argument("--compare", help="JSON-baseline для сравнения")
+    parser.add_argument("--threshold", type=float, default=20.0, help="порог регрессии, %%")
+    args = parser.parse_args()
+
+    result = {"commit": _git_commit(), "repeat": args.repeat, "seed": args.seed, "sizes": {}}
+    for size in args.sizes.split(","):
+        result["sizes"][size] = run_size(size.strip(), args.repeat, args.seed)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+dto_bench.py
+Сравнение ORM-объектов и лёгких строк (UserRow/RoleUserRow) на чтении списков.
+
+Для каждого способа чтения считается время (лучшее из --repeat) и память,
+которую занимает результат после закрытия сессии (tracemalloc), а также пик
+во время чтения. Пользователи генерируются datagen во временной БД.
+
+Запуск:
+    python -m benchmarks.dto_bench --users 100000
+    python -m benchmarks.dto_bench --users 100000 --json dto.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:DTOBENCH")
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_dtobench_"), "bench.db"))
+
+from sqlalchemy import select  # noqa: E402
+
+from db import Session, User, Middle, get_all_users_sync, get_role_users_sync  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+
+def orm_users():
+    """Как было раньше: полные ORM-объекты из закрытой сессии"""
+    session = Session()
+    try:
+        return session.query(User).all()
+    finally:
+        session.close()
+
+
+def orm_role_users():
+    session = Session()
+    try:
+        return session.query(Middle).all()
+    finally:
+        session.close()
+
+
+def row_users():
+    """Строки SQLAlchemy (Row) без преобразования"""
+    session = Session()
+    try:
+        return session.execute(select(User.user_id, User.first_name, User.last_name, User.username)).all()
+    finally:
+        session.close()
+
+
+CASES = {
+    "users: ORM User": orm_users,
+    "users: Row": row_users,
+    "users: UserRow": get_all_users_sync,
+    "role: ORM Middle": orm_role_users,
+    "role: RoleUserRow": lambda: get_role_users_sync(Middle),
+}
+
+
+def measure(func, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - started) * 1000)
+        del result
+
+    # Память считаем отдельным прогоном, чтобы трассировка не искажала время
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(result)
+    del result
+
+    retained -= before
+    return {
+        "rows": count,
+        "best_ms": round(min(times), 1),
+        "mean_ms": round(sum(times) / len(times), 1),
+        "retained_mb": round(retained / 2**20, 2),
+        "peak_mb": round((peak - before) / 2**20, 2),
+        "bytes_per_row": round(retained / count) if count else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORM-объекты против лёгких строк на чтении списков")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--role-share", type=float, default=0.6, help="доля пользователей с ролью")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    datagen.clear_all()
+    started = time.perf_counter()
+    data = datagen.populate(users=args.users, events=0, role_share=args.role_share, seed=args.seed)
+    print(f"📦 {data['counts']} (генерация {time.perf_counter() - started:.1f} с)\n")
+
+    results = {}
+    print(f"{'способ':<22}{'строк':>9}{'лучшее, мс':>13}{'среднее, мс':>14}{'держит, МБ':>13}{'пик, МБ':>10}{'Б/строку':>10}")
+    for name, func in CASES.items():
+        stats = results[name] = measure(func, args.repeat)
+        print(
+            f"{name:<22}{stats['rows']:>9}{stats['best_ms']:>13.1f}{stats['mean_ms']:>14.1f}"
+            f"{stats['retained_mb']:>13.2f}{stats['peak_mb']:>10.2f}{stats['bytes_per_row']:>10}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"users": args.users, "repeat": args.repeat, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
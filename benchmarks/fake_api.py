@@ -0,0 +1,317 @@
+"""
+fake_api.py
+Локальный фейковый Telegram Bot API для бенчмарков и нагрузочных тестов.
+
+Реализует минимум методов, нужный python-telegram-bot, чтобы бот работал как с настоящим
+Telegram: getMe, getUpdates (long polling), setWebhook/deleteWebhook (с доставкой апдейтов
+POST-запросом и заголовком секрета), sendMessage, editMessageText, answerCallbackQuery.
+Умеет имитировать задержку сети и лимиты Telegram (ответ 429 с retry_after).
+
+Подключение бота:
+    Application.builder().token(TOKEN).base_url(server.base_url)
+
+Сервер написан на голом asyncio, чтобы не тащить в проект веб-фреймворки.
+"""
+import asyncio
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl
+
+import httpx
+
+FAKE_BOT_ID = 777000
+FAKE_BOT_USERNAME = "fake_ml_manager_bot"
+
+
+def _decode_params(body: bytes, content_type: str) -> dict:
+    """PTB шлёт параметры формой, где не-строковые значения закодированы в JSON"""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode("utf-8"), keep_blank_values=True):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class FakeBotAPI:
+    """
+    Фейковый сервер Bot API.
+
+    updates кладутся через push_update(); ответы бота (sendMessage и т.п.)
+    записываются в self.calls и передаются подписчикам on_call.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, chat_rate_limit: float = 0.0, chat_burst: int = 20):
+        """
+        latency_ms       — искусственная задержка каждого метода (сеть до Telegram)
+        chat_rate_limit  — лимит сообщений в секунду на чат (0 — без лимита);
+                           при превышении отвечаем 429 с retry_after, как Telegram
+        chat_burst       — сколько сообщений можно отправить в чат пачкой
+        """
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.chat_rate_limit = chat_rate_limit
+        self.chat_burst = chat_burst
+        self._chat_buckets = {}  # chat_id -> [токены, время последнего пополнения]
+        self.stats = {"calls": 0, "rate_limited": 0}
+        self._server = None
+        self._updates = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._webhook = None  # (url, secret_token)
+        self._webhook_task = None
+        self._http = None
+        self.calls = []
+        self.on_call = []
+
+    # --- Жизненный цикл ---
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._http = httpx.AsyncClient(timeout=10)
+        return self
+
+    async def stop(self):
+        if self._webhook_task:
+            self._webhook_task.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._http:
+            await self._http.aclose()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # --- Апдейты ---
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    def push_update(self, update: dict) -> dict:
+        """Ставит апдейт в очередь (update_id проставляется, если не задан)"""
+        update.setdefault("update_id", self.next_update_id())
+        self._updates.put_nowait(update)
+        return update
+
+    async def _take_updates(self, timeout: float, limit: int = 100) -> list:
+        try:
+            first = await asyncio.wait_for(self._updates.get(), timeout=max(timeout, 0.001))
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while len(batch) < limit and not self._updates.empty():
+            batch.append(self._updates.get_nowait())
+        return batch
+
+    async def _deliver_webhook(self):
+        """Доставка апдейтов на webhook бота, как это делает Telegram"""
+        while self._webhook:
+            update = await self._updates.get()
+            url, secret = self._webhook
+            headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+            try:
+                await self._http.post(url, json=update, headers=headers)
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+                self._updates.put_nowait(update)
+
+    # --- Методы Bot API ---
+
+    def _bot_user(self) -> dict:
+        return {
+            "id": FAKE_BOT_ID, "is_bot": True, "first_name": "Fake ML Manager",
+            "username": FAKE_BOT_USERNAME, "can_join_groups": True,
+            "can_read_all_group_messages": True, "supports_inline_queries": False,
+        }
+
+    def _message(self, params: dict) -> dict:
+        chat_id = params.get("chat_id")
+        chat_type = "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": self._bot_user(),
+            "text": params.get("text", ""),
+        }
+
+    def _take_chat_token(self, chat_id):
+        """Token bucket на чат. Возвращает 0, если можно отправлять, иначе retry_after в секундах"""
+        if not self.chat_rate_limit or chat_id is None:
+            return 0
+        now = time.monotonic()
+        tokens, last = self._chat_buckets.get(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - last) * self.chat_rate_limit)
+        if tokens < 1:
+            self._chat_buckets[chat_id] = (tokens, now)
+            return max(1, int((1 - tokens) / self.chat_rate_limit + 0.999))
+        self._chat_buckets[chat_id] = (tokens - 1, now)
+        return 0
+
+    async def call(self, method: str, params: dict):
+        """Выполняет метод и возвращает (ok, result | (code, description[, parameters]))"""
+        if method != "getUpdates":
+            self.stats["calls"] += 1
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000)
+        if method in ("sendMessage", "editMessageText"):
+            retry_after = self._take_chat_token(params.get("chat_id"))
+            if retry_after:
+                self.stats["rate_limited"] += 1
+                return False, (429, f"Too Many Requests: retry after {retry_after}", {"retry_after": retry_after})
+        if method == "getMe":
+            return True, self._bot_user()
+        if method == "getUpdates":
+            if self._webhook:
+                return False, (409, "Conflict: can't use getUpdates method while webhook is active")
+            return True, await self._take_updates(float(params.get("timeout", 0)), int(params.get("limit", 100)))
+        if method == "setWebhook":
+            self._webhook = (params["url"], params.get("secret_token"))
+            if not self._webhook_task or self._webhook_task.done():
+                self._webhook_task = asyncio.create_task(self._deliver_webhook())
+            return True, True
+        if method == "deleteWebhook":
+            self._webhook = None
+            if self._webhook_task:
+                self._webhook_task.cancel()
+            return True, True
+        if method == "sendMessage":
+            return True, self._message(params)
+        if method == "editMessageText":
+            if params.get("inline_message_id"):
+                return True, True
+            message = self._message(params)
+            message["message_id"] = params.get("message_id", message["message_id"])
+            message["edit_date"] = message["date"]
+            return True, message
+        if method == "answerCallbackQuery":
+            return True, True
+        if method == "getChatAdministrators":
+            # В фейковой группе админов нет: права только у ADMIN_IDS
+            return True, []
+        return True, True
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                params = _decode_params(body, headers.get("content-type", ""))
+                ok, result = await self.call(method, params)
+                status = 200
+                if ok:
+                    payload = {"ok": True, "result": result}
+                    self.calls.append((method, params, time.perf_counter()))
+                    for callback in self.on_call:
+                        callback(method, params)
+                else:
+                    status, description = result[0], result[1]
+                    payload = {"ok": False, "error_code": status, "description": description}
+                    if len(result) > 2:
+                        payload["parameters"] = result[2]
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if ok else 'Error'}\r\n".encode("ascii")
+                    + b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode("ascii")
+                    + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Сервер останавливается посреди long polling — просто закрываем соединение
+            pass
+        finally:
+            writer.close()
+
+
+# ==========================================
+# ГЕНЕРАТОРЫ АПДЕЙТОВ
+# ==========================================
+
+def make_user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}", "username": f"player{user_id}"}
+
+
+def make_message_update(api: FakeBotAPI, user_id: int, text: str, chat: dict | None = None) -> dict:
+    """Текстовое сообщение (в ЛС, если chat не задан)"""
+    chat = chat or {"id": user_id, "type": "private", "first_name": f"Player{user_id}"}
+    message = {
+        "message_id": next(api._message_ids),
+        "date": int(time.time()),
+        "chat": chat,
+        "from": make_user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": api.next_update_id(), "message": message}
+
+
+def make_group_message_update(api: FakeBotAPI, user_id: int, group_id: int, text: str,
+                              reply_to_user_id: int | None = None) -> dict:
+    """Сообщение в группе (опционально — ответ на сообщение другого пользователя)"""
+    chat = {"id": group_id, "type": "supergroup", "title": "ML Community"}
+    update = make_message_update(api, user_id, text, chat=chat)
+    if reply_to_user_id is not None:
+        update["message"]["reply_to_message"] = {
+            "message_id": next(api._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": make_user(reply_to_user_id),
+            "text": "...",
+        }
+    return update
+
+
+def make_callback_update(api: FakeBotAPI, user_id: int, data: str) -> dict:
+    """Нажатие inline-кнопки под сообщением бота в ЛС"""
+    update_id = api.next_update_id()
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": make_user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(api._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": api._bot_user(),
+                "text": "menu",
+            },
+        },
+    }
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+loadtest.py
+Нагрузочный тест бота на локальном фейковом Bot API.
+
+Бот поднимается целиком (все хендлеры, persistence, параллельная обработка) на временной
+БД с синтетическим сообществом. Синтетические пользователи (агенты) ведут себя как живые:
+болтают в группе, спрашивают «кто», смотрят и записываются на ивенты; админы делают миксы,
+оценивают игроков и массово тегают роли.
+
+Для каждого уровня нагрузки выводятся пропускная способность, перцентили времени
+обработки и ожидания апдейтов, ошибки блокировки SQLite и ответы 429.
+
+С --double-tap P каждое нажатие кнопки с вероятностью P сразу повторяется (двойной тап):
+повтор должен склеиться с первым нажатием (throttle.py), а не выполниться второй раз.
+
+С --workers N бот работает как в режиме WORKERS=N (workers.py): этот процесс принимает
+апдейты и раздаёт их N процессам-воркерам; ошибки и очередь суммируются по воркерам.
+
+Запуск:
+    python -m benchmarks.loadtest --levels 10,100,1000 --duration 20
+    python -m benchmarks.loadtest --levels 10,100,1000 --duration 20 --workers 4
+    python -m benchmarks.loadtest --levels 100 --duration 20 --double-tap 0.3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN = "123456:LOADTEST"
+GROUP_ID = -1001234567890
+FIRST_USER_ID = 100_000
+ADMIN_COUNT = 3
+
+# Бот читает настройки из окружения при импорте
+os.environ.setdefault("BOT_TOKEN", TOKEN)
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_load_"), "load.db"))
+os.environ.setdefault("GROUP_ID", str(GROUP_ID))
+os.environ.setdefault("ADMIN_IDS", ",".join(str(FIRST_USER_ID + i) for i in range(ADMIN_COUNT)))
+os.environ.setdefault("METRICS_LOG_INTERVAL_MINUTES", "0")
+
+from telegram.ext import Application  # noqa: E402
+
+import main as bot_main  # noqa: E402
+import metrics  # noqa: E402
+from db import Session, EventMatch, MatchParticipant, ROLE_TO_MODEL  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+from benchmarks.fake_api import (  # noqa: E402
+    FakeBotAPI, make_message_update, make_group_message_update, make_callback_update
+)
+
+CHATTER = ["gg", "кто в игру?", "го катку", "я на миде", "лес свободен?", "+", "ща буду"]
+
+
+class Scenario:
+    """Общие данные для агентов: API, сгенерированное сообщество и счётчик отправленных апдейтов"""
+
+    def __init__(self, api: FakeBotAPI, data: dict, double_tap: float = 0.0, seed: int = 0):
+        self.api = api
+        self.data = data
+        self.double_tap = double_tap
+        self._rnd = random.Random(seed)
+        self.active_events = data["events"]["active"]
+        self.fixed_events = data["events"]["lineup_fixed"]
+        self.sent = 0
+        self.match_participants = self._load_match_participants()
+
+    def _load_match_participants(self) -> dict:
+        session = Session()
+        try:
+            rows = session.query(EventMatch.event_id, MatchParticipant.id).join(
+                MatchParticipant, MatchParticipant.match_id == EventMatch.id
+            ).filter(
+                EventMatch.event_id.in_(self.fixed_events),
+                MatchParticipant.team.in_(["red", "blue"]),
+            ).all()
+        finally:
+            session.close()
+        result = {}
+        for event_id, mp_id in rows:
+            result.setdefault(event_id, []).append(mp_id)
+        return result
+
+    def push(self, update: dict):
+        self.api.push_update(update)
+        self.sent += 1
+        query = update.get("callback_query")
+        if query and self.double_tap and self._rnd.random() < self.double_tap:
+            # Второе нажатие той же кнопки: новый апдейт с теми же callback_data
+            update_id = self.api.next_update_id()
+            self.api.push_update({"update_id": update_id, "callback_query": {**query, "id": str(update_id)}})
+            self.sent += 1
+
+
+# ==========================================
+# АГЕНТЫ
+# ==========================================
+
+def _player_action(sc: Scenario, user_id: int, rnd: random.Random, population: list):
+    api = sc.api
+    roll = rnd.random()
+    if roll < 0.45:
+        sc.push(make_group_message_update(api, user_id, GROUP_ID, rnd.choice(CHATTER)))
+    elif roll < 0.55:
+        sc.push(make_group_message_update(api, user_id, GROUP_ID, "кто", reply_to_user_id=rnd.choice(population)))
+    elif roll < 0.70 and sc.active_events:
+        sc.push(make_callback_update(api, user_id, f"evt_detail:{rnd.choice(sc.active_events)}"))
+    elif roll < 0.85 and sc.active_events:
+        action = rnd.choice(("event_join", "event_leave"))
+        sc.push(make_callback_update(api, user_id, f"{action}:{rnd.choice(sc.active_events)}"))
+    elif roll < 0.93:
+        sc.push(make_message_update(api, user_id, "/start"))
+        sc.push(make_callback_update(api, user_id, "menu_crm"))
+    else:
+        role_key = rnd.choice(list(ROLE_TO_MODEL))
+        sc.push(make_callback_update(api, user_id, f"teg_role:{role_key}:1"))
+
+
+def _admin_action(sc: Scenario, user_id: int, rnd: random.Random):
+    api = sc.api
+    roll = rnd.random()
+    if roll < 0.35 and sc.active_events:
+        event_id = rnd.choice(sc.active_events)
+        sc.push(make_callback_update(api, user_id, f"event_mix:{event_id}"))
+        for _ in range(rnd.randint(1, 3)):
+            sc.push(make_callback_update(api, user_id, f"event_mix_again:{event_id}"))
+    elif roll < 0.65 and sc.match_participants:
+        event_id = rnd.choice(list(sc.match_participants))
+        sc.push(make_callback_update(api, user_id, f"event_rate:{event_id}"))
+        for mp_id in sc.match_participants[event_id]:
+            sc.push(make_callback_update(api, user_id, f"rate_user:{mp_id}:{rnd.randint(1, 5)}"))
+    elif roll < 0.80:
+        role_key = rnd.choice(list(ROLE_TO_MODEL))
+        sc.push(make_callback_update(api, user_id, f"teg_all:{role_key}"))
+    else:
+        sc.push(make_callback_update(api, user_id, f"menu_players:{rnd.randint(1, 5)}"))
+
+
+async def agent(sc: Scenario, user_id: int, is_admin: bool, stop_at: float,
+                think_time: float, population: list, seed: int):
+    rnd = random.Random(seed)
+    # Разносим старт агентов, чтобы не было синхронного залпа
+    await asyncio.sleep(rnd.uniform(0, think_time))
+    while time.monotonic() < stop_at:
+        if is_admin:
+            _admin_action(sc, user_id, rnd)
+        else:
+            _player_action(sc, user_id, rnd, population)
+        await asyncio.sleep(rnd.expovariate(1 / think_time))
+
+
+# ==========================================
+# ПРОГОН УРОВНЯ
+# ==========================================
+
+def _filtered(counters: dict) -> int:
+    """Апдейты, отсеянные throttle.py до обработки"""
+    return counters.get("throttle.dropped", 0) + counters.get("throttle.coalesced", 0)
+
+
+async def _drain(sc: Scenario, timeout: float) -> bool:
+    """Ждёт, пока бот обработает (или отсеет) все отправленные апдейты"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        counters = metrics.snapshot()["counters"]
+        if counters.get("updates.processed", 0) + _filtered(counters) >= sc.sent:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def run_level(sc: Scenario, users: int, duration: float, think_time: float, seed: int, ingress=None) -> dict:
+    metrics.reset()
+    if ingress is not None:
+        await ingress.worker_metrics(reset=True)
+    sc.sent = 0
+    sc.api.stats.update(calls=0, rate_limited=0)
+
+    population = sc.data["user_ids"][:users]
+    admins = set(population[:ADMIN_COUNT])
+    started = time.monotonic()
+    stop_at = started + duration
+    await asyncio.gather(*(
+        agent(sc, uid, uid in admins, stop_at, think_time, population, seed + uid)
+        for uid in population
+    ))
+    drained = await _drain(sc, timeout=max(30.0, duration * 3))
+    elapsed = time.monotonic() - started
+
+    snap = metrics.snapshot()
+    counters = snap["counters"]
+    max_queue = snap["gauges"].get("updates.max_waiting", 0)
+    if ingress is not None:
+        # Ошибки и очереди — в процессах-воркерах
+        for worker in await ingress.worker_metrics():
+            for name in ("db.locked_errors", "errors.unhandled", "throttle.dropped", "throttle.coalesced"):
+                counters[name] = counters.get(name, 0) + worker["counters"].get(name, 0)
+            max_queue = max(max_queue, worker["gauges"].get("updates.max_waiting", 0))
+    processed = counters.get("updates.processed", 0)
+    return {
+        "users": users,
+        "duration_s": round(elapsed, 2),
+        "drained": drained,
+        "updates_sent": sc.sent,
+        "updates_processed": processed,
+        "throttle_dropped": counters.get("throttle.dropped", 0),
+        "throttle_coalesced": counters.get("throttle.coalesced", 0),
+        "throughput_per_s": round(processed / elapsed, 1) if elapsed else 0,
+        "handler_ms": snap["histograms"].get("updates.duration_ms", {}),
+        "wait_ms": snap["histograms"].get("updates.wait_ms", {}),
+        "max_queue": max_queue,
+        "sqlite_locked_errors": counters.get("db.locked_errors", 0),
+        "unhandled_errors": counters.get("errors.unhandled", 0),
+        "api_calls": sc.api.stats["calls"],
+        "api_429": sc.api.stats["rate_limited"],
+    }
+
+
+def _print_report(results: list):
+    header = (f"{'users':>6}{'sent':>8}{'done':>8}{'upd/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'wait95':>9}{'queue':>7}{'locked':>8}{'errors':>8}{'429':>6}{'drop':>6}{'merge':>7}")
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        h, w = r["handler_ms"], r["wait_ms"]
+        print(f"{r['users']:>6}{r['updates_sent']:>8}{r['updates_processed']:>8}{r['throughput_per_s']:>8}"
+              f"{h.get('p50', 0):>9.1f}{h.get('p95', 0):>9.1f}{h.get('p99', 0):>9.1f}"
+              f"{w.get('p95', 0):>9.1f}{r['max_queue']:>7}{r['sqlite_locked_errors']:>8}"
+              f"{r['unhandled_errors']:>8}{r['api_429']:>6}{r['throttle_dropped']:>6}{r['throttle_coalesced']:>7}")
+
+
+async def amain(args):
+    levels = [int(x) for x in args.levels.split(",")]
+    # Лог каждого HTTP-запроса к фейковому API только мешает читать отчёт
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    datagen.clear_all()
+    data = datagen.populate(users=max(levels), events=args.events, seed=args.seed)
+    print(f"📦 Сообщество: {data['counts']}")
+
+    api = FakeBotAPI(latency_ms=args.latency_ms, chat_rate_limit=args.chat_rate)
+    await api.start()
+    builder = Application.builder().token(TOKEN).base_url(api.base_url)
+    application = bot_main.build_application(builder)
+    await application.initialize()
+    ingress = None
+    if args.workers:
+        from workers import Ingress
+        ingress = Ingress(application, args.workers, base_url=api.base_url)
+        await ingress.start()
+    else:
+        await application.start()
+    await application.updater.start_polling(
+        poll_interval=0, timeout=1, allowed_updates=bot_main.derive_allowed_updates(application)
+    )
+    sc = Scenario(api, data, double_tap=args.double_tap, seed=args.seed)
+    results = []
+    try:
+        for users in levels:
+            print(f"▶️  {users} пользователей, {args.duration} с...")
+            results.append(await run_level(sc, users, args.duration, args.think_time, args.seed, ingress))
+    finally:
+        await application.updater.stop()
+        if ingress is not None:
+            await ingress.stop()
+        else:
+            await application.stop()
+        await application.shutdown()
+        await api.stop()
+
+    _print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на фейковом Bot API")
+    parser.add_argument("--levels", default="10,100,1000", help="число пользователей через запятую")
+    parser.add_argument("--duration", type=float, default=20, help="длительность уровня, сек")
+    parser.add_argument("--think-time", type=float, default=2.0, help="средняя пауза агента между действиями, сек")
+    parser.add_argument("--events", type=int, default=200, help="сколько ивентов сгенерировать")
+    parser.add_argument("--latency-ms", type=float, default=0, help="задержка каждого вызова Bot API, мс")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="лимит сообщений в секунду на чат (0 — без лимита)")
+    parser.add_argument("--workers", type=int, default=0, help="процессов-воркеров (0 — один процесс, как без WORKERS)")
+    parser.add_argument("--double-tap", type=float, default=0.0, help="доля нажатий кнопок, повторённых сразу (двойной тап)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    asyncio.run(amain(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+query_bench.py
+Накладные расходы горячих запросов: legacy session.query(...).filter_by(...)
+против готовых select() с bindparam из db.py.
+
+Каждая пара вызывается на одних и тех же случайных входах (фиксированный seed).
+Функции events/utils.py получают одну сессию на все вызовы, identity map
+очищается после каждого вызова, чтобы каждый раз выполнялся SQL.
+Функции db.py вызываются целиком, как из хендлеров (со своей сессией).
+
+Запуск:
+    python -m benchmarks.query_bench --users 10000 --calls 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:QUERYBENCH")
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_querybench_"), "bench.db"))
+
+from sqlalchemy.exc import LegacyAPIWarning  # noqa: E402
+
+from db import (  # noqa: E402
+    Session, Event, EventParticipant, EventMatch, User, ROLE_TO_MODEL, OPEN_EVENT_STATUSES,
+    get_user_role_sync, find_user_by_username_sync, get_event_with_lineup_sync, get_user_sync,
+)
+from events import utils  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+
+# ==========================================
+# LEGACY-ВЕРСИИ (как было до готовых запросов)
+# ==========================================
+
+# Query.get() намеренно оставлен как в старом коде
+warnings.filterwarnings("ignore", category=LegacyAPIWarning)
+
+
+def legacy_get_event_by_id(session, event_id):
+    return session.query(Event).get(event_id)
+
+
+def legacy_get_upcoming_events(session):
+    return session.query(Event).filter(Event.status.in_(OPEN_EVENT_STATUSES)).order_by(Event.event_time).all()
+
+
+def legacy_get_event_participants(session, event_id):
+    return session.query(EventParticipant).filter_by(event_id=event_id).all()
+
+
+def legacy_is_user_participant(session, event_id, user_id):
+    return session.query(EventParticipant).filter_by(event_id=event_id, user_id=user_id).first() is not None
+
+
+def legacy_count_event_participants(session, event_id):
+    return session.query(EventParticipant).filter_by(event_id=event_id).count()
+
+
+def legacy_get_user_role(session, user_id):
+    for role_key, model in ROLE_TO_MODEL.items():
+        if session.query(model).filter_by(user_id=user_id).first():
+            return role_key
+    return None
+
+
+def legacy_get_user_role_sync(user_id):
+    session = Session()
+    try:
+        return legacy_get_user_role(session, user_id)
+    finally:
+        session.close()
+
+
+def legacy_find_user_by_username_sync(username):
+    session = Session()
+    try:
+        return session.query(User).filter(User.username == username.lstrip('@')).first()
+    finally:
+        session.close()
+
+
+def legacy_get_event_with_lineup_sync(event_id):
+    session = Session()
+    try:
+        return session.query(EventMatch).filter_by(event_id=event_id).first() is not None
+    finally:
+        session.close()
+
+
+def legacy_get_user_sync(user_id):
+    session = Session()
+    try:
+        return session.query(User).filter_by(user_id=user_id).first()
+    finally:
+        session.close()
+
+
+# ==========================================
+# ЗАМЕРЫ
+# ==========================================
+
+def _time_session_calls(func, args_list: list) -> float:
+    """Мкс на вызов с общей сессией; identity map очищается вне замера"""
+    session = Session()
+    total = 0.0
+    try:
+        for args in args_list:
+            started = time.perf_counter()
+            func(session, *args)
+            total += time.perf_counter() - started
+            session.expunge_all()
+    finally:
+        session.close()
+    return total / len(args_list) * 1e6
+
+
+def _time_calls(func, args_list: list) -> float:
+    started = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - started) / len(args_list) * 1e6
+
+
+def _usernames(user_ids: list) -> list:
+    session = Session()
+    try:
+        rows = session.query(User.username).filter(User.user_id.in_(user_ids), User.username.isnot(None)).all()
+        return [row[0] for row in rows] or ["nobody"]
+    finally:
+        session.close()
+
+
+def run(users: int, events: int, calls: int, seed: int) -> dict:
+    datagen.clear_all()
+    data = datagen.populate(users=users, events=events, seed=seed)
+    print(f"📦 {data['counts']}\n")
+
+    rnd = random.Random(seed)
+    event_ids = [eid for ids in data["events"].values() for eid in ids]
+    user_ids = data["user_ids"]
+    pairs = [(rnd.choice(event_ids), rnd.choice(user_ids)) for _ in range(calls)]
+    event_args = [(event_id,) for event_id, _ in pairs]
+    user_args = [(user_id,) for _, user_id in pairs]
+    usernames = _usernames([user_id for _, user_id in pairs[:500]])
+    username_args = [(rnd.choice(usernames),) for _ in range(calls)]
+
+    session_cases = {
+        "utils.get_event_by_id": (legacy_get_event_by_id, utils.get_event_by_id, event_args),
+        "utils.get_upcoming_events": (
+            legacy_get_upcoming_events, utils.get_upcoming_events, [()] * max(1, calls // 20)
+        ),
+        "utils.get_event_participants": (
+            legacy_get_event_participants, utils.get_event_participants, event_args
+        ),
+        "utils.is_user_participant": (legacy_is_user_participant, utils.is_user_participant, pairs),
+        "utils.count_event_participants": (
+            legacy_count_event_participants, utils.count_event_participants, event_args
+        ),
+        "utils.get_user_role": (legacy_get_user_role, utils.get_user_role, user_args),
+    }
+    plain_cases = {
+        "db.get_user_role_sync": (legacy_get_user_role_sync, get_user_role_sync, user_args),
+        "db.find_user_by_username_sync": (
+            legacy_find_user_by_username_sync, find_user_by_username_sync, username_args
+        ),
+        "db.get_user_sync": (legacy_get_user_sync, get_user_sync, user_args),
+        "db.get_event_with_lineup_sync": (
+            legacy_get_event_with_lineup_sync, get_event_with_lineup_sync, event_args
+        ),
+    }
+
+    results = {}
+    print(f"{'функция':<34}{'было, мкс':>12}{'стало, мкс':>13}{'ускорение':>11}")
+    for cases, timer in ((session_cases, _time_session_calls), (plain_cases, _time_calls)):
+        for name, (legacy, current, args_list) in cases.items():
+            # Прогрев: первый вызов компилирует SQL и заполняет кэш
+            timer(legacy, args_list[:5])
+            timer(current, args_list[:5])
+            before = timer(legacy, args_list)
+            after = timer(current, args_list)
+            results[name] = {"before_us": round(before, 1), "after_us": round(after, 1)}
+            print(f"{name:<34}{before:>12.1f}{after:>13.1f}{before / after:>10.2f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="legacy Query API против готовых select() на горячих запросах")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=1_000)
+    parser.add_argument("--calls", type=int, default=2_000, help="вызовов каждой функции")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = run(args.users, args.events, args.calls, args.seed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"users": args.users, "events": args.events, "calls": args.calls, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
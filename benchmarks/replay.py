@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+replay.py
+Детерминированное воспроизведение записанных апдейтов (см. recorder.py) через полный стек хендлеров.
+
+Апдейты прогоняются по одному, в записанном порядке, против временной копии БД и
+фейкового Bot API, с фиксированным seed для random (микс команд). Каждый идёт через
+update processor, как в боте (и в workers._Worker._process): троттлинг, очередь по ключам,
+единица работы и сброс сообщества — поэтому отсеянные троттлингом нажатия не доходят
+до хендлеров и в отчёте видны отдельно. Для каждого хендлера считается время выполнения
+и число SQL-запросов, поэтому два коммита можно сравнить на одной и той же реальной нагрузке.
+
+Запуск:
+    python -m benchmarks.replay updates.jsonl --db bot_users.db --json after.json
+    python -m benchmarks.replay updates.jsonl --db bot_users.db --compare before.json
+    python -m benchmarks.replay updates.jsonl --db bot_users.db --pace recorded --speed 10
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN = "123456:REPLAY"
+OUTSIDE_HANDLERS = "(вне хендлеров)"
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов")
+    parser.add_argument("recording", help="JSONL-файл, записанный UpdateRecorder")
+    parser.add_argument("--db", help="исходная БД; воспроизведение идёт на её временной копии (по умолчанию — пустая БД)")
+    parser.add_argument("--pace", choices=("fast", "recorded"), default="fast",
+                        help="fast — без пауз, recorded — с записанными интервалами")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение для --pace recorded")
+    parser.add_argument("--limit", type=int, default=0, help="воспроизвести только первые N апдейтов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    return parser.parse_args()
+
+
+def _scratch_copy(source: str | None) -> str:
+    """Копия БД через backup API (безопасно даже при работающем боте)"""
+    path = os.path.join(tempfile.mkdtemp(prefix="mlbot_replay_"), "replay.db")
+    if source:
+        src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    return path
+
+
+ARGS = _parse_args() if __name__ == "__main__" else None
+
+# Бот читает настройки из окружения при импорте — подменяем БД и токен до импорта
+os.environ["DB_NAME"] = _scratch_copy(ARGS.db if ARGS else None)
+os.environ["BOT_TOKEN"] = TOKEN
+os.environ["UPDATE_RECORD_PATH"] = ""
+
+from sqlalchemy import event  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+import db  # noqa: E402
+import main as bot_main  # noqa: E402
+import metrics  # noqa: E402
+from benchmarks.fake_api import FakeBotAPI  # noqa: E402
+
+# Статистика текущего хендлера; asyncio.to_thread копирует контекст, так что запросы из потоков
+# попадают в тот же словарь
+_current = contextvars.ContextVar("replay_handler_stats", default=None)
+
+
+class HandlerStats:
+    def __init__(self):
+        self.by_handler = {}
+
+    def entry(self, name: str) -> dict:
+        stats = self.by_handler.get(name)
+        if stats is None:
+            stats = self.by_handler[name] = {"calls": 0, "times_ms": [], "queries": 0}
+        return stats
+
+    def on_query(self, *args):
+        stats = _current.get()
+        (stats or self.entry(OUTSIDE_HANDLERS))["queries"] += 1
+
+    def wrap(self, callback):
+        name = getattr(callback, "__name__", type(callback).__name__)
+
+        @functools.wraps(callback)
+        async def timed(update, context):
+            stats = self.entry(name)
+            token = _current.set(stats)
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                stats["calls"] += 1
+                stats["times_ms"].append((time.perf_counter() - started) * 1000)
+                _current.reset(token)
+
+        return timed
+
+    def report(self) -> dict:
+        result = {}
+        for name, stats in self.by_handler.items():
+            times = sorted(stats["times_ms"])
+            calls = stats["calls"]
+            result[name] = {
+                "calls": calls,
+                "total_ms": round(sum(times), 2),
+                "mean_ms": round(sum(times) / calls, 3) if calls else 0.0,
+                "p95_ms": round(metrics._percentile(times, 95), 3),
+                "queries": stats["queries"],
+                "queries_per_call": round(stats["queries"] / calls, 2) if calls else float(stats["queries"]),
+            }
+        return result
+
+
+def _instrument(application: Application, stats: HandlerStats):
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = stats.wrap(handler.callback)
+
+
+def _load_recording(path: str, limit: int) -> list[dict]:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+                if limit and len(records) >= limit:
+                    break
+    return records
+
+
+async def replay(args) -> dict:
+    random.seed(args.seed)
+    records = _load_recording(args.recording, args.limit)
+    stats = HandlerStats()
+    event.listen(db.engine, "before_cursor_execute", stats.on_query)
+
+    async with FakeBotAPI() as api:
+        builder = Application.builder().token(TOKEN).base_url(api.base_url)
+        application = bot_main.build_application(builder)
+        _instrument(application, stats)
+        await application.initialize()
+        try:
+            started = time.perf_counter()
+            first_ts = records[0]["ts"] if records else 0
+            for record in records:
+                if args.pace == "recorded":
+                    delay = (record["ts"] - first_ts) / args.speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                update = Update.de_json(record["update"], application.bot)
+                await application.update_processor.process_update(update, application.process_update(update))
+            elapsed = time.perf_counter() - started
+        finally:
+            await application.shutdown()
+    event.remove(db.engine, "before_cursor_execute", stats.on_query)
+
+    handlers = stats.report()
+    counters = metrics.snapshot()["counters"]
+    return {
+        "recording": os.path.basename(args.recording),
+        "updates": len(records),
+        "elapsed_s": round(elapsed, 3),
+        "errors": counters.get("errors.unhandled", 0),
+        "throttled": counters.get("throttle.dropped", 0) + counters.get("throttle.coalesced", 0),
+        "api_calls": api.stats["calls"],
+        "queries": sum(h["queries"] for h in handlers.values()),
+        "handlers": handlers,
+    }
+
+
+def _delta(new: float, old: float | None) -> str:
+    if old is None:
+        return "new"
+    if not old:
+        return "—" if not new else "+∞"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def _print_report(result: dict, baseline: dict | None):
+    print(f"\n📼 {result['recording']}: {result['updates']} апдейтов за {result['elapsed_s']} с, "
+          f"{result['queries']} SQL-запросов, {result['api_calls']} вызовов API, ошибок: {result['errors']}, "
+          f"отсеяно троттлингом: {result.get('throttled', 0)}")
+    header = f"{'handler':<28}{'calls':>7}{'total ms':>11}{'mean ms':>10}{'p95 ms':>10}{'q/call':>8}"
+    if baseline:
+        header += f"{'Δ mean':>9}{'Δ q/call':>10}"
+    print(header)
+    print("-" * len(header))
+    old_handlers = (baseline or {}).get("handlers", {})
+    for name, h in sorted(result["handlers"].items(), key=lambda item: -item[1]["total_ms"]):
+        line = (f"{name[:27]:<28}{h['calls']:>7}{h['total_ms']:>11.1f}{h['mean_ms']:>10.2f}"
+                f"{h['p95_ms']:>10.2f}{h['queries_per_call']:>8}")
+        if baseline:
+            old = old_handlers.get(name, {})
+            line += f"{_delta(h['mean_ms'], old.get('mean_ms')):>9}"
+            line += f"{_delta(h['queries_per_call'], old.get('queries_per_call')):>10}"
+        print(line)
+
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    result = asyncio.run(replay(ARGS))
+    baseline = None
+    if ARGS.compare:
+        with open(ARGS.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_report(result, baseline)
+    if ARGS.json:
+        with open(ARGS.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
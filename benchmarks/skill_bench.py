@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+skill_bench.py
+Пакетный пересчёт рейтинга навыка (skill.py) на большой истории.
+
+По умолчанию история генерируется сразу в памяти (без БД): игроки с «истинным» навыком
+по ролям, матчи (дрейф) и 1–3 оценки админов за каждый. Замеряются NumPy-пересчёт и
+эталонный цикл, результаты сравниваются. С --db история записывается во временную БД
+генератором datagen, и замеряется весь recompute_sync: чтение, расчёт, запись таблицы.
+
+Запуск:
+    python -m benchmarks.skill_bench --ratings 1000000
+    python -m benchmarks.skill_bench --ratings 1000000 --db
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:SKILLBENCH")
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_skill_"), "skill.db"))
+
+import skill  # noqa: E402
+from db import ROLE_LIST  # noqa: E402
+
+
+def synthetic_history(ratings: int, players: int, tenants: int, seed: int) -> skill.History:
+    """История в памяти: примерно ratings оценок, по 1–3 за каждый сыгранный матч"""
+    rnd = random.Random(seed)
+    history = skill.History()
+    roles = ROLE_LIST + [skill.UNKNOWN_ROLE]
+    true_skill = {}
+    rows = []
+    when, row_id, graded = 2_460_000.0, 0, 0
+    while graded < ratings:
+        chat_id = -1000 - rnd.randrange(tenants)
+        user_id = 100_000 + rnd.randrange(players)
+        role = roles[user_id % len(roles)]
+        key = (chat_id, user_id, role)
+        level = true_skill.setdefault(key, rnd.gauss(3.0, 0.7))
+        when += 1e-4
+        row_id += 1
+        rows.append((chat_id, user_id, role, when, skill.pack(skill.DRIFT, row_id, 0)))
+        for _ in range(rnd.choice((1, 1, 2, 3))):
+            row_id += 1
+            grade = min(5, max(1, round(rnd.gauss(level, 1.0))))
+            rows.append((chat_id, user_id, role, when, skill.pack(skill.GRADE, row_id, grade)))
+            graded += 1
+    history.extend(rows)
+    return history
+
+
+def graded_count(history: skill.History) -> int:
+    return sum(1 for seq in history.seq if seq >> skill.KIND_SHIFT == skill.GRADE)
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def bench_memory(args) -> dict:
+    history, build_ms = _timed(synthetic_history, args.ratings, args.players, args.tenants, args.seed)
+    result = {"events": len(history), "ratings": graded_count(history), "build_ms": round(build_ms)}
+    print(f"📦 История: событий {result['events']}, оценок {result['ratings']} ({build_ms:.0f} мс)")
+
+    (fast, quality), numpy_ms = _timed(skill.compute_numpy, history)
+    result.update(numpy_ms=round(numpy_ms, 1), skills=len(fast), quality=quality)
+    print(f"⚡ NumPy: {numpy_ms:.0f} мс, навыков {len(fast)}, прогноз {quality}")
+
+    if not args.skip_python:
+        (slow, _), python_ms = _timed(skill.compute_python, history)
+        diff = max(abs(fast[k].mu - slow[k].mu) + abs(fast[k].variance - slow[k].variance) for k in slow)
+        result.update(python_ms=round(python_ms, 1), speedup=round(python_ms / numpy_ms, 1), max_diff=diff)
+        print(f"🐢 Цикл: {python_ms:.0f} мс, ускорение x{python_ms / numpy_ms:.1f}, расхождение {diff:.2e}")
+    return result
+
+
+def bench_db(args) -> dict:
+    from benchmarks import datagen
+    # datagen: 10 игроков в матче, 80% ивентов завершены и оценены — ~8 оценок на ивент
+    events = max(1, args.ratings // 8)
+    _, populate_ms = _timed(datagen.populate, args.players, events, 14, 0.6, args.seed)
+    print(f"📦 БД заполнена за {populate_ms / 1000:.0f} с ({events} ивентов)")
+    stats, total_ms = _timed(skill.recompute_sync)
+    stats["total_ms"] = round(total_ms, 1)
+    print(f"🗃 recompute_sync: {total_ms:.0f} мс — чтение {stats['load_ms']} мс, расчёт {stats['compute_ms']} мс, "
+          f"запись {stats['write_ms']} мс; событий {stats['events']}, оценок {stats['graded']}, навыков {stats['skills']}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="пакетный пересчёт рейтинга навыка")
+    parser.add_argument("--ratings", type=int, default=1_000_000, help="сколько оценок в истории")
+    parser.add_argument("--players", type=int, default=20_000)
+    parser.add_argument("--tenants", type=int, default=5, help="сообществ (только для истории в памяти)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-python", action="store_true", help="не запускать эталонный цикл")
+    parser.add_argument("--db", action="store_true", help="через временную БД: чтение + расчёт + запись")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    result = bench_db(args) if args.db else bench_memory(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
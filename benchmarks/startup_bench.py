@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+startup_bench.py
+Время запуска: импорты, сборка Application и инициализация БД.
+
+Каждый прогон — отдельный процесс python (холодный интерпретатор, кэш .pyc уже есть).
+Замеряются фазы:
+    import_config   — import config
+    import_db       — import db (без подключения к БД)
+    init_db_miss    — db.init_db() на новой БД: create_all + миграции
+    init_db_hit     — db.init_db() на готовой БД: отпечаток схемы совпал
+    import_main     — import main (хендлеры ещё не загружены)
+    build_app       — main.build_application()
+    preload         — догрузка модулей хендлеров (в боте идёт в фоне после старта)
+    ready           — import_main + build_app + init_db_hit: до приёма первого апдейта
+
+--budget задаёт бюджет на медиану ready в мс: при превышении код выхода 1,
+так проверку можно вставить в CI или pre-commit.
+
+Запуск:
+    python -m benchmarks.startup_bench --runs 7
+    python -m benchmarks.startup_bench --runs 7 --budget 1200
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Выполняется в дочернем процессе; печатает фазы в мс одной строкой JSON
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+phases = {{}}
+
+def timed(name, func):
+    started = time.perf_counter()
+    result = func()
+    phases[name] = (time.perf_counter() - started) * 1000
+    return result
+
+if {mode!r} == "db":
+    timed("import_config", lambda: __import__("config"))
+    db = timed("import_db", lambda: __import__("db"))
+    timed({init_phase!r}, db.init_db)
+else:
+    main = timed("import_main", lambda: __import__("main"))
+    timed("build_app", main.build_application)
+    import db
+    timed("init_db_hit", db.init_db)
+    import lazy
+    phases["preload"] = lazy.preload_sync()
+print(json.dumps(phases))
+"""
+
+
+def run_child(mode: str, db_path: str, init_phase: str = "init_db_hit") -> dict:
+    env = dict(os.environ, BOT_TOKEN="123456:STARTUPBENCH", DB_NAME=db_path)
+    code = CHILD.format(root=ROOT, mode=mode, init_phase=init_phase)
+    out = subprocess.run(
+        [sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(runs: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="mlbot_startup_")
+    samples = {}
+
+    def add(phases: dict):
+        for name, value in phases.items():
+            samples.setdefault(name, []).append(value)
+
+    # Прогрев: компиляция .pyc и создание общей БД
+    shared_db = os.path.join(tmp, "shared.db")
+    run_child("db", shared_db, "init_db_miss")
+    run_child("app", shared_db)
+
+    for i in range(runs):
+        add(run_child("db", os.path.join(tmp, f"fresh_{i}.db"), "init_db_miss"))
+        add(run_child("db", shared_db, "init_db_hit"))
+        phases = run_child("app", shared_db)
+        phases["ready"] = phases["import_main"] + phases["build_app"] + phases["init_db_hit"]
+        add(phases)
+
+    return {
+        name: {"median_ms": round(statistics.median(values), 1), "max_ms": round(max(values), 1)}
+        for name, values in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="время запуска бота по фазам")
+    parser.add_argument("--runs", type=int, default=5, help="прогонов каждой фазы (каждый — новый процесс)")
+    parser.add_argument("--budget", type=float, help="бюджет на медиану ready, мс (превышение -> код выхода 1)")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    print(f"{'фаза':<16}{'медиана, мс':>13}{'макс, мс':>11}")
+    for name, stats in results.items():
+        print(f"{name:<16}{stats['median_ms']:>13.1f}{stats['max_ms']:>11.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    if args.budget is not None:
+        ready = results["ready"]["median_ms"]
+        if ready > args.budget:
+            print(f"\n❌ Запуск {ready:.0f} мс — бюджет {args.budget:.0f} мс превышен")
+            sys.exit(1)
+        print(f"\n✅ Запуск {ready:.0f} мс — в пределах бюджета {args.budget:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
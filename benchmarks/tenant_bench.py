@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+tenant_bench.py
+Стоимость запросов одного сообщества при росте числа сообществ в базе.
+
+В БД последовательно добавляются сообщества одинакового размера (свои игроки,
+роли, ивенты, матчи и оценки). После каждого шага замеряются горячие запросы
+внутри первого сообщества (tenant.use_tenant). Индексы ведут по chat_id, поэтому
+время на вызов должно оставаться почти постоянным, пока общий объём данных растёт.
+
+Запуск:
+    python -m benchmarks.tenant_bench --levels 1,10,50 --users 300 --events 100
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:TENANTBENCH")
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_tenantbench_"), "bench.db"))
+
+from db import (  # noqa: E402
+    Session, get_all_users_sync, get_user_role_sync, get_user_statistics_sync, find_user_by_username_sync,
+)
+from events import utils  # noqa: E402
+from tenant import use_tenant  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+FIRST_CHAT_ID = -1_000_000_000_000
+
+
+def _time_calls(func, args_list: list) -> float:
+    started = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - started) / len(args_list) * 1e6
+
+
+def _with_session(func):
+    def call(*args):
+        session = Session()
+        try:
+            return func(session, *args)
+        finally:
+            session.close()
+    return call
+
+
+def _add_tenant(index: int, users: int, events: int) -> dict:
+    chat_id = FIRST_CHAT_ID - index
+    with use_tenant(chat_id):
+        data = datagen.populate(
+            users=users, events=events, seed=index, first_user_id=datagen.FIRST_USER_ID + index * users
+        )
+    data["chat_id"] = chat_id
+    return data
+
+
+def _measure(data: dict, calls: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    user_ids = data["user_ids"]
+    event_ids = [eid for ids in data["events"].values() for eid in ids]
+    user_args = [(rnd.choice(user_ids),) for _ in range(calls)]
+    pair_args = [(rnd.choice(event_ids), rnd.choice(user_ids)) for _ in range(calls)]
+    list_args = [()] * max(1, calls // 20)
+
+    with use_tenant(data["chat_id"]):
+        usernames = [row.username for row in get_all_users_sync() if row.username] or ["nobody"]
+        cases = {
+            "utils.get_upcoming_events": (_with_session(utils.get_upcoming_events), list_args),
+            "utils.is_user_participant": (_with_session(utils.is_user_participant), pair_args),
+            "db.get_all_users_sync": (get_all_users_sync, list_args),
+            "db.find_user_by_username_sync": (
+                find_user_by_username_sync, [(rnd.choice(usernames),) for _ in range(calls)]
+            ),
+            "db.get_user_role_sync": (get_user_role_sync, user_args),
+            "db.get_user_statistics_sync": (get_user_statistics_sync, user_args),
+        }
+        results = {}
+        for name, (func, args_list) in cases.items():
+            _time_calls(func, args_list[:5])  # прогрев: компиляция SQL
+            results[name] = round(_time_calls(func, args_list), 1)
+    return results
+
+
+def run(levels: list[int], users: int, events: int, calls: int, seed: int) -> dict:
+    datagen.clear_all()
+    first = _add_tenant(0, users, events)
+    tenants = 1
+    report = {}
+    for level in levels:
+        while tenants < level:
+            _add_tenant(tenants, users, events)
+            tenants += 1
+        report[level] = _measure(first, calls, seed)
+        print(f"🏘 сообществ: {tenants}, игроков всего: {tenants * users}, ивентов всего: {tenants * events}")
+
+    names = list(report[levels[0]])
+    print(f"\n{'функция, мкс/вызов':<32}" + "".join(f"{level:>10}" for level in levels))
+    for name in names:
+        print(f"{name:<32}" + "".join(f"{report[level][name]:>10.1f}" for level in levels))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="запросы одного сообщества при росте числа сообществ")
+    parser.add_argument("--levels", default="1,10,50", help="число сообществ в базе на каждом шаге")
+    parser.add_argument("--users", type=int, default=300, help="игроков в каждом сообществе")
+    parser.add_argument("--events", type=int, default=100, help="ивентов в каждом сообществе")
+    parser.add_argument("--calls", type=int, default=1_000, help="вызовов каждой функции")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    levels = sorted(int(level) for level in args.levels.split(","))
+    report = run(levels, args.users, args.events, args.calls, args.seed)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": report}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+webhook_latency.py
+Сравнение сквозной задержки апдейта в режимах polling и webhook.
+
+Бот поднимается целиком (все хендлеры, временная БД) и подключается к локальному
+фейковому Bot API. Задержка — время от появления апдейта в фейковом API
+до ответного sendMessage бота.
+
+Запуск:
+    python -m benchmarks.webhook_latency --updates 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN = "123456:BENCHMARK"
+SECRET = "bench-secret"
+
+# Бот читает настройки из окружения при импорте — готовим временную БД заранее
+os.environ.setdefault("BOT_TOKEN", TOKEN)
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="mlbot_bench_"), "bench.db"))
+
+import httpx  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+import main as bot_main  # noqa: E402
+from benchmarks.fake_api import FakeBotAPI, make_message_update  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def _measure(api: FakeBotAPI, updates: int) -> list[float]:
+    """Шлёт /start от разных пользователей по одному и ждёт ответ бота"""
+    loop = asyncio.get_running_loop()
+    waiting = {}
+
+    def on_call(method, params):
+        fut = waiting.pop(params.get("chat_id"), None) if method == "sendMessage" else None
+        if fut and not fut.done():
+            fut.set_result(time.perf_counter())
+
+    api.on_call.append(on_call)
+    latencies = []
+    for i in range(updates):
+        user_id = 10_000 + i
+        fut = loop.create_future()
+        waiting[user_id] = fut
+        started = time.perf_counter()
+        api.push_update(make_message_update(api, user_id, "/start"))
+        finished = await asyncio.wait_for(fut, timeout=30)
+        latencies.append((finished - started) * 1000)
+    api.on_call.remove(on_call)
+    return latencies
+
+
+async def run_mode(mode: str, updates: int) -> dict:
+    async with FakeBotAPI() as api:
+        builder = Application.builder().token(TOKEN).base_url(api.base_url)
+        application = bot_main.build_application(builder)
+        allowed_updates = bot_main.derive_allowed_updates(application)
+
+        await application.initialize()
+        await application.start()
+        port = None
+        if mode == "polling":
+            await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=allowed_updates)
+        else:
+            port = _free_port()
+            await application.updater.start_webhook(
+                listen="127.0.0.1",
+                port=port,
+                url_path="telegram",
+                webhook_url=f"http://127.0.0.1:{port}/telegram",
+                secret_token=SECRET,
+                allowed_updates=allowed_updates,
+            )
+        try:
+            # Прогрев: первый апдейт создаёт соединения и таблицы
+            await _measure(api, 3)
+            latencies = await _measure(api, updates)
+
+            forged_status = None
+            if port:
+                # Запрос без правильного секрета должен быть отклонён
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(
+                        f"http://127.0.0.1:{port}/telegram",
+                        json=make_message_update(api, 1, "/start"),
+                        headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+                    )
+                    forged_status = response.status_code
+        finally:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+
+    return {
+        "mode": mode,
+        "updates": updates,
+        "allowed_updates": allowed_updates,
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "forged_secret_status": forged_status,
+    }
+
+
+async def amain(args):
+    results = [await run_mode(mode, args.updates) for mode in ("polling", "webhook")]
+    print(f"\n{'режим':<10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+    print(f"\nallowed_updates: {', '.join(results[0]['allowed_updates'])}")
+    if results[1]["forged_secret_status"] is not None:
+        print(f"Запрос с неверным секретом: HTTP {results[1]['forged_secret_status']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling vs webhook: задержка апдейтов")
+    parser.add_argument("--updates", type=int, default=200, help="сколько апдейтов отправить в каждом режиме")
+    parser.add_argument("--json", help="сохранить результаты в JSON-файл")
+    asyncio.run(amain(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+cache.py
+Кэш с TTL и single-flight для дорогих асинхронных вычислений (карточки профилей).
+
+Конкурентные запросы одного ключа ждут одно вычисление, а не запускают по своему.
+invalidate() можно вызывать из любого потока (например, из after_commit сессии,
+которая работает в asyncio.to_thread): результат вычисления, начатого до
+инвалидации, в кэш уже не попадёт.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import metrics
+
+# Все созданные кэши (для диагностики памяти)
+_caches = weakref.WeakSet()
+
+
+def live_caches() -> list:
+    """Живые экземпляры AsyncTTLCache"""
+    return list(_caches)
+
+
+class AsyncTTLCache:
+    """TTL + LRU по числу записей + одно вычисление на ключ. None не кэшируется"""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Future текущего вычисления
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key, compute):
+        """Значение из кэша или результат await compute()"""
+        if self.ttl <= 0:
+            return await compute()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                metrics.incr(f"{self.name}.hit")
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = asyncio.get_running_loop().create_future()
+
+        if not owner:
+            metrics.incr(f"{self.name}.shared")
+            # shield: отмена одного из ждущих не отменяет общее вычисление
+            return await asyncio.shield(future)
+
+        metrics.incr(f"{self.name}.miss")
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            self._finish(key, future)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._finish(key, future)
+            future.set_exception(e)
+            future.exception()  # ждущих может не быть — не пишем "exception was never retrieved"
+            raise
+
+        if self._finish(key, future) and value is not None:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        """Размеры кэша: записей, вычислений в работе и лимиты"""
+        with self._lock:
+            return {"entries": len(self._entries), "inflight": len(self._inflight),
+                    "max_entries": self.max_entries, "ttl": self.ttl}
+
+    def _finish(self, key, future) -> bool:
+        """Снимает вычисление с учёта. False — его уже инвалидировали, результат устарел"""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                return True
+            return False
+
+    def invalidate(self, key=None):
+        """Сбрасывает ключ (или весь кэш при key=None). Потокобезопасно"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._inflight.clear()
+            else:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+        metrics.incr(f"{self.name}.invalidated")
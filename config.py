@@ -4,6 +4,7 @@
 """
 import os
 import logging
+import secrets
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -18,45 +19,189 @@ logger = logging.getLogger(__name__)
 
 # === ОСНОВНЫЕ НАСТРОЙКИ ===
 
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-if not BOT_TOKEN:
-    raise ValueError("❌ BOT_TOKEN не найден в .env файле!")
+# Проверяется в main(): скрипты и бенчмарки импортируют config без токена
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 
 # Список ID администраторов (через запятую в .env)
 # === АДМИНЫ ===
 
+# Владельцы бота: все права во всех сообществах, права не отзываются.
+# Остальные админы и модераторы выдаются командой /grant и хранятся в БД (acl.py).
 ADMIN_IDS = [
     int(uid.strip()) 
     for uid in os.getenv("ADMIN_IDS", "").split(",") 
     if uid.strip()
 ]
 
-def is_user_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
-
-
 # ID группы для уведомлений (обязательный параметр)
 # Пример: GROUP_ID=-100XXXXXXXXXX
 GROUP_ID = int(os.getenv("GROUP_ID", "0"))
 if not GROUP_ID:
     logger.warning("⚠️ GROUP_ID не указан в .env! Будет использован автоопределение группы.")
 
+# === СООБЩЕСТВА (НЕСКОЛЬКО ГРУПП) ===
+# Данные каждой группы (ивенты, роли, участники) хранятся отдельно по chat_id группы.
+# DEFAULT_TENANT_ID — сообщество для ЛС, пока пользователь не выбрал своё через /community,
+# и для данных, созданных до разделения (по умолчанию GROUP_ID)
+DEFAULT_TENANT_ID = int(os.getenv("DEFAULT_TENANT_ID", str(GROUP_ID)))
+# Сколько секунд помнить список администраторов группы из Telegram
+TENANT_ADMINS_TTL_SECONDS = float(os.getenv("TENANT_ADMINS_TTL_SECONDS", "600"))
+
+# === WEBHOOK ===
+# Если WEBHOOK_URL задан, бот принимает апдейты через webhook вместо long polling.
+# WEBHOOK_URL — внешний адрес (https://example.com), по которому Telegram доступен локальный порт.
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token.
+# Без него запросы без заголовка не принимаются: если не задан, генерируется при каждом
+# запуске (run_webhook передаёт его в setWebhook, так что Telegram всегда знает текущий)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    WEBHOOK_SECRET = secrets.token_urlsafe(32)
+    logger.info("🔐 WEBHOOK_SECRET не указан: сгенерирован случайный секрет на этот запуск")
+
+# === ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА ===
+# Сколько апдейтов может обрабатываться одновременно (апдейты одного пользователя — всегда по очереди)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
+# === ОГРАНИЧЕНИЕ ЧАСТОТЫ НАЖАТИЙ (throttle.py) ===
+# Повторы той же кнопки склеиваются, пока первое нажатие в работе; сверх лимита — отбрасываются
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1").lower() not in ("0", "false", "no")
+# Лимит для действий без своего правила в throttle.ACTION_LIMITS: нажатий в секунду и запас на серию
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "10"))
+
+# === НЕСКОЛЬКО ПРОЦЕССОВ ===
+# WORKERS > 0: один процесс принимает апдейты (polling или webhook) и раздаёт их по хэшу user_id
+# WORKERS процессам с хендлерами (см. workers.py). 0 — всё в одном процессе
+WORKERS = int(os.getenv("WORKERS", "0"))
+
 # === НАСТРОЙКИ БАЗЫ ДАННЫХ ===
 
 DB_NAME = os.getenv("DB_NAME", "bot_users.db")
 
+# Журнал SQLite: в режиме WAL читатели не ждут писателя (важно для WORKERS > 0). Пусто — не менять
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "wal")
+# Сколько писатель ждёт чужую транзакцию, прежде чем получить "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Как часто (в секундах) изменённые user_data/chat_data/bot_data сбрасываются в БД
+PERSISTENCE_INTERVAL_SECONDS = float(os.getenv("PERSISTENCE_INTERVAL_SECONDS", "30"))
+
 # === НАСТРОЙКИ ПЛАНИРОВЩИКА ===
 
 SCHEDULER_INTERVAL_MINUTES = int(os.getenv("SCHEDULER_INTERVAL_MINUTES", "1"))
 
+# Как часто писать сводку метрик в лог (0 — не писать)
+METRICS_LOG_INTERVAL_MINUTES = int(os.getenv("METRICS_LOG_INTERVAL_MINUTES", "15"))
+
+# === ОЧИСТКА ПРОШЕДШИХ ИВЕНТОВ ===
+# Как часто закрывать прошедшие ивенты (0 — не закрывать)
+SWEEP_INTERVAL_MINUTES = float(os.getenv("SWEEP_INTERVAL_MINUTES", "15"))
+# Ивент без состава становится 'expired' через столько часов после начала
+EVENT_EXPIRE_GRACE_HOURS = float(os.getenv("EVENT_EXPIRE_GRACE_HOURS", "6"))
+# Ивент с составом становится 'completed' позже, чтобы админ успел выставить оценки
+EVENT_COMPLETE_GRACE_HOURS = float(os.getenv("EVENT_COMPLETE_GRACE_HOURS", "48"))
+
+# === КАРТОЧКИ ПРОФИЛЯ ("кто", /me) ===
+# Сколько секунд карточка живёт в кэше (0 — не кэшировать). Изменения ролей, оценок и профиля сбрасывают её сразу
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "2000"))
+# Повторный "кто" на того же игрока в том же чате в течение стольких секунд игнорируется (0 — без ограничения)
+WHO_IS_CHAT_COOLDOWN_SECONDS = float(os.getenv("WHO_IS_CHAT_COOLDOWN_SECONDS", "30"))
+
+# === РЕЙТИНГ НАВЫКА (skill.py) ===
+# Навык по роли в шкале оценок 1–5: априорное среднее и разброс для нового игрока
+SKILL_PRIOR_MU = float(os.getenv("SKILL_PRIOR_MU", "3.0"))
+SKILL_PRIOR_SIGMA = float(os.getenv("SKILL_PRIOR_SIGMA", "1.0"))
+# Разброс одной оценки вокруг навыка (разные админы, случайность игры)
+SKILL_NOISE = float(os.getenv("SKILL_NOISE", "1.0"))
+# Насколько навык может измениться за один сыгранный матч
+SKILL_DRIFT = float(os.getenv("SKILL_DRIFT", "0.1"))
+# Консервативная оценка для миксов: mu - K * sigma (мало оценок — меньше доверия)
+SKILL_CONSERVATIVE_K = float(os.getenv("SKILL_CONSERVATIVE_K", "1.0"))
+
+# === ПОСЕЩАЕМОСТЬ (attendance.py) ===
+# Час ночного пересчёта по Москве (-1 — не запускать по расписанию)
+ATTENDANCE_HOUR = int(os.getenv("ATTENDANCE_HOUR", "4"))
+# Процессов для расчёта: 0 — по числу ядер, 1 — в процессе бота без пула
+ATTENDANCE_PROCESSES = int(os.getenv("ATTENDANCE_PROCESSES", "0"))
+
+# === АРХИВ ===
+# Завершённые и истёкшие ивенты старше ARCHIVE_AFTER_DAYS дней переносятся в отдельную БД (0 — не архивировать)
+ARCHIVE_DB_NAME = os.getenv("ARCHIVE_DB_NAME", "bot_archive.db")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+# Сколько ивентов переносится в одной транзакции
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+
+# === БЭКАПЫ ===
+# Онлайн-бэкапы через sqlite3 backup API (0 — не делать)
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+# Сколько последних архивов хранить
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# Размер порции копирования (страниц) и пауза между порциями, чтобы бот успевал писать в БД
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "10"))
+
+# === ЗАПИСЬ АПДЕЙТОВ ===
+# Если путь задан, все входящие апдейты пишутся в JSONL-файл для воспроизведения (benchmarks/replay.py)
+UPDATE_RECORD_PATH = os.getenv("UPDATE_RECORD_PATH", "")
+UPDATE_RECORD_ANONYMIZE = os.getenv("UPDATE_RECORD_ANONYMIZE", "1").lower() not in ("0", "false", "no")
+# Соль псевдонимов: с постоянной солью один и тот же пользователь получает один псевдоним в разных записях
+UPDATE_RECORD_SALT = os.getenv("UPDATE_RECORD_SALT", "")
+
+# === ДИАГНОСТИКА ПАМЯТИ (/memory) И ПРОФИЛИРОВАНИЕ (/profiler) ===
+# Куда /memory dump и /profiler пишут файлы
+MEMDIAG_DIR = os.getenv("MEMDIAG_DIR", "diagnostics")
+# Глубина стека аллокаций для /memory start без аргумента (1 — только файл и строка)
+MEMDIAG_TRACE_FRAMES = int(os.getenv("MEMDIAG_TRACE_FRAMES", "1"))
+# Период снятия стеков профайлером и предел длительности одного профиля
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "300"))
+# Автозапуск: p95 обработки апдейтов выше порога (мс, 0 — выключен) -> профиль на PROFILER_AUTO_SECONDS
+# держателям права DIAGNOSTICS (acl.py), не чаще раза в PROFILER_AUTO_COOLDOWN_MINUTES
+PROFILER_AUTO_P95_MS = float(os.getenv("PROFILER_AUTO_P95_MS", "0"))
+PROFILER_AUTO_SECONDS = int(os.getenv("PROFILER_AUTO_SECONDS", "30"))
+PROFILER_AUTO_COOLDOWN_MINUTES = float(os.getenv("PROFILER_AUTO_COOLDOWN_MINUTES", "60"))
+
 # === ЛОГИРОВАНИЕ НАСТРОЕК ПРИ СТАРТЕ ===
 
 def log_config():
     """Выводит текущую конфигурацию при запуске бота"""
     logger.info("=" * 50)
     logger.info("📋 КОНФИГУРАЦИЯ БОТА:")
-    logger.info(f"  • ADMIN_IDS: {ADMIN_IDS}")
+    logger.info(f"  • ADMIN_IDS (владельцы): {ADMIN_IDS}")
     logger.info(f"  • GROUP_ID: {GROUP_ID if GROUP_ID else 'Автоопределение'}")
-    logger.info(f"  • DB_NAME: {DB_NAME}")
+    logger.info(f"  • DEFAULT_TENANT_ID: {DEFAULT_TENANT_ID}, админы групп кэшируются на {TENANT_ADMINS_TTL_SECONDS} сек.")
+    logger.info(f"  • РЕЖИМ: {'webhook ' + WEBHOOK_URL if WEBHOOK_URL else 'polling'}")
+    logger.info(f"  • CONCURRENT_UPDATES: {CONCURRENT_UPDATES}")
+    logger.info(
+        f"  • THROTTLE: {f'{THROTTLE_RATE:g}/с, серия {THROTTLE_BURST:g}' if THROTTLE_ENABLED else 'выключен'}"
+    )
+    logger.info(f"  • WORKERS: {WORKERS if WORKERS else 'один процесс'}")
+    logger.info(f"  • DB_NAME: {DB_NAME} (журнал: {DB_JOURNAL_MODE or 'как есть'}, busy_timeout: {DB_BUSY_TIMEOUT_MS} мс)")
+    logger.info(f"  • PERSISTENCE_INTERVAL: {PERSISTENCE_INTERVAL_SECONDS} сек.")
     logger.info(f"  • SCHEDULER_INTERVAL: {SCHEDULER_INTERVAL_MINUTES} мин.")
+    logger.info(f"  • SWEEP: {'каждые ' + str(SWEEP_INTERVAL_MINUTES) + ' мин. (expired через ' + str(EVENT_EXPIRE_GRACE_HOURS) + ' ч., completed через ' + str(EVENT_COMPLETE_GRACE_HOURS) + ' ч.)' if SWEEP_INTERVAL_MINUTES else 'выключена'}")
+    logger.info(f"  • PROFILE_CACHE: {str(PROFILE_CACHE_TTL_SECONDS) + ' сек., до ' + str(PROFILE_CACHE_MAX_ENTRIES) + ' карточек' if PROFILE_CACHE_TTL_SECONDS else 'выключен'}, \"кто\" в чате раз в {WHO_IS_CHAT_COOLDOWN_SECONDS} сек.")
+    logger.info(f"  • SKILL: mu0={SKILL_PRIOR_MU}, sigma0={SKILL_PRIOR_SIGMA}, шум {SKILL_NOISE}, дрейф {SKILL_DRIFT}, K={SKILL_CONSERVATIVE_K}")
+    logger.info(
+        f"  • ATTENDANCE: {f'в {ATTENDANCE_HOUR}:00 МСК' if ATTENDANCE_HOUR >= 0 else 'по расписанию не запускается'}, "
+        f"процессов {ATTENDANCE_PROCESSES or 'по числу ядер'}"
+    )
+    logger.info(f"  • ARCHIVE: {'старше ' + str(ARCHIVE_AFTER_DAYS) + ' дн. в ' + ARCHIVE_DB_NAME if ARCHIVE_AFTER_DAYS else 'выключен'}")
+    logger.info(f"  • BACKUP: {'каждые ' + str(BACKUP_INTERVAL_HOURS) + ' ч. в ' + BACKUP_DIR if BACKUP_INTERVAL_HOURS else 'выключен'}")
+    logger.info(f"  • MEMDIAG: дампы в {MEMDIAG_DIR}, tracemalloc по {MEMDIAG_TRACE_FRAMES} кадр.")
+    logger.info(
+        f"  • PROFILER: раз в {PROFILER_INTERVAL_MS:g} мс, до {PROFILER_MAX_SECONDS} сек., автозапуск "
+        + (f"при p95 > {PROFILER_AUTO_P95_MS:g} мс на {PROFILER_AUTO_SECONDS} сек. (не чаще раза в "
+           f"{PROFILER_AUTO_COOLDOWN_MINUTES:g} мин.)" if PROFILER_AUTO_P95_MS else "выключен")
+    )
+    if UPDATE_RECORD_PATH:
+        logger.info(f"  • UPDATE_RECORD: {UPDATE_RECORD_PATH} (анонимизация: {UPDATE_RECORD_ANONYMIZE})")
     logger.info("=" * 50)
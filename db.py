@@ -3,12 +3,23 @@
 Содержит модели SQLAlchemy и функции для работы с пользователями, ролями, событиями и статистикой.
 """
 import asyncio
-from sqlalchemy import create_engine, Column, Integer, String, UniqueConstraint, ForeignKey, DateTime, Boolean
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from itertools import starmap
+from sqlalchemy import create_engine, event, select, bindparam, func, literal, union_all, Column, Integer, Float, String, Text, UniqueConstraint, ForeignKey, DateTime, Boolean, Index
+from sqlalchemy.orm import declarative_base, declared_attr, sessionmaker, relationship, with_loader_criteria
 from datetime import datetime
 
 # Импортируем настройки из config.py
-from config import ADMIN_IDS, DB_NAME, logger
+from config import CONCURRENT_UPDATES, DB_NAME, DB_JOURNAL_MODE, DB_BUSY_TIMEOUT_MS, logger
+import acl
+import metrics
+from migrations.runner import migrate, module_names as migration_module_names
+from tenant import current_tenant, effective_tenant
 
 Base = declarative_base()
 
@@ -17,6 +28,15 @@ Base = declarative_base()
 # МОДЕЛИ БАЗЫ ДАННЫХ
 # ==========================================
 
+class TenantMixin:
+    """
+    Данные одного сообщества: chat_id группы — ключ арендатора (см. tenant.py).
+    Внутри апдейта ORM-запросы к таким моделям ограничиваются текущим сообществом,
+    а новые строки получают его chat_id.
+    """
+    chat_id = Column(Integer, nullable=False, default=effective_tenant)
+
+
 class User(Base):
     """Основная таблица пользователей"""
     __tablename__ = 'users'
@@ -28,23 +48,70 @@ class User(Base):
     username = Column(String)
     
     # Связи для статистики
-    match_participations = relationship("MatchParticipant", back_populates="user")
-    ratings_received = relationship("RoleRating", back_populates="user", foreign_keys="RoleRating.user_id")
+    # Удаление каскадом делает сама БД (ON DELETE CASCADE), ORM не загружает дочерние строки
+    match_participations = relationship("MatchParticipant", back_populates="user", passive_deletes=True)
+    ratings_received = relationship(
+        "RoleRating", back_populates="user", foreign_keys="RoleRating.user_id", passive_deletes=True
+    )
     
     def __repr__(self):
         return f"<User(id={self.id}, tg_id={self.user_id}, name='{self.first_name}')>"
 
 
-class RegistrationBase(Base):
-    """Базовый класс для таблиц ролей"""
+class RegistrationBase(TenantMixin, Base):
+    """Базовый класс для таблиц ролей (роль своя в каждом сообществе)"""
     __abstract__ = True
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, unique=True, nullable=False)
+    user_id = Column(Integer, nullable=False)
     first_name = Column(String, nullable=False)
     last_name = Column(String)
     username = Column(String)
     id_ml = Column(Integer)
 
+    @declared_attr.directive
+    def __table_args__(cls):
+        # Индекс уникальности начинается с chat_id: роль сообщества ищется без просмотра чужих строк
+        return (UniqueConstraint('chat_id', 'user_id', name=f'uq_{cls.__tablename__}_chat_user'),)
+
+
+# --- СООБЩЕСТВА ---
+
+class Tenant(Base):
+    """Сообщество (группа), которое обслуживает бот"""
+    __tablename__ = 'tenants'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TenantMember(TenantMixin, Base):
+    """Участник сообщества: пользователь, которого бот видел в группе"""
+    __tablename__ = 'tenant_members'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False, default=effective_tenant)
+    user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    joined_at = Column(DateTime, default=datetime.utcnow)
+
+    # Обратный поиск: в каких сообществах состоит пользователь (/community)
+    __table_args__ = (Index('idx_tenant_members_user', 'user_id'),)
+
+
+# --- ПРАВА (acl.py) ---
+
+class AdminGrant(Base):
+    """
+    Права админа/модератора: битовая маска acl.Permission в сообществе (chat_id группы)
+    или во всех сообществах (chat_id = 0). Не TenantMixin: снимок прав читается целиком.
+    """
+    __tablename__ = 'admin_grants'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    permissions = Column(Integer, nullable=False)
+    granted_by = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 # --- РОЛИ ---
 
@@ -74,30 +141,42 @@ class Moderator(RegistrationBase):
 
 # --- СОБЫТИЯ (ИВЕНТЫ) ---
 
-class Event(Base):
+class Event(TenantMixin, Base):
     """Таблица событий/игр"""
     __tablename__ = 'events'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String, nullable=False)
     event_time = Column(String, nullable=False)
-    status = Column(String, default='active')  # active, lineup_fixed, completed
+    status = Column(String, default='active')  # active, lineup_fixed, completed, expired
     
     # Связи
-    participants = relationship("EventParticipant", back_populates="event")
-    matches = relationship("EventMatch", back_populates="event")
+    participants = relationship("EventParticipant", back_populates="event", passive_deletes=True)
+    matches = relationship("EventMatch", back_populates="event", passive_deletes=True)
+    
+    # Список ивентов сообщества — по (chat_id, status, event_time);
+    # планировщик, очистка и архив идут по всем сообществам — по (status, event_time)
+    __table_args__ = (
+        Index('idx_events_chat_status_time', 'chat_id', 'status', 'event_time'),
+        Index('idx_events_status_time', 'status', 'event_time'),
+    )
     
     def __repr__(self):
         return f"<Event(id={self.id}, title='{self.title}', time='{self.event_time}', status='{self.status}')>"
 
 
+# Статусы, в которых ивент ещё идёт: на него можно записаться, он виден в списке и в планировщике.
+# 'completed' ставит админ (или очистка после игры с составом), 'expired' — очистка для прошедших без состава.
+OPEN_EVENT_STATUSES = ('active', 'lineup_fixed')
+
+
 class EventParticipant(Base):
     """Таблица участников событий"""
     __tablename__ = 'event_participants'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
-    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
+    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
     status = Column(String, default='Active')
     
     # Связи
@@ -114,12 +193,15 @@ class EventMatch(Base):
     __tablename__ = 'event_matches'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    event_id = Column(Integer, ForeignKey('events.id'), nullable=False)
+    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Связи
     event = relationship("Event", back_populates="matches")
-    participants = relationship("MatchParticipant", back_populates="match")
+    participants = relationship("MatchParticipant", back_populates="match", passive_deletes=True)
+    
+    # Выгрузка матчей (match_export.py) с фильтром по датам
+    __table_args__ = (Index('idx_event_matches_created_at', 'created_at'),)
     
     def __repr__(self):
         return f"<EventMatch(id={self.id}, event_id={self.event_id}, created_at={self.created_at})>"
@@ -130,8 +212,8 @@ class MatchParticipant(Base):
     __tablename__ = 'match_participants'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    match_id = Column(Integer, ForeignKey('event_matches.id'), nullable=False)
-    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
+    match_id = Column(Integer, ForeignKey('event_matches.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
     team = Column(String(10))  # 'red', 'blue', 'spectator'
     role_played = Column(String(20))  # роль, которую реально исполнял (из профиля или 'random')
     played = Column(Boolean, default=True)  # играл ли вообще (true для red/blue, false для spectators)
@@ -139,7 +221,10 @@ class MatchParticipant(Base):
     # Связи
     match = relationship("EventMatch", back_populates="participants")
     user = relationship("User", back_populates="match_participations")
-    ratings = relationship("RoleRating", back_populates="match_participant")
+    ratings = relationship("RoleRating", back_populates="match_participant", passive_deletes=True)
+    
+    # Выгрузка матчей с фильтром по роли: участники матча отбираются по индексу
+    __table_args__ = (Index('idx_match_participants_match_role', 'match_id', 'role_played'),)
     
     def __repr__(self):
         return f"<MatchParticipant(id={self.id}, user_id={self.user_id}, team='{self.team}', played={self.played})>"
@@ -150,11 +235,11 @@ class RoleRating(Base):
     __tablename__ = 'role_ratings'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    match_participant_id = Column(Integer, ForeignKey('match_participants.id'), nullable=False)
-    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)  # кому оценка
+    match_participant_id = Column(Integer, ForeignKey('match_participants.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)  # кому оценка
     rating = Column(Integer)  # 1-5
     comment = Column(String, nullable=True)
-    rated_by = Column(Integer, ForeignKey('users.user_id'))  # кто оценил (админ)
+    rated_by = Column(Integer, ForeignKey('users.user_id', ondelete='SET NULL'))  # кто оценил (админ)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Связи
@@ -166,6 +251,115 @@ class RoleRating(Base):
         return f"<RoleRating(id={self.id}, user_id={self.user_id}, rating={self.rating})>"
 
 
+# --- АРХИВ (агрегаты по перенесённым в архивную БД матчам) ---
+
+class ArchivedUserStats(TenantMixin, Base):
+    """Сводная статистика игрока по заархивированным ивентам сообщества"""
+    __tablename__ = 'archived_user_stats'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False, default=effective_tenant)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    played_matches = Column(Integer, nullable=False, default=0)
+    spectator_count = Column(Integer, nullable=False, default=0)
+    ratings_count = Column(Integer, nullable=False, default=0)
+    ratings_sum = Column(Integer, nullable=False, default=0)
+    # Посещаемость по заархивированным завершённым ивентам — начальное состояние для attendance.py.
+    # server_default: строки вставляет и сырой SQL архивации, который этих колонок не перечисляет
+    signups = Column(Integer, nullable=False, default=0, server_default='0')
+    events_played = Column(Integer, nullable=False, default=0, server_default='0')
+    no_shows = Column(Integer, nullable=False, default=0, server_default='0')
+    events_spectated = Column(Integer, nullable=False, default=0, server_default='0')
+    not_picked = Column(Integer, nullable=False, default=0, server_default='0')
+    current_streak = Column(Integer, nullable=False, default=0, server_default='0')  # серия на последнем архивном ивенте
+    best_streak = Column(Integer, nullable=False, default=0, server_default='0')
+    last_played = Column(String)
+
+
+class ArchivedRoleStats(TenantMixin, Base):
+    """Оценки игрока по ролям в заархивированных матчах сообщества ('unknown' — игры без роли)"""
+    __tablename__ = 'archived_role_stats'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False, default=effective_tenant)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    role = Column(String(20), primary_key=True)
+    ratings_count = Column(Integer, nullable=False, default=0)
+    ratings_sum = Column(Integer, nullable=False, default=0)
+    events_played = Column(Integer, nullable=False, default=0, server_default='0')  # игры на роли для attendance.py
+
+
+# --- РЕЙТИНГ НАВЫКА (см. skill.py) ---
+
+class SkillRating(TenantMixin, Base):
+    """Навык игрока по роли в сообществе: нормальное распределение N(mu, variance) в шкале оценок"""
+    __tablename__ = 'skill_ratings'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False, default=effective_tenant)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    role = Column(String(20), primary_key=True)
+    mu = Column(Float, nullable=False)
+    variance = Column(Float, nullable=False)
+    ratings = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# --- ПОСЕЩАЕМОСТЬ (ночной расчёт, см. attendance.py) ---
+
+class AttendanceStats(TenantMixin, Base):
+    """Посещаемость игрока в сообществе по завершённым ивентам"""
+    __tablename__ = 'attendance_stats'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False, default=effective_tenant)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    signups = Column(Integer, nullable=False, default=0)  # записался на ивент
+    played = Column(Integer, nullable=False, default=0)  # сыграл за red/blue
+    no_shows = Column(Integer, nullable=False, default=0)  # был в составе, но не играл
+    spectated = Column(Integer, nullable=False, default=0)  # попал в зрители
+    not_picked = Column(Integer, nullable=False, default=0)  # записался, но в составе матча его нет
+    current_streak = Column(Integer, nullable=False, default=0)  # игр подряд без неявки
+    best_streak = Column(Integer, nullable=False, default=0)
+    last_played = Column(String)  # event_time последней игры
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AttendanceRoleStats(TenantMixin, Base):
+    """Сколько игр игрок сыграл на каждой роли ('unknown' — игры без роли)"""
+    __tablename__ = 'attendance_role_stats'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False, default=effective_tenant)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    role = Column(String(20), primary_key=True)
+    played = Column(Integer, nullable=False, default=0)
+
+
+# --- СОСТОЯНИЯ БОТА (PERSISTENCE) ---
+
+class UserDataRecord(Base):
+    """Сохранённый context.user_data (компактный JSON)"""
+    __tablename__ = 'persist_user_data'
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChatDataRecord(Base):
+    """Сохранённый context.chat_data (компактный JSON)"""
+    __tablename__ = 'persist_chat_data'
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BotDataRecord(Base):
+    """Сохранённый context.bot_data (одна строка на ключ хранилища)"""
+    __tablename__ = 'persist_bot_data'
+
+    key = Column(String, primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
 # --- СЛОВАРИ РОЛЕЙ ---
 
 ROLE_NAMES = {
@@ -189,56 +383,474 @@ ROLE_TO_MODEL = {
 ROLE_LIST = ["middle", "gold", "les", "roam", "exp"]  # основные роли для игры
 
 
+# --- ЛЁГКИЕ СТРОКИ ДЛЯ ЧТЕНИЯ ---
+# Списки пользователей живут дольше сессии (пагинация, рассылки), поэтому вместо ORM-объектов
+# с identity map и состоянием экземпляра читаем только нужные колонки в неизменяемые
+# объекты со __slots__ (атрибуты те же, что у моделей).
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    """Пользователь из таблицы users"""
+    user_id: int
+    first_name: str
+    last_name: str | None
+    username: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class RoleUserRow:
+    """Пользователь из таблицы роли"""
+    user_id: int
+    first_name: str
+    last_name: str | None
+    username: str | None
+    id_ml: int | None
+
+
+def _user_columns(model):
+    return select(model.user_id, model.first_name, model.last_name, model.username)
+
+
+# --- ГОТОВЫЕ ЗАПРОСЫ ГОРЯЧИХ ПУТЕЙ ---
+# Собираются один раз при импорте, параметры передаются через bindparam. Повторный вызов
+# не строит выражение заново и сразу находит скомпилированный SQL в кэше движка
+# (session.query(...).filter_by(...) каждый раз строит и хэширует новое выражение).
+
+EVENT_BY_ID = select(Event).where(Event.id == bindparam("event_id"))
+UPCOMING_EVENTS = select(Event).where(Event.status.in_(OPEN_EVENT_STATUSES)).order_by(Event.event_time)
+EVENT_PARTICIPANTS = select(EventParticipant).where(EventParticipant.event_id == bindparam("event_id"))
+EVENT_PARTICIPANT = select(EventParticipant).where(
+    EventParticipant.event_id == bindparam("event_id"),
+    EventParticipant.user_id == bindparam("user_id"),
+).limit(1)
+EVENT_PARTICIPANTS_COUNT = select(func.count(EventParticipant.id)).where(
+    EventParticipant.event_id == bindparam("event_id")
+)
+EVENT_HAS_LINEUP = select(EventMatch.id).where(EventMatch.event_id == bindparam("event_id")).limit(1)
+
+USER_BY_ID = select(User).where(User.user_id == bindparam("user_id"))
+USER_ROW_BY_ID = _user_columns(User).where(User.user_id == bindparam("user_id"))
+USER_ROW_BY_USERNAME = _user_columns(User).where(User.username == bindparam("username")).limit(1)
+
+# Пользователи общие для всех сообществ; внутри апдейта списки и поиск идут только по
+# участникам текущего сообщества (на TenantMember действует ограничение по chat_id)
+_MEMBER_JOIN = (TenantMember, TenantMember.user_id == User.user_id)
+MEMBER_ROWS = _user_columns(User).join(*_MEMBER_JOIN).order_by(User.id)
+MEMBER_ROW_BY_USERNAME = USER_ROW_BY_USERNAME.join(*_MEMBER_JOIN)
+MEMBERSHIP = select(TenantMember).where(
+    TenantMember.chat_id == bindparam("chat_id"), TenantMember.user_id == bindparam("user_id")
+).execution_options(all_tenants=True)
+USER_TENANTS = (
+    select(Tenant.chat_id, Tenant.title)
+    .join(TenantMember, TenantMember.chat_id == Tenant.chat_id)
+    .where(TenantMember.user_id == bindparam("user_id"))
+    .order_by(Tenant.title)
+    .execution_options(all_tenants=True)
+)
+
+# Запись пользователя в таблице роли: {модель роли: запрос}
+ROLE_ENTRY = {
+    model: select(model).where(model.user_id == bindparam("user_id")).limit(1)
+    for model in ROLE_TO_MODEL.values()
+}
+
+# Первая роль пользователя в порядке ROLE_TO_MODEL — один запрос вместо проверки каждой таблицы.
+# Фильтр по сообществу явный: на подзапросы внутри UNION автоматическое ограничение не действует
+_role_probes = union_all(*(
+    select(literal(position).label("position"), literal(role_key).label("role"))
+    .where(model.chat_id == bindparam("chat_id"), model.user_id == bindparam("user_id"))
+    for position, (role_key, model) in enumerate(ROLE_TO_MODEL.items())
+)).subquery()
+USER_FIRST_ROLE = select(_role_probes.c.role).order_by(_role_probes.c.position).limit(1)
+
+# Навыки нескольких игроков по всем ролям — одним запросом по первичному ключу
+USERS_SKILLS = select(
+    SkillRating.user_id, SkillRating.role, SkillRating.mu, SkillRating.variance, SkillRating.ratings
+).where(SkillRating.user_id.in_(bindparam("user_ids", expanding=True)))
+
+# Посещаемость игрока (готовая сводка ночного расчёта) и его игры по ролям
+USER_ATTENDANCE = select(AttendanceStats).where(AttendanceStats.user_id == bindparam("user_id"))
+USER_ATTENDANCE_ROLES = select(AttendanceRoleStats.role, AttendanceRoleStats.played).where(
+    AttendanceRoleStats.user_id == bindparam("user_id")
+).order_by(AttendanceRoleStats.played.desc())
+
+
 # ==========================================
 # ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ
 # ==========================================
 
-engine = create_engine(f'sqlite:///{DB_NAME}')
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Движок и схема создаются при первом обращении к БД (Session(), get_engine()), а не при
+# импорте: скрипты, бенчмарки и сам бот не платят за подключение и проверку схемы, пока
+# БД не нужна. create_all и миграции запускаются, только если изменился отпечаток схемы.
+
+SessionFactory = sessionmaker()
+_engine = None
+_init_lock = threading.Lock()
+
+
+def _table_signature(table) -> str:
+    """Описание таблицы для отпечатка: без компиляции DDL, она дороже самой проверки"""
+    columns = [
+        f"{c.name} {c.type!r} null={c.nullable} pk={c.primary_key} unique={c.unique} "
+        f"fk={sorted((fk.target_fullname, fk.ondelete) for fk in c.foreign_keys)}"
+        for c in table.columns
+    ]
+    indexes = sorted(f"{i.name} unique={i.unique} {[c.name for c in i.columns]}" for i in table.indexes)
+    uniques = sorted(
+        f"{c.name} {[col.name for col in c.columns]}"
+        for c in table.constraints if isinstance(c, UniqueConstraint)
+    )
+    return f"{table.name}({', '.join(columns)}) {indexes} {uniques}"
+
+
+def schema_fingerprint() -> int:
+    """Отпечаток моделей и списка миграций — 31 бит, чтобы поместиться в PRAGMA user_version"""
+    parts = [_table_signature(table) for table in Base.metadata.sorted_tables]
+    parts.extend(migration_module_names())
+    digest = hashlib.sha1("\n".join(parts).encode()).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF or 1
+
+
+def _ensure_schema(engine, db_path: str):
+    """create_all и миграции, если схема БД отличается от моделей (или БД новая)"""
+    fingerprint = schema_fingerprint()
+    with engine.connect() as conn:
+        stored = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    if stored == fingerprint:
+        logger.debug("📦 Схема БД не менялась, create_all и миграции пропущены")
+        return
+
+    Base.metadata.create_all(engine)
+    # Донастраиваем существующую БД версионными миграциями (новая БД уже создана по моделям)
+    applied = migrate(db_path)
+    if applied:
+        logger.info(f"🔧 Применены миграции: {applied}")
+    # Отпечаток записывается последним: после сбоя миграций проверка повторится
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    """
+    Прагмы нового соединения:
+    - foreign_keys: SQLite проверяет внешние ключи (и выполняет ON DELETE CASCADE) только после неё;
+    - busy_timeout: писатель ждёт чужую транзакцию (другой поток или процесс-воркер), а не падает;
+    - journal_mode=WAL: чтения не блокируются записью, synchronous=NORMAL в WAL безопасен.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    if DB_JOURNAL_MODE:
+        mode = cursor.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}").fetchone()[0]
+        if mode == "wal":
+            cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+
+def _count_db_errors(exception_context):
+    """Считает ошибки блокировки SQLite (database is locked) для метрик"""
+    if "database is locked" in str(exception_context.original_exception):
+        metrics.incr("db.locked_errors")
+
+
+def init_db():
+    """Создаёт движок и проверяет схему. Повторные вызовы ничего не делают"""
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _init_lock:
+        if _engine is not None:
+            return _engine
+        started = time.perf_counter()
+        # Каждый апдейт в работе держит одно соединение (см. unit_of_work), плюс запас для
+        # планировщика и записи persistence
+        engine = create_engine(f'sqlite:///{DB_NAME}', pool_size=CONCURRENT_UPDATES + 4, max_overflow=10)
+        event.listen(engine, "connect", _configure_connection)
+        event.listen(engine, "handle_error", _count_db_errors)
+        event.listen(engine, "checkout", _count_checkout)
+        event.listen(engine, "begin", _count_begin)
+        _ensure_schema(engine, DB_NAME)
+        SessionFactory.configure(bind=engine)
+        _engine = engine
+        metrics.observe("db.init_ms", (time.perf_counter() - started) * 1000)
+        logger.info(f"📦 База данных инициализирована: {DB_NAME}")
+    return _engine
+
+
+def get_engine():
+    """Движок БД (при первом вызове — с инициализацией)"""
+    return _engine if _engine is not None else init_db()
+
+
+def __getattr__(name):
+    # db.engine оставлен для совместимости (benchmarks/replay.py вешает на него события)
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ==========================================
+# ЕДИНИЦА РАБОТЫ (ОДНА СЕССИЯ НА АПДЕЙТ)
+# ==========================================
+# Пока апдейт обрабатывается, все Session() внутри него (в хендлере, в *_sync через
+# asyncio.to_thread, во вложенных хелперах) получают одну и ту же сессию на одном
+# соединении. Границы транзакций остаются явными: commit() в хелпере фиксирует
+# изменения сразу, а то, что не закоммитили, откатывается, когда закрывается
+# самая внешняя сессия. Вне апдейта (планировщик, скрипты) Session() — обычная сессия.
+
+_current_uow: ContextVar["UnitOfWork | None"] = ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    """Соединение и сессия одного апдейта. Соединение берётся из пула при первом обращении"""
+
+    def __init__(self):
+        self.connection = None
+        self.session = None
+        self.depth = 0
+        self.checkouts = 0
+        self.transactions = 0
+        self.active = True
+
+    def open(self) -> "SessionHandle":
+        if self.session is None:
+            self.connection = get_engine().connect()
+            # Объекты после commit не перечитываются: соединение и так одно на апдейт
+            self.session = SessionFactory(bind=self.connection, expire_on_commit=False)
+        self.depth += 1
+        return SessionHandle(self)
+
+    def release(self):
+        """Закрытие сессии хелпера. Транзакция завершается на самой внешней"""
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        self._finish()
+
+    def _finish(self):
+        session = self.session
+        if session.info.get("flushed") or session.new or session.dirty or session.deleted:
+            # Как и обычный close(): незакоммиченное не сохраняется
+            session.rollback()
+            metrics.incr("db.uow.discarded")
+        elif session.in_transaction():
+            session.commit()
+        # Как после обычного close(): объекты отвязаны от сессии
+        session.expunge_all()
+
+    def close(self):
+        self.active = False
+        if self.session is None:
+            return
+        try:
+            if self.depth > 0:
+                logger.warning(f"⚠️ Апдейт завершился с незакрытой сессией БД (вложенность {self.depth})")
+                self.depth = 0
+                self._finish()
+            self.session.close()
+        finally:
+            self.connection.close()
+            metrics.observe("db.checkouts_per_update", self.checkouts)
+            metrics.observe("db.transactions_per_update", self.transactions)
+
+
+class SessionHandle:
+    """Сессия единицы работы: всё делегирует общей сессии, кроме close()"""
+    __slots__ = ("_uow", "_closed")
+
+    def __init__(self, uow: UnitOfWork):
+        self._uow = uow
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._uow.session, name)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._uow.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def Session():
+    """Сессия БД: внутри апдейта — общая сессия единицы работы, иначе новая"""
+    uow = _current_uow.get()
+    if uow is None or not uow.active:
+        if _engine is None:
+            init_db()
+        return SessionFactory()
+    return uow.open()
+
+
+@contextmanager
+def unit_of_work():
+    """Одна сессия и одно соединение на всё, что выполняется внутри (в том числе в to_thread)"""
+    uow = UnitOfWork()
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+    finally:
+        _current_uow.reset(token)
+        uow.close()
+
+
+@event.listens_for(SessionFactory, "do_orm_execute")
+def _scope_by_tenant(orm_execute_state):
+    """Все ORM SELECT/UPDATE/DELETE внутри апдейта видят только строки текущего сообщества"""
+    chat_id = current_tenant()
+    if chat_id is None or orm_execute_state.is_column_load or orm_execute_state.is_relationship_load:
+        return
+    # Явный запрос по всем сообществам (например, список сообществ пользователя)
+    if orm_execute_state.execution_options.get("all_tenants"):
+        return
+    if orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(TenantMixin, lambda cls: cls.chat_id == chat_id, include_aliases=True)
+        )
+
 
-logger.info(f"📦 База данных инициализирована: {DB_NAME}")
+@event.listens_for(SessionFactory, "after_flush")
+def _mark_flushed(session, flush_context):
+    session.info["flushed"] = True
+
+
+@event.listens_for(SessionFactory, "after_commit")
+@event.listens_for(SessionFactory, "after_rollback")
+def _clear_flushed(session):
+    session.info.pop("flushed", None)
+
+
+# ==========================================
+# ИЗМЕНЕНИЯ ДАННЫХ ПОЛЬЗОВАТЕЛЕЙ (ДЛЯ КЭШЕЙ)
+# ==========================================
+# После commit подписчики (кэш карточек профиля) получают множество user_id, у которых
+# через ORM изменились профиль, роли, матчи или оценки. None — «неизвестно у кого»:
+# удаление ивента или матча каскадом в самой БД уносит чужие оценки.
+# Массовые операции Core (sqlite_insert, update()) вызывают notify_users_changed сами.
+
+_PROFILE_MODELS = (User, MatchParticipant, RoleRating, *ROLE_TO_MODEL.values())
+_CASCADE_MODELS = (Event, EventMatch)
+_user_change_listeners = []
+
+
+def on_users_changed(callback):
+    """Подписка: callback(user_ids: set | None) вызывается после commit (в потоке сессии)"""
+    _user_change_listeners.append(callback)
+    return callback
+
+
+def notify_users_changed(user_ids):
+    for callback in _user_change_listeners:
+        try:
+            callback(user_ids)
+        except Exception as e:
+            logger.error(f"❌ Ошибка подписчика изменений пользователей: {e}")
+
+
+@event.listens_for(SessionFactory, "after_flush")
+def _collect_changed_users(session, flush_context):
+    if not _user_change_listeners or session.info.get("changed_users", ()) is None:
+        return
+    changed = session.info.setdefault("changed_users", set())
+    # Состояние ещё «до flush»: dirty с неизменёнными значениями (save_user на каждое
+    # сообщение в группе) отсеивает is_modified
+    dirty = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    for obj in (*session.new, *dirty, *session.deleted):
+        if isinstance(obj, _CASCADE_MODELS) and obj in session.deleted:
+            session.info["changed_users"] = None
+            return
+        if isinstance(obj, _PROFILE_MODELS):
+            changed.add(obj.user_id)
+
+
+@event.listens_for(SessionFactory, "after_commit")
+def _notify_changed_users(session):
+    changed = session.info.pop("changed_users", set())
+    if changed is None or changed:
+        notify_users_changed(changed)
+
+
+@event.listens_for(SessionFactory, "after_rollback")
+def _drop_changed_users(session):
+    session.info.pop("changed_users", None)
+
+
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.incr("db.checkouts")
+    uow = _current_uow.get()
+    if uow is not None and uow.active:
+        uow.checkouts += 1
+
+
+def _count_begin(conn):
+    metrics.incr("db.transactions")
+    uow = _current_uow.get()
+    if uow is not None and uow.active:
+        uow.transactions += 1
 
 
 # ==========================================
 # СИНХРОННЫЕ ФУНКЦИИ
 # ==========================================
 
-def get_all_users_sync():
-    """Получает всех пользователей из базы"""
+def get_all_users_sync() -> list[UserRow]:
+    """Получает всех пользователей (внутри апдейта — участников текущего сообщества)"""
     session = Session()
     try:
-        return session.query(User).all()
+        stmt = _user_columns(User).order_by(User.id) if current_tenant() is None else MEMBER_ROWS
+        return list(starmap(UserRow, session.execute(stmt)))
     finally:
         session.close()
 
 
-def get_role_users_sync(role_model):
+def get_role_users_sync(role_model) -> list[RoleUserRow]:
     """Получает всех пользователей указанной роли"""
     session = Session()
     try:
-        return session.query(role_model).all()
+        stmt = _user_columns(role_model).add_columns(role_model.id_ml).order_by(role_model.id)
+        return list(starmap(RoleUserRow, session.execute(stmt)))
     finally:
         session.close()
 
 
-def find_user_by_username_sync(username: str):
+def get_user_sync(user_id: int) -> UserRow | None:
+    """Находит пользователя по Telegram ID"""
+    session = Session()
+    try:
+        row = session.execute(USER_ROW_BY_ID, {"user_id": user_id}).first()
+        return UserRow(*row) if row else None
+    finally:
+        session.close()
+
+
+def find_user_by_username_sync(username: str) -> UserRow | None:
     """Находит пользователя по username"""
     if not username:
         return None
     clean_username = username.lstrip('@')
     session = Session()
     try:
-        return session.query(User).filter(User.username == clean_username).first()
+        stmt = USER_ROW_BY_USERNAME if current_tenant() is None else MEMBER_ROW_BY_USERNAME
+        row = session.execute(stmt, {"username": clean_username}).first()
+        return UserRow(*row) if row else None
     finally:
         session.close()
 
 
-def add_user_to_role_sync(role_model, user: User, id_ml: int):
-    """Добавляет пользователя в роль"""
+def add_user_to_role_sync(role_model, user_id: int, id_ml: int):
+    """Добавляет пользователя в роль (данные имени берутся из таблицы users)"""
     session = Session()
     try:
-        existing = session.query(role_model).filter_by(user_id=user.user_id).first()
+        user = session.execute(USER_BY_ID, {"user_id": user_id}).scalar()
+        if not user:
+            raise ValueError("Пользователь не найден в базе")
+
+        existing = session.execute(ROLE_ENTRY[role_model], {"user_id": user.user_id}).scalar()
         if existing:
             raise ValueError("Пользователь уже зарегистрирован в этой роли")
 
@@ -263,7 +875,7 @@ def remove_user_from_role_sync(role_model, user_id: int):
     """Удаляет пользователя из роли"""
     session = Session()
     try:
-        entry = session.query(role_model).filter_by(user_id=user_id).first()
+        entry = session.execute(ROLE_ENTRY[role_model], {"user_id": user_id}).scalar()
         if not entry:
             raise ValueError("Пользователь не найден в этой категории")
         session.delete(entry)
@@ -276,19 +888,57 @@ def remove_user_from_role_sync(role_model, user_id: int):
         session.close()
 
 
-def is_user_admin_sync(user_id: int) -> bool:
+def load_admin_grants_sync() -> list[tuple[int, int, int]]:
+    """Все выданные права: (chat_id, user_id, маска) — для снимка acl.py"""
+    session = Session()
+    try:
+        stmt = select(AdminGrant.chat_id, AdminGrant.user_id, AdminGrant.permissions)
+        return [tuple(row) for row in session.execute(stmt)]
+    finally:
+        session.close()
+
+
+def change_admin_grant_sync(chat_id: int, user_id: int, add: int = 0, remove: int = 0,
+                            granted_by: int | None = None) -> int:
     """
-    Проверяет, является ли пользователь администратором.
-    Использует ADMIN_IDS из config.py.
+    Добавляет (add) и снимает (remove) биты прав пользователя в сообществе chat_id (0 — во всех).
+    Строка без прав удаляется. Возвращает новую маску; снимок прав в памяти подменяется сразу.
     """
-    return user_id in ADMIN_IDS
+    session = Session()
+    try:
+        grant = session.get(AdminGrant, (chat_id, user_id))
+        before = grant.permissions if grant else 0
+        after = (before | add) & ~remove
+        if after == before:
+            return after
+        if grant is None:
+            session.add(AdminGrant(chat_id=chat_id, user_id=user_id, permissions=after, granted_by=granted_by))
+        elif after:
+            grant.permissions = after
+            grant.granted_by = granted_by
+        else:
+            session.delete(grant)
+        session.commit()
+        # Статус админа/модератора виден в карточке профиля
+        notify_users_changed({user_id})
+        acl.changed()
+        logger.info(f"🔑 Права {user_id} в {chat_id or 'во всех сообществах'}: {before} -> {after} (выдал {granted_by})")
+        return after
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
 
 
-def save_user_sync(user_id, first_name, last_name, username):
-    """Сохраняет или обновляет пользователя в базе"""
+def save_user_sync(user_id, first_name, last_name, username, chat_id=None, chat_title=None):
+    """
+    Сохраняет или обновляет пользователя в базе.
+    chat_id — группа, где его видели: пользователь становится участником сообщества.
+    """
     session = Session()
     try:
-        user = session.query(User).filter_by(user_id=user_id).first()
+        user = session.execute(USER_BY_ID, {"user_id": user_id}).scalar()
         if user:
             user.first_name = first_name
             user.last_name = last_name
@@ -303,6 +953,12 @@ def save_user_sync(user_id, first_name, last_name, username):
             )
             session.add(user)
             logger.info(f"➕ Новый пользователь {user_id} добавлен в базу")
+        if chat_id is not None and not session.execute(MEMBERSHIP, {"chat_id": chat_id, "user_id": user_id}).first():
+            session.flush()  # участник ссылается на users.user_id
+            if session.get(Tenant, chat_id) is None:
+                session.add(Tenant(chat_id=chat_id, title=chat_title))
+                logger.info(f"🏘 Новое сообщество {chat_id} ({chat_title})")
+            session.add(TenantMember(chat_id=chat_id, user_id=user_id))
         session.commit()
         return user.id
     except Exception as e:
@@ -320,11 +976,7 @@ def get_user_role_sync(user_id: int):
     """
     session = Session()
     try:
-        for role_key, model in ROLE_TO_MODEL.items():
-            entry = session.query(model).filter_by(user_id=user_id).first()
-            if entry:
-                return role_key
-        return None
+        return session.execute(USER_FIRST_ROLE, {"chat_id": effective_tenant(), "user_id": user_id}).scalar()
     finally:
         session.close()
 
@@ -335,46 +987,70 @@ def get_user_statistics_sync(user_id: int):
     - количество сыгранных матчей
     - средняя оценка
     - оценки по ролям
+    Живые таблицы складываются с агрегатами заархивированных ивентов.
+    Матчи и оценки соединяются с ивентами: внутри апдейта на Event и архивные агрегаты
+    действует ограничение по сообществу, поэтому статистика — по текущему сообществу.
     """
     session = Session()
     try:
+        archived = session.query(
+            func.coalesce(func.sum(ArchivedUserStats.played_matches), 0),
+            func.coalesce(func.sum(ArchivedUserStats.spectator_count), 0),
+            func.coalesce(func.sum(ArchivedUserStats.ratings_count), 0),
+            func.coalesce(func.sum(ArchivedUserStats.ratings_sum), 0),
+        ).filter(ArchivedUserStats.user_id == user_id).one()
+        archived_played, archived_spectator, archived_count, archived_sum = archived
+
+        def user_matches(query):
+            return query.join(EventMatch, EventMatch.id == MatchParticipant.match_id).join(
+                Event, Event.id == EventMatch.event_id
+            )
+
         # Количество сыгранных матчей (где played=True)
-        played_matches = session.query(MatchParticipant).filter_by(
-            user_id=user_id, 
-            played=True
-        ).count()
+        played_matches = user_matches(session.query(MatchParticipant)).filter(
+            MatchParticipant.user_id == user_id,
+            MatchParticipant.played == True  # noqa: E712
+        ).count() + archived_played
         
         # Средняя оценка по всем ролям
-        from sqlalchemy import func
-        avg_rating = session.query(func.avg(RoleRating.rating)).filter(
+        count, total = user_matches(
+            session.query(func.count(RoleRating.rating), func.sum(RoleRating.rating))
+            .join(MatchParticipant, MatchParticipant.id == RoleRating.match_participant_id)
+        ).filter(
             RoleRating.user_id == user_id
-        ).scalar()
-        avg_rating = round(avg_rating, 1) if avg_rating else None
+        ).one()
+        count, total = count + archived_count, (total or 0) + archived_sum
+        avg_rating = round(total / count, 1) if count else None
         
-        # Оценки по ролям (группировка по role_played)
+        # Оценки по ролям (группировка по role_played, включая игры без роли)
+        role_totals = {}
+        live_rows = user_matches(session.query(
+            MatchParticipant.role_played, func.count(RoleRating.rating), func.sum(RoleRating.rating)
+        ).join(MatchParticipant, MatchParticipant.id == RoleRating.match_participant_id)).filter(
+            RoleRating.user_id == user_id
+        ).group_by(MatchParticipant.role_played).all()
+        archived_rows = session.query(
+            ArchivedRoleStats.role, func.sum(ArchivedRoleStats.ratings_count), func.sum(ArchivedRoleStats.ratings_sum)
+        ).filter(ArchivedRoleStats.user_id == user_id).group_by(ArchivedRoleStats.role).all()
+        for role, role_count, role_sum in live_rows + archived_rows:
+            key = role or 'unknown'
+            prev_count, prev_sum = role_totals.get(key, (0, 0))
+            role_totals[key] = (prev_count + role_count, prev_sum + (role_sum or 0))
+
         role_stats = {}
-        for role in ROLE_LIST + [None]:  # включая игры без роли
-            # Получаем все оценки для этой роли
-            query = session.query(RoleRating).join(MatchParticipant).filter(
-                RoleRating.user_id == user_id
-            )
-            if role:
-                query = query.filter(MatchParticipant.role_played == role)
-            else:
-                query = query.filter(MatchParticipant.role_played.is_(None))
-            
-            ratings = [r.rating for r in query.all()]
-            if ratings:
-                role_stats[role or 'unknown'] = {
-                    'count': len(ratings),
-                    'avg': round(sum(ratings) / len(ratings), 1)
+        for key in ROLE_LIST + ['unknown']:
+            role_count, role_sum = role_totals.get(key, (0, 0))
+            if role_count:
+                role_stats[key] = {
+                    'count': role_count,
+                    'avg': round(role_sum / role_count, 1)
                 }
         
         # Количество матчей, где был зрителем
-        spectator_count = session.query(MatchParticipant).filter_by(
-            user_id=user_id,
-            team='spectator'
-        ).count()
+        spectator_count = user_matches(session.query(MatchParticipant)).filter(
+            MatchParticipant.user_id == user_id,
+            MatchParticipant.team == 'spectator'
+        ).count() + archived_spectator
         
         return {
             'played_matches': played_matches,
@@ -386,13 +1062,98 @@ def get_user_statistics_sync(user_id: int):
         session.close()
 
 
+def get_user_tenants_sync(user_id: int) -> list:
+    """Сообщества, в которых состоит пользователь: строки (chat_id, title)"""
+    session = Session()
+    try:
+        return session.execute(USER_TENANTS, {"user_id": user_id}).all()
+    finally:
+        session.close()
+
+
+def save_tenant_sync(chat_id: int, title: str | None):
+    """Создаёт сообщество или обновляет его название (бота добавили в группу)"""
+    session = Session()
+    try:
+        tenant = session.get(Tenant, chat_id)
+        if tenant is None:
+            session.add(Tenant(chat_id=chat_id, title=title))
+            logger.info(f"🏘 Новое сообщество {chat_id} ({title})")
+        elif title and tenant.title != title:
+            tenant.title = title
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def remove_tenant_member_sync(chat_id: int, user_id: int) -> bool:
+    """
+    Участник вышел из группы: убирает только членство.
+    Роли остаются — ими управляют админы сообщества.
+    """
+    session = Session()
+    try:
+        membership = session.execute(MEMBERSHIP, {"chat_id": chat_id, "user_id": user_id}).scalar()
+        if membership is None:
+            return False
+        session.delete(membership)
+        session.commit()
+        return True
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def remove_user_from_tenant_sync(user_id: int) -> list[str] | None:
+    """
+    Убирает пользователя из текущего сообщества: роли и членство.
+    Запись users удаляется, только если он больше нигде не состоит.
+    Возвращает названия удалённых ролей (None — пользователь не найден).
+    """
+    chat_id = effective_tenant()
+    session = Session()
+    try:
+        if session.execute(USER_ROW_BY_ID, {"user_id": user_id}).first() is None:
+            return None
+        deleted_roles = []
+        for role_key, model in ROLE_TO_MODEL.items():
+            entry = session.execute(
+                select(model).where(model.chat_id == chat_id, model.user_id == user_id)
+            ).scalar()
+            if entry is not None:
+                session.delete(entry)
+                deleted_roles.append(ROLE_NAMES[role_key])
+        membership = session.execute(MEMBERSHIP, {"chat_id": chat_id, "user_id": user_id}).scalar()
+        if membership is not None:
+            session.delete(membership)
+        session.flush()
+        elsewhere = session.execute(
+            select(TenantMember.chat_id).where(TenantMember.user_id == user_id).limit(1)
+            .execution_options(all_tenants=True)
+        ).first()
+        if elsewhere is None:
+            session.delete(session.execute(USER_BY_ID, {"user_id": user_id}).scalar())
+        session.commit()
+        return deleted_roles
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 def get_event_with_lineup_sync(event_id: int):
     """
     Проверяет, есть ли у события зафиксированный состав (матч)
     """
     session = Session()
     try:
-        return session.query(EventMatch).filter_by(event_id=event_id).first() is not None
+        return session.execute(EVENT_HAS_LINEUP, {"event_id": event_id}).first() is not None
     finally:
         session.close()
 
@@ -412,15 +1173,20 @@ async def get_role_users(role_key: str):
     return await asyncio.to_thread(get_role_users_sync, model)
 
 
+async def get_user(user_id: int):
+    """Асинхронная обёртка для поиска по Telegram ID"""
+    return await asyncio.to_thread(get_user_sync, user_id)
+
+
 async def find_user_by_username(username: str):
     """Асинхронная обёртка для поиска по username"""
     return await asyncio.to_thread(find_user_by_username_sync, username)
 
 
-async def add_user_to_role(role_key: str, user: User, id_ml: int):
+async def add_user_to_role(role_key: str, user_id: int, id_ml: int):
     """Асинхронная обёртка для добавления в роль"""
     model = ROLE_TO_MODEL[role_key]
-    return await asyncio.to_thread(add_user_to_role_sync, model, user, id_ml)
+    return await asyncio.to_thread(add_user_to_role_sync, model, user_id, id_ml)
 
 
 async def remove_user_from_role(role_key: str, user_id: int):
@@ -429,11 +1195,6 @@ async def remove_user_from_role(role_key: str, user_id: int):
     return await asyncio.to_thread(remove_user_from_role_sync, model, user_id)
 
 
-async def is_user_admin(user_id: int) -> bool:
-    """Асинхронная обёртка для проверки админа"""
-    return await asyncio.to_thread(is_user_admin_sync, user_id)
-
-
 async def save_user(*args, **kwargs):
     """Асинхронная обёртка для сохранения пользователя"""
     return await asyncio.to_thread(save_user_sync, *args, **kwargs)
@@ -449,6 +1210,26 @@ async def get_user_statistics(user_id: int):
     return await asyncio.to_thread(get_user_statistics_sync, user_id)
 
 
+async def get_user_tenants(user_id: int):
+    """Асинхронная обёртка для списка сообществ пользователя"""
+    return await asyncio.to_thread(get_user_tenants_sync, user_id)
+
+
+async def save_tenant(chat_id: int, title: str | None):
+    """Асинхронная обёртка для сохранения сообщества"""
+    return await asyncio.to_thread(save_tenant_sync, chat_id, title)
+
+
+async def remove_tenant_member(chat_id: int, user_id: int):
+    """Асинхронная обёртка для выхода участника из сообщества"""
+    return await asyncio.to_thread(remove_tenant_member_sync, chat_id, user_id)
+
+
+async def remove_user_from_tenant(user_id: int):
+    """Асинхронная обёртка для удаления пользователя из сообщества"""
+    return await asyncio.to_thread(remove_user_from_tenant_sync, user_id)
+
+
 async def get_event_with_lineup(event_id: int):
     """Асинхронная обёртка для проверки наличия состава"""
     return await asyncio.to_thread(get_event_with_lineup_sync, event_id)
\ No newline at end of file
@@ -0,0 +1,482 @@
+"""
+diagnostics.py
+Диагностика памяти работающего бота: /memory (только админам, в ЛС).
+
+    /memory              — сводка: RSS, сборщик мусора, живые ORM-объекты и DTO, самые
+                           частые типы, размеры user_data / chat_data / bot_data по ключам,
+                           размеры внутренних кэшей;
+    /memory start [N]    — включить tracemalloc (N кадров стека, по умолчанию MEMDIAG_TRACE_FRAMES)
+                           и запомнить исходный снимок;
+    /memory diff         — что выросло с прошлого снимка, по файлу и строке (снимок становится новой базой);
+    /memory stop         — выключить tracemalloc;
+    /memory dump         — всё вместе (и полный топ аллокаций) в JSON-файл в MEMDIAG_DIR, файл приходит
+                           документом; при включённом tracemalloc рядом ложится снимок
+                           (tracemalloc.Snapshot.load) для разбора офлайн.
+
+Сводка считается в цикле событий: user_data и кэши меняются только там, а проход по всем
+объектам gc занимает доли секунды. Цифры — процесса, который обработал команду
+(в режиме WORKERS — воркера, за которым закреплён админ).
+"""
+import asyncio
+import gc
+import html
+import json
+import os
+import sys
+import sysconfig
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from types import FunctionType, MethodType, ModuleType
+
+from telegram import Update, InputFile
+from telegram.ext import ContextTypes
+
+from acl import Permission
+from cache import live_caches
+from config import MEMDIAG_DIR, MEMDIAG_TRACE_FRAMES, logger
+from db import Base, get_engine
+from events.utils import MSK_TZ
+from tenant import has_permission
+import metrics
+
+# Сколько строк в сообщении и в файле
+REPORT_TOP = 10
+DUMP_TOP = 200
+# Предел обхода объектов при подсчёте размеров одного хранилища: сводка не должна вешать бота
+MAX_WALK = 500_000
+# Лимит длины сообщения Telegram (с запасом)
+MESSAGE_LIMIT = 4000
+
+# Не обходим вглубь: это общее для всего процесса, а не данные хранилища
+_OPAQUE = (type, ModuleType, FunctionType, MethodType)
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_STDLIB = sysconfig.get_paths()["stdlib"]
+
+# Снимок, с которым сравнивает /memory diff, и когда он снят
+_baseline: tracemalloc.Snapshot | None = None
+_baseline_at = 0.0
+
+
+# ==========================================
+# ПОДСЧЁТЫ
+# ==========================================
+
+def _rss() -> tuple[int | None, int | None]:
+    """Текущий и пиковый RSS процесса, байт (None — платформа не даёт)"""
+    current = peak = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    return current, peak
+
+
+def deep_size(obj, seen: set, budget: list) -> int:
+    """
+    Размер объекта со всем, на что он ссылается (контейнеры, __dict__, __slots__).
+    Уже посчитанное (seen) не учитывается повторно; budget[0] — сколько объектов ещё можно обойти.
+    """
+    size = 0
+    stack = [obj]
+    while stack and budget[0] > 0:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _OPAQUE):
+            continue
+        seen.add(id(item))
+        budget[0] -= 1
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif not isinstance(item, (str, bytes, int, float, bool)) and item is not None:
+            attrs = getattr(item, "__dict__", None)
+            if attrs is not None:
+                stack.append(attrs)
+            for cls in type(item).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    value = getattr(item, name, None)
+                    if value is not None:
+                        stack.append(value)
+    return size
+
+
+def data_sizes(storage) -> dict:
+    """
+    user_data / chat_data: {id: dict} -> записей, пустых, байт всего и по ключам
+    (у скольких записей ключ есть и сколько занимает). Брошенные состояния мастеров видны здесь.
+    """
+    seen, budget = set(), [MAX_WALK]
+    keys = {}
+    total = empty = 0
+    for data in list(storage.values()):
+        if not data:
+            empty += 1
+        total += sys.getsizeof(data)
+        for key, value in list(data.items()):
+            entry = keys.setdefault(str(key), {"holders": 0, "bytes": 0})
+            entry["holders"] += 1
+            entry["bytes"] += deep_size(value, seen, budget)
+    total += sum(entry["bytes"] for entry in keys.values())
+    ordered = dict(sorted(keys.items(), key=lambda item: item[1]["bytes"], reverse=True))
+    return {"entries": len(storage), "empty": empty, "bytes": total, "keys": ordered, "truncated": budget[0] <= 0}
+
+
+def bot_data_sizes(bot_data: dict) -> dict:
+    seen, budget = set(), [MAX_WALK]
+    keys = {str(key): {"bytes": deep_size(value, seen, budget)} for key, value in list(bot_data.items())}
+    ordered = dict(sorted(keys.items(), key=lambda item: item[1]["bytes"], reverse=True))
+    return {"bytes": sum(entry["bytes"] for entry in keys.values()), "keys": ordered, "truncated": budget[0] <= 0}
+
+
+def _own_dataclass(cls) -> bool:
+    """dataclass, объявленный в модулях бота (а не в SQLAlchemy, aiohttp и т. п.)"""
+    if not hasattr(cls, "__dataclass_fields__"):
+        return False
+    filename = getattr(sys.modules.get(cls.__module__), "__file__", None) or ""
+    return filename.startswith(_ROOT) and os.sep + ".venv" + os.sep not in filename
+
+
+def object_counts() -> dict:
+    """Живые объекты по типам после полной сборки мусора: ORM-модели, DTO (dataclass бота) и самые частые типы"""
+    collected = gc.collect()
+    by_type = Counter(map(type, gc.get_objects()))
+    mapped = {mapper.class_ for mapper in Base.registry.mappers}
+    orm = {cls.__name__: count for cls, count in by_type.items() if cls in mapped}
+    dto = {
+        f"{cls.__module__}.{cls.__qualname__}": count
+        for cls, count in by_type.items() if cls not in mapped and _own_dataclass(cls)
+    }
+    top = [(f"{cls.__module__}.{cls.__qualname__}", count) for cls, count in by_type.most_common(DUMP_TOP)]
+    return {
+        "gc": {"collected": collected, "garbage": len(gc.garbage), "tracked": sum(by_type.values()),
+               "generations": list(gc.get_count())},
+        "orm": dict(sorted(orm.items(), key=lambda item: -item[1])),
+        "dto": dict(sorted(dto.items(), key=lambda item: -item[1])),
+        "top_types": top,
+    }
+
+
+def cache_sizes() -> dict:
+    """Внутренние кэши: AsyncTTLCache по именам, кэш скомпилированного SQL и gauge-метрики структур"""
+    caches = {}
+    for cache in live_caches():
+        stats = cache.stats()
+        entry = caches.setdefault(cache.name, {"instances": 0, "entries": 0, "inflight": 0,
+                                               "max_entries": stats["max_entries"], "ttl": stats["ttl"]})
+        entry["instances"] += 1
+        entry["entries"] += stats["entries"]
+        entry["inflight"] += stats["inflight"]
+    compiled = get_engine()._compiled_cache
+    if compiled is not None:
+        caches["sqlalchemy.compiled"] = {"instances": 1, "entries": len(compiled), "inflight": 0,
+                                         "max_entries": compiled.capacity, "ttl": None}
+    # Очереди процессора, корзины троттлинга и т. п. уже отдаются gauge-метриками
+    gauges = {name: value for name, value in metrics.snapshot()["gauges"].items() if isinstance(value, int)}
+    return {"caches": caches, "gauges": gauges}
+
+
+def collect_report(application) -> dict:
+    """Сводка по процессу. Вызывать в цикле событий (обход user_data и кэшей)"""
+    started = time.perf_counter()
+    rss, peak = _rss()
+    report = {
+        "pid": os.getpid(),
+        "time": datetime.now(MSK_TZ).isoformat(timespec="seconds"),
+        "rss_bytes": rss,
+        "peak_rss_bytes": peak,
+        **object_counts(),
+        "user_data": data_sizes(application.user_data),
+        "chat_data": data_sizes(application.chat_data),
+        "bot_data": bot_data_sizes(application.bot_data),
+        **cache_sizes(),
+        "tracemalloc": trace_status(),
+    }
+    report["collect_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    metrics.observe("memdiag.collect_ms", report["collect_ms"])
+    return report
+
+
+# ==========================================
+# TRACEMALLOC
+# ==========================================
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+
+def short_path(filename: str) -> str:
+    """Путь файла относительно бота, stdlib или site-packages"""
+    # site-packages первым: виртуальное окружение может лежать в папке бота
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[-1]
+    if filename.startswith(_ROOT):
+        return os.path.relpath(filename, _ROOT)
+    if filename.startswith(_STDLIB):
+        return os.path.relpath(filename, _STDLIB)
+    return filename
+
+
+def _where(frame) -> str:
+    return f"{short_path(frame.filename)}:{frame.lineno}"
+
+
+def trace_status() -> dict:
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "baseline_age_s": round(time.monotonic() - _baseline_at) if _baseline else None,
+    }
+
+
+def trace_start(frames: int = MEMDIAG_TRACE_FRAMES) -> bool:
+    """Включает tracemalloc и снимает исходный снимок. False — уже включён"""
+    global _baseline, _baseline_at
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    _baseline, _baseline_at = _snapshot(), time.monotonic()
+    return True
+
+
+def trace_stop() -> bool:
+    """Выключает tracemalloc и забывает снимок. False — не был включён"""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    _baseline = None
+    return True
+
+
+def trace_diff(top: int = REPORT_TOP, rebase: bool = True) -> list[dict] | None:
+    """
+    Рост памяти с прошлого снимка по файлу и строке, от большего к меньшему.
+    rebase — новый снимок становится базой для следующего diff. None — tracemalloc выключен.
+    """
+    global _baseline, _baseline_at
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = _snapshot()
+    stats = snapshot.compare_to(_baseline, "lineno") if _baseline else snapshot.statistics("lineno")
+    if rebase or _baseline is None:
+        _baseline, _baseline_at = snapshot, time.monotonic()
+    return [
+        {"where": _where(stat.traceback[0]), "size_diff": getattr(stat, "size_diff", stat.size),
+         "count_diff": getattr(stat, "count_diff", stat.count), "size": stat.size, "count": stat.count}
+        for stat in stats[:top]
+    ]
+
+
+def trace_top(top: int = DUMP_TOP) -> list[dict]:
+    """Крупнейшие места аллокаций сейчас (без сравнения)"""
+    if not tracemalloc.is_tracing():
+        return []
+    return [
+        {"where": _where(stat.traceback[0]), "size": stat.size, "count": stat.count,
+         "traceback": [_where(frame) for frame in stat.traceback]}
+        for stat in _snapshot().statistics("traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno")[:top]
+    ]
+
+
+# ==========================================
+# ДАМП
+# ==========================================
+
+def dump_sync(report: dict, directory: str = MEMDIAG_DIR) -> tuple[str, str | None]:
+    """Пишет отчёт (и снимок tracemalloc, если включён) в directory. Возвращает пути файлов"""
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"memory_{datetime.now(MSK_TZ):%Y%m%d_%H%M%S}_{report['pid']}")
+    snapshot_path = None
+    if tracemalloc.is_tracing():
+        report = {**report, "allocations": trace_top(), "growth": trace_diff(DUMP_TOP, rebase=False)}
+        snapshot_path = f"{stem}.tracemalloc"
+        _snapshot().dump(snapshot_path)
+    json_path = f"{stem}.json"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1, default=str)
+    return json_path, snapshot_path
+
+
+# ==========================================
+# ТЕКСТ
+# ==========================================
+
+def _size(value: int | None) -> str:
+    if value is None:
+        return "—"
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+    return f"{value:.1f} ГБ"
+
+
+def _fit(lines: list[str]) -> str:
+    """Целые строки, пока сообщение помещается в лимит Telegram"""
+    text, size = [], 0
+    for line in lines:
+        size += len(line) + 1
+        if size > MESSAGE_LIMIT:
+            text.append("…")
+            break
+        text.append(line)
+    return "\n".join(text)
+
+
+def _signed(value: int) -> str:
+    return f"+{_size(value)}" if value >= 0 else f"-{_size(-value)}"
+
+
+def _name(qualified: str) -> str:
+    # Типы из функций называются вроде f.<locals>.Row — в HTML-разметке их нужно экранировать
+    return html.escape(qualified.rsplit(".", 1)[-1] if ".<locals>." not in qualified else qualified)
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"🧠 <b>Память процесса {report['pid']}</b>",
+        f"RSS: {_size(report['rss_bytes'])} (пик {_size(report['peak_rss_bytes'])})",
+        f"gc: объектов {report['gc']['tracked']}, собрано {report['gc']['collected']}, "
+        f"в gc.garbage {report['gc']['garbage']}",
+    ]
+    if report["orm"]:
+        lines.append("\n🗃 <b>ORM-объекты:</b> " + ", ".join(f"{name} {count}" for name, count in report["orm"].items()))
+    if report["dto"]:
+        lines.append("📦 <b>DTO:</b> " + ", ".join(
+            f"{_name(name)} {count}" for name, count in list(report["dto"].items())[:REPORT_TOP]
+        ))
+    lines.append("\n🔢 <b>Частые типы:</b> " + ", ".join(
+        f"{_name(name)} {count}" for name, count in report["top_types"][:REPORT_TOP]
+    ))
+
+    for title, data in (("user_data", report["user_data"]), ("chat_data", report["chat_data"])):
+        lines.append(
+            f"\n👤 <b>{title}</b>: записей {data['entries']} (пустых {data['empty']}), {_size(data['bytes'])}"
+            + (" (обход обрезан)" if data["truncated"] else "")
+        )
+        lines += [
+            f"• {html.escape(key)}: у {entry['holders']}, {_size(entry['bytes'])}"
+            for key, entry in list(data["keys"].items())[:REPORT_TOP]
+        ]
+    bot_data = report["bot_data"]
+    lines.append(f"\n🤖 <b>bot_data</b>: {_size(bot_data['bytes'])}")
+    lines += [f"• {html.escape(key)}: {_size(entry['bytes'])}" for key, entry in list(bot_data["keys"].items())[:REPORT_TOP]]
+
+    lines.append("\n🗄 <b>Кэши:</b>")
+    for name, cache in report["caches"].items():
+        limit = f" из {cache['max_entries']}" if cache["max_entries"] else ""
+        instances = f" ({cache['instances']} шт.)" if cache["instances"] > 1 else ""
+        lines.append(f"• {name}{instances}: {cache['entries']}{limit}")
+    if report["gauges"]:
+        lines.append("📏 " + ", ".join(f"{name} {value}" for name, value in report["gauges"].items()))
+
+    trace = report["tracemalloc"]
+    if trace["tracing"]:
+        lines.append(
+            f"\n🔬 tracemalloc: {_size(trace['traced_bytes'])} (пик {_size(trace['peak_bytes'])}), "
+            f"{trace['frames']} кадр., свои расходы {_size(trace['overhead_bytes'])}"
+        )
+    else:
+        lines.append("\n🔬 tracemalloc выключен: /memory start")
+    lines.append(f"⏱ Собрано за {report['collect_ms']} мс · подробнее: /memory dump")
+    return _fit(lines)
+
+
+def format_diff(diff: list[dict]) -> str:
+    if not diff:
+        return "🔬 С прошлого снимка ничего не изменилось."
+    lines = ["🔬 <b>Рост с прошлого снимка</b> (файл:строка):"]
+    lines += [
+        f"• <code>{html.escape(item['where'])}</code>: {_signed(item['size_diff'])} "
+        f"({item['count_diff']:+d} объектов, всего {_size(item['size'])})"
+        for item in diff
+    ]
+    return _fit(lines)
+
+
+# ==========================================
+# ХЕНДЛЕР
+# ==========================================
+
+USAGE = (
+    "🧠 <b>/memory</b> — сводка по памяти\n"
+    "<code>/memory start [кадров]</code> — включить tracemalloc\n"
+    "<code>/memory diff</code> — рост с прошлого снимка\n"
+    "<code>/memory stop</code> — выключить tracemalloc\n"
+    "<code>/memory dump</code> — всё в файл"
+)
+
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/memory — диагностика памяти процесса (только админам)"""
+    if update.effective_chat.type != "private":
+        await update.message.reply_text("❌ Эта команда доступна только в личных сообщениях.")
+        return
+    if not has_permission(update.effective_user.id, Permission.DIAGNOSTICS):
+        await update.message.reply_text("❌ Эта функция доступна только администраторам.")
+        return
+
+    args = context.args or []
+    action = args[0].lower() if args else "report"
+
+    if action == "start":
+        try:
+            frames = int(args[1]) if len(args) > 1 else MEMDIAG_TRACE_FRAMES
+        except ValueError:
+            await update.message.reply_text(USAGE, parse_mode="HTML")
+            return
+        # Первый снимок — синхронная копия всех трасс, не в цикле событий
+        started = await asyncio.to_thread(trace_start, max(1, frames))
+        text = (f"🔬 tracemalloc включён ({max(1, frames)} кадр.), исходный снимок снят."
+                if started else "🔬 tracemalloc уже включён.")
+        logger.info(f"🧠 tracemalloc включён админом {update.effective_user.id}")
+    elif action == "stop":
+        text = "🔬 tracemalloc выключен." if trace_stop() else "🔬 tracemalloc и так выключен."
+    elif action == "diff":
+        diff = await asyncio.to_thread(trace_diff)
+        text = format_diff(diff) if diff is not None else "🔬 tracemalloc выключен: /memory start"
+    elif action == "report":
+        text = format_report(collect_report(context.application))
+    elif action == "dump":
+        report = collect_report(context.application)
+        try:
+            json_path, snapshot_path = await asyncio.to_thread(dump_sync, report)
+        except OSError as e:
+            logger.error(f"❌ Не удалось записать дамп памяти: {e}")
+            await update.message.reply_text("❌ Не удалось записать дамп.")
+            return
+        logger.info(f"🧠 Дамп памяти: {json_path}")
+        with open(json_path, "rb") as f:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=InputFile(f, filename=os.path.basename(json_path)),
+                caption=f"🧠 Дамп памяти процесса {report['pid']}"
+                        + (f"\nСнимок tracemalloc: {snapshot_path}" if snapshot_path else ""),
+            )
+        return
+    else:
+        text = USAGE
+
+    await update.message.reply_text(text, parse_mode="HTML")
@@ -2,6 +2,7 @@
 handlers.py
 Обработчики событий. Используют HTML-форматирование.
 """
+import asyncio
 import html
 import random
 from datetime import datetime, timedelta
@@ -14,14 +15,18 @@ from db import ROLE_NAMES
 from db import (
     Session, Event, EventParticipant, User,
     EventMatch, MatchParticipant, RoleRating,
-    ROLE_TO_MODEL, ROLE_LIST
+    ROLE_TO_MODEL, ROLE_LIST, OPEN_EVENT_STATUSES
 )
-from config import ADMIN_IDS, logger
+from acl import Permission
+from config import logger
+from tenant import has_permission
+from skill import PRIOR_SKILL, UNKNOWN_ROLE, get_skills, record_lineup, record_not_played, record_rating
 import state
 
 from events.utils import (
     get_group_id, save_user_from_tg, get_event_by_id,
     get_upcoming_events, get_event_participants, is_user_participant,
+    get_event_participant, count_event_participants, event_has_lineup,
     format_user_mention, DATE_FORMAT, MSK_TZ, get_user_role
 )
 from events.keyboards import (
@@ -30,52 +35,70 @@ from events.keyboards import (
 )
 
 
-async def _display_event_detail(query, event_id, context):
-    """Отображает детали события, используя переданный query и event_id"""
-    user_id = query.from_user.id
-    is_admin = user_id in ADMIN_IDS
-
+def load_event_detail_sync(event_id: int, user_id: int):
+    """
+    Загружает всё, что нужно для карточки события.
+    Возвращает None, если события нет, иначе словарь:
+    event, participants, user_map ({user_id: User}), is_joined, has_lineup.
+    """
     session = Session()
     try:
         event = get_event_by_id(session, event_id)
         if not event:
-            await query.edit_message_text("❌ Событие не найдено или удалено.")
-            return
+            return None
 
-        ev_time = datetime.strptime(event.event_time, DATE_FORMAT)
-        time_str = ev_time.strftime("%d %b %Y, %H:%M")
         participants = get_event_participants(session, event_id)
-        is_joined = is_user_participant(session, event_id, user_id)
-        has_lineup = session.query(EventMatch).filter_by(event_id=event_id).first() is not None
-        safe_title = html.escape(event.title)
-
-        lines = [
-            f"🎯 <b>{safe_title}</b>",
-            f"🕒 <b>Время:</b> {time_str} (МСК)",
-            f"\n-------------------"
-        ]
-
-        if not participants:
-            lines.append("\n👻 <b>Участников пока нет</b>\nСтаньте первым!")
-        else:
-            lines.append(f"\n👥 <b>Участники ({len(participants)}):</b>")
-            p_user_ids = [p.user_id for p in participants]
-            users = session.query(User).filter(User.user_id.in_(p_user_ids)).all() if p_user_ids else []
-            user_map = {u.user_id: u for u in users}
-            for i, p in enumerate(participants, 1):
-                u = user_map.get(p.user_id)
-                lines.append(f"{i}. {format_user_mention(u)}")
-
-        reply_markup = get_event_detail_kb(event_id, is_joined, is_admin, event.status, has_lineup)
-
-        await query.edit_message_text(
-            "\n".join(lines),
-            reply_markup=reply_markup,
-            parse_mode="HTML"
-        )
+        p_user_ids = [p.user_id for p in participants]
+        users = session.query(User).filter(User.user_id.in_(p_user_ids)).all() if p_user_ids else []
+        return {
+            'event': event,
+            'participants': participants,
+            'user_map': {u.user_id: u for u in users},
+            'is_joined': is_user_participant(session, event_id, user_id),
+            'has_lineup': event_has_lineup(session, event_id),
+        }
     finally:
         session.close()
 
+
+async def _display_event_detail(query, event_id, context):
+    """Отображает детали события, используя переданный query и event_id"""
+    user_id = query.from_user.id
+    is_admin = has_permission(user_id, Permission.EVENTS)
+
+    detail = await asyncio.to_thread(load_event_detail_sync, event_id, user_id)
+    if not detail:
+        await query.edit_message_text("❌ Событие не найдено или удалено.")
+        return
+
+    event = detail['event']
+    participants = detail['participants']
+    ev_time = datetime.strptime(event.event_time, DATE_FORMAT)
+    time_str = ev_time.strftime("%d %b %Y, %H:%M")
+    safe_title = html.escape(event.title)
+
+    lines = [
+        f"🎯 <b>{safe_title}</b>",
+        f"🕒 <b>Время:</b> {time_str} (МСК)",
+        f"\n-------------------"
+    ]
+
+    if not participants:
+        lines.append("\n👻 <b>Участников пока нет</b>\nСтаньте первым!")
+    else:
+        lines.append(f"\n👥 <b>Участники ({len(participants)}):</b>")
+        for i, p in enumerate(participants, 1):
+            u = detail['user_map'].get(p.user_id)
+            lines.append(f"{i}. {format_user_mention(u)}")
+
+    reply_markup = get_event_detail_kb(event_id, detail['is_joined'], is_admin, event.status, detail['has_lineup'])
+
+    await query.edit_message_text(
+        "\n".join(lines),
+        reply_markup=reply_markup,
+        parse_mode="HTML"
+    )
+
 # ==========================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ДЛЯ ФОРМАТИРОВАНИЯ
 # ==========================================
@@ -102,7 +125,7 @@ async def events_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         user_id = update.effective_user.id
 
-    is_admin = user_id in ADMIN_IDS
+    is_admin = has_permission(user_id, Permission.EVENTS)
 
     session = Session()
     try:
@@ -152,46 +175,39 @@ async def handle_event_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         if not event:
             return await query.answer("Событие было удалено.", show_alert=True)
 
-        # Нельзя записываться/отписываться, если ивент завершён
-        if event.status == 'completed':
+        # Нельзя записываться/отписываться, если ивент завершён или истёк
+        if event.status not in OPEN_EVENT_STATUSES:
             return await query.answer("Ивент уже завершён.", show_alert=True)
 
-        existing = session.query(EventParticipant).filter_by(
-            event_id=event_id, user_id=user_id
-        ).first()
-
-        action_text = ""
-        participants_count = 0
+        existing = get_event_participant(session, event_id, user_id)
 
         if action == "event_join":
             if existing:
                 return await query.answer("Вы уже записаны!")
 
-            session.add(EventParticipant(event_id=event_id, user_id=user_id))
+            # Сохраняем пользователя той же сессией апдейта (единица работы), затем запись
             await save_user_from_tg(tg_user)
+            session.add(EventParticipant(event_id=event_id, user_id=user_id))
+        elif existing:
+            session.delete(existing)
+        else:
+            return await query.answer("Вы не были записаны.")
 
-            participants_count = session.query(EventParticipant).filter_by(event_id=event_id).count()
-            logger.info(f"✅ User {user_id} joined event {event_id}")
+        participants_count = count_event_participants(session, event_id)
+        # Фиксируем до сетевых запросов, чтобы не держать блокировку записи SQLite во время отправки
+        session.commit()
 
+        if action == "event_join":
+            logger.info(f"✅ User {user_id} joined event {event_id}")
             await send_private_confirmation(context, tg_user, event, "join", participants_count)
             await notify_group_about_join(context, event, tg_user)
-
             action_text = f"✅ Вы записаны! Всего участников: {participants_count}"
+        else:
+            logger.info(f"❌ User {user_id} left event {event_id}")
+            await send_private_confirmation(context, tg_user, event, "leave", participants_count)
+            await notify_group_about_leave(context, event, tg_user)
+            action_text = f"❌ Вы отписались. Осталось участников: {participants_count}"
 
-        elif action == "event_leave":
-            if existing:
-                session.delete(existing)
-                participants_count = session.query(EventParticipant).filter_by(event_id=event_id).count()
-                logger.info(f"❌ User {user_id} left event {event_id}")
-
-                await send_private_confirmation(context, tg_user, event, "leave", participants_count)
-                await notify_group_about_leave(context, event, tg_user)
-
-                action_text = f"❌ Вы отписались. Осталось участников: {participants_count}"
-            else:
-                return await query.answer("Вы не были записаны.")
-
-        session.commit()
         await query.answer(action_text)
 
         # Обновляем карточку
@@ -244,7 +260,7 @@ async def notify_group_about_join(context, event, tg_user):
 
     session = Session()
     try:
-        participants_count = session.query(EventParticipant).filter_by(event_id=event.id).count()
+        participants_count = count_event_participants(session, event.id)
     finally:
         session.close()
 
@@ -271,7 +287,7 @@ async def notify_group_about_leave(context, event, tg_user):
 
     session = Session()
     try:
-        participants_count = session.query(EventParticipant).filter_by(event_id=event.id).count()
+        participants_count = count_event_participants(session, event.id)
     finally:
         session.close()
 
@@ -297,7 +313,7 @@ async def create_event_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer()
 
     user_id = query.from_user.id if query else update.effective_user.id
-    if user_id not in ADMIN_IDS:
+    if not is_tenant_admin(user_id):
         if query:
             return await query.answer("🔒 Только админы могут создавать игры.", show_alert=True)
         else:
@@ -317,7 +333,7 @@ async def create_event_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if user_id not in ADMIN_IDS:
+    if not is_tenant_admin(user_id):
         return
 
     state_curr = context.user_data.get("crm_state")
@@ -483,7 +499,7 @@ async def select_minute(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def edit_event_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    if query.from_user.id not in ADMIN_IDS:
+    if not is_tenant_admin(query.from_user.id):
         return await query.answer("🔒 Только для админов", show_alert=True)
 
     event_id = int(query.data.split(":")[1])
@@ -561,7 +577,7 @@ async def receive_edited_title(update: Update, context: ContextTypes.DEFAULT_TYP
     if context.user_data.get("state") != "EDITING_TITLE":
         return
     user_id = update.effective_user.id
-    if user_id not in ADMIN_IDS:
+    if not is_tenant_admin(user_id):
         return
 
     new_title = update.message.text.strip()
@@ -642,7 +658,7 @@ async def delete_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = query.from_user.id
-    if user_id not in ADMIN_IDS:
+    if not is_tenant_admin(user_id):
         return await query.answer("Нет прав.", show_alert=True)
 
     event_id = int(query.data.split(":")[1])
@@ -653,13 +669,7 @@ async def delete_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
             event_title = event.title
             safe_title = html.escape(event_title)
 
-            # Удаляем всё связанное
-            session.query(EventParticipant).filter_by(event_id=event_id).delete()
-            # Удаляем матчи и их участников (каскадно? но проще почистить отдельно)
-            matches = session.query(EventMatch).filter_by(event_id=event_id).all()
-            for m in matches:
-                session.query(MatchParticipant).filter_by(match_id=m.id).delete()
-                session.delete(m)
+            # Участники, матчи, составы и оценки удаляются каскадно внешними ключами (ON DELETE CASCADE)
             session.delete(event)
             session.commit()
             await query.answer("Игра удалена.")
@@ -715,20 +725,56 @@ async def back_to_hour(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # УМНЫЙ МИКС (с учётом ролей)
 # ==========================================
 
+def get_mix_roles(session, users) -> dict:
+    """Роли участников микса: {user_id: ключ роли} (пользователи без роли не попадают)"""
+    user_roles = {}
+    for u in users:
+        role = get_user_role(session, u.user_id)
+        if role:
+            user_roles[u.user_id] = role
+    return user_roles
+
+
+def get_mix_strength(session, users, user_roles) -> dict:
+    """Сила участников микса: консервативный навык в основной роли (skill.py), одним запросом"""
+    skills = get_skills(session, [u.user_id for u in users])
+    return {
+        u.user_id: skills.get(u.user_id, {}).get(user_roles.get(u.user_id) or UNKNOWN_ROLE, PRIOR_SKILL).conservative
+        for u in users
+    }
+
+
+def balance_teams(red: list, blue: list, strength: dict, user_roles: dict, max_swaps: int = 10):
+    """
+    Выравнивает суммарную силу команд обменами игроков одной роли (или обоих без роли):
+    состав ролей не меняется, случайность микса сохраняется, пока обмен не улучшает баланс.
+    """
+    diff = sum(strength[u.user_id] for u in red) - sum(strength[u.user_id] for u in blue)
+    for _ in range(max_swaps):
+        best = None
+        for i, r in enumerate(red):
+            for j, b in enumerate(blue):
+                if user_roles.get(r.user_id) != user_roles.get(b.user_id):
+                    continue
+                new_diff = diff - 2 * (strength[r.user_id] - strength[b.user_id])
+                if abs(new_diff) < abs(diff) - 1e-9 and (best is None or abs(new_diff) < abs(best[2])):
+                    best = (i, j, new_diff)
+        if best is None:
+            return
+        i, j, diff = best
+        red[i], blue[j] = blue[j], red[i]
+
+
 async def smart_mix(users, session):
     """
-    Распределяет участников по командам, стараясь учесть их роли.
+    Распределяет участников по командам, стараясь учесть их роли и выровнять силу команд.
     Возвращает словарь: {'red': [...], 'blue': [...], 'spectators': [...]}
     """
     if len(users) < 2:
         return {'red': [], 'blue': [], 'spectators': []}
 
     # Получаем роли пользователей
-    user_roles = {}
-    for u in users:
-        role = get_user_role(session, u.user_id)
-        if role:
-            user_roles[u.user_id] = role
+    user_roles = get_mix_roles(session, users)
 
     # Группируем игроков по ролям
     role_buckets = {role: [] for role in ROLE_LIST}
@@ -783,11 +829,18 @@ async def smart_mix(users, session):
         else:
             break
 
+    red, blue = red[:5], blue[:5]
+    balance_teams(red, blue, get_mix_strength(session, red + blue, user_roles), user_roles)
+
     # Если после заполнения остались игроки (больше 10), они становятся зрителями
     in_teams = set(red + blue)
     spectators = [u for u in users if u not in in_teams]
 
-    return {'red': red[:5], 'blue': blue[:5], 'spectators': spectators}
+    return {'red': red, 'blue': blue, 'spectators': spectators}
+
+
+# Ключ результата микса -> значение match_participants.team
+MATCH_TEAMS = {'red': 'red', 'blue': 'blue', 'spectators': 'spectator'}
 
 
 def format_mix_result(event_title, mix_result, session):
@@ -839,7 +892,7 @@ async def event_mix(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.answer("Микс доступен только для активных событий.", show_alert=True)
             return
 
-        has_lineup = session.query(EventMatch).filter_by(event_id=event_id).first() is not None
+        has_lineup = event_has_lineup(session, event_id)
         if has_lineup:
             await query.answer("Состав уже зафиксирован. Нельзя перемешать.", show_alert=True)
             return
@@ -893,7 +946,7 @@ async def event_mix_again(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         users = session.query(User).filter(User.user_id.in_(user_ids)).all()
         mix_result = await smart_mix(users, session)
-        text = format_mix_result(event.title, mix_result)
+        text = format_mix_result(event.title, mix_result, session)
 
         keyboard = [
             [InlineKeyboardButton("🔄 Перемешать ещё", callback_data=f"event_mix_again:{event_id}")],
@@ -942,18 +995,24 @@ async def event_fix_lineup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         session.flush()  # получаем id
 
         # Добавляем участников матча
+        players = []
         for team_name, team_users in mix_result.items():
             for u in team_users:
                 role_played = get_user_role(session, u.user_id)  # какая роль была у игрока
+                if team_name != 'spectators':
+                    players.append((u.user_id, role_played))
                 mp = MatchParticipant(
                     match_id=event_match.id,
                     user_id=u.user_id,
-                    team=team_name,
+                    team=MATCH_TEAMS[team_name],
                     role_played=role_played,
                     played=(team_name != 'spectators')
                 )
                 session.add(mp)
 
+        # Сыгранный матч меняет навык игроков (skill.py) — в той же транзакции
+        record_lineup(session, event, players)
+
         # Обновляем статус события
         event.status = 'lineup_fixed'
         session.commit()
@@ -1091,6 +1150,7 @@ async def rate_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             rated_by=query.from_user.id
         )
         session.add(rating_entry)
+        record_rating(session, mp, rating)
         session.commit()
     except Exception as e:
         session.rollback()
@@ -1110,8 +1170,10 @@ async def rate_user_not_played(update: Update, context: ContextTypes.DEFAULT_TYP
     session = Session()
     try:
         mp = session.query(MatchParticipant).get(mp_id)
-        if mp:
+        if mp and mp.played is not False:
             mp.played = False
+            # Матч не сыгран: его дрейф навыка убирается (skill.py) — в той же транзакции
+            record_not_played(session, mp)
             session.commit()
     except Exception as e:
         session.rollback()
@@ -1168,7 +1230,7 @@ async def complete_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not event:
             await query.edit_message_text("❌ Событие не найдено.")
             return
-        if event.status == 'completed':
+        if event.status not in OPEN_EVENT_STATUSES:
             await query.answer("Ивент уже завершён.", show_alert=True)
             return
     finally:
@@ -1191,7 +1253,7 @@ async def confirm_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     session = Session()
     try:
-        event = session.query(Event).get(event_id)
+        event = get_event_by_id(session, event_id)
         if event:
             event.status = 'completed'
             session.commit()
@@ -1222,17 +1284,17 @@ async def check_and_notify_events(context: ContextTypes.DEFAULT_TYPE):
         events = session.query(Event).filter(
             Event.event_time >= now_str,
             Event.event_time <= window,
-            Event.status != 'completed'
+            Event.status.in_(OPEN_EVENT_STATUSES)
         ).all()
 
         if not events:
             return
 
-        group_id = get_group_id(context)
-        if not group_id:
-            return
-
         for ev in events:
+            # Планировщик работает вне апдейта: каждое событие уходит в группу своего сообщества
+            group_id = ev.chat_id or get_group_id(context)
+            if not group_id:
+                continue
             participants = get_event_participants(session, ev.id)
             user_ids = [p.user_id for p in participants]
             users = session.query(User).filter(User.user_id.in_(user_ids)).all() if user_ids else []
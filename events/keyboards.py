@@ -5,6 +5,7 @@ keyboards.py
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from datetime import datetime, timedelta
 
+from db import OPEN_EVENT_STATUSES
 from .utils import DATE_FORMAT, MSK_TZ
 import state
 
@@ -44,8 +45,8 @@ def get_event_detail_kb(event_id: int, is_joined: bool, is_admin: bool,
     """Клавиатура просмотра конкретного события"""
     keyboard = []
     
-    # Если событие завершено – только кнопка назад
-    if event_status == 'completed':
+    # Если событие завершено или истекло – только кнопка назад
+    if event_status not in OPEN_EVENT_STATUSES:
         keyboard.append([InlineKeyboardButton("⬅️ К списку", callback_data="back_to_evt_list")])
         return InlineKeyboardMarkup(keyboard)
     
@@ -6,13 +6,22 @@ from datetime import datetime, timedelta, timezone
 from telegram import User as TgUser
 import html
 
-from db import Event, EventParticipant, User, Session
+from db import (
+    Event, EventParticipant, User, Session,
+    EVENT_BY_ID, UPCOMING_EVENTS, EVENT_PARTICIPANTS, EVENT_PARTICIPANT, EVENT_PARTICIPANTS_COUNT, EVENT_HAS_LINEUP,
+    USER_FIRST_ROLE
+)
 from config import GROUP_ID, logger
+from tenant import current_tenant, effective_tenant
 
 DATE_FORMAT = "%Y-%m-%d %H:%M"
 MSK_TZ = timezone(timedelta(hours=3))
 
 def get_group_id(context) -> int | None:
+    """Группа текущего сообщества; вне апдейта — группа из настроек"""
+    chat_id = current_tenant()
+    if chat_id:
+        return chat_id
     if GROUP_ID:
         return GROUP_ID
     return context.bot_data.get("last_admin_group_id")
@@ -38,26 +47,27 @@ async def save_user_from_tg(tg_user: TgUser):
     )
 
 def get_event_by_id(session, event_id: int) -> Event | None:
-    return session.query(Event).get(event_id)
+    return session.execute(EVENT_BY_ID, {"event_id": event_id}).scalar()
 
 def get_upcoming_events(session) -> list[Event]:
-    # Возвращаем все незавершённые события (статус не 'completed')
-    return session.query(Event).filter(
-        Event.status != 'completed'
-    ).order_by(Event.event_time).all()
+    # Возвращаем все незавершённые события (active / lineup_fixed), по индексу (status, event_time)
+    return session.execute(UPCOMING_EVENTS).scalars().all()
 
 def get_event_participants(session, event_id: int):
-    return session.query(EventParticipant).filter_by(event_id=event_id).all()
+    return session.execute(EVENT_PARTICIPANTS, {"event_id": event_id}).scalars().all()
+
+def count_event_participants(session, event_id: int) -> int:
+    return session.execute(EVENT_PARTICIPANTS_COUNT, {"event_id": event_id}).scalar()
+
+def get_event_participant(session, event_id: int, user_id: int) -> EventParticipant | None:
+    return session.execute(EVENT_PARTICIPANT, {"event_id": event_id, "user_id": user_id}).scalar()
 
 def is_user_participant(session, event_id: int, user_id: int) -> bool:
-    return session.query(EventParticipant).filter_by(
-        event_id=event_id, user_id=user_id
-    ).first() is not None
+    return get_event_participant(session, event_id, user_id) is not None
+
+def event_has_lineup(session, event_id: int) -> bool:
+    return session.execute(EVENT_HAS_LINEUP, {"event_id": event_id}).first() is not None
 
 def get_user_role(session, user_id: int) -> str | None:
     """Возвращает ключ роли пользователя (middle, gold, ...) или None"""
-    from db import ROLE_TO_MODEL
-    for role_key, model in ROLE_TO_MODEL.items():
-        if session.query(model).filter_by(user_id=user_id).first():
-            return role_key
-    return None
\ No newline at end of file
+    return session.execute(USER_FIRST_ROLE, {"chat_id": effective_tenant(), "user_id": user_id}).scalar()
@@ -0,0 +1,56 @@
+"""
+lazy.py
+Отложенная загрузка модулей хендлеров.
+
+main.py регистрирует хендлеры через lazy_callback("модуль:функция"): модуль
+импортируется при первом вызове, а не при импорте main. Так запуск бота, скриптов
+и бенчмарков не платит за модули, которые ещё не понадобились. После старта
+preload() догружает их в фоне, чтобы первый апдейт не ждал импорта.
+"""
+import asyncio
+import importlib
+import time
+
+import metrics
+from config import logger
+
+_registered: set[str] = set()
+
+
+def lazy_callback(path: str):
+    """Корутина-заместитель для "модуль:функция" с тем же именем (его видят логи и replay)"""
+    module_name, attr = path.split(":")
+    target = None
+
+    async def callback(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(importlib.import_module(module_name), attr)
+        return await target(*args, **kwargs)
+
+    callback.__name__ = callback.__qualname__ = attr
+    callback.__module__ = module_name
+    _registered.add(module_name)
+    return callback
+
+
+def preload_sync() -> float:
+    """Импортирует все модули, зарегистрированные через lazy_callback. Возвращает время, мс"""
+    started = time.perf_counter()
+    for module_name in sorted(_registered):
+        importlib.import_module(module_name)
+    elapsed = (time.perf_counter() - started) * 1000
+    metrics.observe("startup.preload_ms", elapsed)
+    return elapsed
+
+
+async def preload(application=None):
+    """post_init: догрузка модулей хендлеров в фоне, пока бот уже принимает апдейты"""
+    async def _run():
+        elapsed = await asyncio.to_thread(preload_sync)
+        logger.info(f"📚 Модули хендлеров загружены за {elapsed:.0f} мс")
+
+    if application is not None:
+        application.create_task(_run(), name="preload_handlers")
+    else:
+        await _run()
@@ -7,7 +7,9 @@ import html
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import ADMIN_IDS, logger
+from acl import Permission
+from config import logger
+from tenant import has_permission, is_admin, is_staff
 from db import get_all_users, Session, ROLE_TO_MODEL, ROLE_NAMES
 import state
 
@@ -19,6 +21,31 @@ def escape_html(text):
     return html.escape(str(text))
 
 
+def get_roles_for_users_sync(user_ids: list) -> dict:
+    """Возвращает {user_id: [названия ролей]} для переданных пользователей"""
+    session = Session()
+    try:
+        user_roles = {}
+        
+        for role_key, Model in ROLE_TO_MODEL.items():
+            role_entries = session.query(Model).filter(
+                Model.user_id.in_(user_ids)
+            ).all()
+            
+            for entry in role_entries:
+                uid = entry.user_id
+                if uid not in user_roles:
+                    user_roles[uid] = []
+                
+                role_name = ROLE_NAMES[role_key]
+                if role_name not in user_roles[uid]:
+                    user_roles[uid].append(role_name)
+        
+        return user_roles
+    finally:
+        session.close()
+
+
 async def show_all_players(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает список всех пользователей с пагинацией"""
     query = update.callback_query
@@ -26,7 +53,7 @@ async def show_all_players(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     
-    if user_id not in ADMIN_IDS:
+    if not has_permission(user_id, Permission.PLAYERS):
         await query.edit_message_text("❌ У вас нет прав для просмотра этого раздела.")
         return
 
@@ -45,7 +72,7 @@ async def show_all_players(update: Update, context: ContextTypes.DEFAULT_TYPE):
             page = 1
 
     total_users = len(users)
-    admin_count = sum(1 for user in users if user.user_id in ADMIN_IDS)
+    admin_count = sum(1 for user in users if is_admin(user.user_id))
     total_pages = (total_users + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
     
     start_index = (page - 1) * ITEMS_PER_PAGE
@@ -57,37 +84,18 @@ async def show_all_players(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"📄 Страница {page}/{total_pages}\n\n"
     )
     
-    # Логика проверки ролей
-    def get_roles_for_page_sync():
-        session = Session()
-        try:
-            user_roles = {}
-            
-            for role_key, Model in ROLE_TO_MODEL.items():
-                role_entries = session.query(Model).filter(
-                    Model.user_id.in_([u.user_id for u in page_users])
-                ).all()
-                
-                for entry in role_entries:
-                    uid = entry.user_id
-                    if uid not in user_roles:
-                        user_roles[uid] = []
-                    
-                    role_name = ROLE_NAMES[role_key]
-                    if role_name not in user_roles[uid]:
-                        user_roles[uid].append(role_name)
-            
-            return user_roles
-        finally:
-            session.close()
-
-    user_roles_map = await asyncio.to_thread(get_roles_for_page_sync)
+    user_roles_map = await asyncio.to_thread(get_roles_for_users_sync, [u.user_id for u in page_users])
 
     # Формируем сообщение
     for user in page_users:
         full_name = f"{user.first_name} {user.last_name or ''}".strip() or "Не указано имя"
         username = f"@{user.username}" if user.username else "нет username"
-        admin_status = "✅ Админ" if user.user_id in ADMIN_IDS else "❌ Игрок"
+        if is_admin(user.user_id):
+            admin_status = "✅ Админ"
+        elif is_staff(user.user_id):
+            admin_status = "🛡 Модератор"
+        else:
+            admin_status = "❌ Игрок"
         
         safe_name = escape_html(full_name)
         safe_username = escape_html(username)
@@ -10,52 +10,107 @@ from telegram.ext import (
     filters,
     ChatMemberHandler,
     CallbackQueryHandler,
+    TypeHandler,
     ContextTypes
 )
 
 # Импорты из наших модулей
-import db
+import metrics
 import state
-from config import BOT_TOKEN, ADMIN_IDS, GROUP_ID, logger, log_config
-from db import save_user
-
-from start import start_command, back_to_menu_handler
-from lists_of_players import show_all_players
-from settings import (
-    settings_menu, settings_del_user_start,
-    settings_info, handle_global_delete_input
+from config import (
+    BOT_TOKEN, GROUP_ID, PERSISTENCE_INTERVAL_SECONDS, CONCURRENT_UPDATES, logger, log_config,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    UPDATE_RECORD_PATH, UPDATE_RECORD_ANONYMIZE, UPDATE_RECORD_SALT, WORKERS, THROTTLE_ENABLED,
+    PROFILER_AUTO_P95_MS
 )
-from profile import profile_command, who_is_handler
-from registration import (
-    reg_menu, view_role_handler, back_to_roles_handler,
-    add_to_role_start, del_from_role_start, handle_registration_input,
-    show_users_by_letter, select_user_for_action,
-    delete_user_handler, del_page_handler
-)
-from tag_players import (
-    tag_menu, teg_view_role_handler, teg_single_user_handler,
-    teg_all_users_handler, teg_back_handler
-)
-# Импорты из папки events
-from events.handlers import (
-    events_menu, show_event_detail, handle_event_action,
-    create_event_start, handle_text_input as handle_crm_input,
-    select_day, select_hour, select_minute,
-    back_to_day, back_to_hour, cancel_creation,
-    delete_event, back_to_events_list,
-    edit_event_start, edit_title_start, edit_time_start, 
-    cancel_edit, receive_edited_title,
-    event_mix, event_mix_again, event_fix_lineup,
-    start_rating, rate_user, rate_user_not_played,
-    rate_skip, rate_finish, complete_event, confirm_complete,
-    check_and_notify_events
-)
-# Импорты из папки announcement
-from announcement.handlers import (
-    announce_start, receive_announce_text,
-    announce_confirm, announce_edit, announce_cancel
-)
-from scheduler import start_scheduler
+from lazy import lazy_callback, preload
+from recorder import UpdateRecorder
+from throttle import ActionThrottle
+from tenant import bind_tenant, invalidate_group_admins
+from update_processor import OrderedUpdateProcessor
+
+# Модули хендлеров (и db вместе с SQLAlchemy) загружаются при первом вызове, см. lazy.py
+save_user = lazy_callback("db:save_user")
+save_tenant = lazy_callback("db:save_tenant")
+remove_tenant_member = lazy_callback("db:remove_tenant_member")
+
+start_command = lazy_callback("start:start_command")
+back_to_menu_handler = lazy_callback("start:back_to_menu_handler")
+community_command = lazy_callback("start:community_command")
+tenant_switch_handler = lazy_callback("start:tenant_switch_handler")
+show_all_players = lazy_callback("lists_of_players:show_all_players")
+settings_menu = lazy_callback("settings:settings_menu")
+settings_del_user_start = lazy_callback("settings:settings_del_user_start")
+settings_info = lazy_callback("settings:settings_info")
+handle_global_delete_input = lazy_callback("settings:handle_global_delete_input")
+profile_command = lazy_callback("profile:profile_command")
+who_is_handler = lazy_callback("profile:who_is_handler")
+roster_menu = lazy_callback("roster:roster_menu")
+roster_document_handler = lazy_callback("roster:roster_document_handler")
+roster_apply = lazy_callback("roster:roster_apply")
+roster_cancel = lazy_callback("roster:roster_cancel")
+roster_export = lazy_callback("roster:roster_export")
+export_command = lazy_callback("match_export:export_command")
+attendance_report = lazy_callback("attendance:attendance_report")
+memory_command = lazy_callback("diagnostics:memory_command")
+profiler_command = lazy_callback("profiler:profiler_command")
+grant_command = lazy_callback("admins:grant_command")
+revoke_command = lazy_callback("admins:revoke_command")
+admins_command = lazy_callback("admins:admins_command")
+
+reg_menu = lazy_callback("registration:reg_menu")
+view_role_handler = lazy_callback("registration:view_role_handler")
+back_to_roles_handler = lazy_callback("registration:back_to_roles_handler")
+add_to_role_start = lazy_callback("registration:add_to_role_start")
+del_from_role_start = lazy_callback("registration:del_from_role_start")
+handle_registration_input = lazy_callback("registration:handle_registration_input")
+show_users_by_letter = lazy_callback("registration:show_users_by_letter")
+select_user_for_action = lazy_callback("registration:select_user_for_action")
+delete_user_handler = lazy_callback("registration:delete_user_handler")
+del_page_handler = lazy_callback("registration:del_page_handler")
+
+tag_menu = lazy_callback("tag_players:tag_menu")
+teg_view_role_handler = lazy_callback("tag_players:teg_view_role_handler")
+teg_single_user_handler = lazy_callback("tag_players:teg_single_user_handler")
+teg_all_users_handler = lazy_callback("tag_players:teg_all_users_handler")
+teg_back_handler = lazy_callback("tag_players:teg_back_handler")
+
+# Хендлеры из папки events
+events_menu = lazy_callback("events.handlers:events_menu")
+show_event_detail = lazy_callback("events.handlers:show_event_detail")
+handle_event_action = lazy_callback("events.handlers:handle_event_action")
+create_event_start = lazy_callback("events.handlers:create_event_start")
+handle_crm_input = lazy_callback("events.handlers:handle_text_input")
+select_day = lazy_callback("events.handlers:select_day")
+select_hour = lazy_callback("events.handlers:select_hour")
+select_minute = lazy_callback("events.handlers:select_minute")
+back_to_day = lazy_callback("events.handlers:back_to_day")
+back_to_hour = lazy_callback("events.handlers:back_to_hour")
+cancel_creation = lazy_callback("events.handlers:cancel_creation")
+delete_event = lazy_callback("events.handlers:delete_event")
+back_to_events_list = lazy_callback("events.handlers:back_to_events_list")
+edit_event_start = lazy_callback("events.handlers:edit_event_start")
+edit_title_start = lazy_callback("events.handlers:edit_title_start")
+edit_time_start = lazy_callback("events.handlers:edit_time_start")
+cancel_edit = lazy_callback("events.handlers:cancel_edit")
+receive_edited_title = lazy_callback("events.handlers:receive_edited_title")
+event_mix = lazy_callback("events.handlers:event_mix")
+event_mix_again = lazy_callback("events.handlers:event_mix_again")
+event_fix_lineup = lazy_callback("events.handlers:event_fix_lineup")
+start_rating = lazy_callback("events.handlers:start_rating")
+rate_user = lazy_callback("events.handlers:rate_user")
+rate_user_not_played = lazy_callback("events.handlers:rate_user_not_played")
+rate_skip = lazy_callback("events.handlers:rate_skip")
+rate_finish = lazy_callback("events.handlers:rate_finish")
+complete_event = lazy_callback("events.handlers:complete_event")
+confirm_complete = lazy_callback("events.handlers:confirm_complete")
+
+# Хендлеры из папки announcement
+announce_start = lazy_callback("announcement.handlers:announce_start")
+receive_announce_text = lazy_callback("announcement.handlers:receive_announce_text")
+announce_confirm = lazy_callback("announcement.handlers:announce_confirm")
+announce_edit = lazy_callback("announcement.handlers:announce_edit")
+announce_cancel = lazy_callback("announcement.handlers:announce_cancel")
 
 
 # ==========================================
@@ -85,17 +140,24 @@ async def dispatch_private_text(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def on_chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка изменения состава чата"""
-    if not update.chat_member:
+    # Добавление самого бота приходит как my_chat_member, вступление участников — как chat_member
+    result = update.chat_member or update.my_chat_member
+    if not result:
         return
     
-    result = update.chat_member
     new_member = result.new_chat_member
+    chat = update.effective_chat
+
+    # Сменились администраторы группы — сбрасываем кэш админов сообщества
+    if {result.old_chat_member.status, new_member.status} & {"administrator", "creator"}:
+        invalidate_group_admins(chat.id)
 
     if new_member.user.id == context.bot.id:
         if new_member.status == "member":
-            chat_id = update.effective_chat.id
+            chat_id = chat.id
             logger.info(f"🤖 Бот добавлен в группу: {chat_id}")
-            await update.effective_chat.send_message(
+            await save_tenant(chat_id, chat.title)
+            await chat.send_message(
                 "✅ Привет! Я запомню эту группу для уведомлений о играх."
             )
             
@@ -103,14 +165,22 @@ async def on_chat_member_update(update: Update, context: ContextTypes.DEFAULT_TY
                 context.bot_data["last_admin_group_id"] = chat_id
         return
 
+    user = new_member.user
     if new_member.status not in ["left", "kicked"]:
-        user = new_member.user
         await save_user(
             user_id=user.id,
             first_name=user.first_name,
             last_name=user.last_name,
-            username=user.username
+            username=user.username,
+            chat_id=chat.id,
+            chat_title=chat.title
         )
+    elif await remove_tenant_member(chat.id, user.id):
+        logger.info(f"👋 Пользователь {user.id} вышел из сообщества {chat.id}")
+        # Меню в ЛС больше не должно работать от имени этой группы
+        user_data = context.application.user_data.get(user.id)
+        if user_data and user_data.get("tenant_id") == chat.id:
+            user_data.pop("tenant_id", None)
 
 
 async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -125,7 +195,9 @@ async def handle_group_message(update: Update, context: ContextTypes.DEFAULT_TYP
         user_id=user.id,
         first_name=user.first_name,
         last_name=user.last_name,
-        username=user.username
+        username=user.username,
+        chat_id=chat.id,
+        chat_title=chat.title
     )
     
     if not GROUP_ID:
@@ -140,6 +212,7 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     if "NoneType" in str(context.error) and "new_chat_member" in str(context.error):
         return
     
+    metrics.incr("errors.unhandled")
     logger.error(f"❌ Ошибка: {context.error}", exc_info=True)
 
 
@@ -147,28 +220,111 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 # MAIN
 # ==========================================
 
-def main():
-    """Точка входа в приложение"""
-    logger.info("🤖 Запуск ML Manager Bot...")
-    
-    log_config()
-    
-    if not BOT_TOKEN:
-        raise ValueError("❌ BOT_TOKEN не найден!")
+# Какие типы апдейтов нужны каждому виду хендлеров.
+# Изменённые сообщения бот не обрабатывает, поэтому MessageHandler/CommandHandler -> только message.
+HANDLER_UPDATE_TYPES = {
+    CallbackQueryHandler: [Update.CALLBACK_QUERY],
+    CommandHandler: [Update.MESSAGE],
+    MessageHandler: [Update.MESSAGE],
+}
+
+CHAT_MEMBER_UPDATE_TYPES = {
+    ChatMemberHandler.MY_CHAT_MEMBER: [Update.MY_CHAT_MEMBER],
+    ChatMemberHandler.CHAT_MEMBER: [Update.CHAT_MEMBER],
+    ChatMemberHandler.ANY_CHAT_MEMBER: [Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER],
+}
+
+
+def derive_allowed_updates(application: Application) -> list[str]:
+    """
+    Собирает allowed_updates по зарегистрированным хендлерам,
+    чтобы Telegram не присылал апдейты, которые бот всё равно не обработает.
+    Для незнакомого типа хендлера безопасно возвращает Update.ALL_TYPES.
+    """
+    allowed = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, TypeHandler):
+                # Служебные TypeHandler (middleware) не требуют отдельных типов
+                continue
+            if isinstance(handler, ChatMemberHandler):
+                allowed.update(CHAT_MEMBER_UPDATE_TYPES[handler.chat_member_types])
+                continue
+            for handler_type, update_types in HANDLER_UPDATE_TYPES.items():
+                if isinstance(handler, handler_type):
+                    allowed.update(update_types)
+                    break
+            else:
+                logger.warning(
+                    f"⚠️ Неизвестный тип хендлера {type(handler).__name__}, запрашиваем все типы апдейтов"
+                )
+                return [str(update_type) for update_type in Update.ALL_TYPES]
+    return sorted(str(update_type) for update_type in allowed)
+
+
+def build_application(builder=None) -> Application:
+    """
+    Создаёт Application и регистрирует все хендлеры.
+    builder можно передать снаружи (например, с base_url локального фейкового Bot API).
+    """
+    # persistence и единица работы нужны сразу: из БД восстанавливаются данные бота
+    import acl
+    import db
+    from persistence import SQLitePersistence
+
+    # Снимок прав — один раз при старте процесса (и в каждом воркере): проверки прав
+    # в хендлерах не ходят в БД
+    acl.reload_sync()
+
+    if builder is None:
+        builder = Application.builder().token(BOT_TOKEN).post_init(preload)
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        builder
+        .persistence(SQLitePersistence(update_interval=PERSISTENCE_INTERVAL_SECONDS))
+        .concurrent_updates(OrderedUpdateProcessor(
+            CONCURRENT_UPDATES, unit_of_work=db.unit_of_work, throttle=ActionThrottle() if THROTTLE_ENABLED else None
+        ))
+        .build()
+    )
     application.add_error_handler(error_handler)
+
+    # Сообщество апдейта (группа или выбранное в ЛС) — раньше всех остальных хендлеров
+    application.add_handler(TypeHandler(Update, bind_tenant), group=-2)
+
+    # Автозапуск профайлера по p95 — в процессе, где выполняются хендлеры (и в каждом воркере)
+    if PROFILER_AUTO_P95_MS:
+        from profiler import LatencyTrigger
+        application.add_handler(TypeHandler(Update, LatencyTrigger()), group=-3)
+
+    # Запись апдейтов для воспроизведения — до всех остальных хендлеров
+    if UPDATE_RECORD_PATH:
+        recorder = UpdateRecorder(
+            UPDATE_RECORD_PATH,
+            anonymize=UPDATE_RECORD_ANONYMIZE,
+            salt=UPDATE_RECORD_SALT.encode() or None,
+        )
+        application.add_handler(TypeHandler(Update, recorder), group=-1)
     
     # ==========================================
     # 1. Системные хендлеры
     # ==========================================
-    application.add_handler(ChatMemberHandler(on_chat_member_update))
+    application.add_handler(
+        ChatMemberHandler(on_chat_member_update, ChatMemberHandler.ANY_CHAT_MEMBER)
+    )
 
     # ==========================================
     # 2. Команды
     # ==========================================
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("me", profile_command))
+    application.add_handler(CommandHandler("community", community_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("memory", memory_command))
+    application.add_handler(CommandHandler("profiler", profiler_command))
+    application.add_handler(CommandHandler("grant", grant_command))
+    application.add_handler(CommandHandler("revoke", revoke_command))
+    application.add_handler(CommandHandler("admins", admins_command))
 
     # ==========================================
     # 3. Групповые хендлеры
@@ -193,6 +349,7 @@ def main():
     application.add_handler(CallbackQueryHandler(tag_menu, pattern=f"^{state.CD_MENU_TAG}$"))
     application.add_handler(CallbackQueryHandler(events_menu, pattern=f"^{state.CD_MENU_CRM}$"))
     application.add_handler(CallbackQueryHandler(back_to_menu_handler, pattern=f"^{state.CD_BACK_TO_MENU}$"))
+    application.add_handler(CallbackQueryHandler(tenant_switch_handler, pattern=f"^{state.CD_TENANT_SWITCH}:"))
     application.add_handler(CallbackQueryHandler(settings_menu, pattern=f"^{state.CD_MENU_SETTINGS}$"))
     
     # ==========================================
@@ -271,6 +428,11 @@ def main():
     application.add_handler(CallbackQueryHandler(settings_del_user_start, pattern="^settings_del_user$"))
     application.add_handler(CallbackQueryHandler(settings_info, pattern="^settings_info$"))
     application.add_handler(CallbackQueryHandler(announce_start, pattern="^settings_announce$"))
+    application.add_handler(CallbackQueryHandler(roster_menu, pattern="^roster_menu$"))
+    application.add_handler(CallbackQueryHandler(roster_export, pattern=r"^roster_export:(csv|json)$"))
+    application.add_handler(CallbackQueryHandler(roster_apply, pattern="^roster_apply$"))
+    application.add_handler(CallbackQueryHandler(roster_cancel, pattern="^roster_cancel$"))
+    application.add_handler(CallbackQueryHandler(attendance_report, pattern="^attendance_report$"))
     
     # ==========================================
     # 8.1. Обработчики объявлений
@@ -291,13 +453,55 @@ def main():
         )
     )
     
+    # Файл состава ролей для массового импорта
+    application.add_handler(
+        MessageHandler(filters.ChatType.PRIVATE & filters.Document.ALL, roster_document_handler)
+    )
+    
+    return application
+
+
+def main():
+    """Точка входа в приложение"""
+    logger.info("🤖 Запуск ML Manager Bot...")
+    
+    log_config()
+    
+    if not BOT_TOKEN:
+        raise ValueError("❌ BOT_TOKEN не найден!")
+
+    application = build_application()
+    allowed_updates = derive_allowed_updates(application)
+    logger.info(f"📨 allowed_updates: {allowed_updates}")
+
+    if WORKERS:
+        # Этот процесс только принимает апдейты и запускает планировщик, обработка — в воркерах
+        import asyncio
+        from workers import serve
+        asyncio.run(serve(application, WORKERS, allowed_updates))
+        return
+
     # ==========================================
     # ЗАПУСК
     # ==========================================
     
+    # APScheduler нужен только боту, не скриптам и бенчмаркам, которые импортируют main
+    from scheduler import start_scheduler
     start_scheduler(application)
     logger.info("🚀 Бот запущен и готов к работе!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+    if WEBHOOK_URL:
+        logger.info(f"🌐 Режим webhook: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates,
+        )
+    else:
+        application.run_polling(allowed_updates=allowed_updates)
 
 
 if __name__ == "__main__":
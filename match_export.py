@@ -0,0 +1,270 @@
+"""
+match_export.py
+Выгрузка истории матчей для таблиц: матчи, составы и оценки текущего сообщества.
+
+/export [csv|parquet] [с YYYY-MM-DD] [по YYYY-MM-DD] [роль] — одна строка на участника
+матча и оценку (участник без оценок — одна строка с пустой оценкой).
+
+Строки читаются из БД порциями (yield_per) и сразу пишутся во временный файл:
+CSV — построчно, Parquet — группой строк на порцию (нужен pyarrow), поэтому память
+не растёт с размером истории. Матчи читаются по индексу event_matches(created_at) —
+фильтр по датам сужает его диапазон, и выгрузка не сортируется; участники нужной роли
+берутся по индексу match_participants(match_id, role_played).
+Матчи, перенесённые в архивную БД (archive.py), в выгрузку не попадают.
+"""
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, literal_column, select
+from telegram import Update, InputFile
+from telegram.ext import ContextTypes
+
+from acl import Permission
+from config import logger
+from db import Event, EventMatch, MatchParticipant, RoleRating, Session, User, ROLE_NAMES
+from events.utils import MSK_TZ
+from tenant import has_permission
+import metrics
+
+EXPORT_CHUNK = 5000
+# Ограничение Bot API на отправку документа
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+FORMATS = ("csv", "parquet")
+DAY_FORMAT = "%Y-%m-%d"
+# Время в выгрузке (UTC, как хранится в БД)
+SQL_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+EXPORT_COLUMNS = [
+    "event_id", "event_title", "event_time", "match_id", "match_created_at",
+    "user_id", "username", "first_name", "team", "role_played", "played",
+    "rating", "comment", "rated_by", "rated_at",
+]
+
+# Роль можно указать ключом (middle) или названием (Мидл); 'unknown' — участники без роли
+ROLE_ALIASES = {**{key: key for key in ROLE_NAMES}, **{name.lower(): key for key, name in ROLE_NAMES.items()}}
+UNKNOWN_ROLE = "unknown"
+
+
+class ExportUnavailable(Exception):
+    """Формат выгрузки недоступен в этой установке (нет pyarrow)"""
+
+
+# ==========================================
+# ПАРАМЕТРЫ
+# ==========================================
+
+def parse_export_args(args: list[str]) -> dict:
+    """
+    Разбирает аргументы /export в любом порядке: формат, до двух дат (с / по) и роль.
+    Бросает ValueError с понятным текстом.
+    """
+    options = {"fmt": "csv", "date_from": None, "date_to": None, "role": None}
+    dates = []
+    for arg in args:
+        token = arg.strip().lower()
+        if token in FORMATS:
+            options["fmt"] = token
+        elif token == UNKNOWN_ROLE or token in ROLE_ALIASES:
+            options["role"] = ROLE_ALIASES.get(token, token)
+        else:
+            try:
+                dates.append(datetime.strptime(token, DAY_FORMAT).date())
+            except ValueError:
+                raise ValueError(f"Непонятный параметр: {arg}")
+    if len(dates) > 2:
+        raise ValueError("Укажите не больше двух дат: с какого и по какое число")
+    if dates:
+        options["date_from"] = dates[0]
+        options["date_to"] = dates[1] if len(dates) == 2 else None
+        if options["date_to"] and options["date_to"] < options["date_from"]:
+            raise ValueError("Дата «по» раньше даты «с»")
+    return options
+
+
+def _utc_bound(day) -> datetime:
+    """Начало дня по Москве в UTC без tzinfo — так created_at хранится в БД"""
+    start = datetime.combine(day, datetime.min.time(), tzinfo=MSK_TZ)
+    return start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _timestamp(column):
+    # Строкой из SQLite: без разбора в datetime и обратного форматирования для каждой строки
+    return func.strftime(SQL_TIME_FORMAT, column)
+
+
+def build_export_query(date_from=None, date_to=None, role: str | None = None):
+    """Матчи ⨝ участники ⨝ оценки; сообщество ограничивает db._scope_by_tenant по Event"""
+    query = (
+        select(
+            Event.id, Event.title, Event.event_time, EventMatch.id, _timestamp(EventMatch.created_at),
+            MatchParticipant.user_id, User.username, User.first_name, MatchParticipant.team,
+            MatchParticipant.role_played, MatchParticipant.played,
+            RoleRating.rating, RoleRating.comment, RoleRating.rated_by, _timestamp(RoleRating.created_at),
+        )
+        .select_from(EventMatch)
+        .join(Event, Event.id == EventMatch.event_id)
+        .join(MatchParticipant, MatchParticipant.match_id == EventMatch.id)
+        .join(User, User.user_id == MatchParticipant.user_id)
+        .outerjoin(RoleRating, RoleRating.match_participant_id == MatchParticipant.id)
+        # Ровно порядок индекса по created_at (с rowid): SQLite ничего не сортирует, участники
+        # и оценки матча идут в порядке индексов по match_id / match_participant_id, то есть по id
+        .order_by(EventMatch.created_at, EventMatch.id)
+    )
+    if date_from:
+        query = query.where(EventMatch.created_at >= _utc_bound(date_from))
+    if date_to:
+        query = query.where(EventMatch.created_at < _utc_bound(date_to + timedelta(days=1)))
+    if role:
+        condition = MatchParticipant.role_played.is_(None) if role == UNKNOWN_ROLE else MatchParticipant.role_played == role
+        # Без статистики SQLite считает фильтр по роли очень избирательным и начинает со скана
+        # match_participants с сортировкой всего результата; likelihood оставляет порядок индекса по дате
+        query = query.where(func.likelihood(condition, literal_column("0.9")))
+    return query
+
+
+def iter_export_chunks(session, query):
+    """Порции строк по EXPORT_CHUNK с курсором на стороне БД"""
+    result = session.execute(query.execution_options(yield_per=EXPORT_CHUNK))
+    yield from result.partitions()
+
+
+# ==========================================
+# ЗАПИСЬ
+# ==========================================
+
+def _write_csv(fileobj, chunks) -> int:
+    # BOM — чтобы Excel открыл UTF-8 без мастера импорта (utf-8-sig пишет его через сброс кодека на каждой строке)
+    fileobj.write("\ufeff".encode("utf-8"))
+    out = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    count = 0
+    try:
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows(
+                (event_id, title, event_time, match_id, created_at, user_id, username, first_name,
+                 team, role_played, int(bool(played)), rating, comment, rated_by, rated_at)
+                for (event_id, title, event_time, match_id, created_at, user_id, username, first_name, team,
+                     role_played, played, rating, comment, rated_by, rated_at) in rows
+            )
+            count += len(rows)
+        out.flush()
+    finally:
+        out.detach()
+    return count
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ("event_id", pa.int64()), ("event_title", pa.string()), ("event_time", pa.string()),
+        ("match_id", pa.int64()), ("match_created_at", pa.timestamp("s")),
+        ("user_id", pa.int64()), ("username", pa.string()), ("first_name", pa.string()),
+        ("team", pa.string()), ("role_played", pa.string()), ("played", pa.bool_()),
+        ("rating", pa.int8()), ("comment", pa.string()), ("rated_by", pa.int64()), ("rated_at", pa.timestamp("s")),
+    ])
+
+
+def _write_parquet(fileobj, chunks) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportUnavailable("Parquet недоступен: на сервере не установлен pyarrow. Выгрузите в CSV.")
+
+    schema = _parquet_schema(pa)
+    count = 0
+    # Каждая порция — отдельная группа строк: в памяти не больше EXPORT_CHUNK строк
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        for rows in chunks:
+            columns = [list(column) for column in zip(*rows)]
+            columns[10] = [bool(played) for played in columns[10]]
+            arrays = [
+                pa.array(column, pa.string()).cast(field.type) if pa.types.is_timestamp(field.type)
+                else pa.array(column, field.type)
+                for column, field in zip(columns, schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+def write_export_sync(fileobj, fmt: str = "csv", date_from=None, date_to=None, role: str | None = None) -> int:
+    """Пишет выгрузку в бинарный файл порциями. Возвращает число строк"""
+    started = time.perf_counter()
+    writer = _write_parquet if fmt == "parquet" else _write_csv
+    session = Session()
+    try:
+        chunks = iter_export_chunks(session, build_export_query(date_from, date_to, role))
+        count = writer(fileobj, chunks)
+    finally:
+        session.close()
+    metrics.incr(f"export.{fmt}")
+    metrics.observe("export.duration_ms", (time.perf_counter() - started) * 1000)
+    return count
+
+
+# ==========================================
+# ХЕНДЛЕР
+# ==========================================
+
+def _describe(options: dict) -> str:
+    parts = []
+    if options["date_from"]:
+        parts.append(f"с {options['date_from']:%d.%m.%Y}")
+    if options["date_to"]:
+        parts.append(f"по {options['date_to']:%d.%m.%Y}")
+    if options["role"]:
+        parts.append(ROLE_NAMES.get(options["role"], "без роли"))
+    return f" ({', '.join(parts)})" if parts else ""
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export — выгрузка матчей, составов и оценок текущего сообщества файлом (только админам)"""
+    if update.effective_chat.type != "private":
+        await update.message.reply_text("❌ Эта команда доступна только в личных сообщениях.")
+        return
+    if not has_permission(update.effective_user.id, Permission.REPORTS):
+        await update.message.reply_text("❌ Эта функция доступна только администраторам.")
+        return
+
+    try:
+        options = parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {e}\n\nПример: <code>/export parquet 2025-01-01 2025-03-31 middle</code>",
+            parse_mode="HTML"
+        )
+        return
+
+    await update.message.reply_text("⏳ Готовлю выгрузку...")
+    fmt = options.pop("fmt")
+    with tempfile.TemporaryFile() as tmp:
+        try:
+            count = await asyncio.to_thread(write_export_sync, tmp, fmt, **options)
+        except ExportUnavailable as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        except Exception as e:
+            logger.error(f"❌ Ошибка выгрузки матчей: {e}", exc_info=True)
+            await update.message.reply_text("❌ Не удалось выгрузить матчи.")
+            return
+
+        size = tmp.seek(0, os.SEEK_END)
+        if size > MAX_DOCUMENT_BYTES:
+            await update.message.reply_text(
+                f"❌ Файл получился больше {MAX_DOCUMENT_BYTES // 1024 // 1024} МБ. "
+                "Сузьте период или выгрузите в Parquet."
+            )
+            return
+        tmp.seek(0)
+        logger.info(f"📤 Выгрузка матчей: {count} строк, {size // 1024} КБ, {fmt}")
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=InputFile(tmp, filename=f"matches_{datetime.now(MSK_TZ):%Y%m%d}.{fmt}"),
+            caption=f"📤 Матчи и оценки{_describe(options)}: {count} строк",
+        )
@@ -0,0 +1,88 @@
+"""
+Простые внутренние метрики бота.
+Счётчики, окна последних значений (для перцентилей) и gauge-функции, которые
+вычисляются в момент снятия снимка. Потокобезопасно: метрики пишутся и из
+event loop, и из потоков asyncio.to_thread.
+"""
+import threading
+from collections import defaultdict, deque
+
+# Сколько последних значений хранить для каждой гистограммы
+SAMPLE_WINDOW = 2048
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_samples = {}
+_gauges = {}
+
+
+def incr(name: str, value: int = 1):
+    """Увеличивает счётчик"""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float):
+    """Добавляет значение в окно гистограммы"""
+    with _lock:
+        window = _samples.get(name)
+        if window is None:
+            window = _samples[name] = deque(maxlen=SAMPLE_WINDOW)
+        window.append(value)
+
+
+def register_gauge(name: str, func):
+    """Регистрирует функцию без аргументов, значение которой попадёт в снимок"""
+    _gauges[name] = func
+
+
+def _percentile(ordered: list, p: float) -> float:
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def percentile(name: str, p: float) -> float:
+    """Перцентиль по текущему окну значений"""
+    with _lock:
+        ordered = sorted(_samples.get(name, ()))
+    return _percentile(ordered, p)
+
+
+def summary(name: str) -> dict:
+    """Сводка по окну: количество, p50/p95/p99, максимум"""
+    with _lock:
+        ordered = sorted(_samples.get(name, ()))
+    return {
+        "count": len(ordered),
+        "p50": _percentile(ordered, 50),
+        "p95": _percentile(ordered, 95),
+        "p99": _percentile(ordered, 99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+def snapshot() -> dict:
+    """Снимок всех метрик (gauge-функции вызываются здесь)"""
+    with _lock:
+        counters = dict(_counters)
+        names = list(_samples)
+    gauges = {}
+    for name, func in list(_gauges.items()):
+        try:
+            gauges[name] = func()
+        except Exception as e:
+            gauges[name] = f"error: {e}"
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": {name: summary(name) for name in names},
+    }
+
+
+def reset():
+    """Сбрасывает счётчики и гистограммы (gauge-функции остаются)"""
+    with _lock:
+        _counters.clear()
+        _samples.clear()
@@ -0,0 +1,41 @@
+"""
+Консольное управление миграциями.
+
+    python -m migrations status
+    python -m migrations up [--target N] [--chunk-size 500] [--pause-ms 5]
+
+Backfill'ы идут короткими транзакциями, поэтому миграции можно применять,
+не останавливая бота.
+"""
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from migrations.runner import migrate, status, DEFAULT_CHUNK_SIZE, DEFAULT_PAUSE_MS
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Версионные миграции БД")
+    parser.add_argument("command", choices=("status", "up"))
+    parser.add_argument("--db", default=os.getenv("DB_NAME", "bot_users.db"), help="путь к БД (по умолчанию DB_NAME)")
+    parser.add_argument("--target", type=int, help="применить миграции до этой версии включительно")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="строк в одной транзакции backfill'а")
+    parser.add_argument("--pause-ms", type=float, default=DEFAULT_PAUSE_MS, help="пауза между порциями backfill'а")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if args.command == "up":
+        applied = migrate(args.db, target=args.target, chunk_size=args.chunk_size, pause_ms=args.pause_ms)
+        print(f"✅ Применено миграций: {len(applied)}" + (f" ({applied})" if applied else ""))
+
+    for version, name, applied_at in status(args.db):
+        mark = f"✅ {applied_at}" if applied_at else "⏳ не применена"
+        print(f"  {version:04d}  {name:<32} {mark}")
+
+
+if __name__ == "__main__":
+    main()
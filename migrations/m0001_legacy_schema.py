@@ -0,0 +1,58 @@
+"""
+Схема, которую раньше доводил до актуальной update_database.py:
+колонка events.status, таблицы миксов и оценок, индексы статистики.
+"""
+VERSION = 1
+NAME = "legacy_schema"
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_match_participants_match_id ON match_participants(match_id)",
+    "CREATE INDEX IF NOT EXISTS idx_match_participants_user_id ON match_participants(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_role_ratings_user_id ON role_ratings(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_role_ratings_match_participant_id ON role_ratings(match_participant_id)",
+]
+
+
+def upgrade(ctx):
+    with ctx.transaction():
+        ctx.add_column("events", "status", "TEXT DEFAULT 'active'")
+
+        ctx.execute("""
+            CREATE TABLE IF NOT EXISTS event_matches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (event_id) REFERENCES events (id) ON DELETE CASCADE
+            )
+        """)
+        ctx.execute("""
+            CREATE TABLE IF NOT EXISTS match_participants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                team TEXT,
+                role_played TEXT,
+                played BOOLEAN DEFAULT 1,
+                FOREIGN KEY (match_id) REFERENCES event_matches (id) ON DELETE CASCADE,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        """)
+        ctx.execute("""
+            CREATE TABLE IF NOT EXISTS role_ratings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_participant_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+                comment TEXT,
+                rated_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (match_participant_id) REFERENCES match_participants (id) ON DELETE CASCADE,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+                FOREIGN KEY (rated_by) REFERENCES users (user_id) ON DELETE SET NULL
+            )
+        """)
+        for sql in INDEXES:
+            ctx.execute(sql)
+
+    # Старые ивенты без статуса считаются активными
+    ctx.backfill_sql("events_status", "events", "status = 'active'", "status IS NULL")
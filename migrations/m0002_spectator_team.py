@@ -0,0 +1,11 @@
+"""
+Единое значение команды зрителей: 'spectator'.
+Фиксация состава писала 'spectators', а статистика профиля ищет 'spectator',
+поэтому счётчик «Зрителем» всегда был нулевым.
+"""
+VERSION = 2
+NAME = "spectator_team"
+
+
+def upgrade(ctx):
+    ctx.backfill_sql("team_spectator", "match_participants", "team = 'spectator'", "team = 'spectators'")
@@ -0,0 +1,130 @@
+"""
+Каскадное удаление через внешние ключи (ON DELETE CASCADE) вместо циклов в Python.
+
+SQLite не умеет менять внешний ключ у существующей таблицы, поэтому таблицы
+пересоздаются: новая таблица -> копия строк одним INSERT ... SELECT -> DROP -> RENAME.
+Перед копированием удаляются «осиротевшие» строки (например, оценки матчей
+удалённых ивентов), иначе включённая проверка ключей не пропустит их изменения.
+"""
+VERSION = 3
+NAME = "cascade_foreign_keys"
+
+# Порядок важен: сначала родители, потом дети
+TABLES = {
+    "event_participants": {
+        "ddl": """
+            CREATE TABLE event_participants__new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+                status VARCHAR,
+                CONSTRAINT uq_event_user UNIQUE (event_id, user_id)
+            )
+        """,
+        "columns": ["id", "event_id", "user_id", "status"],
+        "fk": {"event_id": "CASCADE", "user_id": "CASCADE"},
+        "indexes": [],
+    },
+    "event_matches": {
+        "ddl": """
+            CREATE TABLE event_matches__new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+                created_at DATETIME
+            )
+        """,
+        "columns": ["id", "event_id", "created_at"],
+        "fk": {"event_id": "CASCADE"},
+        "indexes": [],
+    },
+    "match_participants": {
+        "ddl": """
+            CREATE TABLE match_participants__new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_id INTEGER NOT NULL REFERENCES event_matches (id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+                team VARCHAR(10),
+                role_played VARCHAR(20),
+                played BOOLEAN
+            )
+        """,
+        "columns": ["id", "match_id", "user_id", "team", "role_played", "played"],
+        "fk": {"match_id": "CASCADE", "user_id": "CASCADE"},
+        "indexes": [
+            "CREATE INDEX IF NOT EXISTS idx_match_participants_match_id ON match_participants(match_id)",
+            "CREATE INDEX IF NOT EXISTS idx_match_participants_user_id ON match_participants(user_id)",
+        ],
+    },
+    "role_ratings": {
+        "ddl": """
+            CREATE TABLE role_ratings__new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_participant_id INTEGER NOT NULL REFERENCES match_participants (id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+                rating INTEGER,
+                comment VARCHAR,
+                rated_by INTEGER REFERENCES users (user_id) ON DELETE SET NULL,
+                created_at DATETIME
+            )
+        """,
+        "columns": ["id", "match_participant_id", "user_id", "rating", "comment", "rated_by", "created_at"],
+        "fk": {"match_participant_id": "CASCADE", "user_id": "CASCADE", "rated_by": "SET NULL"},
+        "indexes": [
+            "CREATE INDEX IF NOT EXISTS idx_role_ratings_user_id ON role_ratings(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_role_ratings_match_participant_id ON role_ratings(match_participant_id)",
+        ],
+    },
+}
+
+# Строки, ссылающиеся на несуществующих родителей
+ORPHANS = [
+    "DELETE FROM event_participants WHERE event_id NOT IN (SELECT id FROM events)",
+    "DELETE FROM event_participants WHERE user_id NOT IN (SELECT user_id FROM users)",
+    "DELETE FROM event_matches WHERE event_id NOT IN (SELECT id FROM events)",
+    "DELETE FROM match_participants WHERE match_id NOT IN (SELECT id FROM event_matches)",
+    "DELETE FROM match_participants WHERE user_id NOT IN (SELECT user_id FROM users)",
+    "DELETE FROM role_ratings WHERE match_participant_id NOT IN (SELECT id FROM match_participants)",
+    "DELETE FROM role_ratings WHERE user_id NOT IN (SELECT user_id FROM users)",
+    "UPDATE role_ratings SET rated_by = NULL WHERE rated_by NOT IN (SELECT user_id FROM users)",
+]
+
+
+def _has_cascades(ctx, table: str, expected: dict) -> bool:
+    actual = {row[3]: row[6] for row in ctx.execute(f"PRAGMA foreign_key_list({table})")}
+    return all(actual.get(column) == action for column, action in expected.items())
+
+
+def upgrade(ctx):
+    if not all(ctx.table_exists(table) for table in TABLES):
+        return
+    pending = [table for table, spec in TABLES.items() if not _has_cascades(ctx, table, spec["fk"])]
+    if not pending:
+        return
+
+    # Пересоздание таблиц возможно только с выключенной проверкой ключей (вне транзакции)
+    foreign_keys = ctx.execute("PRAGMA foreign_keys").fetchone()[0]
+    ctx.execute("PRAGMA foreign_keys = OFF")
+    try:
+        with ctx.transaction():
+            for sql in ORPHANS:
+                removed = ctx.execute(sql).rowcount
+                if removed:
+                    ctx.log(f"удалено/исправлено осиротевших строк: {removed} ({sql.split(' WHERE')[0]})")
+
+            for table in pending:
+                spec = TABLES[table]
+                existing = {row[1] for row in ctx.execute(f"PRAGMA table_info({table})")}
+                columns = ", ".join(c for c in spec["columns"] if c in existing)
+                ctx.execute(spec["ddl"])
+                ctx.execute(f"INSERT INTO {table}__new ({columns}) SELECT {columns} FROM {table}")
+                ctx.execute(f"DROP TABLE {table}")
+                ctx.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+                for sql in spec["indexes"]:
+                    ctx.execute(sql)
+                ctx.log(f"пересоздана таблица {table}")
+
+            violations = ctx.execute("PRAGMA foreign_key_check").fetchall()
+            if violations:
+                raise RuntimeError(f"Нарушения внешних ключей после пересоздания: {violations[:5]}")
+    finally:
+        ctx.execute(f"PRAGMA foreign_keys = {foreign_keys}")
@@ -0,0 +1,14 @@
+"""
+Составной индекс events(status, event_time).
+По нему работают список ивентов, минутная проверка планировщика,
+очистка прошедших ивентов (sweeper.py) и отбор ивентов для архива.
+"""
+VERSION = 4
+NAME = "events_status_index"
+
+
+def upgrade(ctx):
+    if not ctx.table_exists("events"):
+        return
+    with ctx.transaction():
+        ctx.execute("CREATE INDEX IF NOT EXISTS idx_events_status_time ON events(status, event_time)")
@@ -0,0 +1,146 @@
+"""
+Сообщества: ключ арендатора chat_id у ивентов, ролей и архивной статистики.
+
+Существующие данные относятся к одной группе (сообщество по умолчанию):
+DEFAULT_TENANT_ID / GROUP_ID из окружения, иначе группа, которую бот запомнил
+в bot_data (last_admin_group_id), иначе 0.
+
+    • events: колонка chat_id и индекс (chat_id, status, event_time);
+    • таблицы ролей: уникальность user_id -> (chat_id, user_id), таблицы пересоздаются;
+    • archived_*_stats: chat_id в первичном ключе, таблицы пересоздаются;
+    • все известные пользователи становятся участниками сообщества по умолчанию.
+"""
+import json
+import os
+
+VERSION = 5
+NAME = "tenants"
+
+ROLE_TABLES = ["middle", "exp", "gold", "les", "roam", "moderator"]
+
+ROLE_DDL = """
+    CREATE TABLE {table}__new (
+        id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        first_name VARCHAR NOT NULL,
+        last_name VARCHAR,
+        username VARCHAR,
+        id_ml INTEGER,
+        chat_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT uq_{table}_chat_user UNIQUE (chat_id, user_id)
+    )
+"""
+
+ARCHIVED_DDL = {
+    "archived_user_stats": """
+        CREATE TABLE archived_user_stats__new (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            played_matches INTEGER NOT NULL,
+            spectator_count INTEGER NOT NULL,
+            ratings_count INTEGER NOT NULL,
+            ratings_sum INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    """,
+    "archived_role_stats": """
+        CREATE TABLE archived_role_stats__new (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            ratings_count INTEGER NOT NULL,
+            ratings_sum INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, user_id, role)
+        )
+    """,
+}
+
+SERVICE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS tenants (
+        chat_id INTEGER NOT NULL,
+        title VARCHAR,
+        created_at DATETIME,
+        PRIMARY KEY (chat_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tenant_members (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        joined_at DATETIME,
+        PRIMARY KEY (chat_id, user_id),
+        FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tenant_members_user ON tenant_members (user_id)",
+]
+
+
+def _legacy_chat_id(ctx) -> int:
+    for name in ("DEFAULT_TENANT_ID", "GROUP_ID"):
+        value = os.getenv(name, "").strip()
+        if value and int(value):
+            return int(value)
+    if ctx.table_exists("persist_bot_data"):
+        # До m0007 bot_data хранился одной JSON-строкой под ключом 'bot_data'
+        row = ctx.execute("SELECT data FROM persist_bot_data WHERE key = 'bot_data'").fetchone()
+        if row:
+            try:
+                return int(json.loads(row[0]).get("last_admin_group_id") or 0)
+            except (AttributeError, TypeError, ValueError):
+                pass
+    return 0
+
+
+def _rebuild(ctx, table: str, ddl: str, chat_id: int):
+    """Новая таблица -> копия строк с chat_id -> DROP -> RENAME"""
+    columns = [row[1] for row in ctx.execute(f"PRAGMA table_info({table})") if row[1] != "chat_id"]
+    names = ", ".join(columns)
+    ctx.execute(ddl)
+    ctx.execute(f"INSERT INTO {table}__new ({names}, chat_id) SELECT {names}, ? FROM {table}", (chat_id,))
+    ctx.execute(f"DROP TABLE {table}")
+    ctx.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+    ctx.log(f"пересоздана таблица {table}")
+
+
+def upgrade(ctx):
+    chat_id = _legacy_chat_id(ctx)
+    ctx.log(f"сообщество по умолчанию для существующих данных: {chat_id}")
+    if not chat_id:
+        ctx.warning(
+            "⚠️ группа не известна (нет DEFAULT_TENANT_ID, GROUP_ID и last_admin_group_id в bot_data): "
+            "данные привязаны к сообществу 0 и в группах не видны"
+        )
+
+    with ctx.transaction():
+        for sql in SERVICE_TABLES:
+            ctx.execute(sql)
+
+        if ctx.add_column("events", "chat_id", f"INTEGER NOT NULL DEFAULT {chat_id}"):
+            ctx.execute(
+                "CREATE INDEX IF NOT EXISTS idx_events_chat_status_time ON events (chat_id, status, event_time)"
+            )
+
+        for table in ROLE_TABLES:
+            if ctx.table_exists(table) and not ctx.column_exists(table, "chat_id"):
+                _rebuild(ctx, table, ROLE_DDL.format(table=table), chat_id)
+
+        for table, ddl in ARCHIVED_DDL.items():
+            if ctx.table_exists(table) and not ctx.column_exists(table, "chat_id"):
+                _rebuild(ctx, table, ddl, chat_id)
+
+        if ctx.table_exists("users"):
+            if chat_id:
+                ctx.execute(
+                    "INSERT OR IGNORE INTO tenants (chat_id, title, created_at) VALUES (?, NULL, datetime('now'))",
+                    (chat_id,),
+                )
+            added = ctx.execute(
+                "INSERT OR IGNORE INTO tenant_members (chat_id, user_id, joined_at) "
+                "SELECT ?, user_id, datetime('now') FROM users",
+                (chat_id,),
+            ).rowcount
+            if added:
+                ctx.log(f"участников сообщества {chat_id}: {added}")
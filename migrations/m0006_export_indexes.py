@@ -0,0 +1,17 @@
+"""
+Индексы для выгрузки матчей (match_export.py):
+event_matches(created_at) — фильтр и порядок по дате матча без сортировки всей выгрузки,
+match_participants(match_id, role_played) — фильтр по роли внутри состава матча.
+"""
+VERSION = 6
+NAME = "export_indexes"
+
+
+def upgrade(ctx):
+    with ctx.transaction():
+        if ctx.table_exists("event_matches"):
+            ctx.execute("CREATE INDEX IF NOT EXISTS idx_event_matches_created_at ON event_matches(created_at)")
+        if ctx.table_exists("match_participants"):
+            ctx.execute(
+                "CREATE INDEX IF NOT EXISTS idx_match_participants_match_role ON match_participants(match_id, role_played)"
+            )
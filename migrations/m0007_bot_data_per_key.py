@@ -0,0 +1,32 @@
+"""
+bot_data — по строке на ключ верхнего уровня вместо одной JSON-строки 'bot_data'.
+
+В режиме WORKERS bot_data пишут несколько процессов: целиком записанная строка
+затирала ключи, изменённые другим процессом. Теперь каждый процесс пишет только
+изменённые им ключи (persistence.py).
+"""
+import json
+from datetime import datetime
+
+VERSION = 7
+NAME = "bot_data_per_key"
+
+LEGACY_KEY = "bot_data"
+
+
+def upgrade(ctx):
+    if not ctx.table_exists("persist_bot_data"):
+        return
+    with ctx.transaction():
+        row = ctx.execute("SELECT data FROM persist_bot_data WHERE key = ?", (LEGACY_KEY,)).fetchone()
+        if row is None:
+            return
+        data = json.loads(row[0]) or {}
+        now = datetime.utcnow().isoformat(sep=" ")
+        ctx.execute("DELETE FROM persist_bot_data WHERE key = ?", (LEGACY_KEY,))
+        for key, value in data.items():
+            ctx.execute(
+                "INSERT OR REPLACE INTO persist_bot_data (key, data, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True), now),
+            )
+        ctx.log(f"bot_data разложен по ключам: {len(data)}")
@@ -0,0 +1,20 @@
+"""
+Посещаемость по заархивированным ивентам: колонки в archived_user_stats / archived_role_stats.
+
+Раньше ночной расчёт посещаемости (attendance.py) видел только живые ивенты, и через
+ARCHIVE_AFTER_DAYS записи, неявки и серии игрока пропадали. Теперь архивация складывает
+их в агрегаты, а расчёт начинает с них. Уже заархивированные ивенты досчитывает
+первая архивация после миграции (archive._backfill_attendance).
+"""
+VERSION = 8
+NAME = "archived_attendance"
+
+USER_COLUMNS = ("signups", "events_played", "no_shows", "events_spectated", "not_picked", "current_streak", "best_streak")
+
+
+def upgrade(ctx):
+    with ctx.transaction():
+        for column in USER_COLUMNS:
+            ctx.add_column("archived_user_stats", column, "INTEGER NOT NULL DEFAULT 0")
+        ctx.add_column("archived_user_stats", "last_played", "VARCHAR")
+        ctx.add_column("archived_role_stats", "events_played", "INTEGER NOT NULL DEFAULT 0")
@@ -0,0 +1,262 @@
+"""
+runner.py
+Версионные миграции схемы и данных SQLite.
+
+Каждая миграция — модуль migrations/mNNNN_<name>.py с константами VERSION, NAME
+и функцией upgrade(ctx). Применённые версии хранятся в таблице schema_version.
+
+Миграция может выполняться в несколько транзакций (DDL, затем порционный backfill),
+поэтому upgrade() обязан быть идемпотентным: после сбоя он запускается заново.
+Backfill'ы идут короткими транзакциями по chunk_size строк и сохраняют прогресс
+в schema_migration_progress — повторный запуск продолжает с места остановки,
+а бот между порциями успевает писать в БД.
+"""
+import importlib
+import logging
+import os
+import pkgutil
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+# Пауза между порциями backfill'а, чтобы не забирать блокировку записи подряд
+DEFAULT_PAUSE_MS = 5
+# Как часто писать прогресс backfill'а в лог (в порциях)
+PROGRESS_LOG_EVERY = 20
+
+MODULE_RE = re.compile(r"^m(\d{4})_\w+$")
+
+
+def module_names() -> list:
+    """Имена модулей миграций без их импорта (для отпечатка схемы в db.py)"""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return sorted(info.name for info in pkgutil.iter_modules([package_dir]) if MODULE_RE.match(info.name))
+
+
+def discover() -> list:
+    """Модули миграций, отсортированные по версии"""
+    modules = [importlib.import_module(f"migrations.{name}") for name in module_names()]
+    modules.sort(key=lambda m: m.VERSION)
+    versions = [m.VERSION for m in modules]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Повторяющиеся версии миграций: {versions}")
+    return modules
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    # Автокоммит: транзакциями управляет MigrationContext.transaction()
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def _ensure_service_tables(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL,
+            duration_ms INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migration_progress (
+            version INTEGER NOT NULL,
+            step TEXT NOT NULL,
+            last_id INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (version, step)
+        )
+    """)
+
+
+def applied_versions(conn: sqlite3.Connection) -> dict:
+    """{версия: applied_at}"""
+    _ensure_service_tables(conn)
+    return dict(conn.execute("SELECT version, applied_at FROM schema_version").fetchall())
+
+
+class MigrationContext:
+    """То, что получает upgrade(): соединение и помощники для DDL и порционных backfill'ов"""
+
+    def __init__(self, conn: sqlite3.Connection, version: int, chunk_size: int, pause_ms: float):
+        self.conn = conn
+        self.version = version
+        self.chunk_size = chunk_size
+        self.pause_ms = pause_ms
+
+    # --- транзакции и DDL ---
+
+    @contextmanager
+    def transaction(self):
+        """Короткая транзакция записи (BEGIN IMMEDIATE сразу берёт блокировку записи)"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+
+    def execute(self, sql: str, params=()):
+        return self.conn.execute(sql, params)
+
+    def log(self, message: str):
+        logger.info(f"   {message}")
+
+    def warning(self, message: str):
+        logger.warning(f"   {message}")
+
+    def table_exists(self, table: str) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+        ).fetchone() is not None
+
+    def column_exists(self, table: str, column: str) -> bool:
+        return any(row[1] == column for row in self.conn.execute(f"PRAGMA table_info({table})"))
+
+    def add_column(self, table: str, column: str, column_def: str) -> bool:
+        """ALTER TABLE ADD COLUMN, если колонки ещё нет. Возвращает True, если колонка добавлена"""
+        if not self.table_exists(table) or self.column_exists(table, column):
+            return False
+        self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_def}")
+        logger.info(f"   ➕ {table}.{column}")
+        return True
+
+    # --- backfill ---
+
+    def _checkpoint(self, step: str) -> tuple:
+        row = self.conn.execute(
+            "SELECT last_id, rows_done FROM schema_migration_progress WHERE version=? AND step=?",
+            (self.version, step),
+        ).fetchone()
+        return row if row else (0, 0)
+
+    def _save_checkpoint(self, step: str, last_id: int, rows_done: int):
+        self.conn.execute(
+            "INSERT INTO schema_migration_progress (version, step, last_id, rows_done, updated_at) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(version, step) DO UPDATE SET "
+            "last_id=excluded.last_id, rows_done=excluded.rows_done, updated_at=excluded.updated_at",
+            (self.version, step, last_id, rows_done, datetime.utcnow().isoformat(timespec="seconds")),
+        )
+
+    def _chunks(self, step: str, table: str, columns: str, where_sql: str, params: tuple):
+        """
+        Генератор порций строк (id > checkpoint), каждая — в отдельной транзакции.
+        Отдаёт строки порции и ждёт через send() число изменённых строк;
+        прогресс сохраняется в той же транзакции, что и изменения.
+        """
+        if not self.table_exists(table):
+            return
+        last_id, rows_done = self._checkpoint(step)
+        chunks = 0
+        started = time.perf_counter()
+        while True:
+            with self.transaction():
+                rows = self.conn.execute(
+                    f"SELECT {columns} FROM {table} WHERE id > ? AND ({where_sql}) ORDER BY id LIMIT ?",
+                    (last_id, *params, self.chunk_size),
+                ).fetchall()
+                if not rows:
+                    break
+                changed = yield rows
+                last_id = rows[-1][0]
+                rows_done += changed or 0
+                self._save_checkpoint(step, last_id, rows_done)
+            chunks += 1
+            if chunks % PROGRESS_LOG_EVERY == 0:
+                logger.info(f"   … {step}: {rows_done} строк, id до {last_id}")
+            if self.pause_ms:
+                time.sleep(self.pause_ms / 1000)
+        if chunks:
+            logger.info(f"   ✅ {step}: {rows_done} строк за {time.perf_counter() - started:.1f} с")
+
+    def backfill_sql(self, step: str, table: str, set_sql: str, where_sql: str = "1", params: tuple = ()) -> None:
+        """
+        UPDATE table SET set_sql WHERE where_sql — порциями по id.
+        where_sql должен перестать выполняться для уже обновлённых строк
+        (или шаг опирается только на checkpoint по id).
+        """
+        chunks = self._chunks(step, table, "id", where_sql, params)
+        try:
+            rows = next(chunks)
+            while True:
+                cursor = self.conn.execute(
+                    f"UPDATE {table} SET {set_sql} WHERE id >= ? AND id <= ? AND ({where_sql})",
+                    (rows[0][0], rows[-1][0], *params),
+                )
+                rows = chunks.send(cursor.rowcount)
+        except StopIteration:
+            pass
+        finally:
+            # При ошибке закрытие генератора откатывает незавершённую порцию
+            chunks.close()
+
+    def backfill_rows(self, step: str, table: str, columns: list, convert, where_sql: str = "1",
+                      params: tuple = ()) -> None:
+        """
+        Построчное преобразование в Python: convert(row) получает кортеж (id, *columns)
+        и возвращает словарь новых значений или None, если строку менять не нужно.
+        """
+        chunks = self._chunks(step, table, ", ".join(["id", *columns]), where_sql, params)
+        try:
+            rows = next(chunks)
+            while True:
+                updates = []
+                for row in rows:
+                    values = convert(row)
+                    if values:
+                        updates.append({**values, "_id": row[0]})
+                for values in updates:
+                    assignments = ", ".join(f"{key} = :{key}" for key in values if key != "_id")
+                    self.conn.execute(f"UPDATE {table} SET {assignments} WHERE id = :_id", values)
+                rows = chunks.send(len(updates))
+        except StopIteration:
+            pass
+        finally:
+            chunks.close()
+
+
+def migrate(db_path: str, target: int | None = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+            pause_ms: float = DEFAULT_PAUSE_MS) -> list:
+    """Применяет все неприменённые миграции (до target включительно). Возвращает применённые версии"""
+    conn = connect(db_path)
+    try:
+        done = applied_versions(conn)
+        applied = []
+        for module in discover():
+            if module.VERSION in done or (target is not None and module.VERSION > target):
+                continue
+            logger.info(f"🔧 Миграция {module.VERSION:04d}: {module.NAME}")
+            started = time.perf_counter()
+            module.upgrade(MigrationContext(conn, module.VERSION, chunk_size, pause_ms))
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR IGNORE INTO schema_version (version, name, applied_at, duration_ms) VALUES (?, ?, ?, ?)",
+                (module.VERSION, module.NAME, datetime.utcnow().isoformat(timespec="seconds"), duration_ms),
+            )
+            conn.execute("DELETE FROM schema_migration_progress WHERE version = ?", (module.VERSION,))
+            conn.execute("COMMIT")
+            applied.append(module.VERSION)
+        return applied
+    finally:
+        conn.close()
+
+
+def status(db_path: str) -> list:
+    """[(версия, название, applied_at или None)] по всем известным миграциям"""
+    conn = connect(db_path)
+    try:
+        done = applied_versions(conn)
+    finally:
+        conn.close()
+    return [(m.VERSION, m.NAME, done.get(m.VERSION)) for m in discover()]
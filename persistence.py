@@ -0,0 +1,326 @@
+"""
+Хранение состояний бота (user_data, chat_data, bot_data) в SQLite.
+
+В отличие от PicklePersistence, который переписывает весь файл при каждом сбросе,
+здесь в БД пишутся только те записи, содержимое которых изменилось с прошлой записи.
+Данные хранятся компактным JSON, а user_data/chat_data загружаются лениво —
+при первом обращении к конкретному пользователю или чату.
+
+bot_data хранится по строке на ключ верхнего уровня: в режиме WORKERS его пишут
+несколько процессов, и каждый записывает только изменённые им ключи. Ключи, которые
+записали другие процессы, подтягиваются не чаще раза в BOT_DATA_REFRESH_SECONDS.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import logger
+from db import Session, UserDataRecord, ChatDataRecord, BotDataRecord
+
+# Как часто перечитывать bot_data, записанный другими процессами (shared_bot_data)
+BOT_DATA_REFRESH_SECONDS = 5
+
+
+def _dumps(data: dict) -> str:
+    """Компактная сериализация (без пробелов, кириллица как есть)"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def _digest(dumped: str) -> bytes:
+    """Отпечаток записанного JSON: 16 байт в памяти вместо самого JSON на каждого пользователя"""
+    return hashlib.blake2b(dumped.encode(), digest_size=16).digest()
+
+
+# ==========================================
+# СИНХРОННЫЕ ФУНКЦИИ
+# ==========================================
+
+def _load_record_sync(model, key_column, key):
+    """Загружает одну запись и возвращает распакованный словарь (или None)"""
+    session = Session()
+    try:
+        row = session.query(model.data).filter(key_column == key).first()
+        return json.loads(row[0]) if row else None
+    finally:
+        session.close()
+
+
+def _load_table_sync(model, key_column) -> dict:
+    """Все записи таблицы: ключ -> JSON как есть"""
+    session = Session()
+    try:
+        return dict(session.query(key_column, model.data))
+    finally:
+        session.close()
+
+
+def _write_records_sync(model, key_name: str, upserts: dict, deletes: set):
+    """
+    Пишет изменённые записи одной транзакцией:
+    upsert через executemany для изменённых, DELETE для опустевших.
+    """
+    session = Session()
+    try:
+        if upserts:
+            now = datetime.utcnow()
+            stmt = sqlite_insert(model.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[key_name],
+                set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+            )
+            session.execute(
+                stmt,
+                [{key_name: key, "data": data, "updated_at": now} for key, data in upserts.items()],
+            )
+        if deletes:
+            key_column = getattr(model, key_name)
+            session.query(model).filter(key_column.in_(list(deletes))).delete(synchronize_session=False)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# ==========================================
+# ГРЯЗНЫЕ ЗАПИСИ ОДНОЙ ТАБЛИЦЫ
+# ==========================================
+
+class _DirtyTable:
+    """
+    Отслеживает изменения записей одной таблицы.
+    Хранит отпечаток последнего записанного JSON каждой записи и копит изменившиеся записи до сброса.
+    """
+
+    def __init__(self, model, key_name: str):
+        self.model = model
+        self.key_name = key_name
+        self.written = {}   # key -> _digest последнего записанного JSON
+        self.loaded = set()  # ключи, уже загруженные из БД
+        self.pending = {}   # key -> JSON (или None для удаления)
+
+    def mark(self, key, data: dict):
+        """Помечает запись изменённой, если её JSON отличается от записанного"""
+        try:
+            dumped = _dumps(data) if data else None
+        except (TypeError, ValueError) as e:
+            logger.error(f"❌ Состояние {self.model.__tablename__}[{key}] не сериализуется в JSON: {e}")
+            return
+        if (_digest(dumped) if dumped else None) == self.written.get(key):
+            self.pending.pop(key, None)
+            return
+        self.pending[key] = dumped
+
+    def mark_value(self, key, value):
+        """Как mark, но пустое значение (0, "", {}) хранится, а не удаляется — для ключей bot_data"""
+        try:
+            dumped = _dumps(value)
+        except (TypeError, ValueError) as e:
+            logger.error(f"❌ Состояние {self.model.__tablename__}[{key}] не сериализуется в JSON: {e}")
+            return
+        if _digest(dumped) == self.written.get(key):
+            self.pending.pop(key, None)
+            return
+        self.pending[key] = dumped
+
+    def take_pending(self):
+        """Забирает накопленные изменения: (upserts, deletes)"""
+        pending, self.pending = self.pending, {}
+        upserts = {k: v for k, v in pending.items() if v is not None}
+        deletes = {k for k, v in pending.items() if v is None}
+        return upserts, deletes
+
+    def commit(self, upserts: dict, deletes: set):
+        """Запоминает записанное состояние после успешной транзакции"""
+        for key, data in upserts.items():
+            self.written[key] = _digest(data)
+        for key in deletes:
+            self.written.pop(key, None)
+
+    def restore(self, upserts: dict, deletes: set):
+        """Возвращает изменения в очередь после неудачной записи (новые правки важнее)"""
+        for key, value in upserts.items():
+            self.pending.setdefault(key, value)
+        for key in deletes:
+            self.pending.setdefault(key, None)
+
+
+# ==========================================
+# PERSISTENCE
+# ==========================================
+
+class SQLitePersistence(BasePersistence):
+    """
+    BasePersistence поверх нашей SQLite базы.
+
+    - user_data / chat_data подгружаются лениво в refresh_*_data;
+    - update_*_data только помечают изменившиеся записи, а запись в БД идёт одной
+      транзакцией на весь интервал (update_interval) и при остановке бота (flush);
+    - callback_data и conversations не используются ботом и не сохраняются.
+
+    Ключи словарей проходят через JSON, поэтому должны быть строками.
+    shared_bot_data — bot_data пишут и другие процессы (workers.py включает его в приёмнике
+    и воркерах): refresh_bot_data подтягивает их записи.
+    """
+
+    def __init__(self, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._users = _DirtyTable(UserDataRecord, "user_id")
+        self._chats = _DirtyTable(ChatDataRecord, "chat_id")
+        self._bot = _DirtyTable(BotDataRecord, "key")
+        self._bot_refreshed = 0.0
+        self.shared_bot_data = False
+        self._write_task = None
+
+    # --- Загрузка ---
+
+    async def get_user_data(self) -> dict:
+        # Ничего не грузим заранее: данные пользователя подтянутся в refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        stored = await asyncio.to_thread(_load_table_sync, BotDataRecord, BotDataRecord.key)
+        self._bot.written.update((key, _digest(raw)) for key, raw in stored.items())
+        self._bot_refreshed = time.monotonic()
+        return {key: json.loads(raw) for key, raw in stored.items()}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh(self._users, UserDataRecord.user_id, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh(self._chats, ChatDataRecord.chat_id, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        """
+        bot_data загружается при старте в get_bot_data. При shared_bot_data его ключи пишут и
+        другие процессы: их записи подтягиваются не чаще раза в BOT_DATA_REFRESH_SECONDS,
+        несохранённые изменения этого процесса важнее.
+        """
+        now = time.monotonic()
+        if not self.shared_bot_data or now - self._bot_refreshed < BOT_DATA_REFRESH_SECONDS:
+            return
+        self._bot_refreshed = now
+        stored = await asyncio.to_thread(_load_table_sync, BotDataRecord, BotDataRecord.key)
+        for key, raw in stored.items():
+            digest = _digest(raw)
+            if key not in self._bot.pending and digest != self._bot.written.get(key):
+                bot_data[key] = json.loads(raw)
+                self._bot.written[key] = digest
+        for key in [key for key in self._bot.written if key not in stored and key not in self._bot.pending]:
+            # Ключ удалил другой процесс
+            del self._bot.written[key]
+            bot_data.pop(key, None)
+
+    async def _refresh(self, table: _DirtyTable, key_column, key, target: dict):
+        """Ленивая загрузка одной записи при первом обращении"""
+        if key in table.loaded:
+            return
+        table.loaded.add(key)
+        stored = await asyncio.to_thread(_load_record_sync, table.model, key_column, key)
+        if stored:
+            # Значения, уже записанные в текущем апдейте, имеют приоритет
+            for k, v in stored.items():
+                target.setdefault(k, v)
+            table.written[key] = _digest(_dumps(stored))
+
+    # --- Запись ---
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # Пользователь не загружен — значит, обработчики его данные не трогали,
+        # и пустой словарь не должен затереть сохранённое состояние
+        if user_id not in self._users.loaded:
+            return
+        self._users.mark(user_id, data)
+        self._schedule_write()
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        if chat_id not in self._chats.loaded:
+            return
+        self._chats.mark(chat_id, data)
+        self._schedule_write()
+
+    async def update_bot_data(self, data: dict) -> None:
+        # Пишутся только изменённые ключи: ключи других процессов не затираются
+        for key, value in data.items():
+            self._bot.mark_value(key, value)
+        for key in self._bot.written:
+            if key not in data:
+                self._bot.pending[key] = None
+        self._schedule_write()
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._users.loaded.add(user_id)
+        self._users.mark(user_id, {})
+        self._schedule_write()
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._chats.loaded.add(chat_id)
+        self._chats.mark(chat_id, {})
+        self._schedule_write()
+
+    def forget_user_data(self, user_id: int) -> None:
+        """
+        Забывает загруженное состояние пользователя: его апдейты теперь обрабатывает
+        другой процесс (workers.py). Если пользователь вернётся, состояние перечитается
+        из БД. Вызывать после flush(), иначе несохранённые изменения пропадут.
+        """
+        self._users.loaded.discard(user_id)
+        self._users.written.pop(user_id, None)
+        self._users.pending.pop(user_id, None)
+
+    def _schedule_write(self):
+        """
+        Планирует одну запись на пачку изменений.
+        Application вызывает update_*_data пачкой через gather, поэтому запись
+        стартует после того, как все они отработают.
+        """
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self):
+        await asyncio.sleep(0)
+        written = 0
+        for table in (self._users, self._chats, self._bot):
+            upserts, deletes = table.take_pending()
+            if not upserts and not deletes:
+                continue
+            try:
+                await asyncio.to_thread(_write_records_sync, table.model, table.key_name, upserts, deletes)
+            except Exception as e:
+                table.restore(upserts, deletes)
+                logger.error(f"❌ Ошибка записи состояний {table.model.__tablename__}: {e}")
+                continue
+            table.commit(upserts, deletes)
+            written += len(upserts) + len(deletes)
+        if written:
+            logger.debug(f"💾 Сохранено состояний: {written}")
+
+    async def flush(self) -> None:
+        """Вызывается при остановке бота: дописывает всё, что ещё не записано"""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
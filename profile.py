@@ -1,33 +1,88 @@
 """
 Модуль профиля игрока.
 """
+import asyncio
+import time
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from config import ADMIN_IDS, logger
-from db import User, ROLE_NAMES, ROLE_TO_MODEL, Session, get_user_statistics
-
-
-async def _get_user_profile_text(user_id: int, fallback_name: str) -> str:
+import metrics
+from cache import AsyncTTLCache
+from config import (
+    PROFILE_CACHE_TTL_SECONDS, PROFILE_CACHE_MAX_ENTRIES, WHO_IS_CHAT_COOLDOWN_SECONDS, logger
+)
+from db import (
+    USER_BY_ID, USER_ATTENDANCE, USER_ATTENDANCE_ROLES, ROLE_ENTRY, ROLE_NAMES, ROLE_TO_MODEL, Session,
+    get_user_statistics_sync, on_users_changed
+)
+from skill import get_skills
+from tenant import effective_tenant, is_admin, is_staff
+
+# Карточки по user_id, свои у каждого сообщества: роли, статистика и админство у игрока
+# в разных группах разные. Сбрасываются после commit, изменившего профиль, роли, матчи или оценки
+_profile_cards: dict[int, AsyncTTLCache] = {}
+
+
+def profile_cards(chat_id: int) -> AsyncTTLCache:
+    cache = _profile_cards.get(chat_id)
+    if cache is None:
+        cache = _profile_cards.setdefault(
+            chat_id, AsyncTTLCache("profile.cache", PROFILE_CACHE_TTL_SECONDS, PROFILE_CACHE_MAX_ENTRIES)
+        )
+    return cache
+
+
+@on_users_changed
+def _invalidate_profile_cards(user_ids):
+    # Commit не знает, в каких сообществах показывали карточку — сбрасываем во всех
+    for cache in list(_profile_cards.values()):
+        if user_ids is None:
+            cache.invalidate()
+            continue
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+
+# (chat_id, user_id) -> когда в чате последний раз показали карточку по "кто"
+_who_is_shown: dict[tuple[int, int], float] = {}
+
+
+def _who_is_throttled(chat_id: int, user_id: int) -> bool:
+    """True, если карточку этого игрока в этом чате уже показывали недавно"""
+    if WHO_IS_CHAT_COOLDOWN_SECONDS <= 0:
+        return False
+    now = time.monotonic()
+    key = (chat_id, user_id)
+    last = _who_is_shown.get(key)
+    if last is not None and now - last < WHO_IS_CHAT_COOLDOWN_SECONDS:
+        return True
+    # Отметка ставится до вычисления: остальные "кто" из той же пачки уже отсеются
+    _who_is_shown[key] = now
+    if len(_who_is_shown) > 1000:
+        for stale in [k for k, t in _who_is_shown.items() if now - t >= WHO_IS_CHAT_COOLDOWN_SECONDS]:
+            del _who_is_shown[stale]
+    return False
+
+
+def _build_profile_text_sync(user_id: int) -> str | None:
     """
-    Генерирует текст профиля по ID пользователя.
+    Собирает текст профиля по ID пользователя (в одном потоке, одной сессией).
+    None — пользователя нет в базе.
     """
     session = Session()
     try:
-        db_user = session.query(User).filter_by(user_id=user_id).first()
+        db_user = session.execute(USER_BY_ID, {"user_id": user_id}).scalar()
 
         if not db_user:
-            return (
-                f"❓ Пользователь {fallback_name} не найден в базе данных.\n"
-                f"Возможно, он еще не писал в группе с ботом."
-            )
+            return None
 
         # Собираем роли
         roles_list = []
         id_ml_list = []
 
         for role_key, Model in ROLE_TO_MODEL.items():
-            role_entry = session.query(Model).filter_by(user_id=user_id).first()
+            role_entry = session.execute(ROLE_ENTRY[Model], {"user_id": user_id}).scalar()
             if role_entry:
                 roles_list.append(f"🔹 {ROLE_NAMES[role_key]}")
                 id_ml_list.append(f"{ROLE_NAMES[role_key]}: {role_entry.id_ml}")
@@ -39,10 +94,15 @@ async def _get_user_profile_text(user_id: int, fallback_name: str) -> str:
 
         id_text = "\n".join(id_ml_list) if id_ml_list else "Не указан"
 
-        is_admin = "Да" if user_id in ADMIN_IDS else "Нет"
+        if is_admin(user_id):
+            admin_text = "Да"
+        elif is_staff(user_id):
+            admin_text = "Модератор"
+        else:
+            admin_text = "Нет"
 
         # Получаем статистику
-        stats = await get_user_statistics(user_id)  # асинхронная обёртка
+        stats = get_user_statistics_sync(user_id)
 
         stats_lines = []
         if stats['played_matches'] > 0:
@@ -57,15 +117,38 @@ async def _get_user_profile_text(user_id: int, fallback_name: str) -> str:
                 for role, data in stats['role_stats'].items():
                     role_name = ROLE_NAMES.get(role, role.capitalize()) if role != 'unknown' else 'Без роли'
                     stats_lines.append(f"  {role_name}: {data['avg']} (оценок: {data['count']})")
+            skills = get_skills(session, [user_id]).get(user_id, {})
+            rated = [(role, skill) for role, skill in skills.items() if skill.ratings]
+            if rated:
+                stats_lines.append("\n<b>Навык по ролям:</b>")
+                for role, skill in sorted(rated, key=lambda item: -item[1].mu):
+                    role_name = ROLE_NAMES.get(role, role.capitalize()) if role != 'unknown' else 'Без роли'
+                    stats_lines.append(f"  {role_name}: {skill.mu:.2f} ± {skill.sigma:.2f}")
         else:
             stats_lines.append("📊 Статистики пока нет.")
 
+        attendance = session.execute(USER_ATTENDANCE, {"user_id": user_id}).scalar()
+        if attendance and attendance.signups:
+            stats_lines.append(
+                f"\n📅 <b>Посещаемость:</b> сыграно {attendance.played} из {attendance.signups} записей "
+                f"({attendance.played * 100 // attendance.signups}%)"
+            )
+            if attendance.no_shows:
+                stats_lines.append(f"• Неявок: {attendance.no_shows}")
+            stats_lines.append(f"• Серия без неявок: {attendance.current_streak} (лучшая {attendance.best_streak})")
+            roles_played = session.execute(USER_ATTENDANCE_ROLES, {"user_id": user_id}).all()
+            if roles_played:
+                stats_lines.append("• Игры по ролям: " + ", ".join(
+                    f"{ROLE_NAMES.get(role, role.capitalize()) if role != 'unknown' else 'Без роли'} {count}"
+                    for role, count in roles_played
+                ))
+
         text = (
             f"👤 <b>Профиль игрока</b>\n\n"
             f"🏷 Имя: {db_user.first_name} {db_user.last_name or ''}\n"
             f"🔗 Ник: @{db_user.username if db_user.username else 'скрыт'}\n"
             f"🆔 ID TG: {db_user.user_id}\n"
-            f"👑 Админ: {is_admin}\n\n"
+            f"👑 Админ: {admin_text}\n\n"
             f"⚔️ <b>Роли:</b>\n{role_text}\n\n"
             f"🎮 <b>Игровые ID:</b>\n{id_text}\n\n"
             f"{chr(10).join(stats_lines)}"
@@ -76,6 +159,20 @@ async def _get_user_profile_text(user_id: int, fallback_name: str) -> str:
         session.close()
 
 
+async def _get_user_profile_text(user_id: int, fallback_name: str) -> str:
+    """
+    Текст профиля по ID пользователя: из кэша или одним вычислением на всех,
+    кто запросил этого игрока одновременно.
+    """
+    text = await profile_cards(effective_tenant()).get(user_id, lambda: asyncio.to_thread(_build_profile_text_sync, user_id))
+    if text is None:
+        return (
+            f"❓ Пользователь {fallback_name} не найден в базе данных.\n"
+            f"Возможно, он еще не писал в группе с ботом."
+        )
+    return text
+
+
 async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Команда /me. Доступна всем (в ЛС и в группе).
@@ -106,5 +203,10 @@ async def who_is_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Я всего лишь бот 🤖")
         return
 
+    if _who_is_throttled(update.effective_chat.id, target_user.id):
+        # Карточка этого игрока только что была в чате выше
+        metrics.incr("profile.who_is_throttled")
+        return
+
     text = await _get_user_profile_text(target_user.id, target_user.first_name)
     await update.message.reply_text(text, parse_mode="HTML")
\ No newline at end of file
@@ -0,0 +1,376 @@
+"""
+profiler.py
+Сэмплирующий профайлер работающего бота: /profiler (только админам, в ЛС).
+
+    /profiler [секунд]   — снять профиль (по умолчанию 30 сек., не больше PROFILER_MAX_SECONDS);
+    /profiler stop       — закончить досрочно.
+
+Отдельный поток раз в PROFILER_INTERVAL_MS снимает стеки всех потоков (sys._current_frames)
+и всех задач asyncio (Task.get_stack — где сейчас ждёт каждая корутина). Код бота не
+инструментируется, поэтому бот платит только за сам поток-сэмплер (его доля — в подписи к файлу).
+Результат — collapsed stacks («кадр;кадр;… число», вход flamegraph.pl и speedscope): файл пишется
+в MEMDIAG_DIR и приходит документом. Стеки потоков начинаются с «thread:<имя>» (время по часам,
+включая ожидание), стеки задач — с «task» (задачи снимаются раз в TASK_EVERY снимков: их обход
+дороже, а места ожидания меняются медленно; снимает их сам цикл событий по запросу сэмплера,
+пока цикл занят — снимок задач пропускается).
+
+Автозапуск (PROFILER_AUTO_P95_MS): LatencyTrigger раз в CHECK_EVERY апдейтов сравнивает p95
+updates.duration_ms с порогом и снимает профиль для держателей права DIAGNOSTICS (acl.py). Он зарегистрирован как TypeHandler,
+поэтому работает там, где выполняются хендлеры (в режиме WORKERS — в каждом воркере).
+"""
+import asyncio
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from telegram import Update, InputFile
+from telegram.ext import ContextTypes
+
+import acl
+from acl import Permission
+from config import (
+    MEMDIAG_DIR, PROFILER_INTERVAL_MS, PROFILER_MAX_SECONDS,
+    PROFILER_AUTO_P95_MS, PROFILER_AUTO_SECONDS, PROFILER_AUTO_COOLDOWN_MINUTES, logger
+)
+from diagnostics import short_path
+from events.utils import MSK_TZ
+from tenant import has_permission
+import metrics
+
+DEFAULT_SECONDS = 30
+MAX_DEPTH = 128
+# Стеки задач — в каждом TASK_EVERY-м снимке
+TASK_EVERY = 5
+# Сколько функций показывать в подписи к файлу
+TOP_FRAMES = 5
+# Функции, в которых поток просто ждёт (цикл событий в select, пустой пул потоков):
+# в сводку «на что уходит время» они не попадают, в файле остаются
+IDLE_LEAVES = frozenset({"select", "poll", "wait", "_wait_for_tstate_lock", "sleep", "_worker"})
+# Автозапуск: раз в сколько апдейтов проверять p95 и сколько значений нужно в окне
+CHECK_EVERY = 100
+MIN_SAMPLES = 200
+
+USAGE = (
+    "🔥 <b>/profiler [секунд]</b> — снять профиль (по умолчанию "
+    f"{DEFAULT_SECONDS}, до {PROFILER_MAX_SECONDS})\n"
+    "<code>/profiler stop</code> — закончить досрочно"
+)
+
+
+class ProfilerBusy(Exception):
+    """Профайлер уже снимает профиль"""
+
+
+class SamplingProfiler:
+    """Поток, который с периодом interval снимает стеки потоков и задач цикла событий"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None,
+                 interval: float = PROFILER_INTERVAL_MS / 1000):
+        self.loop = loop
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_s = 0.0
+        self.started = self.finished = 0.0
+        self._deadline = 0.0
+        # Задача, которая ждёт конца профиля, — в профиле не нужна
+        self.own_task: asyncio.Task | None = None
+        self._labels = {}  # code -> подпись кадра
+        # Стеки задач снимаются в самом цикле событий: из чужого потока all_tasks и
+        # get_stack небезопасны. Результат забирается на следующем снимке задач
+        self._tasks_future: concurrent.futures.Future | None = None
+        self._thread_names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    # --- снятие стеков ---
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (
+                f"{getattr(code, 'co_qualname', code.co_name)} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+            )
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.get(ident, str(ident))
+        return name
+
+    def sample(self):
+        """Один снимок: стек каждого потока (кроме своего) и, раз в TASK_EVERY снимков, каждой задачи цикла"""
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(f"thread:{self._thread_name(ident)}")
+            self.stacks[";".join(reversed(labels))] += 1
+
+        if self.loop is not None and self.samples % TASK_EVERY == 0:
+            self._take_task_stacks()
+        self.samples += 1
+
+    def _take_task_stacks(self):
+        """Забирает готовые стеки задач и просит цикл снять новые (поток-сэмплер их не ждёт)"""
+        future = self._tasks_future
+        if future is not None:
+            if not future.done():
+                # Цикл занят и ещё не дошёл до прошлого запроса: почему — видно по стеку его потока
+                return
+            self._tasks_future = None
+            if future.exception() is None:
+                for codes in future.result():
+                    self.stacks[";".join(["task", *map(self._label, codes)])] += 1
+        future = concurrent.futures.Future()
+        try:
+            self.loop.call_soon_threadsafe(self._collect_task_stacks, future)
+        except RuntimeError:
+            # Цикл событий уже закрыт
+            return
+        self._tasks_future = future
+
+    def _collect_task_stacks(self, future: concurrent.futures.Future):
+        """В цикле событий: код кадров каждой задачи (подписи считает поток-сэмплер)"""
+        try:
+            stacks = []
+            for task in asyncio.all_tasks(self.loop):
+                if task is self.own_task:
+                    continue
+                try:
+                    frames = task.get_stack(limit=MAX_DEPTH)
+                except RuntimeError:
+                    continue
+                if frames:
+                    stacks.append(tuple(frame.f_code for frame in frames))
+            future.set_result(stacks)
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run(self):
+        next_at = time.perf_counter()
+        while not self._stop.is_set() and next_at < self._deadline:
+            begin = time.perf_counter()
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"⚠️ Профайлер: не удалось снять стеки: {e}")
+            end = time.perf_counter()
+            self.sampling_s += end - begin
+            # Отстали (долгий снимок) — не догоняем пачкой снимков подряд
+            next_at = max(next_at + self.interval, end)
+            self._stop.wait(next_at - end)
+        self.finished = time.perf_counter()
+
+    # --- управление ---
+
+    def start(self, seconds: float):
+        self.started = time.perf_counter()
+        self._deadline = self.started + seconds
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def overhead(self) -> float:
+        """Доля времени, которую поток-сэмплер держал GIL"""
+        return self.sampling_s / self.duration if self.duration else 0.0
+
+    # --- результат ---
+
+    def folded(self) -> str:
+        """Collapsed stacks: «кадр;кадр;… число» построчно"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def top_leaves(self, root: str, skip_idle: bool) -> list[tuple[str, int]]:
+        """Самые частые верхние кадры стеков с корнем root ("thread" или "task")"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            if not stack.startswith(root):
+                continue
+            leaf = stack.rsplit(";", 1)[-1]
+            if skip_idle and leaf.split(" ", 1)[0].rsplit(".", 1)[-1] in IDLE_LEAVES:
+                continue
+            leaves[leaf] += count
+        return leaves.most_common(TOP_FRAMES)
+
+
+# ==========================================
+# ЗАПУСК И ОТПРАВКА
+# ==========================================
+
+_active: SamplingProfiler | None = None
+
+
+def start_profile(seconds: float) -> SamplingProfiler:
+    """Запускает профайлер для цикла событий вызывающего. Один профиль за раз (иначе ProfilerBusy)"""
+    global _active
+    if _active is not None:
+        raise ProfilerBusy()
+    profiler = _active = SamplingProfiler(asyncio.get_running_loop())
+    profiler.start(seconds)
+    return profiler
+
+
+def stop_profile() -> bool:
+    """Досрочно завершает текущий профиль. False — профайлер не запущен"""
+    if _active is None:
+        return False
+    _active.stop()
+    return True
+
+
+def write_folded_sync(profiler: SamplingProfiler, directory: str = MEMDIAG_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"profile_{datetime.now(MSK_TZ):%Y%m%d_%H%M%S}_{os.getpid()}.folded")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.folded())
+    return path
+
+
+def format_caption(profiler: SamplingProfiler, reason: str) -> str:
+    lines = [
+        f"🔥 Профиль процесса {os.getpid()} ({reason})",
+        f"{profiler.duration:.1f} сек., снимков {profiler.samples}, расход сэмплера {profiler.overhead:.1%}",
+    ]
+    busy = profiler.top_leaves("thread", skip_idle=True)
+    if busy:
+        lines.append("Потоки заняты в:")
+        lines += [f"• {leaf} — {count}" for leaf, count in busy]
+    waits = profiler.top_leaves("task", skip_idle=False)
+    if waits:
+        lines.append("Задачи ждут в:")
+        lines += [f"• {leaf} — {count}" for leaf, count in waits]
+    # Лимит подписи к документу — 1024 символа
+    return "\n".join(lines)[:1024]
+
+
+async def finish_and_send(bot, chat_ids, profiler: SamplingProfiler, reason: str):
+    """Дожидается конца профиля, пишет файл и отправляет его в chat_ids"""
+    global _active
+    profiler.own_task = asyncio.current_task()
+    try:
+        while profiler.running:
+            await asyncio.sleep(0.25)
+    finally:
+        profiler.stop()
+        _active = None
+
+    metrics.incr("profiler.runs")
+    metrics.observe("profiler.overhead_pct", profiler.overhead * 100)
+    try:
+        path = await asyncio.to_thread(write_folded_sync, profiler)
+    except OSError as e:
+        logger.error(f"❌ Не удалось записать профиль: {e}")
+        return
+    logger.info(
+        f"🔥 Профиль снят ({reason}): {path}, снимков {profiler.samples}, расход {profiler.overhead:.1%}"
+    )
+    caption = format_caption(profiler, reason)
+    for chat_id in chat_ids:
+        try:
+            with open(path, "rb") as f:
+                await bot.send_document(
+                    chat_id=chat_id, document=InputFile(f, filename=os.path.basename(path)), caption=caption
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось отправить профиль в {chat_id}: {e}")
+
+
+# ==========================================
+# ХЕНДЛЕР И АВТОЗАПУСК
+# ==========================================
+
+async def profiler_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profiler — сэмплирующий профиль процесса на N секунд (только админам)"""
+    if update.effective_chat.type != "private":
+        await update.message.reply_text("❌ Эта команда доступна только в личных сообщениях.")
+        return
+    if not has_permission(update.effective_user.id, Permission.DIAGNOSTICS):
+        await update.message.reply_text("❌ Эта функция доступна только администраторам.")
+        return
+
+    args = context.args or []
+    if args and args[0].lower() == "stop":
+        text = "⏹ Профиль завершается, файл придёт следом." if stop_profile() else "🔥 Профайлер не запущен."
+        await update.message.reply_text(text)
+        return
+    try:
+        seconds = int(args[0]) if args else DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text(USAGE, parse_mode="HTML")
+        return
+    seconds = max(1, min(seconds, PROFILER_MAX_SECONDS))
+
+    try:
+        profiler = start_profile(seconds)
+    except ProfilerBusy:
+        await update.message.reply_text("⏳ Профайлер уже работает, дождитесь файла или /profiler stop.")
+        return
+    logger.info(f"🔥 Профайлер запущен админом {update.effective_user.id} на {seconds} сек.")
+    await update.message.reply_text(f"🔥 Профайлер запущен на {seconds} сек., файл придёт сюда.")
+    # Профиль снимается в фоне: апдейт не держит очередь админа и слот обработки
+    context.application.create_task(
+        finish_and_send(context.bot, [update.effective_chat.id], profiler, f"по команде, {seconds} сек."),
+        update=update,
+    )
+
+
+class LatencyTrigger:
+    """
+    Middleware автозапуска профайлера по p95 обработки апдейтов.
+    Регистрируется как TypeHandler(Update, trigger) в группе -3; сама проверка — раз в CHECK_EVERY апдейтов.
+    """
+
+    def __init__(self, threshold_ms: float = PROFILER_AUTO_P95_MS, seconds: int = PROFILER_AUTO_SECONDS,
+                 cooldown_minutes: float = PROFILER_AUTO_COOLDOWN_MINUTES, chat_ids=None):
+        self.threshold_ms = threshold_ms
+        self.seconds = seconds
+        self.cooldown = cooldown_minutes * 60
+        # None — держатели DIAGNOSTICS на момент срабатывания (права меняются на ходу)
+        self.chat_ids = None if chat_ids is None else list(chat_ids)
+        self._seen = 0
+        self._next_allowed = 0.0
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self._seen += 1
+        if self._seen % CHECK_EVERY:
+            return
+        now = time.monotonic()
+        if now < self._next_allowed or _active is not None:
+            return
+        latency = metrics.summary("updates.duration_ms")
+        if latency["count"] < MIN_SAMPLES or latency["p95"] <= self.threshold_ms:
+            return
+        chat_ids = acl.holders(Permission.DIAGNOSTICS) if self.chat_ids is None else self.chat_ids
+        if not chat_ids:
+            return
+
+        try:
+            profiler = start_profile(self.seconds)
+        except ProfilerBusy:
+            return
+        self._next_allowed = now + self.cooldown
+        metrics.incr("profiler.auto")
+        reason = f"автозапуск: p95 обработки {latency['p95']:.0f} мс > {self.threshold_ms:g} мс"
+        logger.warning(f"🔥 {reason}, профиль на {self.seconds} сек.")
+        context.application.create_task(finish_and_send(context.bot, chat_ids, profiler, reason))
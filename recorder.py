@@ -0,0 +1,118 @@
+"""
+Запись входящих апдейтов в JSONL-файл для последующего воспроизведения (benchmarks/replay.py).
+
+Каждая строка файла — {"ts": unix-время получения, "update": сырой апдейт Telegram}.
+При анонимизации имена, юзернеймы, названия групп и текст сообщений заменяются
+стабильными псевдонимами той же длины (смещения entities остаются верными).
+Числовые id и callback_data сохраняются: без них повтор против копии БД
+не попадёт ни в одного пользователя, ни в одну кнопку.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import logger
+
+MENTION_RE = re.compile(r"@\w+")
+
+# Тексты, на которые реагируют групповые хендлеры, — их оставляем как есть
+GROUP_TRIGGERS = {"кто"}
+
+# Поля объектов User/Chat, которые заменяются псевдонимами
+NAME_FIELDS = ("first_name", "last_name", "username", "title")
+
+# Поля, которые при анонимизации просто удаляются
+DROP_FIELDS = ("contact", "location", "venue", "photo", "bio", "description")
+
+
+class Anonymizer:
+    """Детерминированно заменяет персональные данные псевдонимами (при одинаковой соли)"""
+
+    def __init__(self, salt: bytes | None = None):
+        self._salt = salt or os.urandom(16)
+
+    def pseudo(self, value: str) -> str:
+        """Псевдоним той же длины, что и исходная строка"""
+        if not value:
+            return value
+        digest = hashlib.blake2b(value.encode("utf-8"), key=self._salt, digest_size=16).hexdigest()
+        return (digest * (len(value) // len(digest) + 1))[:len(value)]
+
+    def _text(self, text: str, chat_type: str | None, from_bot: bool) -> str:
+        if from_bot:
+            # Собственные сообщения бота (callback_query.message) хендлеры не читают,
+            # а в них бывают списки игроков
+            return self.pseudo(text)
+        if text.startswith("/"):
+            return text
+        if chat_type == "private":
+            # В ЛС текст — ввод для мастеров (название ивента, @username), прячем только упоминания
+            return MENTION_RE.sub(lambda m: "@" + self.pseudo(m.group(0)[1:]), text)
+        if text.strip().lower() in GROUP_TRIGGERS:
+            return text
+        return self.pseudo(text)
+
+    def scrub(self, data, chat_type: str | None = None):
+        """Рекурсивно анонимизирует словарь апдейта (возвращает новый объект)"""
+        if isinstance(data, list):
+            return [self.scrub(item, chat_type) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        if isinstance(data.get("chat"), dict):
+            chat_type = data["chat"].get("type", chat_type)
+
+        sender = data.get("from")
+        from_bot = isinstance(sender, dict) and bool(sender.get("is_bot"))
+
+        result = {}
+        for key, value in data.items():
+            if key in DROP_FIELDS:
+                continue
+            if key in NAME_FIELDS and isinstance(value, str):
+                result[key] = self.pseudo(value)
+            elif key in ("text", "caption") and isinstance(value, str):
+                result[key] = self._text(value, chat_type, from_bot)
+            else:
+                result[key] = self.scrub(value, chat_type)
+        return result
+
+
+class UpdateRecorder:
+    """
+    Middleware, которое пишет каждый апдейт в JSONL-файл.
+    Регистрируется как TypeHandler(Update, recorder) в группе -1, чтобы видеть все апдейты.
+    """
+
+    def __init__(self, path: str, anonymize: bool = True, salt: bytes | None = None):
+        self.path = path
+        self.anonymizer = Anonymizer(salt) if anonymize else None
+        self._lock = threading.Lock()
+        # Построчная буферизация: запись не теряется при падении процесса
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        logger.info(f"📼 Запись апдейтов в {path} (анонимизация: {'да' if anonymize else 'нет'})")
+
+    def record(self, update: Update):
+        data = update.to_dict()
+        if self.anonymizer:
+            data = self.anonymizer.scrub(data)
+        line = json.dumps({"ts": round(time.time(), 3), "update": data}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            self.record(update)
+        except Exception as e:
+            # Запись — вспомогательная функция, она не должна ломать обработку апдейта
+            logger.error(f"❌ Не удалось записать апдейт: {e}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
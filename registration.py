@@ -1,12 +1,15 @@
 # registration.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from sqlalchemy import or_
+from itertools import starmap
+from sqlalchemy import or_, select
 from db import (
-    User, get_all_users, get_role_users, 
-    add_user_to_role, remove_user_from_role, is_user_admin, 
-    ROLE_NAMES, Session
+    User, UserRow, get_all_users, get_role_users, get_user, 
+    add_user_to_role, remove_user_from_role, 
+    ROLE_NAMES, Session, TenantMember
 )
+from acl import Permission
+from tenant import current_tenant, has_permission
 import state
 
 ITEMS_PER_PAGE = 10
@@ -86,7 +89,7 @@ async def reg_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    if not await is_user_admin(query.from_user.id):
+    if not has_permission(query.from_user.id, Permission.PLAYERS):
         await query.edit_message_text("❌ Эта функция доступна только администраторам.")
         return
 
@@ -197,6 +200,28 @@ async def add_to_role_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
+def search_users_by_letters_sync(group_name: str, letters: list):
+    """Ищет пользователей, у которых имя или ник начинается с одной из букв группы"""
+    session = Session()
+    try:
+        conditions = []
+        for l in letters:
+            conditions.append(User.username.ilike(f'{l}%'))
+            conditions.append(User.first_name.ilike(f'{l}%'))
+        
+        if group_name == "😎 Другое":
+            rus_letters = ['а','б','в','г','д','е','ё','ж','з','и','й','к','л','м','н','о','п','р','с','т','у','ф','х','ц','ч','ш','щ','ъ','ы','ь','э','ю','я']
+            conditions = [User.username.ilike(f'{l}%') for l in rus_letters] + [User.first_name.ilike(f'{l}%') for l in rus_letters]
+
+        if not conditions: return []
+        stmt = select(User.user_id, User.first_name, User.last_name, User.username).where(or_(*conditions)).order_by(User.id)
+        if current_tenant() is not None:
+            # Только участники текущего сообщества
+            stmt = stmt.join(TenantMember, TenantMember.user_id == User.user_id)
+        return list(starmap(UserRow, session.execute(stmt)))
+    finally:
+        session.close()
+
 async def show_users_by_letter(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -204,25 +229,8 @@ async def show_users_by_letter(update: Update, context: ContextTypes.DEFAULT_TYP
     group_name = query.data.split(":")[1]
     letters = LETTER_GROUPS.get(group_name, [])
 
-    def search_users_sync():
-        session = Session()
-        try:
-            conditions = []
-            for l in letters:
-                conditions.append(User.username.ilike(f'{l}%'))
-                conditions.append(User.first_name.ilike(f'{l}%'))
-            
-            if group_name == "😎 Другое":
-                rus_letters = ['а','б','в','г','д','е','ё','ж','з','и','й','к','л','м','н','о','п','р','с','т','у','ф','х','ц','ч','ш','щ','ъ','ы','ь','э','ю','я']
-                conditions = [User.username.ilike(f'{l}%') for l in rus_letters] + [User.first_name.ilike(f'{l}%') for l in rus_letters]
-
-            if not conditions: return []
-            return session.query(User).filter(or_(*conditions)).all()
-        finally:
-            session.close()
-
     import asyncio
-    users = await asyncio.to_thread(search_users_sync)
+    users = await asyncio.to_thread(search_users_by_letters_sync, group_name, letters)
 
     if not users:
         role_key = context.user_data.get("reg_role")
@@ -254,16 +262,17 @@ async def select_user_for_action(update: Update, context: ContextTypes.DEFAULT_T
     user_id = int(query.data.split(":")[1])
     role_key = context.user_data.get('reg_role')
     
-    session = Session()
-    try:
-        user = session.query(User).filter_by(user_id=user_id).first()
-        if not user:
-            await query.message.reply_text("Ошибка: пользователь не найден.")
-            return
-    finally:
-        session.close()
+    user = await get_user(user_id)
+    if not user:
+        await query.message.reply_text("Ошибка: пользователь не найден.")
+        return
 
-    context.user_data['candidate_user'] = user
+    # Храним только примитивы: user_data сохраняется в БД как JSON
+    context.user_data['candidate_user'] = {
+        "user_id": user.user_id,
+        "first_name": user.first_name,
+        "username": user.username,
+    }
     context.user_data['reg_state'] = state.REG_AWAITING_IDML
     
     name = f"{user.first_name} (@{user.username})" if user.username else user.first_name
@@ -324,7 +333,7 @@ async def del_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_registration_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    if not await is_user_admin(user_id):
+    if not has_permission(user_id, Permission.PLAYERS):
         await update.message.reply_text("❌ Нет прав.")
         return
 
@@ -350,9 +359,9 @@ async def handle_registration_input(update: Update, context: ContextTypes.DEFAUL
         return await update.message.reply_text("❌ ID должен быть положительным числом (только цифры).")
 
     try:
-        await add_user_to_role(role_key, candidate, id_ml)
+        await add_user_to_role(role_key, candidate["user_id"], id_ml)
         await update.message.reply_text(
-            f"✅ Пользователь @{candidate.username} добавлен в {ROLE_NAMES[role_key]} с ID {id_ml}!"
+            f"✅ Пользователь @{candidate['username']} добавлен в {ROLE_NAMES[role_key]} с ID {id_ml}!"
         )
     except ValueError as e:
         await update.message.reply_text(f"❌ {e}")
@@ -0,0 +1,413 @@
+"""
+Массовый импорт и экспорт составов ролей.
+
+Импорт: админ присылает боту CSV или JSON (колонки user / user_id / username, role, id_ml).
+Файл проверяется за один проход по словарям пользователей и ролей, загруженным в память,
+админ видит diff (добавить / обновить / без изменений / ошибки) и только после
+подтверждения изменения применяются одной транзакцией: по одному executemany-upsert
+(INSERT ... ON CONFLICT(chat_id, user_id) DO UPDATE) на таблицу роли.
+Импорт и экспорт работают в рамках текущего сообщества.
+
+Экспорт: строки читаются из БД порциями (yield_per) и сразу пишутся во временный файл,
+таблицы целиком в память не загружаются.
+"""
+import asyncio
+import csv
+import html
+import io
+import json
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.ext import ContextTypes
+
+from config import logger
+from db import Session, TenantMember, User, ROLE_NAMES, ROLE_TO_MODEL, notify_users_changed
+from acl import Permission
+from tenant import current_tenant, effective_tenant, has_permission
+import metrics
+import state
+
+MAX_FILE_BYTES = 1024 * 1024
+MAX_ROWS = 5000
+# Сколько строк diff показывать в сообщении по каждому разделу
+DIFF_PREVIEW = 10
+EXPORT_CHUNK = 500
+EXPORT_COLUMNS = ["role", "user_id", "username", "first_name", "id_ml"]
+
+# Роль можно указать ключом (middle) или названием (Мидл)
+ROLE_ALIASES = {**{key: key for key in ROLE_TO_MODEL}, **{name.lower(): key for key, name in ROLE_NAMES.items()}}
+
+
+# ==========================================
+# РАЗБОР ФАЙЛА
+# ==========================================
+
+def parse_roster(data: bytes, filename: str) -> list[dict]:
+    """Разбирает CSV/JSON в список словарей. Бросает ValueError с понятным текстом"""
+    if len(data) > MAX_FILE_BYTES:
+        raise ValueError(f"Файл больше {MAX_FILE_BYTES // 1024} КБ")
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("Файл должен быть в кодировке UTF-8")
+
+    name = (filename or "").lower()
+    if name.endswith(".json"):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Некорректный JSON: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("roster", [])
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSON должен быть списком объектов")
+    elif name.endswith(".csv"):
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = list(csv.DictReader(io.StringIO(text), dialect=dialect))
+    else:
+        raise ValueError("Поддерживаются только файлы .csv и .json")
+
+    if not rows:
+        raise ValueError("Файл пустой")
+    if len(rows) > MAX_ROWS:
+        raise ValueError(f"Слишком много строк: {len(rows)} (максимум {MAX_ROWS})")
+    # Ключи без регистра и пробелов: "ID_ML " == "id_ml"
+    return [{str(k).strip().lower(): ("" if v is None else str(v).strip()) for k, v in row.items() if k} for row in rows]
+
+
+# ==========================================
+# ПЛАН ИМПОРТА (DRY-RUN)
+# ==========================================
+
+def _load_maps(session) -> tuple[dict, dict, dict]:
+    """Пользователи по id и по username, текущие id_ml по ролям"""
+    by_id, by_username = {}, {}
+    users = select(User.user_id, User.username, User.first_name, User.last_name)
+    if current_tenant() is not None:
+        # Только участники сообщества (фильтр по chat_id добавит сессия)
+        users = users.join(TenantMember, TenantMember.user_id == User.user_id)
+    for user_id, username, first_name, last_name in session.execute(users):
+        info = {"user_id": user_id, "username": username, "first_name": first_name, "last_name": last_name}
+        by_id[user_id] = info
+        if username:
+            by_username[username.lower()] = info
+
+    current = {}
+    for role_key, model in ROLE_TO_MODEL.items():
+        current[role_key] = dict(session.execute(select(model.user_id, model.id_ml)).all())
+    return by_id, by_username, current
+
+
+def _resolve_user(row: dict, by_id: dict, by_username: dict):
+    ref = row.get("user_id") or row.get("user") or row.get("username") or ""
+    if ref.lstrip("-").isdigit():
+        return by_id.get(int(ref)), ref
+    return by_username.get(ref.lstrip("@").lower()), ref
+
+
+def plan_roster_import(session, rows: list[dict]) -> dict:
+    """Сверяет строки файла с БД за один проход. Ничего не пишет"""
+    by_id, by_username, current = _load_maps(session)
+    plan = {"add": [], "update": [], "unchanged": 0, "errors": []}
+    seen = {}
+
+    for line, row in enumerate(rows, start=1):
+        user, ref = _resolve_user(row, by_id, by_username)
+        role_key = ROLE_ALIASES.get(row.get("role", "").lower())
+        raw_id_ml = row.get("id_ml", "")
+
+        if not ref:
+            plan["errors"].append((line, "не указан пользователь"))
+            continue
+        if user is None:
+            plan["errors"].append((line, f"пользователь {ref} не найден в базе"))
+            continue
+        if role_key is None:
+            plan["errors"].append((line, f"неизвестная роль «{row.get('role', '')}»"))
+            continue
+        if not raw_id_ml.isdigit() or int(raw_id_ml) <= 0:
+            plan["errors"].append((line, f"некорректный id_ml «{raw_id_ml}»"))
+            continue
+        id_ml = int(raw_id_ml)
+
+        key = (role_key, user["user_id"])
+        if key in seen:
+            if seen[key] != id_ml:
+                plan["errors"].append((line, f"{ref} в роли {ROLE_NAMES[role_key]} встречается повторно с другим id_ml"))
+            continue
+        seen[key] = id_ml
+
+        item = {**user, "role": role_key, "id_ml": id_ml}
+        role_entries = current[role_key]
+        if user["user_id"] not in role_entries:
+            plan["add"].append(item)
+        elif role_entries[user["user_id"]] != id_ml:
+            plan["update"].append({**item, "old_id_ml": role_entries[user["user_id"]]})
+        else:
+            plan["unchanged"] += 1
+    return plan
+
+
+def plan_roster_import_sync(rows: list[dict]) -> dict:
+    session = Session()
+    try:
+        return plan_roster_import(session, rows)
+    finally:
+        session.close()
+
+
+def apply_roster_import_sync(rows: list[dict]) -> dict:
+    """Применяет импорт одной транзакцией. План пересчитывается внутри неё же"""
+    started = time.perf_counter()
+    session = Session()
+    try:
+        plan = plan_roster_import(session, rows)
+        by_role = {}
+        chat_id = effective_tenant()
+        for item in plan["add"] + plan["update"]:
+            by_role.setdefault(item["role"], []).append({
+                "chat_id": chat_id,
+                "user_id": item["user_id"],
+                "first_name": item["first_name"],
+                "last_name": item["last_name"],
+                "username": item["username"],
+                "id_ml": item["id_ml"],
+            })
+
+        for role_key, params in by_role.items():
+            table = ROLE_TO_MODEL[role_key].__table__
+            stmt = sqlite_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.chat_id, table.c.user_id],
+                set_={
+                    "id_ml": stmt.excluded.id_ml,
+                    "first_name": stmt.excluded.first_name,
+                    "last_name": stmt.excluded.last_name,
+                    "username": stmt.excluded.username,
+                },
+            )
+            # Список параметров -> один executemany на таблицу
+            session.execute(stmt, params)
+        session.commit()
+        # executemany идёт мимо ORM, поэтому кэши профилей сбрасываем сами
+        notify_users_changed({item["user_id"] for item in plan["add"] + plan["update"]})
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    metrics.incr("roster.imported", len(plan["add"]) + len(plan["update"]))
+    metrics.observe("roster.import_ms", (time.perf_counter() - started) * 1000)
+    logger.info(
+        f"📥 Импорт ролей: добавлено {len(plan['add'])}, обновлено {len(plan['update'])}, "
+        f"ошибок {len(plan['errors'])}"
+    )
+    return plan
+
+
+def format_roster_diff(plan: dict, applied: bool = False) -> str:
+    def who(item):
+        return html.escape(f"@{item['username']}") if item["username"] else str(item["user_id"])
+
+    title = "✅ <b>Импорт применён</b>" if applied else "📋 <b>Проверка файла (изменения ещё не применены)</b>"
+    lines = [
+        title,
+        f"➕ Добавить: {len(plan['add'])}",
+        f"✏️ Обновить id_ml: {len(plan['update'])}",
+        f"▫️ Без изменений: {plan['unchanged']}",
+        f"❌ Ошибок: {len(plan['errors'])}",
+    ]
+    if plan["add"]:
+        lines.append("\n<b>Добавить:</b>")
+        lines += [f"• {who(i)} → {ROLE_NAMES[i['role']]}, ID {i['id_ml']}" for i in plan["add"][:DIFF_PREVIEW]]
+        if len(plan["add"]) > DIFF_PREVIEW:
+            lines.append(f"… и ещё {len(plan['add']) - DIFF_PREVIEW}")
+    if plan["update"]:
+        lines.append("\n<b>Обновить:</b>")
+        lines += [
+            f"• {who(i)} ({ROLE_NAMES[i['role']]}): {i['old_id_ml']} → {i['id_ml']}"
+            for i in plan["update"][:DIFF_PREVIEW]
+        ]
+        if len(plan["update"]) > DIFF_PREVIEW:
+            lines.append(f"… и ещё {len(plan['update']) - DIFF_PREVIEW}")
+    if plan["errors"]:
+        lines.append("\n<b>Ошибки (строки будут пропущены):</b>")
+        lines += [f"• запись {line}: {html.escape(reason)}" for line, reason in plan["errors"][:DIFF_PREVIEW]]
+        if len(plan["errors"]) > DIFF_PREVIEW:
+            lines.append(f"… и ещё {len(plan['errors']) - DIFF_PREVIEW}")
+    return "\n".join(lines)
+
+
+# ==========================================
+# ЭКСПОРТ
+# ==========================================
+
+def iter_roster_rows(session):
+    """Строки всех ролей порциями по EXPORT_CHUNK, без загрузки таблиц целиком"""
+    for role_key, model in ROLE_TO_MODEL.items():
+        result = session.execute(
+            select(model.user_id, model.username, model.first_name, model.id_ml)
+            .order_by(model.id)
+            .execution_options(yield_per=EXPORT_CHUNK)
+        )
+        for user_id, username, first_name, id_ml in result:
+            yield {"role": role_key, "user_id": user_id, "username": username or "",
+                   "first_name": first_name, "id_ml": id_ml}
+
+
+def write_roster_export_sync(fileobj, fmt: str = "csv") -> int:
+    """Пишет экспорт в бинарный файл построчно. Возвращает число строк"""
+    out = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    count = 0
+    session = Session()
+    try:
+        if fmt == "json":
+            out.write("[\n")
+            for row in iter_roster_rows(session):
+                out.write((",\n" if count else "") + json.dumps(row, ensure_ascii=False))
+                count += 1
+            out.write("\n]\n")
+        else:
+            writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS)
+            writer.writeheader()
+            for row in iter_roster_rows(session):
+                writer.writerow(row)
+                count += 1
+        out.flush()
+    finally:
+        session.close()
+        out.detach()
+    return count
+
+
+# ==========================================
+# ХЕНДЛЕРЫ
+# ==========================================
+
+async def roster_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Описание импорта и кнопки экспорта"""
+    query = update.callback_query
+    await query.answer()
+
+    if not has_permission(query.from_user.id, Permission.PLAYERS):
+        await query.edit_message_text("❌ Эта функция доступна только администраторам.")
+        return
+
+    roles = ", ".join(ROLE_TO_MODEL)
+    text = (
+        "📋 <b>Импорт и экспорт ролей</b>\n\n"
+        "Чтобы добавить много игроков сразу, пришлите боту в личку файл <b>.csv</b> или <b>.json</b> "
+        "с колонками <code>user</code> (@username или Telegram ID), <code>role</code> и <code>id_ml</code>.\n"
+        f"Роли: <code>{roles}</code> (или названия: Мидл, Лес…).\n\n"
+        "Бот сначала покажет, что изменится, и применит импорт только после подтверждения.\n"
+        "Экспорт выгружает файл в том же формате."
+    )
+    keyboard = [
+        [
+            InlineKeyboardButton("📤 Экспорт CSV", callback_data="roster_export:csv"),
+            InlineKeyboardButton("📤 Экспорт JSON", callback_data="roster_export:json"),
+        ],
+        [InlineKeyboardButton("⬅ Назад", callback_data=state.CD_MENU_SETTINGS)],
+    ]
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML")
+
+
+async def roster_document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Принимает файл состава и показывает diff"""
+    if not has_permission(update.effective_user.id, Permission.PLAYERS):
+        return
+
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_FILE_BYTES:
+        await update.message.reply_text(f"❌ Файл больше {MAX_FILE_BYTES // 1024} КБ.")
+        return
+
+    try:
+        file = await document.get_file()
+        data = bytes(await file.download_as_bytearray())
+        rows = parse_roster(data, document.file_name)
+        plan = await asyncio.to_thread(plan_roster_import_sync, rows)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    except Exception as e:
+        logger.error(f"❌ Ошибка проверки импорта ролей: {e}", exc_info=True)
+        await update.message.reply_text("❌ Не удалось обработать файл.")
+        return
+
+    keyboard = []
+    if plan["add"] or plan["update"]:
+        context.user_data["roster_import"] = rows
+        keyboard.append([
+            InlineKeyboardButton("✅ Применить", callback_data="roster_apply"),
+            InlineKeyboardButton("❌ Отмена", callback_data="roster_cancel"),
+        ])
+    else:
+        context.user_data.pop("roster_import", None)
+
+    await update.message.reply_text(
+        format_roster_diff(plan),
+        reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None,
+        parse_mode="HTML",
+    )
+
+
+async def roster_apply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    if not has_permission(query.from_user.id, Permission.PLAYERS):
+        return
+
+    rows = context.user_data.pop("roster_import", None)
+    if not rows:
+        await query.edit_message_text("❌ Нет загруженного файла. Пришлите его ещё раз.")
+        return
+
+    try:
+        plan = await asyncio.to_thread(apply_roster_import_sync, rows)
+    except Exception as e:
+        logger.error(f"❌ Ошибка импорта ролей: {e}", exc_info=True)
+        await query.edit_message_text("❌ Импорт не применён: ошибка базы данных.")
+        return
+
+    await query.edit_message_text(format_roster_diff(plan, applied=True), parse_mode="HTML")
+
+
+async def roster_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    context.user_data.pop("roster_import", None)
+    await query.edit_message_text("❌ Импорт отменён.")
+
+
+async def roster_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгружает все роли файлом"""
+    query = update.callback_query
+    await query.answer()
+
+    if not has_permission(query.from_user.id, Permission.PLAYERS):
+        return
+
+    fmt = query.data.split(":")[1]
+    with tempfile.TemporaryFile() as tmp:
+        try:
+            count = await asyncio.to_thread(write_roster_export_sync, tmp, fmt)
+        except Exception as e:
+            logger.error(f"❌ Ошибка экспорта ролей: {e}", exc_info=True)
+            await query.message.reply_text("❌ Не удалось выгрузить роли.")
+            return
+        tmp.seek(0)
+        await context.bot.send_document(
+            chat_id=query.message.chat_id,
+            document=InputFile(tmp, filename=f"roster.{fmt}"),
+            caption=f"📤 Роли: {count} записей",
+        )
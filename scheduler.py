@@ -4,11 +4,22 @@
 """
 import asyncio
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.schedulers.base import STATE_RUNNING
 
-from config import logger, SCHEDULER_INTERVAL_MINUTES
+import metrics
+from archive import scheduled_archive
+from attendance import scheduled_attendance, scheduled_attendance_backfill
+from backup import scheduled_backup
+from config import (
+    logger, SCHEDULER_INTERVAL_MINUTES, METRICS_LOG_INTERVAL_MINUTES, BACKUP_INTERVAL_HOURS,
+    ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_HOURS, SWEEP_INTERVAL_MINUTES, ATTENDANCE_HOUR
+)
 from events.handlers import check_and_notify_events
+from events.utils import MSK_TZ
+from skill import scheduled_skill_backfill
+from sweeper import scheduled_sweep
 
 # Инициализация планировщика
 scheduler = AsyncIOScheduler()
@@ -34,6 +45,77 @@ async def run_and_start_scheduler(application):
             replace_existing=True  # Заменяет задачу, если она уже существует
         )
         
+        if METRICS_LOG_INTERVAL_MINUTES:
+            scheduler.add_job(
+                log_metrics,
+                trigger=IntervalTrigger(minutes=METRICS_LOG_INTERVAL_MINUTES),
+                id='log_metrics',
+                name='Сводка метрик',
+                replace_existing=True
+            )
+        
+        if SWEEP_INTERVAL_MINUTES:
+            scheduler.add_job(
+                scheduled_sweep,
+                trigger=IntervalTrigger(minutes=SWEEP_INTERVAL_MINUTES),
+                args=(application,),
+                id='sweep_events',
+                name='Закрытие прошедших ивентов',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        
+        if BACKUP_INTERVAL_HOURS:
+            scheduler.add_job(
+                scheduled_backup,
+                trigger=IntervalTrigger(hours=BACKUP_INTERVAL_HOURS),
+                args=(application,),
+                id='db_backup',
+                name='Бэкап базы данных',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        
+        if ARCHIVE_AFTER_DAYS and ARCHIVE_INTERVAL_HOURS:
+            scheduler.add_job(
+                scheduled_archive,
+                trigger=IntervalTrigger(hours=ARCHIVE_INTERVAL_HOURS),
+                id='archive_events',
+                name='Архивация старых ивентов',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        
+        if ATTENDANCE_HOUR >= 0:
+            scheduler.add_job(
+                scheduled_attendance,
+                trigger=CronTrigger(hour=ATTENDANCE_HOUR, timezone=MSK_TZ),
+                id='attendance',
+                name='Посещаемость игроков',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        
+        # Таблица посещаемости появилась в уже работающей БД: не ждём ночи
+        scheduler.add_job(
+            scheduled_attendance_backfill,
+            id='attendance_backfill',
+            name='Первый расчёт посещаемости',
+            replace_existing=True
+        )
+        
+        # Таблица навыков появилась в уже работающей БД: один пересчёт по истории при старте
+        scheduler.add_job(
+            scheduled_skill_backfill,
+            id='skill_backfill',
+            name='Пересчёт навыков',
+            replace_existing=True
+        )
+        
         # Проверяем, не запущен ли уже планировщик
         if scheduler.state != STATE_RUNNING:
             scheduler.start()
@@ -52,6 +134,50 @@ async def run_and_start_scheduler(application):
             logger.error(f"❌ Критическая ошибка планировщика: {e2}")
 
 
+async def log_metrics():
+    """Пишет в лог краткую сводку по очереди апдейтов"""
+    snap = metrics.snapshot()
+    gauges = snap["gauges"]
+    duration = snap["histograms"].get("updates.duration_ms", {})
+    wait = snap["histograms"].get("updates.wait_ms", {})
+    logger.info(
+        f"📈 Апдейтов: {snap['counters'].get('updates.received', 0)}, "
+        f"в работе: {gauges.get('updates.in_flight', 0)}, "
+        f"в очереди: {gauges.get('updates.waiting', 0)} (макс. {gauges.get('updates.max_waiting', 0)}), "
+        f"ожидание p95: {wait.get('p95', 0):.1f} мс, "
+        f"обработка p95: {duration.get('p95', 0):.1f} мс"
+    )
+    checkouts = snap["histograms"].get("db.checkouts_per_update", {})
+    transactions = snap["histograms"].get("db.transactions_per_update", {})
+    if checkouts.get("count"):
+        logger.info(
+            f"🗃 БД на апдейт: соединений p95 {checkouts['p95']:.0f} (макс. {checkouts['max']:.0f}), "
+            f"транзакций p95 {transactions.get('p95', 0):.0f} (макс. {transactions.get('max', 0):.0f}), "
+            f"откатов незакоммиченного: {snap['counters'].get('db.uow.discarded', 0)}"
+        )
+    counters = snap["counters"]
+    card_requests = sum(counters.get(f"profile.cache.{kind}", 0) for kind in ("hit", "miss", "shared"))
+    if card_requests:
+        logger.info(
+            f"🪪 Карточки профиля: запросов {card_requests}, вычислено {counters.get('profile.cache.miss', 0)}, "
+            f"из кэша {counters.get('profile.cache.hit', 0)}, ждали чужое вычисление "
+            f"{counters.get('profile.cache.shared', 0)}, \"кто\" отсеяно: {counters.get('profile.who_is_throttled', 0)}"
+        )
+    throttled = counters.get("throttle.dropped", 0) + counters.get("throttle.coalesced", 0)
+    if throttled:
+        logger.info(
+            f"🚦 Частые нажатия: отброшено {counters.get('throttle.dropped', 0)}, "
+            f"склеено с нажатием в работе {counters.get('throttle.coalesced', 0)}"
+        )
+    if "shard.workers_alive" in gauges:
+        roundtrip = snap["histograms"].get("shard.roundtrip_ms", {})
+        logger.info(
+            f"🧩 Воркеры: живых {gauges['shard.workers_alive']}, отправлено {counters.get('shard.dispatched', 0)}, "
+            f"в работе {gauges.get('shard.in_flight', 0)}, путь до воркера и обратно p95 {roundtrip.get('p95', 0):.1f} мс, "
+            f"перебалансировок {counters.get('shard.rebalances', 0)}, потеряно {counters.get('shard.lost', 0)}"
+        )
+
+
 def stop_scheduler():
     """
     Корректная остановка планировщика.
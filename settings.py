@@ -4,10 +4,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import ADMIN_IDS, logger
-from db import (
-    ROLE_NAMES, ROLE_TO_MODEL, Session, User
-)
+from acl import Permission
+from config import logger
+from tenant import has_permission, permissions
+from db import find_user_by_username, remove_user_from_tenant
 import state
 from announcement.handlers import announce_start  # <-- импортируем новый обработчик
 
@@ -18,7 +18,8 @@ async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
-    if user_id not in ADMIN_IDS:
+    granted = permissions(user_id)
+    if not granted & (Permission.PLAYERS | Permission.ANNOUNCE | Permission.REPORTS):
         await query.edit_message_text("❌ Эта функция доступна только администраторам.")
         return
 
@@ -27,14 +28,18 @@ async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Управление базой данных, документация и объявления."
     )
     
-    keyboard = [
-        [
-            InlineKeyboardButton("🗑 Удалить игрока (Из базы)", callback_data="settings_del_user"),
-            InlineKeyboardButton("ℹ️ Инструкция", callback_data="settings_info")
-        ],
-        [InlineKeyboardButton("📢 Объявить информацию", callback_data="settings_announce")],
-        [InlineKeyboardButton("⬅ Назад в меню", callback_data=state.CD_BACK_TO_MENU)]
-    ]
+    # Модератор видит только кнопки своих прав (acl.py)
+    first_row = [InlineKeyboardButton("ℹ️ Инструкция", callback_data="settings_info")]
+    if granted & Permission.PLAYERS:
+        first_row.insert(0, InlineKeyboardButton("🗑 Удалить игрока (Из сообщества)", callback_data="settings_del_user"))
+    keyboard = [first_row]
+    if granted & Permission.ANNOUNCE:
+        keyboard.append([InlineKeyboardButton("📢 Объявить информацию", callback_data="settings_announce")])
+    if granted & Permission.PLAYERS:
+        keyboard.append([InlineKeyboardButton("📋 Импорт/экспорт ролей", callback_data="roster_menu")])
+    if granted & Permission.REPORTS:
+        keyboard.append([InlineKeyboardButton("📅 Посещаемость", callback_data="attendance_report")])
+    keyboard.append([InlineKeyboardButton("⬅ Назад в меню", callback_data=state.CD_BACK_TO_MENU)])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
@@ -48,9 +53,10 @@ async def settings_del_user_start(update: Update, context: ContextTypes.DEFAULT_
     
     await query.edit_message_text(
         "🗑 **Полное удаление игрока**\n\n"
-        "⚠️ Это действие удалит игрока:\n"
-        "1. Из таблицы `users`.\n"
-        "2. Из ВСЕХ ролей (Мидл, Лес и т.д.).\n\n"
+        "⚠️ Это действие удалит игрока из сообщества:\n"
+        "1. Из участников группы в боте.\n"
+        "2. Из ВСЕХ ролей этой группы (Мидл, Лес и т.д.).\n"
+        "Если игрок больше нигде не состоит, он удаляется из базы.\n\n"
         "Введите @username игрока для удаления:",
         parse_mode='Markdown'
     )
@@ -63,48 +69,34 @@ async def handle_global_delete_input(update: Update, context: ContextTypes.DEFAU
     
     user_id = update.effective_user.id
     
-    if user_id not in ADMIN_IDS:
+    if not has_permission(user_id, Permission.PLAYERS):
         return
 
     username = update.message.text.strip()
     if not username.startswith('@'):
         return await update.message.reply_text("❌ Введите username с @ (например: @username).")
 
-    session = Session()
     try:
-        user = session.query(User).filter(User.username == username.lstrip('@')).first()
+        user = await find_user_by_username(username)
         if not user:
-            return await update.message.reply_text("❌ Пользователь с таким ником не найден в базе.")
-        
-        deleted_roles = []
-        
-        # Удаляем из всех ролей
-        for role_key, Model in ROLE_TO_MODEL.items():
-            entry = session.query(Model).filter_by(user_id=user.user_id).first()
-            if entry:
-                session.delete(entry)
-                deleted_roles.append(ROLE_NAMES[role_key])
-        
-        # Удаляем пользователя
-        session.delete(user)
-        session.commit()
-        
+            return await update.message.reply_text("❌ Пользователь с таким ником не найден в сообществе.")
+
+        # Роли и членство только в текущем сообществе; в других группах игрок остаётся
+        deleted_roles = await remove_user_from_tenant(user.user_id)
+
         context.user_data.pop("settings_state", None)
-        
+
         roles_str = ", ".join(deleted_roles) if deleted_roles else "Нет"
         await update.message.reply_text(
-            f"✅ Игрок @{user.username} полностью удален из базы данных.\n"
+            f"✅ Игрок @{user.username} удален из сообщества.\n"
             f"Удалены роли: {roles_str}."
         )
-        
-        logger.info(f"🗑 Игрок @{user.username} полностью удалён. Роли: {roles_str}")
-        
+
+        logger.info(f"🗑 Игрок @{user.username} удалён из сообщества. Роли: {roles_str}")
+
     except Exception as e:
-        session.rollback()
         await update.message.reply_text(f"❌ Ошибка при удалении: {e}")
         logger.error(f"❌ Ошибка при удалении игрока: {e}")
-    finally:
-        session.close()
 
 
 async def settings_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -117,7 +109,8 @@ async def settings_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         "🤖 **Основные команды:**\n"
         "• `/start` — Главное меню бота.\n"
-        "• `/me` — Посмотреть свой игровой профиль (роль и ID).\n\n"
+        "• `/me` — Посмотреть свой игровой профиль (роль и ID).\n"
+        "• `/community` — Выбрать группу, с которой работать в личке.\n\n"
         
         "👥 **Для Игроков:**\n"
         "Вы можете использовать кнопку **\"Тегнуть игроков\"**, чтобы позвать конкретную роль (например, Мидл) в общий чат.\n\n"
@@ -129,7 +122,17 @@ async def settings_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2. Выберите нужную роль (Мидл, Лес и т.д.).\n"
         "3. Нажмите \"➕ Добавить\".\n"
         "4. Выберите первую букву имени игрока.\n"
-        "5. Кликните на игрока из списка и введите его **ID из Mobile Legends**.\n\n"
+        "5. Кликните на игрока из списка и введите его **ID из Mobile Legends**.\n"
+        "Много игроков сразу: Настройки -> \"Импорт/экспорт ролей\" и файл CSV/JSON в личку боту.\n\n"
+        
+        "📤 **Выгрузка матчей:**\n"
+        "`/export` в личке — файл с матчами, составами и оценками. Можно указать формат (csv/parquet), "
+        "период и роль: `/export parquet 2025-01-01 2025-03-31 middle`.\n\n"
+        
+        "🔑 **Админы и модераторы:**\n"
+        "`/grant @user moderator` — выдать права в сообществе (admin, moderator или список: events, players, "
+        "announce, reports, acl), `/revoke @user` — отозвать, `/admins` — кто что может. "
+        "Слово `global` в конце — права во всех сообществах.\n\n"
         
         "🗑 **Удаление игроков:**\n"
         "• **Из роли:** Меню -> Регистрация -> Выбрать роль -> \"Удалить\".\n"
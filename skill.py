@@ -0,0 +1,584 @@
+"""
+skill.py
+Рейтинг навыка игрока по ролям из оценок админов (1–5).
+
+Модель — одномерный фильтр Калмана (Glicko/TrueSkill для одного игрока без соперников):
+навык игрока в роли в сообществе — нормальное распределение N(mu, sigma²) в шкале оценок.
+    • новый игрок: N(SKILL_PRIOR_MU, SKILL_PRIOR_SIGMA²);
+    • сыгранный матч (фиксация состава, red/blue): sigma² += SKILL_DRIFT², но не больше
+      априорной — с прошлых оценок навык мог измениться. Участник, которого админ отметил
+      «не играл» (played = False), матча не сыграл: дрейфа от этого матча нет;
+    • оценка g: k = sigma² / (sigma² + SKILL_NOISE²), mu += k·(g − mu), sigma² ·= (1 − k).
+Чем больше оценок, тем меньше k: одна случайная оценка почти не сдвигает опытного игрока,
+а после перерыва (дрейф) новые оценки снова весят больше. Роль — role_played участника
+матча ('unknown' — играл без роли), как в архивной статистике.
+
+Два пути с одинаковым результатом:
+    • инкрементальный — в транзакции фиксации состава (record_lineup) и оценки
+      (record_rating): один UPSERT, новое значение SQLite считает из текущей строки,
+      поэтому одновременные оценки из разных процессов не теряются. Отметка «не играл»
+      (record_not_played) пересчитывает по истории одну роль игрока;
+    • пакетный пересчёт всей истории (recompute_sync) — для подбора параметров и
+      восстановления таблицы. С NumPy все ключи (сообщество, игрок, роль) проходят
+      историю одновременно: шаг r обновляет r-е событие каждого ключа одной векторной
+      операцией. Без NumPy — тот же расчёт циклом.
+Заархивированные матчи известны только числом и суммой оценок: при пересчёте они
+учитываются одной порцией без дрейфа, поэтому после архивации пересчёт может немного
+отличаться от накопленного инкрементально.
+
+Результат — таблица skill_ratings; миксы и профиль читают её одним запросом (get_skills).
+
+Пересчёт и подбор параметров (качество — ошибка прогноза каждой оценки по навыку до неё):
+    python skill.py                              # пересчитать с параметрами из .env
+    python skill.py --noise 0.8 --drift 0.2 --dry-run
+"""
+import argparse
+import asyncio
+import math
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import metrics
+from config import (
+    SKILL_PRIOR_MU, SKILL_PRIOR_SIGMA, SKILL_NOISE, SKILL_DRIFT, SKILL_CONSERVATIVE_K, logger
+)
+from db import (
+    Session, Event, EventMatch, MatchParticipant, RoleRating, ArchivedRoleStats, SkillRating,
+    USERS_SKILLS, notify_users_changed
+)
+
+UNKNOWN_ROLE = 'unknown'
+PLAYED_TEAMS = ('red', 'blue')
+
+# Виды событий истории: сыгранный матч идёт раньше оценок за него
+DRIFT, GRADE = 0, 1
+# Упаковка вида, id и оценки в одно целое (см. History)
+KIND_SHIFT = 60
+GRADE_BITS = 3
+GRADE_MASK = (1 << GRADE_BITS) - 1
+
+LOAD_CHUNK = 50_000
+WRITE_CHUNK = 10_000
+RECOMPUTE_ATTEMPTS = 3
+
+
+@dataclass(frozen=True)
+class SkillParams:
+    """Параметры модели (по умолчанию — из окружения)"""
+    prior_mu: float = SKILL_PRIOR_MU
+    prior_sigma: float = SKILL_PRIOR_SIGMA
+    noise: float = SKILL_NOISE
+    drift: float = SKILL_DRIFT
+
+    @property
+    def prior_var(self) -> float:
+        return self.prior_sigma ** 2
+
+    @property
+    def noise_var(self) -> float:
+        return self.noise ** 2
+
+    @property
+    def drift_var(self) -> float:
+        return self.drift ** 2
+
+
+DEFAULT_PARAMS = SkillParams()
+
+
+@dataclass(frozen=True, slots=True)
+class Skill:
+    """Навык игрока в роли"""
+    mu: float
+    variance: float
+    ratings: int
+
+    @property
+    def sigma(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def conservative(self) -> float:
+        """Оценка «не ниже чем» для миксов: у новичка она ниже, чем у проверенного игрока с тем же mu"""
+        return self.mu - SKILL_CONSERVATIVE_K * self.sigma
+
+
+PRIOR_SKILL = Skill(DEFAULT_PARAMS.prior_mu, DEFAULT_PARAMS.prior_var, 0)
+
+
+# ==========================================
+# ФОРМУЛЫ
+# ==========================================
+
+def observe(mu: float, variance: float, grade: float, params: SkillParams = DEFAULT_PARAMS) -> tuple:
+    """Навык после оценки"""
+    gain = variance / (variance + params.noise_var)
+    return mu + gain * (grade - mu), variance * (1 - gain)
+
+
+def drift(variance: float, params: SkillParams = DEFAULT_PARAMS) -> float:
+    """Разброс после сыгранного матча"""
+    return min(variance + params.drift_var, params.prior_var)
+
+
+def from_aggregate(count: int, total: float, params: SkillParams = DEFAULT_PARAMS) -> tuple:
+    """Навык по count оценкам с суммой total без дрейфа (архивные агрегаты)"""
+    precision = 1 / params.prior_var + count / params.noise_var
+    return (params.prior_mu / params.prior_var + total / params.noise_var) / precision, 1 / precision
+
+
+# ==========================================
+# ИНКРЕМЕНТАЛЬНОЕ ОБНОВЛЕНИЕ (В ТРАНЗАКЦИИ ХЕНДЛЕРА)
+# ==========================================
+
+def _upsert(values, set_):
+    table = SkillRating.__table__
+    stmt = sqlite_insert(table).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.chat_id, table.c.user_id, table.c.role],
+        set_={**set_(table.c), "updated_at": stmt.excluded.updated_at},
+    )
+
+
+def record_lineup(session, event: Event, players, params: SkillParams = DEFAULT_PARAMS):
+    """
+    Сыгранный матч: дрейф навыка игроков red/blue.
+    players — пары (user_id, role_played). Коммитит вызывающий вместе с составом.
+    """
+    now = datetime.utcnow()
+    for user_id, role in players:
+        session.execute(_upsert(
+            {"chat_id": event.chat_id, "user_id": user_id, "role": role or UNKNOWN_ROLE,
+             "mu": params.prior_mu, "variance": params.prior_var, "ratings": 0, "updated_at": now},
+            lambda c: {"variance": func.min(c.variance + params.drift_var, params.prior_var)},
+        ))
+
+
+def record_rating(session, participant: MatchParticipant, grade: int, params: SkillParams = DEFAULT_PARAMS):
+    """Оценка участника матча. Коммитит вызывающий вместе с самой оценкой"""
+    chat_id = session.execute(
+        select(Event.chat_id).join(EventMatch, EventMatch.event_id == Event.id)
+        .where(EventMatch.id == participant.match_id)
+    ).scalar()
+    if chat_id is None:
+        return
+    mu, variance = observe(params.prior_mu, params.prior_var, grade, params)
+    noise_var = params.noise_var
+    session.execute(_upsert(
+        {"chat_id": chat_id, "user_id": participant.user_id, "role": participant.role_played or UNKNOWN_ROLE,
+         "mu": mu, "variance": variance, "ratings": 1, "updated_at": datetime.utcnow()},
+        # Правая часть SET видит строку до обновления: mu и variance — прежние
+        lambda c: {
+            "mu": c.mu + c.variance / (c.variance + noise_var) * (grade - c.mu),
+            "variance": c.variance * noise_var / (c.variance + noise_var),
+            "ratings": c.ratings + 1,
+        },
+    ))
+
+
+def record_not_played(session, participant: MatchParticipant, params: SkillParams = DEFAULT_PARAMS):
+    """
+    Участник отмечен «не играл» (played уже False): убирает дрейф его матча.
+    Обратить дрейф формулой нельзя — он ограничен априорной дисперсией, а после него могли
+    быть оценки, — поэтому навык роли пересчитывается по её истории, как в пакетном пересчёте.
+    Коммитит вызывающий вместе с отметкой.
+    """
+    if participant.team not in PLAYED_TEAMS:
+        return
+    chat_id = session.execute(
+        select(Event.chat_id).join(EventMatch, EventMatch.event_id == Event.id)
+        .where(EventMatch.id == participant.match_id)
+    ).scalar()
+    if chat_id is None:
+        return
+    key = (chat_id, participant.user_id, participant.role_played or UNKNOWN_ROLE)
+    # Отметка пишется первой: блокировка записи взята, и история ниже уже без этого матча
+    session.flush()
+    history = History()
+    rows = session.execute(_history_query(key)).all()
+    if rows:
+        history.extend(rows)
+    archived = session.execute(
+        select(ArchivedRoleStats.ratings_count, ArchivedRoleStats.ratings_sum)
+        .where(ArchivedRoleStats.chat_id == key[0], ArchivedRoleStats.user_id == key[1], ArchivedRoleStats.role == key[2])
+        .execution_options(all_tenants=True)
+    ).first()
+    if archived:
+        history.archived[key] = tuple(archived)
+    skills, _ = compute_python(history, params)
+    skill = skills.get(key) or Skill(params.prior_mu, params.prior_var, 0)
+    values = {"mu": skill.mu, "variance": skill.variance, "ratings": skill.ratings}
+    session.execute(_upsert(
+        {"chat_id": key[0], "user_id": key[1], "role": key[2], **values, "updated_at": datetime.utcnow()},
+        lambda c: values,
+    ))
+
+
+def get_skills(session, user_ids) -> dict:
+    """{user_id: {роль: Skill}} для игроков текущего сообщества — одним запросом"""
+    skills = {}
+    if not user_ids:
+        return skills
+    for user_id, role, mu, variance, ratings in session.execute(USERS_SKILLS, {"user_ids": list(user_ids)}):
+        skills.setdefault(user_id, {})[role] = Skill(mu, variance, ratings)
+    return skills
+
+
+# ==========================================
+# ПАКЕТНЫЙ ПЕРЕСЧЁТ
+# ==========================================
+
+class History:
+    """
+    События истории столбцами (компактные array, NumPy читает их без копирования).
+
+    Вид, id строки и оценка упакованы в одно целое seq = вид << 60 | id << 3 | оценка:
+    сортировка по (время, seq) ставит матч раньше оценок за него, а оценки — по id;
+    меньше столбцов — меньше Python-объектов при чтении миллионов строк.
+    """
+
+    def __init__(self):
+        self.roles = {}  # роль -> код
+        self.chat = array('q')
+        self.user = array('q')
+        self.role = array('h')
+        self.time = array('d')
+        self.seq = array('q')
+        # Архивные агрегаты: (chat_id, user_id, роль) -> (оценок, сумма)
+        self.archived = {}
+
+    def __len__(self):
+        return len(self.seq)
+
+    def role_code(self, role: str) -> int:
+        return self.roles.setdefault(role, len(self.roles))
+
+    def extend(self, rows):
+        """Порция строк (chat_id, user_id, роль, время, seq) — по столбцам, без цикла по строкам"""
+        chat, user, role, when, seq = zip(*rows)
+        self.chat.extend(chat)
+        self.user.extend(user)
+        for name in set(role):
+            self.role_code(name)
+        self.role.extend([self.roles[name] for name in role])
+        self.time.extend(when)
+        self.seq.extend(seq)
+
+
+def pack(kind: int, row_id: int, grade: int) -> int:
+    return kind << KIND_SHIFT | row_id << GRADE_BITS | grade
+
+
+def _julianday(column):
+    # created_at может отсутствовать у строк, вставленных в обход ORM: такие события — в начале
+    return func.coalesce(func.julianday(column), 0.0)
+
+
+def _history_query(key: tuple | None = None):
+    """События истории: все или одного ключа (chat_id, user_id, роль) — для record_not_played"""
+    role = func.coalesce(MatchParticipant.role_played, UNKNOWN_ROLE)
+    played = (
+        select(Event.chat_id, MatchParticipant.user_id, role, _julianday(EventMatch.created_at),
+               literal(DRIFT << KIND_SHIFT) + EventMatch.id * (1 << GRADE_BITS))
+        .select_from(MatchParticipant)
+        .join(EventMatch, EventMatch.id == MatchParticipant.match_id)
+        .join(Event, Event.id == EventMatch.event_id)
+        # «Не играл» (played = False) — без дрейфа; NULL у старых строк считается сыгранным
+        .where(MatchParticipant.team.in_(PLAYED_TEAMS), MatchParticipant.played.isnot(False))
+    )
+    graded = (
+        select(Event.chat_id, RoleRating.user_id, role, _julianday(RoleRating.created_at),
+               literal(GRADE << KIND_SHIFT) + RoleRating.id * (1 << GRADE_BITS) + RoleRating.rating)
+        .select_from(RoleRating)
+        .join(MatchParticipant, MatchParticipant.id == RoleRating.match_participant_id)
+        .join(EventMatch, EventMatch.id == MatchParticipant.match_id)
+        .join(Event, Event.id == EventMatch.event_id)
+        .where(RoleRating.rating.between(1, 5))
+    )
+    if key is not None:
+        chat_id, user_id, role_name = key
+        played = played.where(Event.chat_id == chat_id, MatchParticipant.user_id == user_id, role == role_name)
+        graded = graded.where(Event.chat_id == chat_id, RoleRating.user_id == user_id, role == role_name)
+    return union_all(played, graded)
+
+
+def _watermark(session) -> tuple:
+    """Последние id матча и оценки и число отметок «не играл»: инкрементальные обновления их сдвигают"""
+    return session.execute(select(
+        select(func.max(EventMatch.id)).scalar_subquery(),
+        select(func.max(RoleRating.id)).scalar_subquery(),
+        select(func.count()).select_from(MatchParticipant).where(MatchParticipant.played.is_(False)).scalar_subquery(),
+    )).one()
+
+
+def load_history_sync(session) -> History:
+    """Вся история всех сообществ: сыгранные матчи, оценки и архивные агрегаты"""
+    history = History()
+    # Курсор драйвера напрямую: миллионы строк без обёрток Row из SQLAlchemy
+    connection = session.connection()
+    sql = _history_query().compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.execute(str(sql))
+        while rows := cursor.fetchmany(LOAD_CHUNK):
+            history.extend(rows)
+    finally:
+        cursor.close()
+    archived = session.execute(
+        select(ArchivedRoleStats.chat_id, ArchivedRoleStats.user_id, ArchivedRoleStats.role,
+               ArchivedRoleStats.ratings_count, ArchivedRoleStats.ratings_sum)
+        .execution_options(all_tenants=True)
+    )
+    for chat_id, user_id, role, count, total in archived:
+        history.role_code(role)
+        history.archived[(chat_id, user_id, role)] = (count, total)
+    return history
+
+
+def _start_state(archived, key, params: SkillParams) -> tuple:
+    count, total = archived.get(key, (0, 0))
+    if count:
+        return (*from_aggregate(count, total, params), count)
+    return params.prior_mu, params.prior_var, 0
+
+
+def compute_python(history: History, params: SkillParams = DEFAULT_PARAMS) -> tuple:
+    """Эталонный пересчёт циклом: ({(chat_id, user_id, роль): Skill}, качество прогноза)"""
+    names = {code: role for role, code in history.roles.items()}
+    events = {}
+    for chat_id, user_id, role, when, seq in zip(history.chat, history.user, history.role, history.time, history.seq):
+        events.setdefault((chat_id, user_id, names[role]), []).append((when, seq))
+
+    quality = _Quality()
+    skills = {}
+    for key, items in events.items():
+        mu, variance, ratings = _start_state(history.archived, key, params)
+        items.sort()
+        for _, seq in items:
+            grade = seq & GRADE_MASK
+            if seq >> KIND_SHIFT == DRIFT:
+                variance = drift(variance, params)
+            else:
+                quality.add(grade - mu, variance + params.noise_var)
+                mu, variance = observe(mu, variance, grade, params)
+                ratings += 1
+        skills[key] = Skill(mu, variance, ratings)
+    for key in history.archived.keys() - skills.keys():
+        skills[key] = Skill(*_start_state(history.archived, key, params))
+    return skills, quality.summary()
+
+
+def compute_numpy(history: History, params: SkillParams = DEFAULT_PARAMS) -> tuple:
+    """Векторный пересчёт: тот же результат, что compute_python"""
+    import numpy as np
+
+    chat = np.frombuffer(history.chat, dtype=np.int64)
+    seq = np.frombuffer(history.seq, dtype=np.int64)
+    # Меньше ключей сортировки — быстрее lexsort: (игрок, роль) в одном int64 (ролей < 256)
+    user_role = np.frombuffer(history.user, dtype=np.int64) << 8 | np.frombuffer(history.role, dtype=np.int16)
+
+    # События каждого ключа подряд и по времени
+    order = np.lexsort((seq, np.frombuffer(history.time, dtype=np.float64), user_role, chat))
+    chat, user_role, seq = chat[order], user_role[order], seq[order]
+    kind = seq >> KIND_SHIFT
+    grade = (seq & GRADE_MASK).astype(np.float64)
+    n = len(order)
+    new_key = np.ones(n, dtype=bool)
+    if n:
+        new_key[1:] = (chat[1:] != chat[:-1]) | (user_role[1:] != user_role[:-1])
+    starts = np.flatnonzero(new_key)
+    counts = np.diff(np.append(starts, n))
+
+    names = {code: name for name, code in history.roles.items()}
+    keys = list(zip(
+        chat[starts].tolist(),
+        (user_role[starts] >> 8).tolist(),
+        [names[code] for code in (user_role[starts] & 0xFF).tolist()],
+    ))
+    mu = np.full(len(keys), params.prior_mu)
+    var = np.full(len(keys), params.prior_var)
+    ratings = np.zeros(len(keys), dtype=np.int64)
+    if history.archived:
+        for i, key in enumerate(keys):
+            if key in history.archived:
+                mu[i], var[i], ratings[i] = _start_state(history.archived, key, params)
+
+    # Ключи по убыванию длины истории: на шаге r активны первые active[r] из них
+    by_length = np.argsort(-counts, kind='stable')
+    starts, counts = starts[by_length], counts[by_length]
+    mu, var, ratings = mu[by_length], var[by_length], ratings[by_length]
+    steps = int(counts[0]) if len(counts) else 0
+    active = np.searchsorted(-counts, -np.arange(steps), side='left')
+
+    quality = _Quality()
+    for r in range(steps):
+        m = active[r]
+        idx = starts[:m] + r
+        is_drift = kind[idx] == DRIFT
+        v = np.where(is_drift, np.minimum(var[:m] + params.drift_var, params.prior_var), var[:m])
+        total_var = v + params.noise_var
+        error = grade[idx] - mu[:m]
+        graded = ~is_drift
+        quality.add_many(error[graded], total_var[graded])
+        gain = np.where(is_drift, 0.0, v / total_var)
+        mu[:m] += gain * error
+        var[:m] = v * (1 - gain)
+        ratings[:m] += graded
+
+    ordered_keys = [keys[k] for k in by_length.tolist()]
+    skills = dict(zip(ordered_keys, map(Skill, mu.tolist(), var.tolist(), ratings.tolist())))
+    for key in history.archived.keys() - skills.keys():
+        skills[key] = Skill(*_start_state(history.archived, key, params))
+    return skills, quality.summary()
+
+
+class _Quality:
+    """Качество одношагового прогноза: каждая оценка против навыка до неё"""
+
+    def __init__(self):
+        self.count = 0
+        self.squared = 0.0
+        self.nll = 0.0
+
+    def add(self, error: float, variance: float):
+        self.count += 1
+        self.squared += error * error
+        self.nll += 0.5 * (math.log(2 * math.pi * variance) + error * error / variance)
+
+    def add_many(self, errors, variances):
+        import numpy as np
+        self.count += len(errors)
+        self.squared += float(np.dot(errors, errors))
+        self.nll += float(0.5 * np.sum(np.log(2 * np.pi * variances) + errors * errors / variances))
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"graded": 0, "rmse": None, "nll": None}
+        return {
+            "graded": self.count,
+            "rmse": round(math.sqrt(self.squared / self.count), 4),
+            "nll": round(self.nll / self.count, 4),
+        }
+
+
+def compute(history: History, params: SkillParams = DEFAULT_PARAMS) -> tuple:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        logger.info("ℹ️ NumPy не установлен: пересчёт навыков циклом")
+        return compute_python(history, params)
+    return compute_numpy(history, params)
+
+
+class _HistoryChanged(Exception):
+    pass
+
+
+def _write(session, skills: dict, watermark: tuple):
+    """Заменяет таблицу целиком одной транзакцией, если история не менялась с момента чтения"""
+    table = SkillRating.__table__
+    # DELETE первым берёт блокировку записи: проверка ниже видит все закоммиченные изменения
+    session.execute(delete(table))
+    if _watermark(session) != watermark:
+        raise _HistoryChanged()
+    now = datetime.utcnow()
+    rows = [
+        {"chat_id": chat_id, "user_id": user_id, "role": role, "mu": skill.mu,
+         "variance": skill.variance, "ratings": skill.ratings, "updated_at": now}
+        for (chat_id, user_id, role), skill in skills.items()
+    ]
+    for i in range(0, len(rows), WRITE_CHUNK):
+        session.execute(insert(table), rows[i:i + WRITE_CHUNK])
+
+
+def recompute_sync(params: SkillParams = DEFAULT_PARAMS, dry_run: bool = False) -> dict:
+    """
+    Пересчитывает skill_ratings по всей истории. dry_run — только качество прогноза.
+    Если во время расчёта появились новые матчи или оценки, расчёт повторяется.
+    """
+    for attempt in range(1, RECOMPUTE_ATTEMPTS + 1):
+        started = time.perf_counter()
+        session = Session()
+        try:
+            watermark = _watermark(session)
+            history = load_history_sync(session)
+            loaded = time.perf_counter()
+            skills, quality = compute(history, params)
+            computed = time.perf_counter()
+            session.rollback()  # чтение закончено: не держим снимок БД, пока идёт запись
+            if not dry_run:
+                _write(session, skills, watermark)
+                session.commit()
+        except _HistoryChanged:
+            session.rollback()
+            logger.info(f"🔁 История изменилась во время пересчёта навыков, попытка {attempt + 1}")
+            continue
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        finished = time.perf_counter()
+        if not dry_run:
+            # Навыки поменялись у всех: карточки профилей строятся заново
+            notify_users_changed(None)
+        stats = {
+            "events": len(history),
+            "skills": len(skills),
+            "load_ms": round((loaded - started) * 1000, 1),
+            "compute_ms": round((computed - loaded) * 1000, 1),
+            "write_ms": round((finished - computed) * 1000, 1),
+            **quality,
+        }
+        metrics.observe("skill.recompute_ms", (finished - started) * 1000)
+        logger.info(f"🎯 Навыки {'оценены' if dry_run else 'пересчитаны'}: {stats}")
+        return stats
+    raise RuntimeError(f"История менялась во время каждой из {RECOMPUTE_ATTEMPTS} попыток пересчёта")
+
+
+def backfill_sync() -> dict | None:
+    """Первый запуск с таблицей навыков: пересчёт, если навыков ещё нет, а история есть"""
+    session = Session()
+    try:
+        empty = session.execute(select(SkillRating.user_id).limit(1).execution_options(all_tenants=True)).first() is None
+        has_history = any(_watermark(session))
+    finally:
+        session.close()
+    if empty and has_history:
+        return recompute_sync()
+    return None
+
+
+async def scheduled_skill_backfill():
+    """Разовая задача планировщика при старте"""
+    try:
+        await asyncio.to_thread(backfill_sync)
+    except Exception as e:
+        logger.error(f"❌ Ошибка пересчёта навыков: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="пересчёт рейтинга навыка по всей истории оценок")
+    parser.add_argument("--prior-mu", type=float, default=SKILL_PRIOR_MU)
+    parser.add_argument("--prior-sigma", type=float, default=SKILL_PRIOR_SIGMA)
+    parser.add_argument("--noise", type=float, default=SKILL_NOISE)
+    parser.add_argument("--drift", type=float, default=SKILL_DRIFT)
+    parser.add_argument("--dry-run", action="store_true", help="не записывать, только качество прогноза")
+    args = parser.parse_args()
+    params = SkillParams(args.prior_mu, args.prior_sigma, args.noise, args.drift)
+    stats = recompute_sync(params, dry_run=args.dry_run)
+    print(f"Событий: {stats['events']}, навыков: {stats['skills']}, оценок в прогнозе: {stats['graded']}")
+    print(f"RMSE прогноза: {stats['rmse']}, NLL: {stats['nll']}")
+    print(f"Чтение {stats['load_ms']} мс, расчёт {stats['compute_ms']} мс, запись {stats['write_ms']} мс")
+    if not args.dry_run and params != DEFAULT_PARAMS:
+        print("⚠️ Параметры отличаются от .env: перенесите их в SKILL_*, иначе новые оценки пойдут по старым")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import ADMIN_IDS, logger
-from db import save_user
+from acl import Permission
+from config import logger
+from tenant import effective_tenant, group_admins, is_admin as is_tenant_admin, permissions, use_tenant
+from db import get_user_tenants, save_user
 import state
 
 
@@ -41,7 +43,8 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         return
     
-    is_admin = user_id in ADMIN_IDS
+    is_admin = is_tenant_admin(user_id)
+    granted = permissions(user_id)
     
     keyboard = []
 
@@ -60,6 +63,20 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton("⚙️ ДопФункционал", callback_data=state.CD_MENU_SETTINGS)  # <-- изменено
             ]
         ]
+    elif granted:
+        # Модератор: только разделы выданных прав (acl.py)
+        text = "🛡 <b>Панель Модератора</b>\n\nДоступны разделы по выданным правам."
+        keyboard = []
+        if granted & Permission.PLAYERS:
+            keyboard.append([
+                InlineKeyboardButton("👥 Список игроков", callback_data=state.CD_MENU_PLAYERS),
+                InlineKeyboardButton("📝 Регистрация ролей", callback_data=state.CD_MENU_REG)
+            ])
+        keyboard.append([InlineKeyboardButton("📅 События", callback_data=state.CD_MENU_CRM)])
+        last_row = [InlineKeyboardButton("📢 Тегнуть игроков", callback_data=state.CD_MENU_TAG)]
+        if granted & (Permission.PLAYERS | Permission.ANNOUNCE | Permission.REPORTS):
+            last_row.append(InlineKeyboardButton("⚙️ ДопФункционал", callback_data=state.CD_MENU_SETTINGS))
+        keyboard.append(last_row)
     else:
         text = "👋 <b>Добро пожаловать!</b>\n\nВы можете записываться на игры и вызывать игроков."
         
@@ -83,4 +100,54 @@ async def back_to_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     if query:
         await query.answer()
-    await show_main_menu(update, context)
\ No newline at end of file
+    await show_main_menu(update, context)
+
+
+async def community_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/community — выбор сообщества (группы), от имени которого работает меню в ЛС"""
+    if update.effective_chat.type != "private":
+        await update.message.reply_text(
+            "❌ Эта команда доступна только в личных сообщениях."
+        )
+        return
+
+    tenants = await get_user_tenants(update.effective_user.id)
+    if not tenants:
+        await update.message.reply_text(
+            "🏘 Вы пока не состоите ни в одной группе с ботом.\n"
+            "Напишите что-нибудь в группе, и она появится здесь."
+        )
+        return
+
+    current = effective_tenant()
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{'✅ ' if tenant.chat_id == current else ''}{tenant.title or tenant.chat_id}",
+            callback_data=f"{state.CD_TENANT_SWITCH}:{tenant.chat_id}"
+        )]
+        for tenant in tenants
+    ]
+    await update.message.reply_text(
+        "🏘 <b>Выберите сообщество</b>\n\nСобытия, роли и списки игроков будут показаны для него.",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="HTML"
+    )
+
+
+async def tenant_switch_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = query.from_user.id
+    chat_id = int(query.data.split(":")[1])
+
+    tenants = await get_user_tenants(user_id)
+    if chat_id not in {tenant.chat_id for tenant in tenants}:
+        await query.answer("❌ Вы не состоите в этом сообществе.", show_alert=True)
+        return
+    await query.answer()
+
+    context.user_data["tenant_id"] = chat_id
+    logger.info(f"🏘 Пользователь {user_id} переключился на сообщество {chat_id}")
+
+    # Текущий апдейт уже привязан к прежнему сообществу: меню показываем от имени нового
+    with use_tenant(chat_id, await group_admins(context.bot, chat_id)):
+        await show_main_menu(update, context)
@@ -26,4 +26,6 @@ CD_BACK_TO_ROLES = "back_to_roles"
 CD_TEG_ROLE = "teg_role"
 CD_TEG_USER = "teg_user"
 CD_TEG_ALL = "teg_all"
-CD_TEG_BACK = "teg_back"
\ No newline at end of file
+CD_TEG_BACK = "teg_back"
+# --- Сообщества ---
+CD_TENANT_SWITCH = "tenant_switch"
@@ -0,0 +1,127 @@
+"""
+Очистка прошедших ивентов.
+
+Раньше ивент становился 'completed' только по кнопке «Завершить», и прошедшие ивенты
+навсегда оставались в списке и в минутной проверке планировщика. Очистка одним
+UPDATE ... RETURNING (по индексу events(status, event_time)) закрывает:
+    • 'active' старше EVENT_EXPIRE_GRACE_HOURS -> 'expired' (игра не состоялась);
+    • 'lineup_fixed' старше EVENT_COMPLETE_GRACE_HOURS -> 'completed'.
+Список закрытых ивентов, у которых был состав, но нет ни одной оценки, получают
+держатели права EVENTS в сообществе ивента — администраторы группы и выданные в нём
+права (tenant.holders). Если в сообществе их нет, список уходит владельцам и держателям
+глобального права (acl.holders).
+"""
+import asyncio
+import html
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, exists, or_, select, update
+
+import acl
+from acl import Permission
+from config import EVENT_EXPIRE_GRACE_HOURS, EVENT_COMPLETE_GRACE_HOURS, logger
+from db import Session, Event, EventMatch, MatchParticipant, RoleRating
+from events.utils import DATE_FORMAT, MSK_TZ
+import metrics
+import tenant
+
+
+def sweep_events_sync(now: datetime | None = None, expire_hours: float = EVENT_EXPIRE_GRACE_HOURS,
+                      complete_hours: float = EVENT_COMPLETE_GRACE_HOURS) -> dict:
+    """Закрывает прошедшие ивенты. Возвращает переходы и ивенты с составом без оценок"""
+    now = now or datetime.now(MSK_TZ)
+    expire_before = (now - timedelta(hours=expire_hours)).strftime(DATE_FORMAT)
+    complete_before = (now - timedelta(hours=complete_hours)).strftime(DATE_FORMAT)
+    started = time.perf_counter()
+
+    session = Session()
+    try:
+        stmt = (
+            update(Event)
+            .where(or_(
+                (Event.status == 'active') & (Event.event_time < expire_before),
+                (Event.status == 'lineup_fixed') & (Event.event_time < complete_before),
+            ))
+            .values(status=case((Event.status == 'active', 'expired'), else_='completed'))
+            .returning(Event.id, Event.title, Event.event_time, Event.status)
+            .execution_options(synchronize_session=False)
+        )
+        closed = session.execute(stmt).all()
+
+        unrated = []
+        if closed:
+            rated = exists().where(
+                RoleRating.match_participant_id == MatchParticipant.id,
+                MatchParticipant.match_id == EventMatch.id,
+                EventMatch.event_id == Event.id,
+            )
+            has_lineup = exists().where(EventMatch.event_id == Event.id)
+            unrated = session.execute(
+                select(Event.chat_id, Event.id, Event.title, Event.event_time)
+                .where(Event.id.in_([row.id for row in closed]), has_lineup, ~rated)
+                .order_by(Event.event_time)
+            ).all()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    transitions = {"expired": 0, "completed": 0}
+    for row in closed:
+        transitions[row.status] += 1
+    for status, count in transitions.items():
+        if count:
+            metrics.incr(f"sweeper.{status}", count)
+    metrics.incr("sweeper.unrated", len(unrated))
+    metrics.observe("sweeper.duration_ms", (time.perf_counter() - started) * 1000)
+
+    return {
+        "transitions": transitions,
+        "unrated": [(row.chat_id, row.id, row.title, row.event_time) for row in unrated],
+    }
+
+
+def format_unrated_report(unrated: list, chat_id: int | None = None) -> str:
+    lines = ["⚠️ <b>Ивенты закрыты без оценок</b>"]
+    if chat_id:
+        lines.append(f"Сообщество <code>{chat_id}</code>")
+    lines.append("Состав был зафиксирован, но оценок нет:")
+    for event_id, title, event_time in unrated[:30]:
+        lines.append(f"• #{event_id} {html.escape(title)} ({event_time})")
+    if len(unrated) > 30:
+        lines.append(f"… и ещё {len(unrated) - 30}")
+    return "\n".join(lines)
+
+
+async def scheduled_sweep(application):
+    """Задача планировщика: очистка в отдельном потоке и уведомление админов"""
+    try:
+        report = await asyncio.to_thread(sweep_events_sync)
+    except Exception as e:
+        metrics.incr("sweeper.failed")
+        logger.error(f"❌ Ошибка очистки ивентов: {e}", exc_info=True)
+        return
+
+    transitions = report["transitions"]
+    if any(transitions.values()):
+        logger.info(
+            f"🧹 Закрыто ивентов: expired {transitions['expired']}, completed {transitions['completed']}, "
+            f"без оценок {len(report['unrated'])}"
+        )
+    if not report["unrated"]:
+        return
+
+    by_chat = {}
+    for chat_id, event_id, title, event_time in report["unrated"]:
+        by_chat.setdefault(chat_id, []).append((event_id, title, event_time))
+    for chat_id, unrated in by_chat.items():
+        text = format_unrated_report(unrated, chat_id)
+        recipients = await tenant.holders(application.bot, chat_id, Permission.EVENTS) or acl.holders(Permission.EVENTS)
+        for admin_id in recipients:
+            try:
+                await application.bot.send_message(chat_id=admin_id, text=text, parse_mode="HTML")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отправить отчёт об очистке админу {admin_id}: {e}")
@@ -7,6 +7,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from config import GROUP_ID, logger
+from tenant import current_tenant
 from db import get_role_users, ROLE_NAMES, ROLE_TO_MODEL, Session
 import state
 
@@ -19,7 +20,10 @@ TAG_CHUNK_SIZE = 4
 # ==========================================
 
 def get_group_id(context: ContextTypes.DEFAULT_TYPE) -> int | None:
-    """Безопасное получение ID группы"""
+    """Безопасное получение ID группы (группа текущего сообщества)"""
+    chat_id = current_tenant()
+    if chat_id:
+        return chat_id
     if GROUP_ID:
         return GROUP_ID
     return context.bot_data.get("last_admin_group_id")
@@ -0,0 +1,163 @@
+"""
+tenant.py
+Сообщества (арендаторы): один бот обслуживает много игровых групп.
+
+Ключ арендатора — chat_id группы. Ивенты, роли, участники сообщества и архивная
+статистика хранят chat_id, и все ORM-запросы внутри апдейта автоматически
+ограничиваются текущим сообществом (db._scope_by_tenant). Пользователи Telegram
+общие: один человек может состоять в нескольких группах.
+
+Текущее сообщество апдейта:
+    • в группе — сама группа;
+    • в ЛС — выбранное через /community (context.user_data["tenant_id"]),
+      иначе DEFAULT_TENANT_ID, иначе единственное сообщество пользователя.
+Вне апдейтов (планировщик, очистка, архив, скрипты) сообщество не задано
+и запросы видят все данные; use_tenant() ограничивает их явно.
+
+Права в сообществе (acl.py): владельцы ADMIN_IDS — все; права из admin_grants —
+глобальные и выданные в этом сообществе; администраторы группы в Telegram
+(кэшируются на TENANT_ADMINS_TTL_SECONDS) — TENANT_ADMIN.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import acl
+import metrics
+from acl import Permission
+from cache import AsyncTTLCache
+from config import DEFAULT_TENANT_ID, TENANT_ADMINS_TTL_SECONDS, logger
+
+_current_tenant: ContextVar[int | None] = ContextVar("tenant", default=None)
+_current_admins: ContextVar[frozenset] = ContextVar("tenant_admins", default=frozenset())
+
+# chat_id -> frozenset(user_id) администраторов группы
+_group_admins = AsyncTTLCache("tenant.admins", TENANT_ADMINS_TTL_SECONDS, max_entries=10_000)
+
+
+def current_tenant() -> int | None:
+    """chat_id сообщества текущего апдейта (None — вне апдейта, без ограничения)"""
+    return _current_tenant.get()
+
+
+def effective_tenant() -> int:
+    """Текущее сообщество или сообщество по умолчанию (chat_id новых строк, явные фильтры)"""
+    chat_id = _current_tenant.get()
+    return DEFAULT_TENANT_ID if chat_id is None else chat_id
+
+
+@contextmanager
+def use_tenant(chat_id: int, admins: frozenset = frozenset()):
+    """Выполняет блок от имени сообщества (планировщик, скрипты, бенчмарки)"""
+    tenant_token = _current_tenant.set(chat_id)
+    admins_token = _current_admins.set(admins)
+    try:
+        yield chat_id
+    finally:
+        _current_admins.reset(admins_token)
+        _current_tenant.reset(tenant_token)
+
+
+def permissions(user_id: int) -> Permission:
+    """Права пользователя в текущем сообществе (снимок acl.py + администраторы группы)"""
+    mask = acl.permissions(user_id, _current_tenant.get())
+    if user_id in _current_admins.get():
+        mask |= acl.TENANT_ADMIN
+    return mask
+
+
+def has_permission(user_id: int, permission: Permission) -> bool:
+    """Есть ли у пользователя все биты permission в текущем сообществе"""
+    return permissions(user_id) & permission == permission
+
+
+@contextmanager
+def update_scope():
+    """
+    Сообщество и админы живут ровно один апдейт: при CONCURRENT_UPDATES=1 PTB выполняет
+    апдейты прямо в контексте получателя, и без сброса они переходили бы к следующему.
+    """
+    tenant_token = _current_tenant.set(None)
+    admins_token = _current_admins.set(frozenset())
+    try:
+        yield
+    finally:
+        _current_admins.reset(admins_token)
+        _current_tenant.reset(tenant_token)
+
+
+def is_admin(user_id: int) -> bool:
+    """Админ текущего сообщества: все права сообщества (владелец, /grant admin или администратор группы)"""
+    return has_permission(user_id, acl.TENANT_ADMIN)
+
+
+def is_staff(user_id: int) -> bool:
+    """Админ или модератор: хоть какое-то право в текущем сообществе"""
+    return bool(permissions(user_id))
+
+
+async def _load_group_admins(bot, chat_id: int) -> frozenset:
+    try:
+        members = await bot.get_chat_administrators(chat_id)
+    except Exception as e:
+        # Бота убрали из группы или API недоступен: остаются только права из acl.py
+        logger.warning(f"⚠️ Не удалось получить админов группы {chat_id}: {e}")
+        metrics.incr("tenant.admins_errors")
+        return frozenset()
+    return frozenset(member.user.id for member in members if not member.user.is_bot)
+
+
+async def group_admins(bot, chat_id: int) -> frozenset:
+    if not chat_id:
+        return frozenset()
+    return await _group_admins.get(chat_id, lambda: _load_group_admins(bot, chat_id))
+
+
+def invalidate_group_admins(chat_id: int):
+    _group_admins.invalidate(chat_id)
+
+
+async def holders(bot, chat_id: int, permission: Permission) -> list[int]:
+    """
+    Получатели уведомлений сообщества: права из admin_grants в нём и администраторы группы
+    (если permission входит в TENANT_ADMIN). Владельцы и глобальные — acl.holders().
+    """
+    users = set(acl.tenant_holders(permission, chat_id))
+    if chat_id and acl.TENANT_ADMIN & permission == permission:
+        users.update(await group_admins(bot, chat_id))
+    return sorted(users)
+
+
+async def resolve_tenant(update, context) -> int:
+    """Сообщество, от имени которого обрабатывается апдейт"""
+    chat = update.effective_chat
+    if chat is not None and chat.type in ("group", "supergroup"):
+        return chat.id
+
+    user_data = context.user_data
+    if user_data is not None and user_data.get("tenant_id") is not None:
+        return user_data["tenant_id"]
+    if DEFAULT_TENANT_ID or update.effective_user is None:
+        return DEFAULT_TENANT_ID
+
+    from db import get_user_tenants
+    tenants = await get_user_tenants(update.effective_user.id)
+    if len(tenants) == 1:
+        # Единственное сообщество запоминаем, чтобы не искать его на каждый апдейт
+        user_data["tenant_id"] = tenants[0].chat_id
+        return tenants[0].chat_id
+    return DEFAULT_TENANT_ID
+
+
+async def bind_tenant(update, context):
+    """
+    Middleware (TypeHandler, group=-2): задаёт сообщество и его админов для всех
+    хендлеров апдейта. ContextVar копируется в asyncio.to_thread, поэтому
+    *_sync функции db.py видят то же сообщество.
+    """
+    # До первого await: если resolve_tenant упадёт, следующие группы хендлеров увидят
+    # сообщество по умолчанию без админов группы, а не значения чужого апдейта
+    _current_tenant.set(DEFAULT_TENANT_ID)
+    _current_admins.set(frozenset())
+    chat_id = await resolve_tenant(update, context)
+    _current_tenant.set(chat_id)
+    _current_admins.set(await group_admins(context.bot, chat_id))
@@ -0,0 +1,174 @@
+"""
+throttle.py
+Ограничение частоты нажатий: token bucket на пару (пользователь, действие) и склейка двойных нажатий.
+
+Проверка идёт в OrderedUpdateProcessor до очереди пользователя, поэтому отсеянное
+нажатие не занимает ни очередь, ни слот, ни соединение с БД:
+    • повтор тех же callback_data от того же пользователя, пока предыдущее нажатие
+      ждёт очереди или выполняется, склеивается с ним — работа выполняется один раз;
+    • нажатие сверх лимита действия (ACTION_LIMITS, остальное — THROTTLE_RATE/THROTTLE_BURST)
+      отбрасывается.
+В обоих случаях кнопке отвечает дешёвый answerCallbackQuery, чтобы у пользователя
+не крутились часики. Команды ограничиваются так же, но без ответа.
+В режиме WORKERS пользователь закреплён за одним воркером, так что его корзины живут в одном процессе.
+
+Метрики: throttle.dropped, throttle.coalesced (и с суффиксом действия).
+"""
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from telegram import Update
+from telegram.error import TelegramError
+
+import metrics
+from config import THROTTLE_RATE, THROTTLE_BURST, logger
+
+# Действие — префикс callback_data до ":" (у команд — имя команды); родственные кнопки делят корзину.
+# Действие -> (корзина, токенов в секунду, ёмкость корзины)
+ACTION_LIMITS = {
+    # Запись/отписка: запись в БД, уведомление в группу и перерисовка карточки
+    "event_join": ("signup", 0.2, 4),
+    "event_leave": ("signup", 0.2, 4),
+    # Перемешивание: расчёт микса и перерисовка
+    "event_mix": ("mix", 0.5, 3),
+    "event_mix_again": ("mix", 0.5, 3),
+    # Листание списков
+    "menu_players": ("paging", 2.0, 6),
+    "reg_letter": ("paging", 2.0, 6),
+    "del_page": ("paging", 2.0, 6),
+    "teg_role": ("paging", 2.0, 6),
+    # Оценивание: админ проходит состав подряд, корзина на весь матч
+    "rate_user": ("rating", 3.0, 15),
+    "rate_user_not_played": ("rating", 3.0, 15),
+    "rate_skip": ("rating", 3.0, 15),
+}
+
+# Предел числа корзин: сверх него выбрасываются давно не нажатые, даже неполные
+MAX_BUCKETS = 10_000
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите пару секунд"
+COALESCED_TEXT = "⏳ Уже выполняется..."
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше burst"""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+def action_of(update: Update) -> tuple[str, str | None] | None:
+    """(действие, callback_data) нажатия или команды; None — апдейт не ограничивается"""
+    query = update.callback_query
+    if query is not None:
+        if not query.data:
+            return None
+        return query.data.split(":", 1)[0], query.data
+    message = update.message
+    if message is not None and message.text and message.text.startswith("/"):
+        return message.text.split(maxsplit=1)[0].split("@", 1)[0].lstrip("/"), None
+    return None
+
+
+class ActionThrottle:
+    """Корзины по (user_id, действие) и нажатия в работе по (user_id, callback_data)"""
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST, limits: dict = ACTION_LIMITS):
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits
+        # В порядке последнего нажатия: в начале — дольше всех простаивавшие
+        self._buckets: OrderedDict[tuple, TokenBucket] = OrderedDict()
+        self._in_flight: set[tuple] = set()
+
+        metrics.register_gauge("throttle.buckets", lambda: len(self._buckets))
+
+    def _bucket(self, user_id: int, action: str, now: float) -> TokenBucket:
+        name, rate, burst = self.limits.get(action, (action, self.rate, self.burst))
+        key = (user_id, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _prune(self, now: float):
+        """
+        Выбрасывает корзины с начала (дольше всех без нажатий): полные — всегда, их состояние
+        совпадает с новой корзиной (простой дольше burst / rate), неполные — пока корзин не
+        меньше MAX_BUCKETS. Останавливается на первой неполной: в среднем O(1) на новую корзину.
+        """
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) < MAX_BUCKETS and not bucket.full(now):
+                break
+            del self._buckets[key]
+
+    @asynccontextmanager
+    async def gate(self, update: object):
+        """
+        async with throttle.gate(update) as admitted: — False, если нажатие склеено или отброшено
+        (кнопке уже ответили). Пока блок выполняется, такие же нажатия склеиваются с этим.
+        """
+        user = update.effective_user if isinstance(update, Update) else None
+        action = action_of(update) if user is not None else None
+        if action is None:
+            yield True
+            return
+
+        name, data = action
+        flight_key = (user.id, data) if data is not None else None
+        if flight_key in self._in_flight:
+            metrics.incr("throttle.coalesced")
+            metrics.incr(f"throttle.coalesced.{name}")
+            await self._answer(update, COALESCED_TEXT)
+            yield False
+            return
+        now = time.monotonic()
+        if not self._bucket(user.id, name, now).take(now):
+            metrics.incr("throttle.dropped")
+            metrics.incr(f"throttle.dropped.{name}")
+            await self._answer(update, THROTTLED_TEXT)
+            yield False
+            return
+
+        if flight_key is None:
+            yield True
+            return
+        self._in_flight.add(flight_key)
+        try:
+            yield True
+        finally:
+            self._in_flight.discard(flight_key)
+
+    @staticmethod
+    async def _answer(update: Update, text: str):
+        if update.callback_query is None:
+            return
+        try:
+            await update.callback_query.answer(text)
+        except TelegramError as e:
+            # Кнопка могла устареть — отвечать уже некому
+            logger.debug(f"answerCallbackQuery для отсеянного нажатия не прошёл: {e}")
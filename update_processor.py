@@ -0,0 +1,150 @@
+"""
+Обработка апдейтов параллельно между пользователями, но строго по порядку внутри одного пользователя.
+
+Состояния в context.user_data (мастер создания ивента, оценивание, регистрация ролей)
+рассчитаны на последовательную обработку, поэтому апдейты одного user_id выполняются
+по очереди. Запись/отписка дополнительно упорядочиваются по ивенту, чтобы счётчики
+участников не гонялись между разными пользователями.
+"""
+import asyncio
+import inspect
+import re
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, nullcontext
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+from tenant import update_scope
+
+EVENT_ACTION_RE = re.compile(r"^event_(?:join|leave):(\d+)")
+# Лимит принятых апдейтов (в работе и в очереди) — во столько раз больше слотов выполнения
+ADMISSION_FACTOR = 16
+
+
+def ordering_keys(update: object) -> list[tuple]:
+    """
+    Ключи, по которым апдейт должен выполняться строго последовательно.
+    Возвращаются в фиксированном порядке, чтобы не было взаимных блокировок.
+    """
+    keys = []
+    if isinstance(update, Update):
+        if update.effective_user:
+            keys.append(("user", update.effective_user.id))
+        elif update.effective_chat:
+            keys.append(("chat", update.effective_chat.id))
+
+        query = update.callback_query
+        if query and query.data:
+            match = EVENT_ACTION_RE.match(query.data)
+            if match:
+                keys.append(("event", int(match.group(1))))
+    return sorted(keys)
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor с глобальным лимитом параллельности и упорядочиванием по ключам.
+
+    Сначала апдейт ждёт свою очередь по ключам (пользователь, ивент), и только потом
+    занимает глобальный слот — так апдейты одного занятого пользователя не держат
+    слоты, нужные остальным.
+
+    BaseUpdateProcessor.process_update (@final) берёт свой семафор до do_process_update,
+    то есть до очереди по ключам. Поэтому его семафор — только лимит принятых апдейтов
+    (в работе и в очереди, ADMISSION_FACTOR слотов на каждый), а троттлинг, очередь по ключам
+    и слот выполнения — в do_process_update. Через него идут и апдейты PTB, и воркеры
+    (workers._Worker._process вызывает тот же process_update).
+
+    Метрики:
+        updates.waiting       — сколько апдейтов сейчас ждут очереди или слота (gauge)
+        updates.in_flight     — сколько апдейтов выполняется прямо сейчас (gauge)
+        updates.queue_depth   — глубина очереди в момент поступления апдейта
+        updates.wait_ms       — сколько апдейт ждал до начала выполнения
+        updates.duration_ms   — время выполнения хендлеров
+
+    unit_of_work — фабрика контекстного менеджера, внутри которого выполняются хендлеры
+    апдейта (db.unit_of_work: одна сессия БД на апдейт). Сообщество апдейта
+    (tenant.bind_tenant) сбрасывается после него в tenant.update_scope.
+    throttle — throttle.ActionThrottle: отсевает частые и повторные нажатия ещё до очереди.
+    """
+
+    def __init__(self, max_concurrent_updates: int, unit_of_work=None, throttle=None):
+        # При max_concurrent_updates=1 PTB выполняет апдейты по одному и без лимита принятых
+        super().__init__(max_concurrent_updates * ADMISSION_FACTOR if max_concurrent_updates > 1 else 1)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._unit_of_work = unit_of_work or nullcontext
+        self._throttle = throttle
+        self._key_locks = {}  # key -> [asyncio.Lock, число держащих/ждущих]
+        self._waiting = 0
+        self._max_waiting = 0
+        self._in_flight = 0
+
+        metrics.register_gauge("updates.waiting", lambda: self._waiting)
+        metrics.register_gauge("updates.max_waiting", lambda: self._max_waiting)
+        metrics.register_gauge("updates.in_flight", lambda: self._in_flight)
+        metrics.register_gauge("updates.ordering_keys", lambda: len(self._key_locks))
+
+    @asynccontextmanager
+    async def _hold(self, key):
+        entry = self._key_locks.get(key)
+        if entry is None:
+            entry = self._key_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._key_locks[key]
+
+    async def do_process_update(self, update, coroutine) -> None:
+        metrics.incr("updates.received")
+        if self._throttle is None:
+            await self._process_ordered(update, coroutine)
+            return
+        async with self._throttle.gate(update) as admitted:
+            if admitted:
+                await self._process_ordered(update, coroutine)
+            else:
+                coroutine.close()
+
+    async def _process_ordered(self, update, coroutine) -> None:
+        self._waiting += 1
+        self._max_waiting = max(self._max_waiting, self._waiting)
+        metrics.observe("updates.queue_depth", self._waiting)
+        timed = self._timed(coroutine, queued_at=time.perf_counter())
+        try:
+            async with AsyncExitStack() as stack:
+                for key in ordering_keys(update):
+                    await stack.enter_async_context(self._hold(key))
+                # Слот — после ключей: ждущий своей очереди апдейт не занимает слот выполнения
+                async with self._slots:
+                    await timed
+        finally:
+            if inspect.getcoroutinestate(timed) == inspect.CORO_CREATED:
+                # Апдейт отменили, пока он ждал очереди — до хендлеров дело не дошло
+                self._waiting -= 1
+                timed.close()
+                coroutine.close()
+
+    async def _timed(self, coroutine, queued_at: float):
+        begin = time.perf_counter()
+        self._waiting -= 1
+        self._in_flight += 1
+        metrics.observe("updates.wait_ms", (begin - queued_at) * 1000)
+        try:
+            with update_scope(), self._unit_of_work():
+                await coroutine
+        finally:
+            self._in_flight -= 1
+            metrics.incr("updates.processed")
+            metrics.observe("updates.duration_ms", (time.perf_counter() - begin) * 1000)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
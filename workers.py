@@ -0,0 +1,663 @@
+"""
+workers.py
+Режим нескольких процессов (WORKERS > 0): один процесс принимает апдейты, N процессов их обрабатывают.
+
+Приёмник (ingress) получает апдейты от Telegram (polling или webhook) и по локальному
+unix-сокету раздаёт их процессам-воркерам. В каждом воркере работает обычный стек
+хендлеров (main.build_application, OrderedUpdateProcessor, persistence). CPU-тяжёлые
+хендлеры (миксы, карточки профилей, большие списки) одного процесса больше не
+задерживают приём апдейтов и работу остальных.
+
+Шардирование: апдейт уходит воркеру по rendezvous-хэшу от user_id (без пользователя —
+от chat_id). Все апдейты пользователя обрабатывает один процесс, поэтому его user_data
+и порядок апдейтов остаются как в одном процессе. Когда воркер уходит, к остальным
+переезжают только его пользователи; когда возвращается, они переезжают обратно.
+
+Перебалансировка:
+    • приёмник рассылает новый состав воркеров и не раздаёт апдейты, пока все живые
+      воркеры его не подтвердят (ring_ok);
+    • перед подтверждением воркер сохраняет user_data (update_persistence + flush) и
+      забывает пользователей, которые ему больше не принадлежат: новый владелец
+      прочитает их состояние из БД;
+    • пока у пользователя есть апдейты в работе у прежнего воркера, новые апдейты идут
+      туда же, чтобы не нарушить их порядок;
+    • воркер, получивший SIGTERM, уходит мягко: сохраняет состояния, выходит из состава,
+      дорабатывает то, что уже получил, и только потом останавливается.
+    Апдейты, которые упавший воркер не успел обработать, теряются, как и при падении
+    одного процесса (polling их уже подтвердил); счётчик shard.lost. Упавший воркер
+    перезапускается с нарастающей паузой.
+
+Дисциплина записи в SQLite:
+    • схема и миграции — только в приёмнике до запуска воркеров;
+    • WAL и busy_timeout (DB_JOURNAL_MODE, DB_BUSY_TIMEOUT_MS): чтения не ждут записи,
+      писатели ждут друг друга, а не падают с "database is locked";
+    • user_data пользователя пишет только процесс-владелец;
+    • bot_data пишут все процессы, поэтому он хранится по строке на ключ (persistence.py):
+      процесс пишет только изменённые им ключи. Чужие записи видны не сразу, а с задержкой
+      до BOT_DATA_REFRESH_SECONDS; одновременная запись одного ключа из двух процессов —
+      побеждает последняя;
+    • планировщик (напоминания, очистка, архив, бэкапы) работает только в приёмнике.
+
+Кэши карточек профиля у каждого процесса свои: сброс (db.on_users_changed) приёмник
+пересылает всем остальным процессам. Так же расходится изменение прав (acl.on_acl_changed):
+получатель перечитывает снимок прав из БД.
+
+Запись/отписка разных пользователей на один ивент теперь может идти в разных процессах
+параллельно: целостность держат транзакции БД, а не ключ ("event", id) упорядочивания.
+
+Протокол — кадры "4 байта длины + JSON":
+    ingress -> worker: update, ring, users_changed, acl_changed, metrics, stop
+    worker -> ingress: hello, done, ring_ok, leaving, users_changed, acl_changed, metrics
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import struct
+import tempfile
+import threading
+import time
+
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+from config import BOT_TOKEN, logger
+
+_HEADER = struct.Struct(">I")
+
+# Сколько приёмник ждёт подтверждения нового состава, прежде чем продолжить без него
+RING_TIMEOUT_SECONDS = 10
+# Сколько ждать подключения всех воркеров при старте
+START_TIMEOUT_SECONDS = 60
+# Пауза перед перезапуском упавшего воркера: удваивается до максимума,
+# сбрасывается, если воркер проработал дольше STABLE_SECONDS
+RESTART_DELAY_SECONDS = 1
+RESTART_DELAY_MAX_SECONDS = 30
+STABLE_SECONDS = 60
+
+# Сброс кэшей, пришедший от другого процесса, не пересылается обратно
+_peer = threading.local()
+
+
+# ==========================================
+# ОБЩЕЕ
+# ==========================================
+
+def _frame(message: dict) -> bytes:
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode()
+    return _HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict | None:
+    """Следующее сообщение или None, если соединение закрыто"""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        return json.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def shard_key(update: Update) -> str | None:
+    """Ключ шардирования: пользователь, иначе чат. None — подойдёт любой воркер"""
+    if update.effective_user:
+        return f"user:{update.effective_user.id}"
+    if update.effective_chat:
+        return f"chat:{update.effective_chat.id}"
+    return None
+
+
+def owner(key: str, workers: list[int]) -> int:
+    """
+    Rendezvous-хэширование: у каждого ключа свой порядок воркеров, владелец — первый
+    живой. При смене состава переезжают только ключи ушедшего или пришедшего воркера.
+    """
+    return max(workers, key=lambda w: hashlib.blake2b(f"{w}:{key}".encode(), digest_size=8).digest())
+
+
+def _apply_users_changed(users):
+    """Сброс кэшей по событию из другого процесса (без повторной пересылки)"""
+    from db import notify_users_changed
+    _peer.active = True
+    try:
+        notify_users_changed(None if users is None else set(users))
+    finally:
+        _peer.active = False
+
+
+def _apply_acl_changed():
+    """Перечитывает снимок прав по событию из другого процесса (в потоке, без повторной пересылки)"""
+    import acl
+    _peer.active = True
+    try:
+        acl.changed()
+    finally:
+        _peer.active = False
+
+
+# ==========================================
+# ПРИЁМНИК
+# ==========================================
+
+class _WorkerLink:
+    """Процесс-воркер глазами приёмника"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.writer = None
+        self.leaving = False
+        self.in_flight = {}  # id апдейта -> (ключ шардирования, когда отправлен)
+
+    def send(self, message: dict):
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(_frame(message))
+
+
+class Ingress:
+    """
+    Раздаёт апдейты из application.update_queue процессам-воркерам.
+
+    Application приёмника не запускается (start() не вызывается): от него нужны только
+    updater (polling/webhook), bot и bot_data для планировщика.
+
+    Метрики (как в одном процессе, чтобы отчёты и log_metrics не менялись):
+        updates.processed, updates.wait_ms, updates.duration_ms — по подтверждениям воркеров
+        shard.roundtrip_ms   — от отправки воркеру до подтверждения
+        shard.dispatched, shard.lost, shard.rebalances, shard.rebalance_ms, shard.worker_exits
+        shard.workers_alive, shard.in_flight (gauge)
+    """
+
+    def __init__(self, application: Application, workers: int, base_url: str | None = None):
+        self.application = application
+        self.base_url = base_url
+        self.links = {index: _WorkerLink(index) for index in range(workers)}
+        self.alive: list[int] = []
+        self.sticky = {}  # ключ -> [воркер, апдейтов в работе]
+        self._seq = 0
+        self._epoch = 0
+        self._ring_pending = set()
+        self._ring_started = 0.0
+        self._ready = asyncio.Event()
+        self._stopping = False
+        self._server = None
+        self._tasks = set()
+        self._connections = set()
+        self._metric_replies = {}
+        self.socket_path = os.path.join(tempfile.mkdtemp(prefix="mlbot_workers_"), "ingress.sock")
+
+        metrics.register_gauge("shard.workers_alive", lambda: len(self.alive))
+        metrics.register_gauge("shard.in_flight", lambda: sum(len(link.in_flight) for link in self.links.values()))
+
+    # --- Запуск и остановка ---
+
+    async def start(self):
+        """Поднимает сокет, запускает воркеры и ждёт, пока все они примут состав"""
+        from acl import on_acl_changed
+        from db import init_db, on_users_changed
+        # Схема и миграции — здесь, до воркеров: они увидят готовый отпечаток схемы
+        init_db()
+        on_users_changed(self._on_local_users_changed)
+        on_acl_changed(self._on_local_acl_changed)
+
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_unix_server(self._on_connect, path=self.socket_path)
+        for link in self.links.values():
+            self._spawn_task(self._supervise(link))
+        if self.application.persistence is not None:
+            self.application.persistence.shared_bot_data = True
+            self._spawn_task(self._refresh_bot_data())
+
+        deadline = time.monotonic() + START_TIMEOUT_SECONDS
+        while len(self.alive) < len(self.links) or not self._ready.is_set():
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"❌ Воркеры не подключились за {START_TIMEOUT_SECONDS} с: живых {self.alive}")
+            await asyncio.sleep(0.05)
+        self._spawn_task(self._dispatch_loop())
+        logger.info(f"👷 Воркеров запущено: {len(self.alive)}")
+
+    async def stop(self, timeout: float = 30):
+        """Дорабатывает отправленные апдейты и останавливает воркеры"""
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        while any(link.in_flight for link in self.links.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for link in self.links.values():
+            link.send({"t": "stop"})
+        for link in self.links.values():
+            if link.process is not None:
+                await asyncio.to_thread(link.process.join, max(0.0, deadline - time.monotonic()))
+                if link.process.is_alive():
+                    logger.warning(f"⚠️ Воркер {link.index} не остановился вовремя, завершаем принудительно")
+                    link.process.kill()
+                    await asyncio.to_thread(link.process.join)
+        # Соединения закрываются сами, когда процессы вышли: дочитываем последние подтверждения
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=5)
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._server.close()
+        await self._server.wait_closed()
+        try:
+            os.unlink(self.socket_path)
+            os.rmdir(os.path.dirname(self.socket_path))
+        except OSError:
+            pass
+
+    async def _refresh_bot_data(self):
+        """Приёмник не обрабатывает апдейты: bot_data для планировщика освежается по таймеру"""
+        from persistence import BOT_DATA_REFRESH_SECONDS
+        while True:
+            await asyncio.sleep(BOT_DATA_REFRESH_SECONDS)
+            try:
+                await self.application.persistence.refresh_bot_data(self.application.bot_data)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось обновить bot_data: {e}")
+
+    def _spawn_task(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _supervise(self, link: _WorkerLink):
+        """Запускает процесс воркера и перезапускает его после падения"""
+        # spawn, а не fork: в приёмнике уже есть потоки (пул SQLAlchemy, to_thread)
+        context = multiprocessing.get_context("spawn")
+        delay = RESTART_DELAY_SECONDS
+        while not self._stopping:
+            link.leaving = False
+            link.process = context.Process(
+                target=worker_main, args=(link.index, self.socket_path, self.base_url),
+                name=f"mlbot-worker-{link.index}", daemon=True,
+            )
+            link.process.start()
+            started = time.monotonic()
+            await asyncio.to_thread(link.process.join)
+            if self._stopping:
+                return
+            code = link.process.exitcode
+            if time.monotonic() - started > STABLE_SECONDS:
+                delay = RESTART_DELAY_SECONDS
+            logger.warning(f"⚠️ Воркер {link.index} завершился (код {code}), перезапуск через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX_SECONDS)
+
+    # --- Соединения воркеров ---
+
+    async def _on_connect(self, reader, writer):
+        hello = await read_frame(reader)
+        if not hello or hello.get("t") != "hello" or hello.get("worker") not in self.links:
+            writer.close()
+            return
+        link = self.links[hello["worker"]]
+        link.writer = writer
+        task = asyncio.current_task()
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+        logger.info(f"👷 Воркер {link.index} подключился (pid {hello.get('pid')})")
+        self._set_ring(sorted(set(self.alive) | {link.index}))
+        try:
+            while (message := await read_frame(reader)) is not None:
+                self._on_message(link, message)
+        finally:
+            self._on_disconnect(link)
+            writer.close()
+
+    def _on_message(self, link: _WorkerLink, message: dict):
+        kind = message["t"]
+        if kind == "done":
+            self._on_done(link, message)
+        elif kind == "ring_ok":
+            if message["epoch"] == self._epoch:
+                self._ring_pending.discard(link.index)
+                if not self._ring_pending:
+                    self._ring_agreed()
+        elif kind == "leaving":
+            # Мягкий уход: новые пользователи к нему больше не попадут, начатое он доделает
+            link.leaving = True
+            logger.info(f"👋 Воркер {link.index} выходит из состава")
+            self._set_ring([index for index in self.alive if index != link.index])
+            self._release_if_idle(link)
+        elif kind == "users_changed":
+            self._broadcast({"t": "users_changed", "users": message["users"]}, exclude=link.index)
+            _apply_users_changed(message["users"])
+        elif kind == "acl_changed":
+            self._broadcast({"t": "acl_changed"}, exclude=link.index)
+            self._spawn_task(asyncio.to_thread(_apply_acl_changed))
+        elif kind == "metrics":
+            future = self._metric_replies.get((link.index, message["request"]))
+            if future is not None and not future.done():
+                future.set_result(message["snapshot"])
+
+    def _on_done(self, link: _WorkerLink, message: dict):
+        key, sent_at = link.in_flight.pop(message["id"], (None, None))
+        if sent_at is None:
+            return
+        self._unstick(key)
+        metrics.incr("updates.processed")
+        metrics.observe("updates.wait_ms", message["wait"])
+        metrics.observe("updates.duration_ms", message["ms"])
+        metrics.observe("shard.roundtrip_ms", (time.perf_counter() - sent_at) * 1000)
+        self._release_if_idle(link)
+
+    def _release_if_idle(self, link: _WorkerLink):
+        if link.leaving and not link.in_flight:
+            link.send({"t": "stop"})
+
+    def _on_disconnect(self, link: _WorkerLink):
+        link.writer = None
+        lost = len(link.in_flight)
+        for key, _ in link.in_flight.values():
+            self._unstick(key, drop=True)
+        link.in_flight.clear()
+        metrics.incr("shard.worker_exits")
+        if lost:
+            metrics.incr("shard.lost", lost)
+            logger.warning(f"⚠️ Воркер {link.index} отключился, не обработав апдейтов: {lost}")
+        if link.index in self.alive and not self._stopping:
+            self._set_ring([index for index in self.alive if index != link.index])
+
+    def _unstick(self, key, drop: bool = False):
+        entry = self.sticky.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if drop or entry[1] <= 0:
+            del self.sticky[key]
+
+    # --- Состав воркеров ---
+
+    def _set_ring(self, workers: list[int]):
+        """Новый состав: раздача апдейтов приостанавливается до подтверждения всеми воркерами"""
+        self.alive = workers
+        self._epoch += 1
+        metrics.incr("shard.rebalances")
+        self._ready.clear()
+        if not workers:
+            logger.error("❌ Нет живых воркеров: апдейты ждут перезапуска")
+            return
+        self._ring_pending = set(workers)
+        self._ring_started = time.perf_counter()
+        for index in workers:
+            self.links[index].send({"t": "ring", "epoch": self._epoch, "workers": workers})
+        self._loop.call_later(RING_TIMEOUT_SECONDS, self._ring_timeout, self._epoch)
+        logger.info(f"🔀 Состав воркеров: {workers}")
+
+    def _ring_agreed(self):
+        metrics.observe("shard.rebalance_ms", (time.perf_counter() - self._ring_started) * 1000)
+        self._ready.set()
+
+    def _ring_timeout(self, epoch: int):
+        if epoch == self._epoch and self._ring_pending and not self._ready.is_set():
+            logger.warning(f"⚠️ Воркеры {sorted(self._ring_pending)} не подтвердили состав, продолжаем без них")
+            self._ring_agreed()
+
+    # --- Раздача апдейтов ---
+
+    async def _dispatch_loop(self):
+        queue = self.application.update_queue
+        while True:
+            update = await queue.get()
+            try:
+                await self._ready.wait()
+                if isinstance(update, Update):
+                    self._dispatch(update)
+            finally:
+                queue.task_done()
+
+    def _dispatch(self, update: Update):
+        key = shard_key(update)
+        self._seq += 1
+        entry = self.sticky.get(key) if key else None
+        if entry is not None:
+            # У прежнего владельца ещё есть апдейты этого пользователя — сохраняем порядок
+            entry[1] += 1
+            index = entry[0]
+        elif key is not None:
+            index = owner(key, self.alive)
+            self.sticky[key] = [index, 1]
+        else:
+            index = self.alive[self._seq % len(self.alive)]
+        link = self.links[index]
+        link.in_flight[self._seq] = (key, time.perf_counter())
+        link.send({"t": "update", "id": self._seq, "update": update.to_dict()})
+        metrics.incr("shard.dispatched")
+
+    # --- Кэши и метрики воркеров ---
+
+    def _broadcast(self, message: dict, exclude: int | None = None):
+        for index in self.alive:
+            if index != exclude:
+                self.links[index].send(message)
+
+    def _on_local_users_changed(self, user_ids):
+        # Commit в самом приёмнике (очистка ивентов, планировщик) — из потока сессии
+        if getattr(_peer, "active", False):
+            return
+        users = None if user_ids is None else sorted(user_ids)
+        self._loop.call_soon_threadsafe(self._broadcast, {"t": "users_changed", "users": users})
+
+    def _on_local_acl_changed(self):
+        # /grant и /revoke выполняются в воркерах, но права меняет и скрипт в приёмнике
+        if getattr(_peer, "active", False):
+            return
+        self._loop.call_soon_threadsafe(self._broadcast, {"t": "acl_changed"})
+
+    async def worker_metrics(self, reset: bool = False, timeout: float = 5) -> list[dict]:
+        """Снимки метрик живых воркеров (reset — обнулить их после снятия)"""
+        self._seq += 1
+        request = self._seq
+        futures = {}
+        for index in self.alive:
+            futures[index] = self._metric_replies[(index, request)] = self._loop.create_future()
+            self.links[index].send({"t": "metrics", "request": request, "reset": reset})
+        try:
+            done, _ = await asyncio.wait(futures.values(), timeout=timeout)
+            return [future.result() for future in done]
+        finally:
+            for index in futures:
+                self._metric_replies.pop((index, request), None)
+
+
+# ==========================================
+# ВОРКЕР
+# ==========================================
+
+class _Worker:
+    """Обработка апдейтов одного шарда в процессе-воркере"""
+
+    def __init__(self, index: int, application: Application):
+        self.index = index
+        self.application = application
+        self.ring = [index]
+        self.writer = None
+        self.loop = None
+        self.active = {}  # user_id -> апдейтов в работе
+        self.seen = set()  # пользователи, чьё состояние загружено в этом процессе
+        self.tasks = set()
+        self.leaving = False
+
+    def send(self, message: dict):
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(_frame(message))
+
+    def owns(self, user_id: int) -> bool:
+        return not self.leaving and owner(f"user:{user_id}", self.ring) == self.index
+
+    async def run(self, socket_path: str):
+        from acl import on_acl_changed
+        from db import on_users_changed
+        self.loop = asyncio.get_running_loop()
+        on_users_changed(self._on_local_users_changed)
+        on_acl_changed(self._on_local_acl_changed)
+        self.loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.leave()))
+
+        reader, self.writer = await asyncio.open_unix_connection(socket_path)
+        self.send({"t": "hello", "worker": self.index, "pid": os.getpid()})
+        while (message := await read_frame(reader)) is not None:
+            kind = message["t"]
+            if kind == "update":
+                task = asyncio.create_task(self._process(message))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            elif kind == "ring":
+                await self._rebalance(message)
+            elif kind == "users_changed":
+                _apply_users_changed(message["users"])
+            elif kind == "acl_changed":
+                task = asyncio.create_task(asyncio.to_thread(_apply_acl_changed))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            elif kind == "metrics":
+                self.send({"t": "metrics", "request": message["request"], "snapshot": metrics.snapshot()})
+                if message.get("reset"):
+                    metrics.reset()
+            elif kind == "stop":
+                break
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.writer.close()
+
+    async def _process(self, message: dict):
+        received = time.perf_counter()
+        update = Update.de_json(message["update"], self.application.bot)
+        user_id = update.effective_user.id if update.effective_user else None
+        if user_id is not None:
+            self.active[user_id] = self.active.get(user_id, 0) + 1
+            self.seen.add(user_id)
+        started = []
+
+        async def handlers():
+            started.append(time.perf_counter())
+            await self.application.process_update(update)
+
+        try:
+            # Как Application.__process_update_wrapper: очередь пользователя, слот, единица работы
+            await self.application.update_processor.process_update(update, handlers())
+        finally:
+            if user_id is not None:
+                self.active[user_id] -= 1
+                if not self.active[user_id]:
+                    del self.active[user_id]
+                    if not self.owns(user_id):
+                        # Пользователь переехал к другому воркеру: отдаём его состояние до подтверждения
+                        await self._release([user_id])
+            finished = time.perf_counter()
+            begin = started[0] if started else finished
+            self.send({
+                "t": "done", "id": message["id"],
+                "wait": (begin - received) * 1000, "ms": (finished - begin) * 1000,
+            })
+
+    async def _release(self, user_ids: list[int]):
+        """Сохраняет user_data и забывает пользователей, которых теперь обслуживает другой воркер"""
+        await self.application.update_persistence()
+        await self.application.persistence.flush()
+        for user_id in user_ids:
+            self.application.persistence.forget_user_data(user_id)
+            data = self.application.user_data.get(user_id)
+            if data is not None:
+                data.clear()
+            self.seen.discard(user_id)
+        metrics.incr("shard.released_users", len(user_ids))
+
+    async def _rebalance(self, message: dict):
+        self.ring = message["workers"]
+        moved = [user_id for user_id in self.seen if user_id not in self.active and not self.owns(user_id)]
+        if moved:
+            await self._release(moved)
+        self.send({"t": "ring_ok", "epoch": message["epoch"]})
+
+    async def leave(self):
+        """SIGTERM: отдаём всех пользователей и выходим из состава; приёмник пришлёт stop"""
+        if self.leaving:
+            return
+        self.leaving = True
+        await self._release([user_id for user_id in self.seen if user_id not in self.active])
+        self.send({"t": "leaving"})
+
+    def _on_local_users_changed(self, user_ids):
+        if getattr(_peer, "active", False):
+            return
+        users = None if user_ids is None else sorted(user_ids)
+        self.loop.call_soon_threadsafe(self.send, {"t": "users_changed", "users": users})
+
+    def _on_local_acl_changed(self):
+        if getattr(_peer, "active", False):
+            return
+        self.loop.call_soon_threadsafe(self.send, {"t": "acl_changed"})
+
+
+async def _worker_amain(index: int, socket_path: str, base_url: str | None):
+    import lazy
+    import main as bot_main
+
+    builder = Application.builder().token(BOT_TOKEN).updater(None)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = bot_main.build_application(builder)
+    application.persistence.shared_bot_data = True
+    # Модули хендлеров загружаются до подключения: первый апдейт не ждёт импортов
+    await lazy.preload()
+    await application.initialize()
+    await application.start()
+    try:
+        await _Worker(index, application).run(socket_path)
+    finally:
+        # stop() сохраняет оставшиеся user_data
+        await application.stop()
+        await application.shutdown()
+
+
+def worker_main(index: int, socket_path: str, base_url: str | None = None):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C приходит всей группе процессов; останавливает воркеры приёмник
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_amain(index, socket_path, base_url))
+
+
+# ==========================================
+# ЗАПУСК БОТА В РЕЖИМЕ ВОРКЕРОВ
+# ==========================================
+
+async def serve(application: Application, workers: int, allowed_updates: list[str]):
+    """Приёмник: polling или webhook + воркеры + планировщик до SIGINT/SIGTERM"""
+    from config import WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+    from scheduler import run_and_start_scheduler, stop_scheduler
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    ingress = Ingress(application, workers)
+    await application.initialize()
+    await ingress.start()
+    # Планировщик один на все процессы
+    await run_and_start_scheduler(application)
+    try:
+        if WEBHOOK_URL:
+            logger.info(f"🌐 Режим webhook: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+            await application.updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
+            )
+        else:
+            await application.updater.start_polling(allowed_updates=allowed_updates)
+        logger.info(f"🚀 Бот запущен: приёмник + {workers} воркеров")
+        await stop.wait()
+    finally:
+        logger.info("🛑 Остановка: дорабатываем принятые апдейты...")
+        if application.updater.running:
+            await application.updater.stop()
+        stop_scheduler()
+        await ingress.stop()
+        await application.shutdown()